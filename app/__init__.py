@@ -5,12 +5,13 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from config import Config
+from .services.read_replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 
-def create_app() -> Flask:
+def create_app(config_class=Config) -> Flask:
     app = Flask(__name__, instance_relative_config=True)
 
     Path(app.instance_path).mkdir(parents=True, exist_ok=True)
@@ -19,9 +20,29 @@ def create_app() -> Flask:
     Path(app.config.get('UPLOAD_FOLDER', 'uploads')).mkdir(parents=True, exist_ok=True)
 
     # Load configuration from config.py
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+
+    # Provider JSON (numpy; orjson se FAST_JSON_ENCODER)
+    from .services.json_encoding import configure_json_provider
+    configure_json_provider(app)
+
+    # Profilo engine (pool PostgreSQL / pragma SQLite) scelto da DB_ENGINE_PROFILE
+    from .services.db_engine import get_profile, engine_options, configure_engine
+    engine_profile = get_profile(app.config.get('DB_ENGINE_PROFILE'))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI'], engine_profile))
+
+    # Replica in sola lettura per le statistiche (opzionale)
+    from .services.read_replica import replica_binds
+    replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        app.config.setdefault('SQLALCHEMY_BINDS', {}).update(
+            replica_binds(replica_uri, engine_options(replica_uri, engine_profile)))
 
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(app, engine, engine_profile)
     migrate.init_app(app, db)
     
     # Configurazione Flask-Login
@@ -43,6 +64,10 @@ def create_app() -> Flask:
     app.register_blueprint(stats_bp)
     app.register_blueprint(stats_general_bp)
 
+    # Comandi CLI
+    from .cli import register_commands
+    register_commands(app)
+
 
     # Import modelli se presenti
     try:
@@ -0,0 +1,93 @@
+import json
+
+from flask import render_template, request, flash, redirect, url_for, jsonify, send_file, abort
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
+from app.models import JobLog
+from app.services.backup import BackupError, backup_file, get_backup, list_backups, start_job
+from .routes_main import admin_bp
+
+# ===========================
+# BACKUP DEL DATABASE
+# ===========================
+
+@admin_bp.route("/backups")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def backups():
+    """
+    Backup disponibili, ultimi job di backup e prova di ripristino
+    """
+    recent_jobs = (JobLog.query.filter(JobLog.job_type.in_(['backup', 'backup_verify']))
+                   .order_by(JobLog.started_at.desc()).limit(10).all())
+    return render_template("backups.html", backups=list_backups(), recent_jobs=recent_jobs)
+
+
+@admin_bp.route("/backups", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def backups_create():
+    """
+    Avvia un backup completo o incrementale in background
+    """
+    incremental = request.form.get('kind') == 'incremental'
+    try:
+        job = start_job('backup', incremental=incremental)
+    except BackupError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin_bp.backups'))
+    flash(f"Backup {'incrementale' if incremental else 'completo'} avviato (job {job.id}): "
+          f"l'applicazione resta disponibile durante la copia.", "info")
+    return redirect(url_for('admin_bp.backups'))
+
+
+@admin_bp.route("/backups/<backup_id>/verify", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def backups_verify(backup_id):
+    """
+    Avvia la prova di ripristino di un backup in background
+    """
+    try:
+        job = start_job('backup_verify', backup_id=backup_id)
+    except BackupError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin_bp.backups'))
+    flash(f"Prova di ripristino di {backup_id} avviata (job {job.id}).", "info")
+    return redirect(url_for('admin_bp.backups'))
+
+
+@admin_bp.route("/backups/<backup_id>/download")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def backups_download(backup_id):
+    """
+    Scarica il file di un backup (gli incrementali vanno applicati al completo di partenza)
+    """
+    try:
+        manifest = get_backup(backup_id)
+    except BackupError:
+        abort(404)
+    return send_file(backup_file(manifest), as_attachment=True, download_name=manifest['file'])
+
+
+@admin_bp.route("/backups/jobs/<int:job_id>")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def backups_job_status(job_id):
+    """
+    Stato di un job di backup o di prova (JSON)
+    """
+    job = JobLog.query.filter(JobLog.id == job_id, JobLog.job_type.in_(['backup', 'backup_verify'])).first_or_404()
+    return jsonify({
+        'job_id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'details': json.loads(job.details or '{}'),
+        'error': job.error_message,
+    })
@@ -0,0 +1,93 @@
+import csv
+import io
+
+from flask import render_template, request, flash, redirect, url_for, jsonify, Response
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from app.blueprints.auth.decorators import disclaimer_required, role_required
+from app.models import JobLog
+from app.blueprints.stats.uploads_stats import DEFAULT_UPLOAD_MODE
+from app.services.bulk_import import BulkImportError, read_bulk_file, run_bulk_import, error_report_rows
+from .routes_main import admin_bp
+
+# ===========================
+# IMPORT MASSIVO PROVIDER
+# ===========================
+
+@admin_bp.route("/bulk-import", methods=["GET", "POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def bulk_import():
+    """
+    Import di un file provider (CSV/Excel/Parquet) con risultati di più lab e cicli
+    
+    GET: form di upload e ultimi import
+    POST: importa il file (mode=merge aggiunge o corregge, mode=replace sostituisce i risultati
+    dei lab nei cicli del file); risponde in JSON se richiesto (Accept o ?format=json)
+    """
+    wants_json = request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+    recent_jobs = JobLog.query.filter_by(job_type='bulk_import').order_by(JobLog.started_at.desc()).limit(10).all()
+    
+    if request.method == 'GET':
+        return render_template("bulk_import.html", result=None, recent_jobs=recent_jobs)
+    
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        if wants_json:
+            return jsonify({'success': False, 'error': "Nessun file selezionato"}), 400
+        flash("Nessun file selezionato", "warning")
+        return redirect(url_for('admin_bp.bulk_import'))
+    
+    filename = secure_filename(file.filename)
+    try:
+        df = read_bulk_file(file.stream, filename)
+    except BulkImportError as e:
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), "danger")
+        return redirect(url_for('admin_bp.bulk_import'))
+    
+    workers = request.form.get('workers', type=int)
+    try:
+        result = run_bulk_import(df, current_user.id, filename, workers=workers,
+                                 mode=request.form.get('mode') or DEFAULT_UPLOAD_MODE)
+    except BulkImportError as e:
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), "danger")
+        return redirect(url_for('admin_bp.bulk_import'))
+    
+    if wants_json:
+        return jsonify(dict(result, success=True))
+    
+    summary = result['summary']
+    category = "success" if not summary['failed'] and not summary['deleted'] else "warning"
+    flash(f"Import completato: {summary['imported']} partizioni importate, {summary['skipped']} invariate, "
+          f"{summary['failed']} con errori; risultati {summary['inserted']} nuovi, {summary['updated']} modificati, "
+          f"{summary['deleted']} eliminati.", category)
+    return render_template("bulk_import.html", result=result, recent_jobs=recent_jobs)
+
+
+@admin_bp.route("/bulk-import/<int:job_id>/errors.csv")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def bulk_import_errors(job_id):
+    """Report CSV degli errori per laboratorio di un import"""
+    import json
+    
+    job = JobLog.query.filter_by(id=job_id, job_type='bulk_import').first_or_404()
+    details = json.loads(job.details or '{}')
+    partitions = [
+        {'lab_code': key.split('/', 1)[0], 'cycle_code': key.split('/', 1)[1], 'errors': errors}
+        for key, errors in details.get('errors', {}).items()
+    ]
+    
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=["lab_code", "cycle_code", "row", "error"])
+    writer.writeheader()
+    writer.writerows(error_report_rows({'partitions': partitions}))
+    return Response(output.getvalue(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=bulk_import_{job_id}_errors.csv'
+    })
@@ -1,13 +1,24 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
 from app import db
 from app.models import Cycle, CycleParameter, DocFile
 from datetime import datetime
+from app.blueprints.stats.homogeneity_stats import publication_blockers
 from .routes_main import admin_bp
 
 # ===========================
 # GESTIONE CICLI PT
 # ===========================
 
+def _check_publishable(cycle):
+    """Verifica omogeneità/stabilità prima della pubblicazione (flash degli esiti non conformi)"""
+    blockers = publication_blockers(cycle.code)
+    if blockers:
+        flash(f"Impossibile pubblicare {cycle.code}: " + "; ".join(blockers[:5])
+              + (f" (e altri {len(blockers) - 5})" if len(blockers) > 5 else ""), "danger")
+    return not blockers
+
 @admin_bp.route("/cycles")
 def cycles_list():
     """Lista tutti i cicli per amministrazione"""
@@ -61,6 +72,8 @@ def cycle_review(cycle_id):
             if missing_data:
                 flash(f"Impossibile approvare: {len(missing_data)} parametri senza XPT/SigmaPT!", "danger")
                 return redirect(url_for("admin_bp.cycle_review", cycle_id=cycle_id))
+            if not _check_publishable(cycle):
+                return redirect(url_for("admin_bp.cycle_review", cycle_id=cycle_id))
             
             cycle.status = "published"
             cycle.updated_at = datetime.utcnow()
@@ -86,7 +99,9 @@ def cycle_review(cycle_id):
     if missing_pdf:
         flash(f"{len(missing_pdf)} parametri senza XPT o SigmaPT!", "warning")
     
-    return render_template("cycle_review.html", cycle=cycle, params=params)
+    homogeneity_blockers = publication_blockers(cycle.code)
+    return render_template("cycle_review.html", cycle=cycle, params=params,
+                           homogeneity_blockers=homogeneity_blockers)
 
 @admin_bp.route("/cycles/<int:cycle_id>/toggle_status", methods=["POST"])
 def cycle_toggle_status(cycle_id):
@@ -98,6 +113,8 @@ def cycle_toggle_status(cycle_id):
     if new_status not in valid_statuses:
         flash("Stato non valido.", "danger")
         return redirect(url_for("admin_bp.cycles_list"))
+    if new_status == "published" and not _check_publishable(cycle):
+        return redirect(url_for("admin_bp.cycles_list"))
     
     cycle.status = new_status
     cycle.updated_at = datetime.utcnow()
@@ -114,6 +131,8 @@ def cycle_quick_approve(id):
     if cycle.status != "pending_review":
         flash("Il ciclo non è in stato 'pending_review'.", "warning")
         return redirect(url_for("admin_bp.cycles_pending"))
+    if not _check_publishable(cycle):
+        return redirect(url_for("admin_bp.cycles_pending"))
     
     cycle.status = "published"
     cycle.updated_at = datetime.utcnow()
@@ -134,4 +153,104 @@ def cycle_quick_reject(id):
     cycle.updated_at = datetime.utcnow()
     db.session.commit()
     flash(f"Ciclo {cycle.code} rigettato.", "warning")
-    return redirect(url_for("admin_bp.cycles_pending"))
\ No newline at end of file
+    return redirect(url_for("admin_bp.cycles_pending"))
+
+@admin_bp.route("/cycles/<int:cycle_id>/recompute", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycle_recompute(cycle_id):
+    """Ricalcola punteggi e PtStats di tutti i risultati del ciclo"""
+    from app.blueprints.stats.cycle_stats import recompute_cycle_statistics
+    
+    cycle = Cycle.query.get_or_404(cycle_id)
+    if cycle.archived_at:
+        flash(f"Il ciclo {cycle.code} è archiviato: ripristinalo prima di ricalcolare.", "warning")
+        return redirect(url_for("admin_bp.cycles_list"))
+    if cycle.frozen_at:
+        flash(f"Il ciclo {cycle.code} è congelato: scongelalo prima di ricalcolare.", "warning")
+        return redirect(url_for("admin_bp.cycles_list"))
+    summary = recompute_cycle_statistics(cycle.code)
+    flash(f"Ciclo {cycle.code}: ricalcolati {summary['results']} risultati in {summary['seconds']}s "
+          f"({summary['updated']} punteggi aggiornati, {summary['pt_stats']} PtStats).", "success")
+    return redirect(url_for("admin_bp.cycles_list"))
+
+@admin_bp.route("/cycles/<int:cycle_id>/archive", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycle_archive(cycle_id):
+    """Sposta i risultati del ciclo nelle tabelle di archivio, o li ripristina (action=restore)"""
+    from app.services.archive import ArchiveError, archive_cycle, restore_cycle
+    
+    cycle = Cycle.query.get_or_404(cycle_id)
+    restore = request.form.get("action") == "restore"
+    try:
+        moved = restore_cycle(cycle.code) if restore else archive_cycle(cycle.code)
+    except ArchiveError as e:
+        flash(str(e), "warning")
+        return redirect(url_for("admin_bp.cycles_list"))
+    
+    if restore:
+        flash(f"Ciclo {cycle.code} ripristinato: {moved} risultati di nuovo nelle tabelle correnti.", "success")
+    else:
+        flash(f"Ciclo {cycle.code} archiviato: {moved} risultati spostati nell'archivio.", "success")
+    return redirect(url_for("admin_bp.cycles_list"))
+
+@admin_bp.route("/cycles/<int:cycle_id>/freeze", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycle_freeze(cycle_id):
+    """Congela il ciclo in uno snapshot immutabile, o lo scongela (action=unfreeze)"""
+    from app.services.snapshots import SnapshotError, freeze_cycle, unfreeze_cycle
+    
+    cycle = Cycle.query.get_or_404(cycle_id)
+    unfreeze = request.form.get("action") == "unfreeze"
+    try:
+        if unfreeze:
+            unfreeze_cycle(cycle.code)
+        else:
+            manifest = freeze_cycle(cycle.code)
+    except SnapshotError as e:
+        flash(str(e), "warning")
+        return redirect(url_for("admin_bp.cycles_list"))
+    
+    if unfreeze:
+        flash(f"Ciclo {cycle.code} scongelato: statistiche di nuovo dal database.", "success")
+    else:
+        flash(f"Ciclo {cycle.code} congelato: snapshot v{manifest['version']} con {manifest['rows']} risultati.", "success")
+    return redirect(url_for("admin_bp.cycles_list"))
+
+@admin_bp.route("/cycles/<int:cycle_id>/snapshot")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycle_snapshot(cycle_id):
+    """Aggregati dello snapshot del ciclo congelato (JSON)"""
+    from app.services.snapshots import current_snapshot
+    
+    cycle = Cycle.query.get_or_404(cycle_id)
+    snapshot = current_snapshot(cycle.code)
+    if snapshot is None:
+        abort(404)
+    return jsonify(snapshot.summary())
+
+@admin_bp.route("/cycles/<int:cycle_id>/delete", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycles_delete(cycle_id):
+    """Elimina ciclo con parametri, partecipazioni e risultati (in background se molti risultati)"""
+    from app.services.cascade_delete import start_deletion, CascadeDeleteError
+    from .routes_labs import _deletion_message
+    
+    cycle = Cycle.query.get_or_404(cycle_id)
+    try:
+        job = start_deletion('cycle', cycle.code)
+    except CascadeDeleteError as e:
+        flash(str(e), "warning")
+        return redirect(url_for("admin_bp.cycles_list"))
+    
+    flash(_deletion_message(job, f"Ciclo {cycle.code}"), "success" if job.status != 'failed' else "danger")
+    return redirect(url_for("admin_bp.cycles_list"))
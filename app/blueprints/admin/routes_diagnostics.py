@@ -0,0 +1,30 @@
+from flask import jsonify, current_app
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
+from app.services import query_diagnostics
+from .routes_main import admin_bp
+
+# ===========================
+# DIAGNOSTICA E STRUMENTAZIONE
+# ===========================
+
+@admin_bp.route("/diagnostics/queries")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def diagnostics_queries():
+    """Voci diagnostiche campionate delle query (JSON)"""
+    return jsonify({
+        'enabled': query_diagnostics.is_enabled(),
+        'sample_rate': current_app.config.get('QUERY_DIAGNOSTICS_SAMPLE_RATE'),
+        'entries': query_diagnostics.recent_entries()
+    })
+
+@admin_bp.route("/diagnostics/queries/clear", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def diagnostics_queries_clear():
+    """Svuota il buffer della diagnostica query"""
+    query_diagnostics.clear()
+    return jsonify({'success': True})
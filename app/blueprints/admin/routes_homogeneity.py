@@ -0,0 +1,56 @@
+from flask import render_template, request, flash, redirect, url_for
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
+from app.blueprints.stats.homogeneity_stats import (
+    CRITERION_FACTOR, read_sample_measurements, store_sample_measurements, evaluate_cycle, publication_blockers,
+    insufficient_data,
+)
+from app.models import Cycle, HomogeneityResult
+from .routes_main import admin_bp
+
+# ===========================
+# OMOGENEITÀ E STABILITÀ CAMPIONI
+# ===========================
+
+@admin_bp.route("/cycles/<int:cycle_id>/homogeneity", methods=["GET", "POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def cycle_homogeneity(cycle_id):
+    """
+    Studi di omogeneità e stabilità dei campioni di un ciclo
+    
+    GET: esiti per parametro
+    POST: carica il CSV delle misure in replicato (action=upload) o ricalcola (action=evaluate)
+    """
+    cycle = Cycle.query.get_or_404(cycle_id)
+    
+    if request.method == "POST":
+        if request.form.get("action") == "evaluate":
+            results = evaluate_cycle(cycle.code)
+            flash(f"Ciclo {cycle.code}: {len(results)} esiti ricalcolati.", "success")
+            return redirect(url_for("admin_bp.cycle_homogeneity", cycle_id=cycle_id))
+        
+        file = request.files.get("file")
+        if not file or file.filename == "":
+            flash("Nessun file selezionato", "warning")
+            return redirect(url_for("admin_bp.cycle_homogeneity", cycle_id=cycle_id))
+        
+        df, errors = read_sample_measurements(file.stream)
+        if not errors:
+            results, errors = store_sample_measurements(cycle.code, df)
+        if errors:
+            flash(f"File non importato, {len(errors)} errori: " + "; ".join(errors[:10]), "danger")
+            return redirect(url_for("admin_bp.cycle_homogeneity", cycle_id=cycle_id))
+        
+        insufficient = sum(1 for r in results if insufficient_data(r['study'], r['ss'], r['difference']))
+        failed = sum(1 for r in results if not r['passed']) - insufficient
+        flash(f"Importate {len(df)} misure: {len(results)} esiti, {failed} non conformi, "
+              f"{insufficient} con dati insufficienti.",
+              "success" if not failed and not insufficient else "warning")
+        return redirect(url_for("admin_bp.cycle_homogeneity", cycle_id=cycle_id))
+    
+    results = HomogeneityResult.query.filter_by(cycle_code=cycle.code).order_by(
+        HomogeneityResult.parameter_code, HomogeneityResult.study).all()
+    return render_template("cycle_homogeneity.html", cycle=cycle, results=results,
+                           blockers=publication_blockers(cycle.code), criterion_factor=CRITERION_FACTOR)
@@ -1,8 +1,12 @@
 from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
 from app import db
-from app.models import Lab, LabParticipation, Result, User, Role, UserLabRole
+from app.models import Lab, LabParticipation, User, Role, JobLog
 from app.services.roles import RoleService, RoleManagementError
+from app.services.cascade_delete import start_deletion, CascadeDeleteError
 from datetime import datetime
+import json
 from .routes_main import admin_bp
 
 # ===========================
@@ -99,22 +103,43 @@ def labs_edit(lab_id):
 
 @admin_bp.route("/labs/<int:lab_id>/delete", methods=["POST"])
 def labs_delete(lab_id):
-    """Elimina laboratorio"""
+    """Elimina laboratorio con risultati, upload e partecipazioni (in background se molti risultati)"""
     lab = Lab.query.get_or_404(lab_id)
     
-    # Verifica se il laboratorio è usato in partecipazioni o risultati
-    participation_usage = LabParticipation.query.filter_by(lab_code=lab.code).count()
-    result_usage = Result.query.filter_by(lab_code=lab.code).count()
-    
-    if participation_usage > 0 or result_usage > 0:
-        flash(f"Impossibile eliminare: laboratorio usato in {participation_usage} partecipazioni e {result_usage} risultati.", "danger")
+    try:
+        job = start_deletion('lab', lab.code)
+    except CascadeDeleteError as e:
+        flash(str(e), "warning")
         return redirect(url_for("admin_bp.labs_list"))
     
-    db.session.delete(lab)
-    db.session.commit()
-    flash("Laboratorio eliminato con successo.", "success")
+    flash(_deletion_message(job, f"Laboratorio {lab.code}"), "success" if job.status != 'failed' else "danger")
     return redirect(url_for("admin_bp.labs_list"))
 
+@admin_bp.route("/deletions/<int:job_id>")
+@login_required
+@disclaimer_required
+@role_required("admin")
+def deletion_status(job_id):
+    """Avanzamento di un'eliminazione (JSON)"""
+    job = JobLog.query.filter_by(id=job_id, job_type='cascade_delete').first_or_404()
+    return jsonify({
+        'status': job.status,
+        'error': job.error_message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        **json.loads(job.details or '{}'),
+    })
+
+def _deletion_message(job, label):
+    """Messaggio flash per l'esito (o l'avvio) di un'eliminazione"""
+    details = json.loads(job.details or '{}')
+    if job.status == 'running':
+        return (f"{label}: eliminazione di {details['results']} risultati avviata in background "
+                f"(avanzamento: {url_for('admin_bp.deletion_status', job_id=job.id)}).")
+    if job.status == 'failed':
+        return f"{label}: eliminazione non riuscita: {job.error_message}"
+    return f"{label} eliminato con {details['deleted']} risultati."
+
 @admin_bp.route("/labs/<int:lab_id>/toggle_active", methods=["POST"])
 def lab_toggle_active(lab_id):
     """Attiva/disattiva laboratorio"""
@@ -49,4 +49,8 @@ from . import routes_labs
 from . import routes_parameters
 from . import routes_users
 from . import routes_docs
-from . import routes_registrations
\ No newline at end of file
+from . import routes_registrations
+from . import routes_diagnostics
+from . import routes_bulk_import
+from . import routes_homogeneity
+from . import routes_backup
@@ -1,6 +1,8 @@
 from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required
+from app.blueprints.auth.decorators import disclaimer_required, role_required
 from app import db
-from app.models import Unit, Parameter
+from app.models import Unit, Parameter, UnitConversion
 from app.forms import UnitForm
 from datetime import datetime
 from .routes_main import admin_bp
@@ -19,8 +21,10 @@ def units_list():
         query = query.filter((Unit.description.ilike(f"%{q}%")) | (Unit.code.ilike(f"%{q}%")))
     
     units = query.order_by(Unit.description.asc()).all()
+    conversions = UnitConversion.query.order_by(UnitConversion.from_unit_code, UnitConversion.to_unit_code).all()
+    unit_codes = [code for (code,) in db.session.query(Unit.code).order_by(Unit.code)]
     
-    return render_template("units_list.html", units=units, q=q)
+    return render_template("units_list.html", units=units, q=q, conversions=conversions, unit_codes=unit_codes)
 
 @admin_bp.route("/units/new", methods=["GET", "POST"])
 def units_new():
@@ -70,7 +74,50 @@ def units_delete(unit_id):
         flash(f"Impossibile eliminare: unità usata da {parameter_usage} parametri.", "danger")
         return redirect(url_for("admin_bp.units_list"))
     
+    UnitConversion.query.filter((UnitConversion.from_unit_code == unit.code) |
+                                (UnitConversion.to_unit_code == unit.code)).delete(synchronize_session=False)
     db.session.delete(unit)
     db.session.commit()
     flash("Unità di misura eliminata con successo.", "success")
-    return redirect(url_for("admin_bp.units_list"))
\ No newline at end of file
+    return redirect(url_for("admin_bp.units_list"))
+
+@admin_bp.route("/units/conversions", methods=["POST"])
+@login_required
+@disclaimer_required
+@role_required("admin")
+def unit_conversion_save():
+    """Crea o aggiorna il fattore di conversione tra due unità"""
+    from_code = request.form.get("from_unit_code", "").strip()
+    to_code = request.form.get("to_unit_code", "").strip()
+    factor = request.form.get("factor", type=float)
+    
+    if not from_code or not to_code or from_code == to_code:
+        flash("Selezionare due unità diverse.", "warning")
+        return redirect(url_for("admin_bp.units_list"))
+    if not factor or factor <= 0:
+        flash("Il fattore deve essere un numero positivo.", "danger")
+        return redirect(url_for("admin_bp.units_list"))
+    
+    # Una sola conversione per coppia, in qualsiasi verso
+    conversion = UnitConversion.query.filter_by(from_unit_code=from_code, to_unit_code=to_code).first()
+    reverse = UnitConversion.query.filter_by(from_unit_code=to_code, to_unit_code=from_code).first()
+    if reverse:
+        reverse.factor = 1.0 / factor
+        reverse.updated_at = datetime.utcnow()
+    elif conversion:
+        conversion.factor = factor
+        conversion.updated_at = datetime.utcnow()
+    else:
+        db.session.add(UnitConversion(from_unit_code=from_code, to_unit_code=to_code, factor=factor))
+    db.session.commit()
+    flash(f"Conversione salvata: 1 {from_code} = {factor:g} {to_code}.", "success")
+    return redirect(url_for("admin_bp.units_list"))
+
+@admin_bp.route("/units/conversions/<int:conversion_id>/delete", methods=["POST"])
+def unit_conversion_delete(conversion_id):
+    """Elimina un fattore di conversione"""
+    conversion = UnitConversion.query.get_or_404(conversion_id)
+    db.session.delete(conversion)
+    db.session.commit()
+    flash("Conversione eliminata.", "success")
+    return redirect(url_for("admin_bp.units_list"))
@@ -1,5 +1,6 @@
 from functools import wraps
-from flask import abort, redirect, url_for, session, request
+from datetime import datetime
+from flask import abort, redirect, url_for, session, request, g, jsonify
 from flask_login import current_user
 
 def disclaimer_required(f):
@@ -62,6 +63,36 @@ def lab_role_required(min_role="viewer"):
         return decorated_function
     return decorator
 
+def api_token_required(min_role="analyst"):
+    """Richiede un token API (Authorization: Bearer) del laboratorio della route, senza sessione"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from app import db
+            from app.models import ApiToken
+
+            scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+            api_token = None
+            if scheme.lower() == "bearer" and token.strip():
+                api_token = ApiToken.query.filter_by(token_hash=ApiToken.hash_token(token.strip())).first()
+            if api_token is None or not api_token.is_valid:
+                response = jsonify({"success": False, "error": "Token API mancante, non valido o revocato"})
+                response.headers["WWW-Authenticate"] = "Bearer"
+                return response, 401
+
+            # Il token vale solo per il proprio laboratorio e finché l'utente ne ha il ruolo
+            user = api_token.user
+            if api_token.lab_code != kwargs.get("lab_code") or not user.is_active \
+                    or not user.has_lab_min_role(api_token.lab_code, min_role):
+                return jsonify({"success": False, "error": "Token non autorizzato per questo laboratorio"}), 403
+
+            api_token.last_used_at = datetime.utcnow()
+            db.session.commit()
+            g.api_token = api_token
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def has_lab_min_role(user, lab_code, min_role):
     """Funzione helper per verificare ruoli minimi nei laboratori"""
     return user.has_lab_min_role(lab_code, min_role)
\ No newline at end of file
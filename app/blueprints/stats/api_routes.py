@@ -3,18 +3,36 @@ API Routes per il modulo Statistics
 Endpoint API separati per mantenere la leggibilità del codice
 """
 
-from flask import request, jsonify, current_app
+import hashlib
+
+from flask import request, jsonify, current_app, g
 from flask_login import login_required
+from sqlalchemy import func
 from app import db
-from app.models import Result, Parameter, Technique, Cycle
-from app.blueprints.auth.decorators import lab_role_required
+from app.models import Parameter, Technique, Cycle
+from app.blueprints.auth.decorators import lab_role_required, api_token_required
+from app.services.read_replica import replica_reads
+from app.services.data_version import conditional_stats
+from app.services.compression import compress_response
+from app.services.archive import distinct_options, result_sources, union_results
+from app.services.snapshots import frozen_snapshots, lab_columns
 from app.blueprints.stats.services_stats import get_control_chart_data
+from app.blueprints.stats.queries_stats import as_float
+from app.blueprints.stats.scores_stats import resolve_metric
 from app.blueprints.stats import stats_bp
 
 
+@stats_bp.after_request
+def compress_api_response(response):
+    """Compressione gzip/brotli delle risposte JSON del blueprint"""
+    return compress_response(response)
+
+
 @stats_bp.route("/api/chart-data")
 @login_required
 @lab_role_required("viewer")
+@replica_reads
+@conditional_stats(time_window=True)
 def get_chart_data_api(lab_code):
     """
     API endpoint per ottenere i dati del grafico via AJAX
@@ -32,6 +50,13 @@ def get_chart_data_api(lab_code):
         
         technique_codes = request.args.getlist('techniques[]')
         cycle_codes = request.args.getlist('cycles[]')
+        # format=compact: nomi codificati a dizionario e array numerici
+        compact = request.args.get('format') == 'compact'
+        # metric: punteggio sull'asse y (z, z_prime, zeta, en)
+        try:
+            metric, metric_info = resolve_metric(request.args.get('metric'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         # Recupera i dati per il grafico con filtri multipli
         chart_data = get_control_chart_data(
@@ -39,12 +64,15 @@ def get_chart_data_api(lab_code):
             parameter_codes=parameter_codes, 
             limit_days=days_limit,
             technique_codes=technique_codes,
-            cycle_codes=cycle_codes
+            cycle_codes=cycle_codes,
+            compact=compact,
+            metric=metric
         )
         
         return jsonify({
             'success': True,
             'data': chart_data,
+            'metric': dict(metric_info, key=metric),
             'filters': {
                 'parameters': parameter_codes,
                 'days': days_limit,
@@ -67,6 +95,8 @@ def get_chart_data_api(lab_code):
 @stats_bp.route("/api/filter-options")
 @login_required
 @lab_role_required("viewer")
+@replica_reads
+@conditional_stats()
 def get_filter_options(lab_code):
     """
     API endpoint per ottenere le opzioni dei filtri disponibili
@@ -80,27 +110,36 @@ def get_filter_options(lab_code):
         selected_techniques = request.args.getlist('techniques[]')
         selected_cycles = request.args.getlist('cycles[]')
         
-        # Ottieni tutti i parametri disponibili (sempre visibili)
-        available_parameters = db.session.query(Result.parameter_code, Parameter.name).join(
-            Parameter, Result.parameter_code == Parameter.code
-        ).filter(Result.lab_code == lab_code).distinct().all()
-        
-        # Per tecniche e cicli: mostra solo quelli compatibili con i parametri selezionati
-        techniques_query = db.session.query(Result.technique_code, Technique.name).join(
-            Technique, Result.technique_code == Technique.code, isouter=True
-        ).filter(Result.lab_code == lab_code, Result.technique_code.isnot(None))
+        # Opzioni su tutto lo storico: anche i cicli archiviati, se il laboratorio ne ha
+        sources = result_sources(lab_code)
         
-        cycles_query = db.session.query(Result.cycle_code, Cycle.name).join(
-            Cycle, Result.cycle_code == Cycle.code
-        ).filter(Result.lab_code == lab_code)
+        # Tutti i parametri disponibili (sempre visibili)
+        def parameters_query(Result, ZScore):
+            return db.select(Result.parameter_code, Parameter.name).join(
+                Parameter, Result.parameter_code == Parameter.code
+            ).where(Result.lab_code == lab_code).distinct()
         
-        # Se sono selezionati parametri, filtra tecniche e cicli di conseguenza
-        if selected_parameters:
-            techniques_query = techniques_query.filter(Result.parameter_code.in_(selected_parameters))
-            cycles_query = cycles_query.filter(Result.parameter_code.in_(selected_parameters))
-        
-        available_techniques = techniques_query.distinct().all()
-        available_cycles = cycles_query.distinct().all()
+        # Per tecniche e cicli: mostra solo quelli compatibili con i parametri selezionati
+        def techniques_query(Result, ZScore):
+            query = db.select(Result.technique_code, Technique.name).join(
+                Technique, Result.technique_code == Technique.code, isouter=True
+            ).where(Result.lab_code == lab_code, Result.technique_code.isnot(None))
+            if selected_parameters:
+                query = query.where(Result.parameter_code.in_(selected_parameters))
+            return query.distinct()
+        
+        def cycles_query(Result, ZScore):
+            query = db.select(Result.cycle_code, Cycle.name).join(
+                Cycle, Result.cycle_code == Cycle.code
+            ).where(Result.lab_code == lab_code)
+            if selected_parameters:
+                query = query.where(Result.parameter_code.in_(selected_parameters))
+            return query.distinct()
+        
+        available_parameters, available_techniques, available_cycles = (
+            distinct_options(build, sources)
+            for build in (parameters_query, techniques_query, cycles_query)
+        )
         
         # Formatta le opzioni per il frontend
         parameters_options = [
@@ -143,6 +182,8 @@ def get_filter_options(lab_code):
 @stats_bp.route("/api/statistics")
 @login_required
 @lab_role_required("viewer")
+@replica_reads
+@conditional_stats()
 def get_statistics_api(lab_code):
     """
     API endpoint per ottenere statistiche riassuntive con filtri
@@ -151,35 +192,41 @@ def get_statistics_api(lab_code):
         JSON: Statistiche aggregate
     """
     try:
-        from app.models import ZScore
+        from datetime import datetime, timedelta
         
         # Parametri filtro
         parameter_codes = request.args.getlist('parameters[]')
         technique_codes = request.args.getlist('techniques[]')
         cycle_codes = request.args.getlist('cycles[]')
         days_limit = request.args.get('days', None)
+        cutoff_date = datetime.utcnow() - timedelta(days=int(days_limit)) if days_limit else None
         
-        # Base query per risultati con Z-scores
-        results_query = db.session.query(Result, ZScore).join(
-            ZScore, Result.id == ZScore.result_id
-        ).filter(Result.lab_code == lab_code)
-        
-        # Applica filtri
-        if parameter_codes:
-            results_query = results_query.filter(Result.parameter_code.in_(parameter_codes))
-        if technique_codes:
-            results_query = results_query.filter(Result.technique_code.in_(technique_codes))
-        if cycle_codes:
-            results_query = results_query.filter(Result.cycle_code.in_(cycle_codes))
-        
-        if days_limit:
-            from datetime import datetime, timedelta
-            cutoff_date = datetime.utcnow() - timedelta(days=int(days_limit))
-            results_query = results_query.filter(Result.submitted_at >= cutoff_date)
-        
-        results_data = results_query.all()
-        
-        if not results_data:
+        def build(Result, ZScore):
+            # Base query per risultati con Z-scores
+            results_query = db.select(as_float(ZScore.z)).join(
+                Result, Result.id == ZScore.result_id
+            ).where(Result.lab_code == lab_code)
+            
+            # Applica filtri
+            if parameter_codes:
+                results_query = results_query.where(Result.parameter_code.in_(parameter_codes))
+            if technique_codes:
+                results_query = results_query.where(Result.technique_code.in_(technique_codes))
+            if cycle_codes:
+                results_query = results_query.where(Result.cycle_code.in_(cycle_codes))
+            if cutoff_date is not None:
+                results_query = results_query.where(Result.submitted_at >= cutoff_date)
+            return results_query
+        
+        snapshots = frozen_snapshots(cycle_codes)
+        if snapshots is not None:
+            # Solo cicli congelati: z dagli snapshot, senza query
+            z_scores = lab_columns(snapshots, lab_code, parameter_codes, technique_codes, since=cutoff_date)['z'].tolist()
+        else:
+            results = union_results(build, result_sources(lab_code, since=cutoff_date, cycle_codes=cycle_codes))
+            z_scores = list(db.session.scalars(db.select(results.c.z)))
+        
+        if not z_scores:
             return jsonify({
                 'success': True,
                 'statistics': {
@@ -189,15 +236,13 @@ def get_statistics_api(lab_code):
                 }
             })
         
-        z_scores = [float(z.z) for _, z in results_data]
-        
         # Calcola statistiche performance
         excellent = sum(1 for z in z_scores if abs(z) < 2)
         acceptable = sum(1 for z in z_scores if 2 <= abs(z) < 3)
         poor = sum(1 for z in z_scores if abs(z) >= 3)
         
         statistics = {
-            'total_results': len(results_data),
+            'total_results': len(z_scores),
             'performance': {
                 'excellent': excellent,
                 'acceptable': acceptable, 
@@ -230,6 +275,8 @@ def get_statistics_api(lab_code):
 @stats_bp.route("/api/table-data")
 @login_required
 @lab_role_required("viewer")
+@replica_reads
+@conditional_stats()
 def get_table_data_api(lab_code):
     """
     API endpoint per ottenere i dati della tabella risultati con informazioni collegate
@@ -238,7 +285,7 @@ def get_table_data_api(lab_code):
         JSON: Lista dei risultati con dati delle tabelle collegate
     """
     try:
-        from app.models import Parameter, Technique, Provider, ZScore
+        from app.models import Parameter, Technique, Provider
         from datetime import datetime, timedelta
         
         # Parametri filtro dalla query string
@@ -248,59 +295,62 @@ def get_table_data_api(lab_code):
         days_limit = request.args.get('days', None)
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
-        
-        # Query base con JOIN per ottenere tutte le informazioni collegate
-        query = db.session.query(
-            Result.id,
-            Result.measured_value,
-            Result.uncertainty,
-            Result.submitted_at,
-            Result.notes,
-            ZScore.z.label('z_score'),
-            Parameter.name.label('parameter_name'),
-            Parameter.code.label('parameter_code'),
-            Technique.name.label('technique_name'),
-            Technique.code.label('technique_code'),
-            Cycle.name.label('cycle_name'),
-            Cycle.code.label('cycle_code'),
-            Provider.name.label('provider_name')
-        ).join(
-            ZScore, Result.id == ZScore.result_id
-        ).join(
-            Parameter, Result.parameter_code == Parameter.code
-        ).join(
-            Cycle, Result.cycle_code == Cycle.code
-        ).join(
-            Provider, Cycle.provider_id == Provider.id, isouter=True
-        ).join(
-            Technique, Result.technique_code == Technique.code, isouter=True
-        ).filter(
-            Result.lab_code == lab_code
-        )
-        
-        # Applica filtri
-        if parameter_codes:
-            query = query.filter(Result.parameter_code.in_(parameter_codes))
-        if technique_codes:
-            query = query.filter(Result.technique_code.in_(technique_codes))
-        if cycle_codes:
-            query = query.filter(Result.cycle_code.in_(cycle_codes))
-        if days_limit:
-            cutoff_date = datetime.utcnow() - timedelta(days=int(days_limit))
-            query = query.filter(Result.submitted_at >= cutoff_date)
-        
-        # Ordina per data di invio (più recenti per primi)
-        query = query.order_by(Result.submitted_at.desc())
-        
-        # Paginazione
-        total_count = query.count()
-        results = query.offset((page - 1) * per_page).limit(per_page).all()
+        cutoff_date = datetime.utcnow() - timedelta(days=int(days_limit)) if days_limit else None
+        
+        def build(Result, ZScore):
+            # Query base con JOIN per ottenere tutte le informazioni collegate
+            query = db.select(
+                Result.id,
+                as_float(Result.measured_value),
+                as_float(Result.uncertainty),
+                Result.submitted_at,
+                Result.notes,
+                as_float(ZScore.z, 'z_score'),
+                Parameter.name.label('parameter_name'),
+                Parameter.code.label('parameter_code'),
+                Technique.name.label('technique_name'),
+                Technique.code.label('technique_code'),
+                Cycle.name.label('cycle_name'),
+                Cycle.code.label('cycle_code'),
+                Provider.name.label('provider_name')
+            ).join(
+                ZScore, Result.id == ZScore.result_id
+            ).join(
+                Parameter, Result.parameter_code == Parameter.code
+            ).join(
+                Cycle, Result.cycle_code == Cycle.code
+            ).join(
+                Provider, Cycle.provider_id == Provider.id, isouter=True
+            ).join(
+                Technique, Result.technique_code == Technique.code, isouter=True
+            ).where(
+                Result.lab_code == lab_code
+            )
+            
+            # Applica filtri
+            if parameter_codes:
+                query = query.where(Result.parameter_code.in_(parameter_codes))
+            if technique_codes:
+                query = query.where(Result.technique_code.in_(technique_codes))
+            if cycle_codes:
+                query = query.where(Result.cycle_code.in_(cycle_codes))
+            if cutoff_date is not None:
+                query = query.where(Result.submitted_at >= cutoff_date)
+            return query
+        
+        rows = union_results(build, result_sources(lab_code, since=cutoff_date, cycle_codes=cycle_codes))
+        
+        # Paginazione, ordinando per data di invio (più recenti per primi)
+        total_count = db.session.scalar(db.select(func.count()).select_from(rows))
+        results = db.session.execute(
+            db.select(rows).order_by(rows.c.submitted_at.desc()).offset((page - 1) * per_page).limit(per_page)
+        ).all()
         
         # Formatta i risultati per la tabella
         table_data = []
         for row in results:
             # Determina la classe CSS del colore basata sul z-score
-            z_score = float(row.z_score) if row.z_score else 0
+            z_score = row.z_score or 0
             if abs(z_score) < 2:
                 performance_class = 'success'
                 performance_text = 'Eccellente'
@@ -320,8 +370,8 @@ def get_table_data_api(lab_code):
                 'cycle_code': row.cycle_code,
                 'cycle_name': row.cycle_name,
                 'provider_name': row.provider_name or 'Non specificato',
-                'measured_value': float(row.measured_value) if row.measured_value else 0,
-                'uncertainty': float(row.uncertainty) if row.uncertainty else None,
+                'measured_value': row.measured_value or 0,
+                'uncertainty': row.uncertainty or None,
                 'z_score': round(z_score, 3),
                 'performance_class': performance_class,
                 'performance_text': performance_text,
@@ -351,4 +401,70 @@ def get_table_data_api(lab_code):
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@stats_bp.route("/api/results", methods=["POST"])
+@api_token_required("analyst")
+def post_results_api(lab_code):
+    """
+    Invio di un lotto di risultati da un LIMS (token API, senza sessione)
+
+    Il corpo è un array JSON o NDJSON (Content-Type application/x-ndjson) di
+    oggetti con cycle_code, parameter_code, result_value e campi opzionali
+    uncertainty, technique_code, unit_code, date_performed. Con l'header
+    Idempotency-Key un reinvio dello stesso lotto restituisce la risposta
+    salvata senza elaborarlo di nuovo.
+
+    I risultati si aggiungono a quelli del laboratorio nel ciclo o li
+    correggono; con ?mode=replace il lotto sostituisce i risultati dei suoi
+    cicli e quelli assenti sono eliminati (conteggio in summary.deleted).
+
+    Returns:
+        JSON: Riepilogo e stato per elemento (200 se nessun elemento è rifiutato, altrimenti 422)
+    """
+    from app.blueprints.stats.uploads_stats import DEFAULT_UPLOAD_MODE, UPLOAD_MODES
+    from app.services.results_api import (
+        ApiBatchError, HashingReader, NDJSON_MIME_TYPES, collect_items, complete_idempotency_key,
+        iter_json_items, iter_ndjson_items, process_batch, release_idempotency_key, reserve_idempotency_key,
+    )
+
+    token = g.api_token
+    mode = request.args.get('mode', DEFAULT_UPLOAD_MODE)
+    if mode not in UPLOAD_MODES:
+        return jsonify({'success': False, 'error': f"mode non valido (ammessi: {', '.join(UPLOAD_MODES)})"}), 400
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if len(idempotency_key) > 255:
+        return jsonify({'success': False, 'error': "Idempotency-Key troppo lunga (massimo 255 caratteri)"}), 400
+
+    stream = HashingReader(request.stream)
+    items = iter_ndjson_items(stream) if request.mimetype in NDJSON_MIME_TYPES else iter_json_items(stream)
+    record = None
+    try:
+        df, item_errors = collect_items(items, current_app.config['API_BATCH_MAX_ITEMS'])
+        if idempotency_key:
+            # Lo stesso corpo con un'altra modalità è un lotto diverso
+            request_hash = stream.hexdigest()
+            if mode != DEFAULT_UPLOAD_MODE:
+                request_hash = hashlib.sha256(f"{mode}:{request_hash}".encode()).hexdigest()
+            record, replay = reserve_idempotency_key(lab_code, idempotency_key, request_hash)
+            if replay is not None:
+                response = current_app.response_class(replay.response_body, status=replay.response_code,
+                                                      mimetype='application/json')
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+    except ApiBatchError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+
+    try:
+        result = process_batch(df, item_errors, lab_code, token.user_id, f"api:{token.name}", mode=mode)
+    except Exception:
+        if record is not None:
+            release_idempotency_key(record)
+        raise
+
+    status_code = 422 if result['summary']['rejected'] else 200
+    body = {'success': status_code == 200, **result}
+    if record is not None:
+        complete_idempotency_key(record, body, status_code)
+    current_app.logger.info(f"API risultati {lab_code} (token {token.name}): {result['summary']}")
+    return jsonify(body), status_code
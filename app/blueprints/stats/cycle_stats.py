@@ -0,0 +1,345 @@
+"""
+Ricalcolo delle statistiche di un intero ciclo PT
+
+Per ogni risultato del ciclo si ricalcolano z, sz², z', zeta ed En con i valori
+di riferimento (xpt, sigma_pt, u_xpt) del ciclo (vedi scores_stats.py); per ogni parametro/laboratorio le PtStats
+(n_results, mean_z, rsz) e per ogni parametro il consenso robusto dei
+partecipanti (mediana e scarto tipo robusto MAD_K × MAD).
+
+I calcoli sono indipendenti per parametro: nei cicli grandi le righe, ordinate
+per parametro, vengono suddivise in blocchi di parametri ed elaborate in un
+pool di processi. Gli array di ingresso e le colonne dei punteggi stanno in
+memoria condivisa (multiprocessing.shared_memory): ai processi passano solo i
+nomi dei segmenti e gli estremi del blocco, non DataFrame serializzati.
+La scrittura sul database resta nel processo principale, in una transazione.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select, update, delete, insert
+
+from app import db
+from app.models import Result, ZScore, PtStats, CycleParameter
+from app.services.data_version import bump_data_version
+from app.services.history_store import refresh_labs
+from .services_stats import MAD_K
+from .scores_stats import SCORE_COLUMNS, compute_iso_scores, rounded_scores
+
+# Cifre decimali salvate (colonne Numeric(18, 6))
+SCORE_DECIMALS = 6
+
+# Blocchi di parametri per processo: bilancia parametri con molte o poche righe
+BLOCKS_PER_WORKER = 4
+
+
+def compute_parameter_block(values, xpt, sigma, lab_idx, param_idx, u_x=None, u_xpt=None):
+    """
+    Calcola punteggi e statistiche di un blocco di righe (parametri interi)
+
+    Args:
+        values: Valori misurati (float64)
+        xpt: Valore assegnato per riga
+        sigma: sigma_pt per riga
+        lab_idx: Indice del laboratorio per riga (int32)
+        param_idx: Indice del parametro per riga (int32)
+        u_x: Incertezza tipo dei risultati (NaN = non dichiarata), opzionale
+        u_xpt: Incertezza tipo del valore assegnato per riga, opzionale
+
+    Returns:
+        tuple: (scores, lab_stats, consensus)
+            - scores: dict di array per ogni colonna di SCORE_COLUMNS
+            - lab_stats: dict di array param/lab/n_results/mean_z/rsz
+            - consensus: dict di array param/n/median/robust_sd
+    """
+    import numpy as np
+    import pandas as pd
+
+    scores = compute_iso_scores(values, xpt, sigma, u_x=u_x, u_xpt=u_xpt)
+    z = scores['z']
+
+    frame = pd.DataFrame({'param': param_idx, 'lab': lab_idx, 'value': values, 'z': z})
+    keys = ['param', 'lab']
+    abs_dev = (frame['z'] - frame.groupby(keys, sort=False)['z'].transform('median')).abs()
+    grouped = frame[keys].assign(z=frame['z'], abs_dev=abs_dev).groupby(keys, sort=False).agg(
+        n_results=('z', 'size'), mean_z=('z', 'mean'), mad=('abs_dev', 'median')
+    )
+    n_results = grouped['n_results'].to_numpy()
+    lab_stats = {
+        'param': grouped.index.get_level_values('param').to_numpy(),
+        'lab': grouped.index.get_level_values('lab').to_numpy(),
+        'n_results': n_results,
+        'mean_z': grouped['mean_z'].to_numpy(),
+        # Come _calculate_statistics: rsz nullo con meno di due risultati
+        'rsz': np.where(n_results >= 2, MAD_K * grouped['mad'].to_numpy(), 0.0),
+    }
+
+    value_dev = (frame['value'] - frame.groupby('param', sort=False)['value'].transform('median')).abs()
+    by_param = frame[['param']].assign(value=frame['value'], dev=value_dev).groupby('param', sort=False).agg(
+        n=('value', 'size'), median=('value', 'median'), mad=('dev', 'median')
+    )
+    consensus = {
+        'param': by_param.index.to_numpy(),
+        'n': by_param['n'].to_numpy(),
+        'median': by_param['median'].to_numpy(),
+        'robust_sd': MAD_K * by_param['mad'].to_numpy(),
+    }
+    return scores, lab_stats, consensus
+
+
+# ===========================
+# MEMORIA CONDIVISA
+# ===========================
+
+class SharedArrays:
+    """
+    Array numpy in segmenti di memoria condivisa
+
+    Il processo che crea i segmenti li rimuove con unlink(); i processi del
+    pool vi accedono per nome con attach() e li chiudono con close().
+    """
+
+    def __init__(self, segments, arrays):
+        self._segments = segments
+        self.arrays = arrays
+
+    @classmethod
+    def create(cls, arrays):
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        segments, views = {}, {}
+        for name, array in arrays.items():
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+            view[...] = array
+            segments[name], views[name] = segment, view
+        return cls(segments, views)
+
+    @classmethod
+    def attach(cls, descriptor):
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        segments, views = {}, {}
+        for name, (segment_name, dtype, shape) in descriptor.items():
+            segment = shared_memory.SharedMemory(name=segment_name)
+            segments[name] = segment
+            views[name] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        return cls(segments, views)
+
+    @property
+    def descriptor(self):
+        """Nome del segmento, dtype e forma di ogni array (serializzabile)"""
+        return {name: (self._segments[name].name, view.dtype.str, view.shape) for name, view in self.arrays.items()}
+
+    def close(self):
+        self.arrays = {}
+        for segment in self._segments.values():
+            segment.close()
+
+    def unlink(self):
+        self.close()
+        for segment in self._segments.values():
+            segment.unlink()
+
+
+def _compute_shared_block(descriptor, start, stop):
+    """Elabora nel processo del pool le righe [start, stop) e scrive i punteggi in memoria condivisa"""
+    shared = SharedArrays.attach(descriptor)
+    try:
+        arrays = shared.arrays
+        scores, lab_stats, consensus = compute_parameter_block(
+            arrays['value'][start:stop], arrays['xpt'][start:stop], arrays['sigma'][start:stop],
+            arrays['lab'][start:stop], arrays['param'][start:stop],
+            u_x=arrays['u_x'][start:stop], u_xpt=arrays['u_xpt'][start:stop],
+        )
+        for name in SCORE_COLUMNS:
+            arrays[name][start:stop] = scores[name]
+        del arrays, scores
+        return lab_stats, consensus
+    finally:
+        shared.close()
+
+
+def _parameter_blocks(param_idx, n_blocks):
+    """Estremi [start, stop) di blocchi di parametri interi con righe circa uguali"""
+    import numpy as np
+
+    starts = np.flatnonzero(np.r_[True, param_idx[1:] != param_idx[:-1]])
+    targets = np.linspace(0, len(param_idx), n_blocks + 1)[1:-1]
+    cuts = starts[np.searchsorted(starts, targets)] if len(targets) else starts[:0]
+    bounds = np.unique(np.r_[0, cuts, len(param_idx)])
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def compute_cycle_scores(values, xpt, sigma, lab_idx, param_idx, u_x=None, u_xpt=None, workers=1):
+    """
+    Calcola punteggi e statistiche di un ciclo, in serie o in parallelo
+
+    Le righe devono essere ordinate per param_idx (i blocchi contengono parametri interi).
+
+    Args:
+        values, xpt, sigma, lab_idx, param_idx, u_x, u_xpt: Array riga per riga
+            (vedi compute_parameter_block)
+        workers: Processi del pool (1 = nello stesso processo)
+
+    Returns:
+        tuple: (scores, lab_stats, consensus) come compute_parameter_block
+    """
+    import multiprocessing
+    import numpy as np
+
+    n_params = len(np.unique(param_idx))
+    if workers <= 1 or n_params < 2:
+        return compute_parameter_block(values, xpt, sigma, lab_idx, param_idx, u_x=u_x, u_xpt=u_xpt)
+
+    workers = min(workers, n_params)
+    missing = np.full(len(values), np.nan)
+    shared = SharedArrays.create(dict(
+        {'value': values, 'xpt': xpt, 'sigma': sigma, 'lab': lab_idx, 'param': param_idx,
+         'u_x': missing if u_x is None else u_x, 'u_xpt': missing if u_xpt is None else u_xpt},
+        **{name: np.empty(len(values)) for name in SCORE_COLUMNS}
+    ))
+    try:
+        blocks = _parameter_blocks(param_idx, workers * BLOCKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            outputs = list(pool.map(_compute_shared_block, [shared.descriptor] * len(blocks),
+                                    *zip(*blocks)))
+        scores = {name: shared.arrays[name].copy() for name in SCORE_COLUMNS}
+    finally:
+        shared.unlink()
+
+    # I blocchi sono disgiunti per parametro: l'unione è una concatenazione
+    lab_stats = {key: np.concatenate([out[0][key] for out in outputs]) for key in outputs[0][0]}
+    consensus = {key: np.concatenate([out[1][key] for out in outputs]) for key in outputs[0][1]}
+    return scores, lab_stats, consensus
+
+
+# ===========================
+# RICALCOLO DEL CICLO
+# ===========================
+
+def _rounded(value):
+    return None if value is None else round(float(value), SCORE_DECIMALS)
+
+
+def _default_workers(n_rows):
+    config = current_app.config
+    if n_rows < config.get('STATS_PARALLEL_MIN_ROWS', 1000000):
+        return 1
+    return config.get('STATS_COMPUTE_WORKERS') or os.cpu_count() or 1
+
+
+def recompute_cycle_statistics(cycle_code, workers=None):
+    """
+    Ricalcola punteggi, PtStats e consenso robusto di tutti i risultati di un ciclo
+
+    Si aggiornano solo i punteggi cambiati; le PtStats del ciclo vengono
+    riscritte. I risultati di parametri senza xpt/sigma_pt validi nel ciclo
+    sono lasciati invariati.
+
+    Args:
+        cycle_code: Codice del ciclo
+        workers: Processi del pool (default: STATS_COMPUTE_WORKERS se il ciclo
+            ha almeno STATS_PARALLEL_MIN_ROWS righe, altrimenti 1)
+
+    Returns:
+        dict: Conteggi, processi usati, tempi e consenso per parametro
+    """
+    import time
+    import numpy as np
+
+    started = time.perf_counter()
+    references = {
+        code: (float(xpt), float(sigma), float(u_xpt) if u_xpt is not None else float('nan'))
+        for code, xpt, sigma, u_xpt in db.session.execute(
+            select(CycleParameter.parameter_code, CycleParameter.xpt, CycleParameter.sigma_pt, CycleParameter.u_xpt)
+            .where(CycleParameter.cycle_code == cycle_code)
+        ) if xpt is not None and sigma is not None and sigma > 0
+    }
+    rows = db.session.execute(
+        select(Result.id, Result.lab_code, Result.parameter_code, Result.measured_value, Result.uncertainty,
+               ZScore.id, *(getattr(ZScore, name) for name in SCORE_COLUMNS))
+        .outerjoin(ZScore, ZScore.result_id == Result.id)
+        .where(Result.cycle_code == cycle_code, Result.parameter_code.in_(list(references)))
+        .order_by(Result.parameter_code, Result.lab_code, Result.id)
+    ).all()
+    skipped = db.session.scalar(
+        select(func.count(Result.id)).where(Result.cycle_code == cycle_code,
+                                            Result.parameter_code.not_in(list(references)))
+    )
+    summary = {'cycle_code': cycle_code, 'results': len(rows), 'skipped': skipped,
+               'updated': 0, 'inserted': 0, 'pt_stats': 0, 'workers': 1, 'consensus': {}}
+    if not rows:
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+
+    result_ids, lab_codes, parameter_codes, measured, uncertainties, zscore_ids = list(zip(*rows))[:6]
+    labs, lab_idx = np.unique(np.array(lab_codes, dtype=object), return_inverse=True)
+    params, param_idx = np.unique(np.array(parameter_codes, dtype=object), return_inverse=True)
+    ref = np.array([references[code] for code in params]).reshape(-1, 3)
+    values = np.array(measured, dtype=np.float64)
+    u_x = np.array([np.nan if u is None else u for u in uncertainties], dtype=np.float64)
+
+    workers = workers or _default_workers(len(rows))
+    loaded = time.perf_counter()
+    scores, lab_stats, consensus = compute_cycle_scores(
+        values, ref[param_idx, 0], ref[param_idx, 1],
+        lab_idx.astype(np.int32), param_idx.astype(np.int32),
+        u_x=u_x, u_xpt=ref[param_idx, 2], workers=workers,
+    )
+    computed = time.perf_counter()
+
+    # Punteggi: aggiorna solo quelli cambiati, crea quelli mancanti
+    now = datetime.utcnow()
+    new_scores = rounded_scores(scores, SCORE_DECIMALS)
+    updates, inserts = [], []
+    for i, (result_id, zscore_id) in enumerate(zip(result_ids, zscore_ids)):
+        values_i = {name: new_scores[name][i] for name in SCORE_COLUMNS}
+        if zscore_id is None:
+            inserts.append(dict(values_i, result_id=result_id, created_at=now, updated_at=now))
+        elif tuple(_rounded(old) for old in rows[i][6:]) != tuple(values_i.values()):
+            updates.append(dict(values_i, id=zscore_id, updated_at=now))
+    if updates:
+        db.session.execute(update(ZScore), updates)
+    if inserts:
+        db.session.execute(insert(ZScore), inserts)
+
+    # PtStats del ciclo riscritte per intero
+    db.session.execute(delete(PtStats).where(PtStats.cycle_code == cycle_code)
+                       .execution_options(synchronize_session=False))
+    pt_stats = [
+        {'cycle_code': cycle_code, 'parameter_code': params[p], 'lab_code': labs[l], 'n_results': n,
+         'mean_z': round(mean_z, SCORE_DECIMALS), 'rsz': round(rsz, SCORE_DECIMALS),
+         'created_at': now, 'updated_at': now}
+        for p, l, n, mean_z, rsz in zip(lab_stats['param'].tolist(), lab_stats['lab'].tolist(),
+                                        lab_stats['n_results'].tolist(), lab_stats['mean_z'].tolist(),
+                                        lab_stats['rsz'].tolist())
+    ]
+    db.session.execute(insert(PtStats), pt_stats)
+
+    if updates or inserts:
+        bump_data_version(labs.tolist())
+    db.session.commit()
+    if updates or inserts:
+        refresh_labs(labs.tolist())
+
+    summary.update(
+        updated=len(updates), inserted=len(inserts), pt_stats=len(pt_stats), workers=workers,
+        consensus={
+            params[p]: {'n': n, 'median': round(median, SCORE_DECIMALS), 'robust_sd': round(sd, SCORE_DECIMALS)}
+            for p, n, median, sd in zip(consensus['param'].tolist(), consensus['n'].tolist(),
+                                        consensus['median'].tolist(), consensus['robust_sd'].tolist())
+        },
+        load_seconds=round(loaded - started, 3),
+        compute_seconds=round(computed - loaded, 3),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    current_app.logger.info(
+        f"Ricalcolo ciclo {cycle_code}: {len(rows)} risultati, {len(updates)} punteggi aggiornati, "
+        f"{len(inserts)} creati, {workers} processi, {summary['seconds']}s"
+    )
+    return summary
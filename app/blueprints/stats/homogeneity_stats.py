@@ -0,0 +1,319 @@
+"""
+Studi di omogeneità e stabilità dei campioni di un ciclo PT (ISO 13528, B.3-B.5)
+
+Il provider misura in replicato g campioni per ogni parametro del ciclo.
+
+- Omogeneità: ANOVA a una via (campione = fattore). Con N misure in g campioni
+  sw² = SSW / (N - g), MSB = SSB / (g - 1), n0 = (N - Σ nᵢ² / N) / (g - 1) e
+  ss² = max(0, (MSB - sw²) / n0). Il parametro è omogeneo se ss ≤ 0.3·σpt.
+- Stabilità: campioni misurati dopo il periodo di conservazione; il parametro
+  è stabile se |media stabilità - media omogeneità| ≤ 0.3·σpt.
+
+L'ANOVA è calcolata per tutti i parametri in un solo passaggio (np.bincount
+su indici di parametro e di campione), senza cicli Python per parametro.
+Un parametro non conforme blocca la pubblicazione del ciclo, come uno studio
+con dati insufficienti (omogeneità con meno di 2 campioni o senza repliche,
+stabilità senza studio di omogeneità), segnalato con un messaggio a parte.
+"""
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, delete, insert
+
+from app import db
+from app.models import SampleMeasurement, HomogeneityResult, CycleParameter
+
+# Criterio ISO 13528: ss (omogeneità) e differenza delle medie (stabilità) ≤ CRITERION_FACTOR·σpt
+CRITERION_FACTOR = 0.3
+
+STUDIES = ('homogeneity', 'stability')
+SAMPLE_COLUMNS = ['parameter_code', 'sample_id', 'value']
+OPTIONAL_SAMPLE_COLUMNS = ['replicate', 'study']
+
+# Cifre decimali salvate (colonne Numeric(18, 6))
+DECIMALS = 6
+
+
+def anova_by_parameter(values, param_idx, sample_idx, n_params=None):
+    """
+    ANOVA a una via tra/entro campione per tutti i parametri insieme
+
+    Args:
+        values: Valori misurati
+        param_idx: Indice del parametro di ogni misura (0..n_params-1)
+        sample_idx: Indice del campione di ogni misura, univoco tra i parametri
+            (stesso campione di parametri diversi = indici diversi)
+        n_params: Numero di parametri (default: max(param_idx) + 1)
+
+    Returns:
+        dict: Array per parametro n_samples, n_measurements, mean, sw, ss
+            (sw/ss NaN se servono almeno 2 campioni e una replica)
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    param_idx = np.asarray(param_idx, dtype=np.int64)
+    sample_idx = np.asarray(sample_idx, dtype=np.int64)
+    if n_params is None:
+        n_params = int(param_idx.max()) + 1 if len(param_idx) else 0
+
+    # Campioni: numero di misure, media e parametro di appartenenza
+    samples, sample_idx = np.unique(sample_idx, return_inverse=True)
+    n_i = np.bincount(sample_idx, minlength=len(samples)).astype(np.float64)
+    sample_mean = np.bincount(sample_idx, weights=values, minlength=len(samples)) / n_i
+    sample_param = np.zeros(len(samples), dtype=np.int64)
+    sample_param[sample_idx] = param_idx
+
+    # Parametri: misure, campioni, media generale
+    n = np.bincount(param_idx, minlength=n_params).astype(np.float64)
+    g = np.bincount(sample_param, minlength=n_params).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(param_idx, weights=values, minlength=n_params) / n
+
+        ssw = np.bincount(param_idx, weights=(values - sample_mean[sample_idx]) ** 2, minlength=n_params)
+        ssb = np.bincount(sample_param, weights=n_i * (sample_mean - mean[sample_param]) ** 2, minlength=n_params)
+        sum_n_i2 = np.bincount(sample_param, weights=n_i ** 2, minlength=n_params)
+
+        valid = (g >= 2) & (n > g)
+        msw = np.where(valid, ssw / (n - g), np.nan)
+        msb = np.where(valid, ssb / (g - 1), np.nan)
+        n0 = np.where(valid, (n - sum_n_i2 / n) / (g - 1), np.nan)
+        ss = np.sqrt(np.maximum(0.0, (msb - msw) / n0))
+
+    return {
+        'n_samples': g.astype(np.int64),
+        'n_measurements': n.astype(np.int64),
+        'mean': mean,
+        'sw': np.sqrt(msw),
+        'ss': ss,
+    }
+
+
+def read_sample_measurements(stream):
+    """
+    Legge e valida il CSV delle misure dei campioni
+
+    Colonne: parameter_code, sample_id, value; opzionali replicate (default:
+    progressivo per campione) e study ('homogeneity' o 'stability', default
+    'homogeneity').
+
+    Args:
+        stream: File o stream del CSV
+
+    Returns:
+        tuple: (DataFrame valido o None, lista di messaggi di errore per riga)
+    """
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(stream, dtype=str, keep_default_na=False)
+    except (ValueError, OSError) as e:
+        return None, [f"File non leggibile: {e}"]
+
+    df.columns = df.columns.str.strip().str.lower()
+    missing = [col for col in SAMPLE_COLUMNS if col not in df.columns]
+    if missing:
+        return None, [f"Colonne obbligatorie mancanti: {missing}"]
+
+    df = df[SAMPLE_COLUMNS + [col for col in OPTIONAL_SAMPLE_COLUMNS if col in df.columns]].copy()
+    for col in ['parameter_code', 'sample_id', 'study']:
+        if col in df.columns:
+            df[col] = df[col].str.strip()
+    if 'study' not in df.columns:
+        df['study'] = 'homogeneity'
+    df['study'] = df['study'].str.lower().replace('', 'homogeneity')
+    df['row'] = range(1, len(df) + 1)
+    df['value'] = pd.to_numeric(df['value'].str.replace(',', '.', regex=False), errors='coerce')
+
+    errors = []
+    checks = [
+        (df['parameter_code'] == '', "parameter_code mancante"),
+        (df['sample_id'] == '', "sample_id mancante"),
+        (df['value'].isna(), "value non numerico"),
+        (~df['study'].isin(STUDIES), f"study non valido (ammessi: {', '.join(STUDIES)})"),
+    ]
+    if 'replicate' in df.columns:
+        replicate = pd.to_numeric(df['replicate'], errors='coerce')
+        checks.append((df['replicate'].str.strip().ne('') & (replicate.isna() | (replicate < 1)),
+                       "replicate deve essere un intero positivo"))
+        df['replicate'] = replicate
+    else:
+        df['replicate'] = float('nan')
+    for mask, message in checks:
+        errors.extend(f"Riga {row}: {message}" for row in df.loc[mask, 'row'].tolist())
+    if errors:
+        return None, sorted(errors, key=lambda e: int(e.split(':')[0].split()[1]))
+
+    # Repliche non indicate: progressivo per studio/parametro/campione
+    progressive = df.groupby(['study', 'parameter_code', 'sample_id']).cumcount() + 1
+    df['replicate'] = df['replicate'].fillna(progressive).astype(int)
+    return df, []
+
+
+def store_sample_measurements(cycle_code, df):
+    """
+    Sostituisce le misure del ciclo per gli studi presenti nel file e rivaluta il ciclo
+
+    Args:
+        cycle_code: Codice del ciclo
+        df: DataFrame restituito da read_sample_measurements
+
+    Returns:
+        tuple: (lista dei risultati di evaluate_cycle, lista di errori); con errori nulla viene salvato
+    """
+    cycle_params = set(db.session.scalars(
+        select(CycleParameter.parameter_code).where(CycleParameter.cycle_code == cycle_code)
+    ))
+    unknown = df.loc[~df['parameter_code'].isin(cycle_params)]
+    if len(unknown):
+        return [], [f"Riga {row}: parametro {code} non associato al ciclo {cycle_code}"
+                    for row, code in zip(unknown['row'].tolist(), unknown['parameter_code'].tolist())]
+
+    studies = sorted(df['study'].unique().tolist())
+    db.session.execute(delete(SampleMeasurement)
+                       .where(SampleMeasurement.cycle_code == cycle_code, SampleMeasurement.study.in_(studies))
+                       .execution_options(synchronize_session=False))
+    now = datetime.utcnow()
+    db.session.execute(insert(SampleMeasurement), [
+        {'cycle_code': cycle_code, 'parameter_code': code, 'study': study, 'sample_id': sample,
+         'replicate': replicate, 'value': round(value, DECIMALS), 'created_at': now}
+        for code, study, sample, replicate, value in zip(
+            df['parameter_code'].tolist(), df['study'].tolist(), df['sample_id'].tolist(),
+            df['replicate'].tolist(), df['value'].tolist())
+    ])
+    return evaluate_cycle(cycle_code), []
+
+
+def evaluate_cycle(cycle_code):
+    """
+    Calcola omogeneità e stabilità di tutti i parametri del ciclo e salva i risultati
+
+    Args:
+        cycle_code: Codice del ciclo
+
+    Returns:
+        list: Un dict per parametro e studio (colonne di HomogeneityResult)
+    """
+    import numpy as np
+
+    sigma_pt = {
+        code: float(sigma) if sigma is not None else float('nan')
+        for code, sigma in db.session.execute(
+            select(CycleParameter.parameter_code, CycleParameter.sigma_pt)
+            .where(CycleParameter.cycle_code == cycle_code)
+        )
+    }
+    rows = db.session.execute(
+        select(SampleMeasurement.study, SampleMeasurement.parameter_code,
+               SampleMeasurement.sample_id, SampleMeasurement.value)
+        .where(SampleMeasurement.cycle_code == cycle_code)
+    ).all()
+
+    db.session.execute(delete(HomogeneityResult).where(HomogeneityResult.cycle_code == cycle_code)
+                       .execution_options(synchronize_session=False))
+    if not rows:
+        db.session.commit()
+        return []
+
+    studies, param_codes, sample_ids, measured = (np.array(col, dtype=object) for col in zip(*rows))
+    values = measured.astype(np.float64)
+    params, param_idx = np.unique(param_codes, return_inverse=True)
+    _, sample_idx = np.unique(param_codes + '\x00' + sample_ids, return_inverse=True)
+    sigma = np.array([sigma_pt.get(code, np.nan) for code in params])
+    criterion = CRITERION_FACTOR * sigma
+
+    is_homog = studies == 'homogeneity'
+    homog = anova_by_parameter(values[is_homog], param_idx[is_homog], sample_idx[is_homog], len(params))
+    stab = anova_by_parameter(values[~is_homog], param_idx[~is_homog], sample_idx[~is_homog], len(params))
+    with np.errstate(invalid='ignore'):
+        difference = np.abs(stab['mean'] - homog['mean'])
+        homog_passed = homog['ss'] <= criterion
+        stab_passed = difference <= criterion
+
+    now = datetime.utcnow()
+    results = []
+    for study, stats, passed, diff in (('homogeneity', homog, homog_passed, None),
+                                       ('stability', stab, stab_passed, difference)):
+        for p in np.flatnonzero(stats['n_measurements'] > 0).tolist():
+            results.append({
+                'cycle_code': cycle_code,
+                'parameter_code': params[p],
+                'study': study,
+                'n_samples': int(stats['n_samples'][p]),
+                'n_measurements': int(stats['n_measurements'][p]),
+                'mean': _rounded(stats['mean'][p]),
+                'sw': _rounded(stats['sw'][p]),
+                'ss': _rounded(stats['ss'][p]),
+                'difference': _rounded(diff[p]) if diff is not None else None,
+                'criterion': _rounded(criterion[p]),
+                'passed': bool(passed[p]),
+                'computed_at': now,
+            })
+    db.session.execute(insert(HomogeneityResult), results)
+    db.session.commit()
+    return results
+
+
+def insufficient_data(study, ss, difference):
+    """
+    Vero se lo studio non è valutabile per mancanza di dati
+
+    Args:
+        study: 'homogeneity' o 'stability'
+        ss: Dev. std. tra campioni (None se non calcolabile)
+        difference: |media stabilità - media omogeneità| (None se non calcolabile)
+
+    Returns:
+        bool: ss (omogeneità) o differenza delle medie (stabilità) mancante
+    """
+    return (ss if study == 'homogeneity' else difference) is None
+
+
+def publication_blockers(cycle_code):
+    """
+    Motivi per cui il ciclo non può essere pubblicato secondo gli studi sui campioni
+
+    Blocca ogni parametro con omogeneità o stabilità non conforme o con dati
+    insufficienti; se HOMOGENEITY_REQUIRED è attivo blocca anche i parametri
+    senza studio di omogeneità.
+
+    Args:
+        cycle_code: Codice del ciclo
+
+    Returns:
+        list: Messaggi (vuota se il ciclo è pubblicabile)
+    """
+    labels = {'homogeneity': "omogeneità", 'stability': "stabilità"}
+    missing = {
+        'homogeneity': "servono almeno 2 campioni con misure replicate",
+        'stability': "manca lo studio di omogeneità",
+    }
+    results = db.session.execute(
+        select(HomogeneityResult.parameter_code, HomogeneityResult.study, HomogeneityResult.passed,
+               HomogeneityResult.ss, HomogeneityResult.difference)
+        .where(HomogeneityResult.cycle_code == cycle_code)
+        .order_by(HomogeneityResult.parameter_code, HomogeneityResult.study)
+    ).all()
+    blockers = []
+    for code, study, passed, ss, difference in results:
+        if insufficient_data(study, ss, difference):
+            blockers.append(f"{code}: {labels[study]} con dati insufficienti ({missing[study]})")
+        elif not passed:
+            blockers.append(f"{code}: {labels[study]} non conforme")
+
+    if current_app.config.get('HOMOGENEITY_REQUIRED'):
+        evaluated = {code for code, study, *_ in results if study == 'homogeneity'}
+        blockers.extend(
+            f"{code}: studio di omogeneità mancante"
+            for code in db.session.scalars(
+                select(CycleParameter.parameter_code).where(CycleParameter.cycle_code == cycle_code)
+                .order_by(CycleParameter.parameter_code)
+            ) if code not in evaluated
+        )
+    return blockers
+
+
+def _rounded(value):
+    """Float arrotondato per il DB (None se NaN)"""
+    return None if value != value else round(float(value), DECIMALS)
@@ -0,0 +1,150 @@
+"""
+Query di sola lettura per le pagine Statistics
+Selezionano solo le colonne necessarie con join espliciti (niente entità ORM
+complete, niente lazy load per riga) e calcolano i riepiloghi direttamente in SQL
+"""
+
+from sqlalchemy import Float, case, cast, func
+
+from app import db
+from app.models import Parameter
+from app.services.archive import result_sources, union_results
+
+
+def as_float(column, name=None):
+    """
+    Colonna Numeric letta come float nativo (percorso di sola lettura per le analisi)
+
+    Le colonne Numeric(18, 6) restituiscono un decimal.Decimal per riga, poi
+    convertito con float(); il CAST in SQL fa arrivare dal driver direttamente
+    float (su SQLite anche per i valori interi che l'affinità NUMERIC salva
+    come INTEGER). Il Decimal resta dove serve il valore esatto (upload,
+    ricalcoli, export).
+
+    Args:
+        column: Colonna del modello (es. ZScore.z)
+        name: Nome della colonna nel risultato (default il nome della colonna)
+
+    Returns:
+        Label: CAST(column AS FLOAT) con etichetta
+    """
+    return cast(column, Float).label(name or column.key)
+
+
+class ResultRow:
+    """Riga leggera della tabella risultati (sostituisce le entità Result/ZScore)"""
+
+    __slots__ = (
+        'id', 'parameter_code', 'result_value', 'technique_code', 'unit_code',
+        'date_performed', 'z_score', 'sz2', 'rsz', 'performance_class'
+    )
+
+    def __init__(self, id, parameter_code, result_value, technique_code, unit_code,
+                 date_performed, z_score, sz2, rsz=None, performance_class=None):
+        self.id = id
+        self.parameter_code = parameter_code
+        self.result_value = result_value
+        self.technique_code = technique_code
+        self.unit_code = unit_code
+        self.date_performed = date_performed
+        self.z_score = z_score
+        self.sz2 = sz2
+        self.rsz = rsz  # RSZ non è nel modello ZScore
+        self.performance_class = performance_class
+
+
+def _recent_results_query(lab_code, limit):
+    """
+    Select degli ultimi risultati del laboratorio con z-score e unità
+
+    Con risultati archiviati gli ultimi `limit` di ciascuna tabella sono uniti
+    e ordinati di nuovo (ognuno letto sull'indice del laboratorio).
+
+    Args:
+        lab_code: Codice del laboratorio
+        limit: Numero massimo di righe
+
+    Returns:
+        Select: Query con le sole colonne usate dalla tabella risultati
+    """
+    def build(Result, ZScore):
+        latest = (
+            db.select(
+                Result.id,
+                Result.parameter_code,
+                Result.measured_value,
+                Result.technique_code,
+                Parameter.unit_code,
+                Result.submitted_at,
+                ZScore.z,
+                ZScore.sz2,
+            )
+            .outerjoin(ZScore, Result.id == ZScore.result_id)
+            .outerjoin(Parameter, Result.parameter_code == Parameter.code)
+            .where(Result.lab_code == lab_code)
+            .order_by(Result.submitted_at.desc())
+            .limit(limit)
+        )
+        # ORDER BY e LIMIT dentro un UNION richiedono una subquery
+        return db.select(latest.subquery())
+
+    recent = union_results(build, result_sources(lab_code))
+    return db.select(recent).order_by(recent.c.submitted_at.desc()).limit(limit)
+
+
+def fetch_recent_results(lab_code, limit=100):
+    """
+    Recupera gli ultimi risultati del laboratorio come righe leggere
+
+    Args:
+        lab_code: Codice del laboratorio
+        limit: Numero massimo di risultati (default 100)
+
+    Returns:
+        list[ResultRow]: Righe pronte per il template
+    """
+    rows = db.session.execute(_recent_results_query(lab_code, limit))
+    return [
+        ResultRow(id_, param_code, value, tech_code, unit_code or '', submitted_at, z, sz2)
+        for id_, param_code, value, tech_code, unit_code, submitted_at, z, sz2 in rows
+    ]
+
+
+def summarize_recent_results(lab_code, limit=100):
+    """
+    Statistiche riassuntive sugli ultimi risultati, calcolate in SQL
+
+    Args:
+        lab_code: Codice del laboratorio
+        limit: Finestra di risultati considerata (stessa della tabella)
+
+    Returns:
+        dict | None: Riepilogo z-score, None se non ci sono z-score
+    """
+    recent = _recent_results_query(lab_code, limit).subquery()
+    abs_z = func.abs(recent.c.z)
+
+    row = db.session.execute(
+        db.select(
+            func.count(),
+            func.count(recent.c.z),
+            func.avg(recent.c.z),
+            func.sum(case((abs_z < 2, 1), else_=0)),
+            func.sum(case(((abs_z >= 2) & (abs_z < 3), 1), else_=0)),
+            func.sum(case((abs_z >= 3, 1), else_=0)),
+            func.max(abs_z),
+        )
+    ).one()
+
+    total, z_count, mean_z, excellent, acceptable, poor, max_abs_z = row
+    if not z_count:
+        return None
+
+    return {
+        'total_results': total,
+        'mean_z': float(mean_z),
+        'excellent_count': int(excellent or 0),
+        'acceptable_count': int(acceptable or 0),
+        'poor_count': int(poor or 0),
+        'max_abs_z': float(max_abs_z or 0),
+    }
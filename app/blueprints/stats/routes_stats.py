@@ -3,19 +3,25 @@ Routes per il modulo Statistics
 Gestisce download template, upload risultati, visualizzazione dati e grafici
 """
 
-from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for, Response, current_app, render_template_string
+from flask import Blueprint, render_template, request, send_file, flash, redirect, url_for, Response, current_app, render_template_string, abort
 from flask_login import login_required, current_user
+from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename
 import io
 from datetime import datetime
-import pandas as pd
 
 from app import db
-from app.models import Lab, Cycle, Result, ZScore, PtStats, UploadFile, Technique, Parameter
+from app.models import Lab, Cycle, UploadFile, Technique, Parameter, JobLog
 from app.blueprints.auth.decorators import lab_role_required
 from app.blueprints.stats.services_stats import process_results_csv, generate_template_csv, get_control_chart_data
-import plotly.graph_objects as go
-import plotly.utils
+from app.blueprints.stats.queries_stats import as_float, fetch_recent_results, summarize_recent_results
+from app.blueprints.stats.uploads_stats import compute_content_hash, find_duplicate_upload, save_upload_rows
+from app.blueprints.stats.validation_stats import UploadValidationError, error_report_csv
+from app.services.read_replica import replica_reads
+from app.services.spreadsheet import XLSX_MIME_TYPE
+from app.services.data_version import bump_data_version
+from app.services.history_store import sync_lab
+from app.services.archive import distinct_options, result_sources
 import json
 
 # Blueprint già definito in __init__.py
@@ -75,7 +81,9 @@ def upload_results(lab_code):
     Upload e processamento dei risultati
     
     GET: Mostra form di upload
-    POST: Processa il file caricato e calcola statistiche
+    POST: Processa il file caricato e calcola statistiche. Le righe del file si
+    aggiungono ai risultati del ciclo (o li correggono); con replace=1 il file
+    sostituisce tutti i risultati del laboratorio nel ciclo.
     """
     if request.method == 'GET':
         return render_template('stats/upload_form.html', lab_code=lab_code)
@@ -93,49 +101,86 @@ def upload_results(lab_code):
             return redirect(request.url)
         
         # Verifica estensione file
-        if not file.filename.lower().endswith('.csv'):
-            flash("Solo file CSV sono supportati", "danger")
+        if not file.filename.lower().endswith(('.csv', '.xlsx')):
+            flash("Sono supportati solo file CSV ed Excel (.xlsx)", "danger")
             return redirect(request.url)
+        is_xlsx = file.filename.lower().endswith('.xlsx')
+        replace = request.form.get('replace') == '1'
         
         # Salva informazioni del file
         original_filename = secure_filename(file.filename)
-        file_size = len(file.read())
+        raw_content = file.read()
+        file_size = len(raw_content)
         file.seek(0)  # Reset stream position
+        content_hash = compute_content_hash(raw_content)
+        
+        # Trova o crea il ciclo corrente per associare i risultati
+        current_cycle = Cycle.query.filter_by(status='published').order_by(Cycle.created_at.desc()).first()
+        if current_cycle and current_cycle.archived_at:
+            flash(f"Il ciclo {current_cycle.code} è archiviato: non accetta nuovi risultati.", "danger")
+            return redirect(request.url)
+        if current_cycle and current_cycle.frozen_at:
+            flash(f"Il ciclo {current_cycle.code} è congelato: non accetta nuovi risultati.", "danger")
+            return redirect(request.url)
+        
+        # File identico all'ultimo upload elaborato: nessuna rielaborazione (la sostituzione
+        # può invece eliminare righe caricate da altri file, quindi va sempre confrontata)
+        duplicate = None if replace else find_duplicate_upload(
+            lab_code, current_cycle.code if current_cycle else None, content_hash
+        )
+        if duplicate:
+            flash(f"File identico a quello già caricato il {duplicate.uploaded_at.strftime('%d/%m/%Y %H:%M')}: "
+                  f"nessuna modifica.", "info")
+            return redirect(url_for('stats_bp.results_view', lab_code=lab_code))
         
         # Processa il CSV
-        df_clean, stats_summary = process_results_csv(file, lab_code)
+        df_clean, stats_summary = process_results_csv(file, lab_code, original_filename)
         
         # Salva record UploadFile
         upload_record = UploadFile(
-            filename=f"results_{lab_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            filename=f"results_{lab_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{'xlsx' if is_xlsx else 'csv'}",
             original_filename=original_filename,
             file_size=file_size,
-            mime_type='text/csv',
+            mime_type=XLSX_MIME_TYPE if is_xlsx else 'text/csv',
             lab_code=lab_code,
             uploaded_by=current_user.id,
             uploaded_at=datetime.utcnow(),
-            status='processed'
+            status='processed',
+            content_hash=content_hash
         )
-        
-        # Trova o crea il ciclo corrente per associare i risultati
-        current_cycle = Cycle.query.filter_by(status='published').order_by(Cycle.created_at.desc()).first()
         if current_cycle:
             upload_record.cycle_code = current_cycle.code
         
         db.session.add(upload_record)
         db.session.flush()  # Per ottenere l'ID
         
-        # Salva i risultati nel database
-        _save_results_to_db(df_clean, lab_code, upload_record.id, current_cycle)
+        # Salva i risultati nel database (solo le differenze con quelli presenti)
+        changes = _save_results_to_db(df_clean, lab_code, upload_record.id, current_cycle, replace=replace)
+        changed = changes['insert'] or changes['update'] or changes['delete']
+        if changed:
+            bump_data_version(lab_code)
         
         db.session.commit()
+        if changed:
+            sync_lab(lab_code, append_only=not (changes['update'] or changes['delete']))
         
-        flash(f"File processato con successo! {stats_summary['total_rows']} risultati caricati.", "success")
+        flash(f"File processato con successo! {stats_summary['total_rows']} risultati caricati "
+              f"({changes['insert']} nuovi, {changes['update']} modificati, {changes['delete']} rimossi, "
+              f"{changes['unchanged']} invariati).", "success")
         flash(f"Statistiche: Media Z-score = {stats_summary['mean_z_score']:.3f}, "
               f"Performance Eccellente = {stats_summary['percent_excellent']:.1f}%", "info")
         
         return redirect(url_for('stats_bp.results_view', lab_code=lab_code))
         
+    except UploadValidationError as e:
+        # Nessuna riga salvata: si conserva solo il report degli errori da scaricare
+        db.session.rollback()
+        job = _save_validation_report(lab_code, original_filename, e)
+        preview = "; ".join(f"riga {err['row']}: {err['error']}" for err in e.errors[:3])
+        flash(Markup(f"File non importato: {e.total} errori di validazione ({escape(preview)}{'; ...' if e.total > 3 else ''}). "
+                     f"<a href=\"{url_for('stats_bp.upload_errors', lab_code=lab_code, job_id=job.id)}\">"
+                     f"Scarica il report degli errori</a>"), "danger")
+        return redirect(request.url)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error uploading results for {lab_code}: {str(e)}")
@@ -143,6 +188,20 @@ def upload_results(lab_code):
         return redirect(request.url)
 
 
+@stats_bp.route("/upload/<int:job_id>/errors.csv")
+@login_required
+@lab_role_required("analyst")
+def upload_errors(lab_code, job_id):
+    """Report CSV degli errori di validazione di un upload rifiutato"""
+    job = JobLog.query.filter_by(id=job_id, job_type='upload_validation').first_or_404()
+    details = json.loads(job.details or '{}')
+    if details.get('lab_code') != lab_code:
+        abort(404)
+    return Response(error_report_csv(details.get('errors', [])), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=upload_{job_id}_errors.csv'
+    })
+
+
 @stats_bp.route("/results")
 @login_required
 @lab_role_required("viewer")
@@ -158,41 +217,12 @@ def results_view(lab_code):
     try:
         # Recupera gli ultimi risultati con Z-scores (limitiamo a 100 per performance)
         # Nota: PtStats sono statistiche aggregate, non collegate ai singoli risultati
-        results_query = db.session.query(Result, ZScore).join(
-            ZScore, Result.id == ZScore.result_id, isouter=True
-        ).filter(Result.lab_code == lab_code).order_by(Result.submitted_at.desc()).limit(100)
-        
-        results_data = results_query.all()
-        
-        # Prepara i dati per il template
-        results_list = []
-        for result, z_score in results_data:
-            result_dict = {
-                'id': result.id,
-                'parameter_code': result.parameter_code,
-                'result_value': result.measured_value,
-                'technique_code': result.technique_code,
-                'unit_code': result.parameter.unit.code if result.parameter and result.parameter.unit else '',
-                'date_performed': result.submitted_at,
-                'z_score': z_score.z if z_score else None,
-                'sz2': z_score.sz2 if z_score else None,
-                'rsz': None,  # RSZ non è nel modello ZScore
-                'performance_class': _get_performance_class(z_score.z if z_score else 0)
-            }
-            results_list.append(result_dict)
-        
-        # Calcola statistiche riassuntive
-        z_scores = [r['z_score'] for r in results_list if r['z_score'] is not None]
-        summary_stats = None
-        if z_scores:
-            summary_stats = {
-                'total_results': len(results_list),
-                'mean_z': sum(z_scores) / len(z_scores),
-                'excellent_count': sum(1 for z in z_scores if abs(z) < 2),
-                'acceptable_count': sum(1 for z in z_scores if 2 <= abs(z) < 3),
-                'poor_count': sum(1 for z in z_scores if abs(z) >= 3),
-                'max_abs_z': max(abs(z) for z in z_scores) if z_scores else 0
-            }
+        results_list = fetch_recent_results(lab_code, limit=100)
+        for row in results_list:
+            row.performance_class = _get_performance_class(row.z_score if row.z_score is not None else 0)
+        
+        # Statistiche riassuntive calcolate in SQL sulla stessa finestra
+        summary_stats = summarize_recent_results(lab_code, limit=100)
         
         return render_template('stats/results_table.html', 
                              lab_code=lab_code,
@@ -228,6 +258,7 @@ def control_charts(lab_code):
             selected_techs = form.techniques.data or []
             selected_cycles = form.cycles.data or []
             days = int(form.days.data) if form.days.data and form.days.data != '' else None
+            metric = form.metric.data or 'z'
             
             current_app.logger.info(f"Form submitted - Params: {selected_params}, Techs: {selected_techs}, Cycles: {selected_cycles}")
             
@@ -240,14 +271,15 @@ def control_charts(lab_code):
                     parameter_codes=selected_params,
                     technique_codes=selected_techs if selected_techs else None,
                     cycle_codes=selected_cycles if selected_cycles else None,
-                    limit_days=days
+                    limit_days=days,
+                    metric=metric
                 )
                 
                 current_app.logger.info(f"Chart data returned: {len(chart_data.get('x', []))} points")
                 
                 # Genera il grafico HTML usando Plotly Python
                 if chart_data and len(chart_data.get('x', [])) > 0:
-                    chart_html = generate_plotly_chart(chart_data, lab_code)
+                    chart_html = generate_plotly_chart(chart_data, lab_code, metric)
                 else:
                     # Debug: Verificare se ci sono dati senza filtro temporale
                     debug_data = get_control_chart_data(
@@ -255,7 +287,8 @@ def control_charts(lab_code):
                         parameter_codes=selected_params,
                         technique_codes=selected_techs if selected_techs else None,
                         cycle_codes=selected_cycles if selected_cycles else None,
-                        limit_days=None  # Nessun limite temporale
+                        limit_days=None,  # Nessun limite temporale
+                        metric=metric
                     )
                     current_app.logger.info(f"Debug query (no time limit): {len(debug_data.get('x', []))} points")
                     
@@ -266,21 +299,29 @@ def control_charts(lab_code):
             else:
                 flash("Seleziona almeno un parametro per visualizzare il grafico.", "info")
         
+        from .scores_stats import SCORE_METRICS
+        
         return render_template('stats/charts_simple.html',
                              lab_code=lab_code,
                              form=form,
                              chart_html=chart_html,
-                             chart_data=chart_data)
+                             chart_data=chart_data,
+                             metric=SCORE_METRICS.get(form.metric.data, SCORE_METRICS['z']))
         
     except Exception as e:
         current_app.logger.error(f"Error in control_charts for {lab_code}: {str(e)}")
         flash(f"Errore: {str(e)}", "danger")
         return redirect(url_for('main.lab_hub', lab_code=lab_code))
 
-def generate_plotly_chart(chart_data, lab_code):
-    """Genera il grafico Plotly lato server"""
+def generate_plotly_chart(chart_data, lab_code, metric='z'):
+    """Genera il grafico Plotly lato server (limiti e colori secondo il punteggio scelto)"""
     import plotly.graph_objects as go
-    import plotly.utils
+    from .scores_stats import SCORE_METRICS
+    
+    metric_info = SCORE_METRICS[metric]
+    label, warning, action = metric_info['label'], metric_info['warning'], metric_info['action']
+    performances = {'green': "✅ Eccellente", 'orange': "⚠️ Accettabile", 'red': "❌ Fuori Controllo"}
+    colors = chart_data.get('colors') or [get_point_color(value, warning, action) for value in chart_data['y']]
     
     # Crea il grafico
     fig = go.Figure()
@@ -295,14 +336,8 @@ def generate_plotly_chart(chart_data, lab_code):
         provider_name = chart_data.get('provider_names', ['N/A'] * len(chart_data['x']))[i] if i < len(chart_data.get('provider_names', [])) else 'N/A'
         
         # Determina la performance
-        z_val = chart_data['y'][i]
-        abs_z = abs(z_val)
-        if abs_z < 2:
-            performance = "✅ Eccellente"
-        elif abs_z < 3:
-            performance = "⚠️ Accettabile"
-        else:
-            performance = "❌ Fuori Controllo"
+        score = chart_data['y'][i]
+        performance = performances[colors[i]]
         
         hover_text = (
             f"<b>Data/Ora:</b> {chart_data['x'][i]}<br>"
@@ -310,7 +345,7 @@ def generate_plotly_chart(chart_data, lab_code):
             f"<b>Tecnica:</b> {technique_name}<br>"
             f"<b>Ciclo PT:</b> {cycle_name}<br>"
             f"<b>Provider:</b> {provider_name}<br>"
-            f"<b>Z-Score:</b> {z_val:.3f}<br>"
+            f"<b>{label}:</b> {score:.3f}<br>"
             f"<b>Performance:</b> {performance}"
         )
         hover_texts.append(hover_text)
@@ -320,9 +355,9 @@ def generate_plotly_chart(chart_data, lab_code):
         x=chart_data['x'],
         y=chart_data['y'],
         mode='markers+lines',
-        name='Z-Score',
+        name=label,
         marker=dict(
-            color=[get_point_color(z) for z in chart_data['y']],
+            color=colors,
             size=8,
             line=dict(color='white', width=1)
         ),
@@ -334,61 +369,62 @@ def generate_plotly_chart(chart_data, lab_code):
     # Linee di controllo
     x_range = [chart_data['x'][0], chart_data['x'][-1]]
     
-    # Limite superiore di controllo (+3σ)
+    # Limite superiore di azione
     fig.add_trace(go.Scatter(
         x=x_range,
-        y=[3, 3],
+        y=[action, action],
         mode='lines',
-        name='UCL (+3σ)',
+        name=f'UCL (+{action:g})',
         line=dict(color='red', dash='dash', width=2),
         hoverinfo='skip'
     ))
     
-    # Limite inferiore di controllo (-3σ)
+    # Limite inferiore di azione
     fig.add_trace(go.Scatter(
         x=x_range,
-        y=[-3, -3],
+        y=[-action, -action],
         mode='lines',
-        name='LCL (-3σ)',
+        name=f'LCL (-{action:g})',
         line=dict(color='red', dash='dash', width=2),
         hoverinfo='skip'
     ))
     
-    # Limiti di warning (±2σ)
-    fig.add_trace(go.Scatter(
-        x=x_range,
-        y=[2, 2],
-        mode='lines',
-        name='UWL (+2σ)',
-        line=dict(color='orange', dash='dot', width=1),
-        hoverinfo='skip'
-    ))
+    # Limiti di warning (assenti per En, che ha un solo limite)
+    if warning < action:
+        fig.add_trace(go.Scatter(
+            x=x_range,
+            y=[warning, warning],
+            mode='lines',
+            name=f'UWL (+{warning:g})',
+            line=dict(color='orange', dash='dot', width=1),
+            hoverinfo='skip'
+        ))
+        
+        fig.add_trace(go.Scatter(
+            x=x_range,
+            y=[-warning, -warning],
+            mode='lines',
+            name=f'LWL (-{warning:g})',
+            line=dict(color='orange', dash='dot', width=1),
+            hoverinfo='skip'
+        ))
     
-    fig.add_trace(go.Scatter(
-        x=x_range,
-        y=[-2, -2],
-        mode='lines',
-        name='LWL (-2σ)',
-        line=dict(color='orange', dash='dot', width=1),
-        hoverinfo='skip'
-    ))
-    
-    # Linea centrale (0σ)
+    # Linea centrale (0)
     fig.add_trace(go.Scatter(
         x=x_range,
         y=[0, 0],
         mode='lines',
-        name='CL (0σ)',
+        name='CL (0)',
         line=dict(color='green', width=2),
         hoverinfo='skip'
     ))
     
     # Layout del grafico
     fig.update_layout(
-        title=f'Control Chart Z-Score - Lab {lab_code}',
+        title=f'Control Chart {label} - Lab {lab_code}',
         xaxis_title='Data/Ora',
-        yaxis_title='Z-Score',
-        yaxis=dict(range=[-4, 4]),
+        yaxis_title=label,
+        yaxis=dict(range=[-(action + 1), action + 1]),
         height=500,
         showlegend=True,
         hovermode='closest'  # Cambiato da 'x unified' a 'closest' per hover individuale
@@ -397,12 +433,12 @@ def generate_plotly_chart(chart_data, lab_code):
     # Converti in HTML
     return fig.to_html(include_plotlyjs='cdn', div_id='chart')
 
-def get_point_color(z_score):
-    """Determina il colore del punto basato sul Z-score"""
+def get_point_color(z_score, warning=2, action=3):
+    """Determina il colore del punto basato sul punteggio e sui limiti"""
     abs_z = abs(z_score)
-    if abs_z >= 3:
+    if abs_z >= action:
         return 'red'
-    elif abs_z >= 2:
+    elif abs_z >= warning:
         return 'orange'
     else:
         return 'green'
@@ -421,23 +457,22 @@ def update_dependent_filters(lab_code):
         # Crea un nuovo form con le opzioni filtrate
         form = ChartsForm(lab_code=lab_code)
         
-        # Filtra tecniche basate sui parametri
+        # Filtra tecniche basate sui parametri (anche nei cicli archiviati)
         if selected_params:
-            techs = db.session.query(Result.technique_code, Technique.name)\
-                .join(Technique, Result.technique_code == Technique.code, isouter=True)\
-                .filter(Result.lab_code == lab_code, 
-                        Result.technique_code.isnot(None),
-                        Result.parameter_code.in_(selected_params))\
-                .distinct().all()
+            sources = result_sources(lab_code)
+            techs = distinct_options(lambda Result, ZScore: db.select(Result.technique_code, Technique.name)
+                                     .join(Technique, Result.technique_code == Technique.code, isouter=True)
+                                     .where(Result.lab_code == lab_code,
+                                            Result.technique_code.isnot(None),
+                                            Result.parameter_code.in_(selected_params)), sources)
             
             form.techniques.choices = [(t[0], f"{t[0]} - {t[1] or t[0]}") for t in techs]
             
             # Filtra cicli basati sui parametri
-            cycles = db.session.query(Result.cycle_code, Cycle.name)\
-                .join(Cycle, Result.cycle_code == Cycle.code)\
-                .filter(Result.lab_code == lab_code, 
-                        Result.parameter_code.in_(selected_params))\
-                .distinct().all()
+            cycles = distinct_options(lambda Result, ZScore: db.select(Result.cycle_code, Cycle.name)
+                                      .join(Cycle, Result.cycle_code == Cycle.code)
+                                      .where(Result.lab_code == lab_code,
+                                             Result.parameter_code.in_(selected_params)), sources)
                 
             form.cycles.choices = [(c[0], f"{c[0]} - {c[1] or c[0]}") for c in cycles]
         else:
@@ -497,17 +532,19 @@ def update_cycles(lab_code):
         form = ChartsForm(lab_code=lab_code)
         
         if selected_params:
-            # Query base filtrata per parametri
-            cycles_query = db.session.query(Result.cycle_code, Cycle.name)\
-                .join(Cycle, Result.cycle_code == Cycle.code)\
-                .filter(Result.lab_code == lab_code, 
-                        Result.parameter_code.in_(selected_params))
-            
-            # Filtra ulteriormente per tecniche se selezionate
-            if selected_techs:
-                cycles_query = cycles_query.filter(Result.technique_code.in_(selected_techs))
+            def cycles_query(Result, ZScore):
+                # Query base filtrata per parametri
+                query = db.select(Result.cycle_code, Cycle.name)\
+                    .join(Cycle, Result.cycle_code == Cycle.code)\
+                    .where(Result.lab_code == lab_code, 
+                           Result.parameter_code.in_(selected_params))
+                
+                # Filtra ulteriormente per tecniche se selezionate
+                if selected_techs:
+                    query = query.where(Result.technique_code.in_(selected_techs))
+                return query
             
-            cycles = cycles_query.distinct().all()
+            cycles = distinct_options(cycles_query, result_sources(lab_code))
             form.cycles.choices = [(c[0], f"{c[0]} - {c[1] or c[0]}") for c in cycles]
         else:
             form.cycles.choices = []
@@ -526,67 +563,52 @@ def update_cycles(lab_code):
         return f"<div class='text-danger'>Errore: {str(e)}</div>"
 
 
-def _save_results_to_db(df, lab_code, upload_file_id, cycle=None):
+def _save_results_to_db(df, lab_code, upload_file_id, cycle=None, replace=False):
     """
     Salva i risultati processati nel database
     
+    Il file viene confrontato con i risultati del lab nel ciclo: si scrivono
+    solo le righe nuove o modificate, e con replace si eliminano quelle assenti
+    dal file (vedi uploads_stats).
+    
     Args:
         df: DataFrame con i risultati calcolati
         lab_code: Codice laboratorio
         upload_file_id: ID del file di upload
         cycle: Oggetto Cycle corrente (opzionale)
+        replace: True se il file sostituisce tutti i risultati del lab nel ciclo
+        
+    Returns:
+        dict: Righe inserite, aggiornate, eliminate e invariate
     """
-    for _, row in df.iterrows():
-        try:
-            # Crea record Result
-            result = Result(
-                lab_code=lab_code,
-                parameter_code=row['parameter_code'],
-                result_value=float(row['result_value']),
-                technique_code=row.get('technique_code', ''),
-                unit_code=row.get('unit_code', ''),
-                date_performed=row.get('date_performed') or datetime.utcnow(),
-                upload_file_id=upload_file_id,
-                cycle_code=cycle.code if cycle else None,
-                user_id=current_user.id
-            )
-            db.session.add(result)
-            db.session.flush()  # Per ottenere l'ID
-            
-            # Crea record ZScore
-            z_score = ZScore(
-                result_id=result.id,
-                z=float(row['z_score']),
-                sz2=float(row['sz2'])
-            )
-            db.session.add(z_score)
-            
-            # Crea record PtStats (statistiche aggregate per ciclo/parametro/lab)
-            # Verifichiamo se esiste già per questo ciclo/parametro/lab
-            existing_stats = PtStats.query.filter_by(
-                cycle_code=result.cycle_code,
-                parameter_code=result.parameter_code,
-                lab_code=result.lab_code
-            ).first()
-            
-            if not existing_stats:
-                pt_stats = PtStats(
-                    cycle_code=result.cycle_code,
-                    parameter_code=result.parameter_code,
-                    lab_code=result.lab_code,
-                    n_results=1,
-                    mean_z=float(row['z_score']),
-                    rsz=float(row['rsz']) if row.get('rsz') else None
-                )
-                db.session.add(pt_stats)
-            else:
-                # Aggiorna le statistiche esistenti
-                existing_stats.n_results += 1
-                existing_stats.updated_at = datetime.utcnow()
-            
-        except Exception as e:
-            current_app.logger.error(f"Error saving result row: {str(e)}")
-            continue  # Continua con la prossima riga
+    return save_upload_rows(df, lab_code, upload_file_id, cycle.code if cycle else None, replace=replace)
+
+
+def _save_validation_report(lab_code, filename, error):
+    """
+    Salva in JobLog il report di un upload rifiutato dalla validazione
+    
+    Args:
+        lab_code: Codice laboratorio
+        filename: Nome del file caricato
+        error: UploadValidationError con gli errori per riga
+        
+    Returns:
+        JobLog: Record creato (l'id serve al download del report)
+    """
+    now = datetime.utcnow()
+    job = JobLog(
+        job_type='upload_validation',
+        status='failed',
+        started_at=now,
+        completed_at=now,
+        error_message=str(error),
+        details=json.dumps({'lab_code': lab_code, 'filename': filename, 'total': error.total,
+                            'errors': error.errors}),
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
 
 
 def _get_performance_class(z_score):
@@ -634,8 +656,25 @@ def _calculate_performance_score(z_score):
 
 # ==== ROUTE PER STATISTICHE GENERALI ====
 
+def _lab_z_rows(lab_code):
+    """
+    Coppie (parametro, z) di tutti i risultati del laboratorio, z None se non calcolato
+
+    Solo le due colonne, con z già float (niente entità Result/ZScore e Decimal per riga)
+    """
+    lab_results = []
+    for results, scores in result_sources(lab_code):
+        lab_results += db.session.execute(
+            db.select(results.parameter_code, as_float(scores.z))
+            .outerjoin(scores, results.id == scores.result_id)
+            .where(results.lab_code == lab_code)
+        ).all()
+    return lab_results
+
+
 @stats_general_bp.route("/general")
 @login_required
+@replica_reads
 def general_stats():
     """
     Statistiche generali di tutti i laboratori dell'utente
@@ -654,18 +693,16 @@ def general_stats():
         lab_stats = []
         
         for lab, role in user_labs:
-            # Statistiche per questo laboratorio
-            lab_results = db.session.query(Result, ZScore).join(
-                ZScore, Result.id == ZScore.result_id, isouter=True
-            ).filter(Result.lab_code == lab.code).all()
+            # Statistiche per questo laboratorio (tabelle calde e, se serve, di archivio)
+            lab_results = _lab_z_rows(lab.code)
             
             lab_total = len(lab_results)
-            lab_excellent = sum(1 for _, z in lab_results if z and abs(z.z) < 2)
-            lab_acceptable = sum(1 for _, z in lab_results if z and 2 <= abs(z.z) < 3)
-            lab_poor = sum(1 for _, z in lab_results if z and abs(z.z) >= 3)
+            lab_excellent = sum(1 for _, z in lab_results if z is not None and abs(z) < 2)
+            lab_acceptable = sum(1 for _, z in lab_results if z is not None and 2 <= abs(z) < 3)
+            lab_poor = sum(1 for _, z in lab_results if z is not None and abs(z) >= 3)
             
             # Calcola media z-score del lab
-            z_scores = [z.z for _, z in lab_results if z]
+            z_scores = [z for _, z in lab_results if z is not None]
             lab_mean_z = sum(z_scores) / len(z_scores) if z_scores else 0
             
             lab_stats.append({
@@ -709,6 +746,7 @@ def general_stats():
 @stats_bp.route("/general")
 @login_required
 @lab_role_required("viewer")
+@replica_reads
 def general_stats_lab(lab_code):
     """
     Statistiche generali per un singolo laboratorio
@@ -725,29 +763,26 @@ def general_stats_lab(lab_code):
                 user_role = lab_role.role
                 break
         
-        # Statistiche dettagliate del laboratorio
-        lab_results = db.session.query(Result, ZScore).join(
-            ZScore, Result.id == ZScore.result_id, isouter=True
-        ).filter(Result.lab_code == lab_code).all()
+        # Statistiche dettagliate del laboratorio (tabelle calde e, se serve, di archivio)
+        lab_results = _lab_z_rows(lab_code)
         
         total_results = len(lab_results)
-        excellent = sum(1 for _, z in lab_results if z and abs(z.z) < 2)
-        acceptable = sum(1 for _, z in lab_results if z and 2 <= abs(z.z) < 3)
-        poor = sum(1 for _, z in lab_results if z and abs(z.z) >= 3)
+        excellent = sum(1 for _, z in lab_results if z is not None and abs(z) < 2)
+        acceptable = sum(1 for _, z in lab_results if z is not None and 2 <= abs(z) < 3)
+        poor = sum(1 for _, z in lab_results if z is not None and abs(z) >= 3)
         
         # Z-scores per analisi temporali
-        z_scores = [z.z for _, z in lab_results if z]
+        z_scores = [z for _, z in lab_results if z is not None]
         mean_z = sum(z_scores) / len(z_scores) if z_scores else 0
         
         # Statistiche per parametri
         parameter_stats = {}
-        for result, z_score in lab_results:
-            if z_score:
-                param = result.parameter_code
+        for param, z_score in lab_results:
+            if z_score is not None:
                 if param not in parameter_stats:
                     parameter_stats[param] = {'count': 0, 'z_values': []}
                 parameter_stats[param]['count'] += 1
-                parameter_stats[param]['z_values'].append(z_score.z)
+                parameter_stats[param]['z_values'].append(z_score)
         
         # Calcola medie per parametro
         for param in parameter_stats:
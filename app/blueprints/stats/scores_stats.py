@@ -0,0 +1,115 @@
+"""
+Punteggi di prestazione ISO 13528 calcolati in modo vettoriale
+
+- z  = (x - xpt) / σpt
+- z' = (x - xpt) / √(σpt² + u(xpt)²)
+- ζ  = (x - xpt) / √(u(x)² + u(xpt)²)
+- En = (x - xpt) / √(U(x)² + U(xpt)²), con U = k·u (k = EN_COVERAGE_FACTOR)
+
+u(x) è Result.uncertainty (incertezza tipo del laboratorio), u(xpt) è
+CycleParameter.u_xpt. Se u(xpt) manca si considera trascurabile (z' = z);
+se manca u(x), ζ ed En non sono calcolabili e restano NULL. Con σpt nullo
+z e sz² non sono definiti (NaN), z' solo se u(xpt) è positiva.
+"""
+
+# Fattore di copertura delle incertezze estese usate da En
+EN_COVERAGE_FACTOR = 2.0
+
+# Punteggi selezionabili nei grafici: colonna di ZScore e limiti di
+# avvertimento/azione su |punteggio| (per En il solo limite |En| < 1)
+SCORE_METRICS = {
+    'z': {'column': 'z', 'label': 'Z-Score', 'warning': 2.0, 'action': 3.0},
+    'z_prime': {'column': 'z_prime', 'label': "Z'-Score", 'warning': 2.0, 'action': 3.0},
+    'zeta': {'column': 'zeta', 'label': 'Zeta-Score', 'warning': 2.0, 'action': 3.0},
+    'en': {'column': 'en', 'label': 'En', 'warning': 1.0, 'action': 1.0},
+}
+DEFAULT_METRIC = 'z'
+
+# Colonne di ZScore scritte per ogni risultato
+SCORE_COLUMNS = ('z', 'sz2', 'z_prime', 'zeta', 'en')
+
+
+def resolve_metric(name):
+    """
+    Restituisce la chiave e la definizione di un punteggio
+
+    Args:
+        name: Chiave in SCORE_METRICS (None o '' = DEFAULT_METRIC)
+
+    Returns:
+        tuple: (chiave, definizione)
+
+    Raises:
+        ValueError: Punteggio sconosciuto
+    """
+    key = name or DEFAULT_METRIC
+    if key not in SCORE_METRICS:
+        raise ValueError(f"Punteggio non supportato: {name} (ammessi: {', '.join(SCORE_METRICS)})")
+    return key, SCORE_METRICS[key]
+
+
+def compute_iso_scores(values, xpt, sigma_pt, u_x=None, u_xpt=None, coverage=EN_COVERAGE_FACTOR):
+    """
+    Calcola z, sz², z', ζ ed En per tutti i risultati in un solo passaggio
+
+    Args:
+        values: Valori misurati
+        xpt: Valori assegnati
+        sigma_pt: Deviazioni standard per la valutazione
+        u_x: Incertezze tipo dei risultati (NaN = non dichiarata), opzionale
+        u_xpt: Incertezze tipo dei valori assegnati (NaN = trascurabile), opzionale
+        coverage: Fattore di copertura k per En
+
+    Returns:
+        dict: Array numpy float per ogni colonna di SCORE_COLUMNS (NaN se non calcolabile)
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    deviation = values - np.asarray(xpt, dtype=float)
+    sigma_pt = np.asarray(sigma_pt, dtype=float)
+    u_x = np.full(values.shape, np.nan) if u_x is None else np.asarray(u_x, dtype=float)
+    u_xpt = np.zeros(values.shape) if u_xpt is None else np.nan_to_num(np.asarray(u_xpt, dtype=float), nan=0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(sigma_pt > 0, deviation / sigma_pt, np.nan)
+        z_prime_denominator = np.sqrt(sigma_pt ** 2 + u_xpt ** 2)
+        z_prime = np.where(z_prime_denominator > 0, deviation / z_prime_denominator, np.nan)
+        zeta_denominator = np.sqrt(u_x ** 2 + u_xpt ** 2)
+        zeta = np.where(zeta_denominator > 0, deviation / zeta_denominator, np.nan)
+    return {
+        'z': z,
+        'sz2': z ** 2,
+        'z_prime': z_prime,
+        'zeta': zeta,
+        'en': zeta / coverage,
+    }
+
+
+def score_classes(scores, metric=DEFAULT_METRIC):
+    """
+    Classi di prestazione dei punteggi: 0 = soddisfacente, 1 = avvertimento, 2 = azione
+
+    Args:
+        scores: Array di punteggi
+        metric: Chiave in SCORE_METRICS (definisce i limiti)
+
+    Returns:
+        ndarray: Classi int8
+    """
+    import numpy as np
+
+    limits = SCORE_METRICS[metric]
+    abs_scores = np.abs(np.asarray(scores, dtype=float))
+    return np.where(abs_scores < limits['warning'], 0, np.where(abs_scores < limits['action'], 1, 2)).astype(np.int8)
+
+
+def rounded_scores(scores, decimals=6):
+    """Punteggi arrotondati come liste Python (None al posto di NaN), pronte per il DB"""
+    import numpy as np
+
+    rounded = {}
+    for name in SCORE_COLUMNS:
+        column = np.round(scores[name], decimals)
+        rounded[name] = [None if value != value else value for value in column.tolist()]
+    return rounded
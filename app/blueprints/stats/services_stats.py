@@ -1,27 +1,58 @@
 """
 Services per il modulo Statistics
 Contiene la logica di calcolo z-score, sz², rsz usando pandas
+
+pandas e numpy sono importati all'interno delle funzioni: il loro costo di
+import si paga solo al primo calcolo, non all'avvio dei worker e dei comandi CLI
 """
 
-import pandas as pd
-import numpy as np
 from datetime import datetime
 from io import StringIO
 from flask import current_app
+from sqlalchemy import func
 from app import db
 from app.models import Lab, Cycle, CycleParameter, Parameter
+from app.services import query_diagnostics
+from app.services.spreadsheet import read_xlsx
+from app.services.unit_conversion import normalize_units
+from .validation_stats import MAX_REPORTED_ERRORS, UploadValidationError, validate_results
 
 # Costante per calcolo RSZ (Robust Z-Score)
 MAD_K = 1.4826
 
+# Righe lette per blocco nelle query dei grafici (streaming con yield_per)
+CHART_YIELD_PER = 2000
+
 
-def process_results_csv(file_stream, lab_code):
+def read_results_file(file_stream, filename=None):
     """
-    Processa un file CSV con risultati di laboratorio e calcola le statistiche
+    Legge un file di risultati (CSV o Excel) come DataFrame di stringhe
+    
+    I file .xlsx sono letti in streaming a blocchi di righe (vedi services/spreadsheet.py);
+    il risultato è identico a quello del CSV e segue la stessa validazione.
     
     Args:
-        file_stream: Stream del file CSV caricato
+        file_stream: Stream del file caricato
+        filename: Nome del file (l'estensione .xlsx sceglie il formato Excel; default CSV)
+        
+    Returns:
+        DataFrame: Valori come scritti nel file ('' per le celle vuote)
+    """
+    import pandas as pd
+    
+    if filename and filename.lower().endswith('.xlsx'):
+        return read_xlsx(file_stream)
+    return pd.read_csv(file_stream, dtype=str, keep_default_na=False)
+
+
+def process_results_csv(file_stream, lab_code, filename=None):
+    """
+    Processa un file CSV o Excel con risultati di laboratorio e calcola le statistiche
+    
+    Args:
+        file_stream: Stream del file caricato
         lab_code: Codice del laboratorio
+        filename: Nome del file caricato (per riconoscere i file .xlsx)
         
     Returns:
         tuple: (df_clean, stats_summary)
@@ -30,10 +61,13 @@ def process_results_csv(file_stream, lab_code):
             
     Raises:
         ValueError: Se mancano colonne obbligatorie o dati non validi
+        UploadValidationError: Righe non valide rispetto all'anagrafica (con il report per riga)
     """
+    import pandas as pd
+    
     try:
-        # Leggi il CSV
-        df = pd.read_csv(file_stream)
+        # Leggi il file come testo: la validazione vede i valori come scritti nel file
+        df = read_results_file(file_stream, filename)
         
         # Pulisci i nomi delle colonne
         df.columns = df.columns.str.strip().str.lower()
@@ -44,10 +78,19 @@ def process_results_csv(file_stream, lab_code):
         if missing_cols:
             raise ValueError(f"Missing required columns: {missing_cols}")
         
-        # Pulizia e conversione dei dati
-        df["result_value"] = pd.to_numeric(df["result_value"], errors="coerce")
+        # Validazione in blocco contro l'anagrafica, prima di qualsiasi scrittura
+        df["row"] = range(1, len(df) + 1)
+        errors = validate_results(df)
+        if errors:
+            raise UploadValidationError(errors[:MAX_REPORTED_ERRORS], total=len(errors))
         
-        # Rimuovi righe con valori NaN in result_value
+        # Conversione dei dati
+        df["parameter_code"] = df["parameter_code"].str.strip()
+        df["result_value"] = pd.to_numeric(df["result_value"].str.strip(), errors="coerce")
+        if "uncertainty" in df.columns:
+            df["uncertainty"] = pd.to_numeric(df["uncertainty"].str.strip(), errors="coerce")
+        
+        # Rimuovi le righe del template senza result_value
         initial_rows = len(df)
         df.dropna(subset=["result_value"], inplace=True)
         final_rows = len(df)
@@ -57,7 +100,12 @@ def process_results_csv(file_stream, lab_code):
         
         # Log delle righe rimosse
         if initial_rows != final_rows:
-            current_app.logger.info(f"Removed {initial_rows - final_rows} rows with invalid result_value")
+            current_app.logger.info(f"Removed {initial_rows - final_rows} rows without result_value")
+        
+        # Valori e incertezze nell'unità del parametro (fattori dalla matrice di conversione in cache)
+        converted = normalize_units(df)
+        if converted:
+            current_app.logger.info(f"Converted {converted} rows to the parameter unit")
         
         # Recupera valori XPT e SPT dal database
         df = _add_reference_values(df, lab_code)
@@ -70,6 +118,9 @@ def process_results_csv(file_stream, lab_code):
         
         return df, stats_summary
         
+    except UploadValidationError as e:
+        current_app.logger.info(f"Upload rejected for lab {lab_code}: {e}")
+        raise
     except Exception as e:
         current_app.logger.error(f"Error processing CSV for lab {lab_code}: {str(e)}")
         raise
@@ -94,19 +145,19 @@ def _add_reference_values(df, lab_code):
         # Usa valori di default se non ci sono cicli pubblicati
         df["xpt"] = 100.0  # Valore di riferimento di default
         df["spt"] = 5.0    # Deviazione standard di default
+        df["u_xpt"] = None
         return df
     
     # Crea un mapping parameter_code -> (xpt, spt)
     reference_values = {}
     
-    cycle_params = CycleParameter.query.filter_by(cycle_id=latest_cycle.id).all()
+    cycle_params = CycleParameter.query.filter_by(cycle_code=latest_cycle.code).all()
     for cycle_param in cycle_params:
-        if cycle_param.parameter:
-            param_code = cycle_param.parameter.code
-            reference_values[param_code] = {
-                'xpt': cycle_param.assigned_xpt or 100.0,  # Default se None
-                'spt': cycle_param.assigned_spt or 5.0     # Default se None
-            }
+        reference_values[cycle_param.parameter_code] = {
+            'xpt': float(cycle_param.xpt) if cycle_param.xpt is not None else 100.0,  # Default se None
+            'spt': float(cycle_param.sigma_pt) if cycle_param.sigma_pt else 5.0,      # Default se None
+            'u_xpt': float(cycle_param.u_xpt) if cycle_param.u_xpt is not None else None
+        }
     
     # Applica i valori di riferimento
     def get_xpt(param_code):
@@ -117,25 +168,38 @@ def _add_reference_values(df, lab_code):
     
     df["xpt"] = df["parameter_code"].map(get_xpt)
     df["spt"] = df["parameter_code"].map(get_spt)
+    df["u_xpt"] = df["parameter_code"].map(lambda code: reference_values.get(code, {}).get('u_xpt'))
     
     return df
 
 
 def _calculate_statistics(df):
     """
-    Calcola z-score, sz², rsz per ogni risultato
+    Calcola z-score, sz², z', zeta, En e rsz per ogni risultato
     
     Args:
-        df: DataFrame con result_value, xpt, spt
+        df: DataFrame con result_value, xpt, spt (opzionali uncertainty e u_xpt)
         
     Returns:
         DataFrame: DataFrame con colonne statistiche aggiunte
     """
-    # Calcolo Z-score
-    df["z_score"] = (df["result_value"] - df["xpt"]) / df["spt"]
+    import pandas as pd
+    import numpy as np
+    from .scores_stats import compute_iso_scores
     
-    # Calcolo SZ² (Squared Z-score)
-    df["sz2"] = df["z_score"] ** 2
+    # Punteggi ISO 13528 in un solo passaggio vettoriale (z', zeta, En usano le incertezze)
+    scores = compute_iso_scores(
+        df["result_value"].to_numpy(dtype=float),
+        df["xpt"].to_numpy(dtype=float),
+        df["spt"].to_numpy(dtype=float),
+        u_x=df["uncertainty"].to_numpy(dtype=float) if "uncertainty" in df.columns else None,
+        u_xpt=df["u_xpt"].to_numpy(dtype=float) if "u_xpt" in df.columns else None,
+    )
+    df["z_score"] = scores["z"]
+    df["sz2"] = scores["sz2"]
+    df["z_prime"] = scores["z_prime"]
+    df["zeta"] = scores["zeta"]
+    df["en"] = scores["en"]
     
     # Calcolo RSZ (Robust Z-score) per gruppo di parametri
     def calculate_rsz_group(group):
@@ -210,6 +274,8 @@ def generate_template_csv(lab_code):
     Returns:
         str: Contenuto CSV come stringa
     """
+    import pandas as pd
+    
     try:
         # Recupera il ciclo pubblicato più recente
         latest_cycle = Cycle.query.filter_by(status='published').order_by(Cycle.created_at.desc()).first()
@@ -219,17 +285,19 @@ def generate_template_csv(lab_code):
             template_data = {
                 'parameter_code': ['NH4', 'NO3', 'TOC', 'pH'],
                 'result_value': ['', '', '', ''],
+                'uncertainty': ['', '', '', ''],
                 'technique_code': ['', '', '', ''],
                 'unit_code': ['mg/L', 'mg/L', 'mg/L', 'units'],
                 'date_performed': ['', '', '', '']
             }
         else:
             # Template basato sui parametri del ciclo
-            cycle_params = CycleParameter.query.filter_by(cycle_id=latest_cycle.id).all()
+            cycle_params = CycleParameter.query.filter_by(cycle_code=latest_cycle.code).all()
             
             template_data = {
                 'parameter_code': [],
                 'result_value': [],
+                'uncertainty': [],
                 'technique_code': [],
                 'unit_code': [],
                 'date_performed': [],
@@ -241,11 +309,12 @@ def generate_template_csv(lab_code):
                 if cp.parameter:
                     template_data['parameter_code'].append(cp.parameter.code)
                     template_data['result_value'].append('')  # Campo da riempire
+                    template_data['uncertainty'].append('')  # Incertezza tipo u(x), opzionale
                     template_data['technique_code'].append('')
                     template_data['unit_code'].append(cp.parameter.unit.code if cp.parameter.unit else '')
                     template_data['date_performed'].append('')
-                    template_data['assigned_xpt'].append(cp.assigned_xpt or '')
-                    template_data['assigned_spt'].append(cp.assigned_spt or '')
+                    template_data['assigned_xpt'].append(cp.xpt if cp.xpt is not None else '')
+                    template_data['assigned_spt'].append(cp.sigma_pt if cp.sigma_pt is not None else '')
         
         # Crea DataFrame e converti in CSV
         df_template = pd.DataFrame(template_data)
@@ -261,15 +330,16 @@ def generate_template_csv(lab_code):
     except Exception as e:
         current_app.logger.error(f"Error generating template CSV for lab {lab_code}: {str(e)}")
         # Template di fallback
-        fallback_template = """parameter_code,result_value,technique_code,unit_code,date_performed
-NH4,,ICP-MS,mg/L,
-NO3,,IC,mg/L,
-TOC,,TOC-V,mg/L,
-pH,,Electrode,units,"""
+        fallback_template = """parameter_code,result_value,uncertainty,technique_code,unit_code,date_performed
+NH4,,,ICP-MS,mg/L,
+NO3,,,IC,mg/L,
+TOC,,,TOC-V,mg/L,
+pH,,,Electrode,units,"""
         return fallback_template
 
 
-def get_control_chart_data(lab_code, parameter_codes=None, limit_days=30, technique_codes=None, cycle_codes=None):
+def get_control_chart_data(lab_code, parameter_codes=None, limit_days=30, technique_codes=None, cycle_codes=None,
+                           compact=False, metric='z'):
     """
     Recupera i dati per i grafici di controllo con filtri multipli
     
@@ -279,97 +349,218 @@ def get_control_chart_data(lab_code, parameter_codes=None, limit_days=30, techni
         limit_days: Limite giorni per i dati (default 30)
         technique_codes: Lista codici tecniche (opzionale)
         cycle_codes: Lista codici cicli (opzionale)
+        compact: Se True restituisce il formato compatto (vedi _compact_chart_payload)
+        metric: Punteggio sull'asse y, chiave di SCORE_METRICS (z, z_prime, zeta, en)
         
     Returns:
         dict: Dati formattati per Plotly con nomi completi
+        
+    Raises:
+        ValueError: Punteggio non supportato
     """
-    from app.models import Result, ZScore, Technique, Provider
+    import pandas as pd
+    import numpy as np
+    from app.models import Technique, Provider
+    from app.services.archive import result_sources, union_results
+    from app.services.history_store import history_columns
+    from app.services.snapshots import frozen_snapshots, lab_columns
     from datetime import datetime, timedelta
+    from .queries_stats import as_float
+    from .scores_stats import resolve_metric, score_classes
     
-    # Query con join per ottenere nomi completi
-    query = db.session.query(
-        ZScore, 
-        Result, 
-        Parameter, 
-        Technique, 
-        Cycle, 
-        Provider
-    ).join(
-        Result, ZScore.result_id == Result.id
-    ).outerjoin(
-        Parameter, Result.parameter_code == Parameter.code
-    ).outerjoin(
-        Technique, Result.technique_code == Technique.code  
-    ).outerjoin(
-        Cycle, Result.cycle_code == Cycle.code
-    ).outerjoin(
-        Provider, Cycle.provider_id == Provider.id
-    ).filter(Result.lab_code == lab_code)
-    
-    # Applica filtri multipli
-    if parameter_codes:
-        query = query.filter(Result.parameter_code.in_(parameter_codes))
-    
-    if technique_codes:
-        query = query.filter(Result.technique_code.in_(technique_codes))
-        
-    if cycle_codes:
-        query = query.filter(Result.cycle_code.in_(cycle_codes))
+    metric, metric_info = resolve_metric(metric)
     
     # Filtra per data se limit_days specificato
+    cutoff_date = None
     if limit_days is not None and limit_days > 0:
         cutoff_date = datetime.utcnow() - timedelta(days=limit_days)
-        query = query.filter(Result.submitted_at >= cutoff_date)
-    
-    # Debug: Log della query
-    from flask import current_app
-    try:
-        current_app.logger.info(f"Query SQL: {str(query.statement.compile(compile_kwargs={'literal_binds': True}))}")
-    except Exception:
-        current_app.logger.info(f"Query being executed for lab_code={lab_code}, parameters={parameter_codes}")
-    
-    # Ordina per data
-    results = query.order_by(Result.submitted_at).all()
-    
-    current_app.logger.info(f"Query returned {len(results)} results")
     
-    if not results:
-        # Debug: Verifica se esistono dati di base per questi parametri
-        basic_query = db.session.query(Result).filter(Result.lab_code == lab_code)
-        if parameter_codes:
-            basic_query = basic_query.filter(Result.parameter_code.in_(parameter_codes))
-        basic_results = basic_query.all()
-        current_app.logger.info(f"Basic query (only Results) returned {len(basic_results)} results")
+    def build(Result, ZScore):
+        # Query a colonne con join per ottenere nomi completi (niente entità ORM, punteggi già float)
+        score_column = getattr(ZScore, metric_info['column'])
+        query = db.select(
+            Result.submitted_at,
+            as_float(score_column),
+            Result.parameter_code,
+            func.coalesce(Parameter.name, 'N/A'),
+            func.coalesce(Technique.name, 'N/A'),
+            func.coalesce(Cycle.name, 'N/A'),
+            func.coalesce(Provider.name, 'N/A'),
+        ).select_from(ZScore).join(
+            Result, ZScore.result_id == Result.id
+        ).outerjoin(
+            Parameter, Result.parameter_code == Parameter.code
+        ).outerjoin(
+            Technique, Result.technique_code == Technique.code  
+        ).outerjoin(
+            Cycle, Result.cycle_code == Cycle.code
+        ).outerjoin(
+            Provider, Cycle.provider_id == Provider.id
+        ).where(Result.lab_code == lab_code)
+        
+        # z', zeta ed En mancano dove non c'è l'incertezza: quei risultati non si disegnano
+        if metric != 'z':
+            query = query.where(score_column.isnot(None))
         
-        # Verifica se ci sono ZScore associati
-        zscore_query = db.session.query(ZScore).join(Result).filter(Result.lab_code == lab_code)
+        # Applica filtri multipli
         if parameter_codes:
-            zscore_query = zscore_query.filter(Result.parameter_code.in_(parameter_codes))
-        zscore_results = zscore_query.all()
-        current_app.logger.info(f"ZScore query returned {len(zscore_results)} results")
+            query = query.where(Result.parameter_code.in_(parameter_codes))
         
+        if technique_codes:
+            query = query.where(Result.technique_code.in_(technique_codes))
+            
+        if cycle_codes:
+            query = query.where(Result.cycle_code.in_(cycle_codes))
+        
+        if cutoff_date is not None:
+            query = query.where(Result.submitted_at >= cutoff_date)
+        return query
+    
+    snapshots = frozen_snapshots(cycle_codes)
+    if snapshots is not None:
+        # Solo cicli congelati: colonne dagli snapshot in memory map, nessuna query
+        rows = lab_columns(snapshots, lab_code, parameter_codes, technique_codes, since=cutoff_date,
+                           not_null=None if metric == 'z' else metric_info['column'])
+    else:
+        # Storico del laboratorio in memory map, se configurato e aggiornato (altrimenti None)
+        rows = history_columns(lab_code, metric_info['column'], parameter_codes, technique_codes, cycle_codes,
+                               since=cutoff_date)
+    if rows is not None:
+        submitted, z_values = rows['submitted_at'], rows[metric_info['column']]
+        param_codes, param_names, tech_names, cycle_names, provider_names = (
+            ['N/A' if value is None else value for value in rows[name].tolist()]
+            for name in ('parameter_code', 'parameter_name', 'technique_name', 'cycle_name', 'provider_name')
+        )
+    else:
+        # Cicli archiviati solo se la finestra arriva fin lì; ordina per data e legge a blocchi
+        results = union_results(build, result_sources(lab_code, since=cutoff_date, cycle_codes=cycle_codes))
+        query = db.select(results).order_by(results.c.submitted_at).execution_options(yield_per=CHART_YIELD_PER)
+        columns = _fetch_columns(query, n_columns=7)
+        submitted, z_values, param_codes, param_names, tech_names, cycle_names, provider_names = columns
+    
+    # Diagnostica solo se attiva e campionata (compilazione SQL e conteggi extra)
+    if rows is None and query_diagnostics.should_sample():
+        details = {'lab_code': lab_code, 'parameters': parameter_codes, 'metric': metric, 'rows': len(z_values)}
+        if not z_values:
+            details.update(_count_lab_results(lab_code, parameter_codes))
+        query_diagnostics.record('chart_data', query, **details)
+    
+    if compact:
+        return _compact_chart_payload(submitted, z_values, metric, {
+            "parameter_codes": param_codes,
+            "parameter_names": param_names,
+            "technique_names": tech_names,
+            "cycle_names": cycle_names,
+            "provider_names": provider_names,
+        })
+    
+    if not len(z_values):
         return {"x": [], "y": [], "parameter_codes": [], "parameter_names": [], "technique_names": [], "cycle_names": [], "provider_names": []}
     
+    # Conversioni vettoriali: date formattate da pandas, punteggi in array float, colori da numpy
+    x_values = pd.DatetimeIndex(submitted).strftime('%Y-%m-%d %H:%M')
+    y_array = np.fromiter(z_values, dtype=float, count=len(z_values))
+    colors = np.asarray(CHART_COLORS)[score_classes(y_array, metric)]
+    
     # Prepara i dati per il grafico con nomi completi
     chart_data = {
-        "x": [result.Result.submitted_at.strftime('%Y-%m-%d %H:%M') if result.Result else 'N/A' for result in results],
-        "y": [float(result.ZScore.z) for result in results],
-        "parameter_codes": [result.Result.parameter_code if result.Result else 'N/A' for result in results],
-        "parameter_names": [result.Parameter.name if result.Parameter else 'N/A' for result in results],
-        "technique_names": [result.Technique.name if result.Technique else 'N/A' for result in results],
-        "cycle_names": [result.Cycle.name if result.Cycle else 'N/A' for result in results],
-        "provider_names": [result.Provider.name if result.Provider else 'N/A' for result in results],
-        "colors": []
+        "x": pd.Series(x_values).fillna('N/A').tolist(),
+        "y": y_array.tolist(),
+        "parameter_codes": param_codes,
+        "parameter_names": param_names,
+        "technique_names": tech_names,
+        "cycle_names": cycle_names,
+        "provider_names": provider_names,
+        "colors": colors.tolist()
     }
     
-    # Assegna colori basati sui valori z
-    for z_val in chart_data["y"]:
-        abs_z = abs(z_val)
-        if abs_z < 2:
-            chart_data["colors"].append("green")
-        elif abs_z < 3:
-            chart_data["colors"].append("orange") 
-        else:
-            chart_data["colors"].append("red")
+    return chart_data
+
+
+CHART_COLORS = ["green", "orange", "red"]
+
+
+def _compact_chart_payload(submitted, z_values, metric, labels):
+    """
+    Formato compatto dei dati grafico: array numerici e nomi codificati a dizionario
+    
+    Le colonne testuali (che si ripetono su ogni punto) diventano indici in una
+    tabella di lookup; le date sono millisecondi epoch (UTC, al minuto) e i
+    colori indici in CHART_COLORS (secondo i limiti del punteggio). Gli array
+    restano numpy: li serializza il provider JSON dell'app (vedi app/services/json_encoding.py).
+    
+    Args:
+        submitted: Lista di datetime dei risultati
+        z_values: Lista di punteggi
+        metric: Chiave del punteggio in SCORE_METRICS
+        labels: Dizionario nome colonna -> lista di etichette
+        
+    Returns:
+        dict: {"format": "compact", "x", "y", "colors", <colonne>, "dictionaries"}
+    """
+    import pandas as pd
+    import numpy as np
+    from .scores_stats import score_classes
+    
+    n = len(z_values)
+    x_ms = pd.DatetimeIndex(submitted).floor('min').as_unit('ms').asi8 if n else np.empty(0, dtype=np.int64)
+    y_array = np.fromiter(z_values, dtype=float, count=n)
+    payload = {
+        "format": "compact",
+        "x": x_ms,
+        "y": y_array,
+        "colors": score_classes(y_array, metric),
+        "dictionaries": {"colors": CHART_COLORS},
+    }
+    for name, values in labels.items():
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        payload[name] = codes.astype(np.int32)
+        payload["dictionaries"][name] = uniques.tolist()
+    return payload
+
+
+def _count_lab_results(lab_code, parameter_codes=None):
+    """
+    Conteggi diagnostici per capire perché un grafico è vuoto
+    
+    Args:
+        lab_code: Codice del laboratorio
+        parameter_codes: Lista codici parametri (opzionale)
+        
+    Returns:
+        dict: Numero di Result e di ZScore del laboratorio per i parametri richiesti
+    """
+    from app.models import Result, ZScore
+    
+    results_count = db.select(func.count(Result.id)).where(Result.lab_code == lab_code)
+    zscores_count = db.select(func.count(ZScore.id)).join(
+        Result, ZScore.result_id == Result.id
+    ).where(Result.lab_code == lab_code)
+    if parameter_codes:
+        results_count = results_count.where(Result.parameter_code.in_(parameter_codes))
+        zscores_count = zscores_count.where(Result.parameter_code.in_(parameter_codes))
     
-    return chart_data
\ No newline at end of file
+    return {
+        'lab_results': db.session.scalar(results_count),
+        'lab_zscores': db.session.scalar(zscores_count),
+    }
+
+
+def _fetch_columns(query, n_columns):
+    """
+    Esegue una select in streaming e la traspone in liste per colonna
+    
+    Args:
+        query: Select con execution_options(yield_per=...)
+        n_columns: Numero di colonne selezionate
+        
+    Returns:
+        list[list]: Una lista di valori per ogni colonna, nell'ordine della select
+    """
+    columns = [[] for _ in range(n_columns)]
+    result = db.session.execute(query)
+    for partition in result.partitions():
+        # zip(*) traspone il blocco di righe in colonne in un solo passaggio
+        for column, values in zip(columns, zip(*partition)):
+            column.extend(values)
+    return columns
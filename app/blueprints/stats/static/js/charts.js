@@ -121,6 +121,9 @@ function updateChart() {
     selectedTechniques.forEach(t => params.append('techniques[]', t));
     selectedCycles.forEach(c => params.append('cycles[]', c));
     if (daysFilter) params.append('days', daysFilter);
+    const metricFilter = document.getElementById('metric-filter');
+    if (metricFilter && metricFilter.value) params.append('metric', metricFilter.value);
+    params.append('format', 'compact');
     
     // Costruisci URL API
     const apiUrl = `/l/${window.labCode}/stats/api/chart-data?${params.toString()}`;
@@ -130,7 +133,7 @@ function updateChart() {
         .then(data => {
             if (data.success) {
                 // Aggiorna il grafico con i nuovi dati
-                updatePlotlyChart(data.data);
+                updatePlotlyChart(decodeCompactChartData(data.data), data.metric);
                 
                 // Aggiorna le statistiche con i filtri correnti
                 updateStatistics();
@@ -155,8 +158,28 @@ function updateChart() {
         });
 }
 
+// Decodifica il formato compatto (indici nei dizionari, date in ms epoch UTC)
+function decodeCompactChartData(chartData) {
+    if (chartData.format !== 'compact') {
+        return chartData;
+    }
+    const dictionaries = chartData.dictionaries;
+    const decoded = {
+        x: chartData.x.map(ms => new Date(ms).toISOString().slice(0, 16).replace('T', ' ')),
+        y: chartData.y
+    };
+    Object.keys(dictionaries).forEach(name => {
+        decoded[name] = chartData[name].map(i => dictionaries[name][i]);
+    });
+    return decoded;
+}
+
+// Punteggio di default (z-score) se l'API non indica il punteggio
+const DEFAULT_METRIC = { key: 'z', label: 'Z-Score', warning: 2, action: 3 };
+
 // Funzione per aggiornare il grafico Plotly
-function updatePlotlyChart(chartData) {
+function updatePlotlyChart(chartData, metric) {
+    metric = metric || DEFAULT_METRIC;
     const chartDiv = document.getElementById('control-chart');
     
     if (!chartData.x || chartData.x.length === 0) {
@@ -183,14 +206,14 @@ function updatePlotlyChart(chartData) {
         y: chartData.y,
         mode: 'markers+lines',
         type: 'scatter',
-        name: 'Z-Score',
+        name: metric.label,
         marker: {
             color: chartData.colors,
             size: 8,
             line: { color: 'rgba(0,0,0,0.3)', width: 1 }
         },
         line: { width: 2, color: 'rgba(31,119,180,0.8)' },
-        hovertemplate: '<b>%{text}</b><br>Z-Score: %{y:.3f}<br>Data: %{x}<extra></extra>',
+        hovertemplate: `<b>%{text}</b><br>${metric.label}: %{y:.3f}<br>Data: %{x}<extra></extra>`,
         text: chartData.parameter_codes
     };
     
@@ -201,20 +224,20 @@ function updatePlotlyChart(chartData) {
     if (xRange.length > 0) {
         traces.push({
             x: [xRange[0], xRange[xRange.length-1]],
-            y: [3, 3],
+            y: [metric.action, metric.action],
             mode: 'lines',
             type: 'scatter',
-            name: 'Limite +3σ',
+            name: `Limite +${metric.action}`,
             line: { color: 'red', width: 2, dash: 'dash' },
             hoverinfo: 'skip'
         });
         
         traces.push({
             x: [xRange[0], xRange[xRange.length-1]],
-            y: [-3, -3],
+            y: [-metric.action, -metric.action],
             mode: 'lines',
             type: 'scatter',
-            name: 'Limite -3σ',
+            name: `Limite -${metric.action}`,
             line: { color: 'red', width: 2, dash: 'dash' },
             hoverinfo: 'skip'
         });
@@ -224,7 +247,7 @@ function updatePlotlyChart(chartData) {
             y: [0, 0],
             mode: 'lines',
             type: 'scatter',
-            name: 'Target (z=0)',
+            name: 'Target (0)',
             line: { color: 'green', width: 1, dash: 'dot' },
             hoverinfo: 'skip'
         });
@@ -232,7 +255,7 @@ function updatePlotlyChart(chartData) {
     
     const layout = {
         title: {
-            text: 'Control Chart - Z-Score nel Tempo',
+            text: `Control Chart - ${metric.label} nel Tempo`,
             font: { size: 16, color: '#333' }
         },
         xaxis: {
@@ -241,7 +264,7 @@ function updatePlotlyChart(chartData) {
             gridcolor: 'rgba(128,128,128,0.2)'
         },
         yaxis: {
-            title: 'Z-Score',
+            title: metric.label,
             zeroline: true,
             zerolinecolor: 'rgba(0,0,0,0.3)',
             gridcolor: 'rgba(128,128,128,0.2)'
@@ -0,0 +1,276 @@
+"""
+Deduplicazione e ricaricamento idempotente degli upload di risultati
+
+- Ogni file caricato ha un hash SHA-256 del contenuto (UploadFile.content_hash):
+  un file identico all'ultimo upload elaborato per lo stesso lab e ciclo non
+  viene rielaborato.
+- Un file viene confrontato riga per riga con i risultati già presenti del lab
+  nel ciclo: si inseriscono le righe nuove, si aggiornano quelle modificate e si
+  ricalcolano le PtStats dei soli parametri toccati. Le righe assenti dal file
+  restano (upload parziali o a lotti); solo in modalità sostituzione, scelta
+  esplicitamente, il file diventa l'insieme completo e le righe assenti sono eliminate.
+
+Le righe si identificano con (parameter_code, technique_code, occorrenza):
+l'occorrenza è la posizione della riga tra quelle con la stessa coppia,
+nell'ordine del file (per i risultati presenti, in ordine di inserimento).
+"""
+
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+
+from app import db
+from app.models import Result, ZScore, PtStats, UploadFile
+from .scores_stats import SCORE_COLUMNS
+
+# Cifre decimali confrontate (colonne Numeric(18, 6))
+VALUE_DECIMALS = 6
+
+# Modalità di salvataggio: 'merge' aggiunge o corregge le righe del file, 'replace'
+# elimina anche i risultati del lab nel ciclo assenti dal file
+UPLOAD_MODES = ('merge', 'replace')
+DEFAULT_UPLOAD_MODE = 'merge'
+
+
+def compute_content_hash(raw_bytes):
+    """
+    Calcola l'hash del contenuto di un file caricato
+
+    I fine riga sono normalizzati: lo stesso CSV salvato con CRLF o LF ha lo stesso hash.
+
+    Args:
+        raw_bytes: Contenuto del file
+
+    Returns:
+        str: Digest SHA-256 esadecimale
+    """
+    normalized = raw_bytes.replace(b'\r\n', b'\n').rstrip(b'\n')
+    return hashlib.sha256(normalized).hexdigest()
+
+
+def find_duplicate_upload(lab_code, cycle_code, content_hash):
+    """
+    Verifica se il file è identico all'ultimo upload elaborato del lab e ciclo
+
+    Il confronto è solo con l'ultimo upload: ricaricare un file più vecchio
+    dopo una correzione è a sua volta una correzione.
+
+    Returns:
+        UploadFile | None: L'ultimo upload, se ha lo stesso contenuto
+    """
+    latest = UploadFile.query.filter_by(
+        lab_code=lab_code, cycle_code=cycle_code, status='processed'
+    ).order_by(UploadFile.id.desc()).first()
+    if latest is not None and latest.content_hash == content_hash:
+        return latest
+    return None
+
+
+def _row_key(parameter_code, technique_code):
+    # Tecnica assente: None sia dal DB sia dal file (dove pandas usa NaN)
+    return parameter_code, technique_code if isinstance(technique_code, str) and technique_code else None
+
+
+def _rounded(value):
+    """Valore arrotondato come nel DB (None per valori mancanti o NaN)"""
+    if value is None or value != value:
+        return None
+    return round(float(value), VALUE_DECIMALS)
+
+
+def _previous_rows(lab_code, cycle_code):
+    """Risultati presenti del lab nel ciclo: chiave -> (result_id, valore, incertezza, punteggi, submitted_at)"""
+    rows = db.session.execute(
+        select(Result.id, Result.parameter_code, Result.technique_code, Result.measured_value,
+               Result.uncertainty, Result.submitted_at, *(getattr(ZScore, name) for name in SCORE_COLUMNS))
+        .outerjoin(ZScore, ZScore.result_id == Result.id)
+        .where(Result.lab_code == lab_code, Result.cycle_code == cycle_code)
+        .order_by(Result.id)
+    ).all()
+    previous, occurrences = {}, {}
+    for result_id, parameter_code, technique_code, value, uncertainty, submitted_at, *scores in rows:
+        base = _row_key(parameter_code, technique_code)
+        n = occurrences[base] = occurrences.get(base, -1) + 1
+        previous[base + (n,)] = (
+            result_id,
+            _rounded(value),
+            _rounded(uncertainty),
+            tuple(_rounded(score) for score in scores),
+            submitted_at,
+        )
+    return previous
+
+
+def _new_rows(df):
+    """Righe del file: chiave -> (valore, incertezza, punteggi, data eseguita o None)"""
+    import pandas as pd
+
+    techniques = df['technique_code'] if 'technique_code' in df.columns else pd.Series(None, index=df.index)
+    techniques = techniques.where(techniques.astype(str).str.strip().ne('') & techniques.notna(), None)
+    dates = pd.to_datetime(df['date_performed'], errors='coerce') if 'date_performed' in df.columns \
+        else pd.Series(pd.NaT, index=df.index)
+    uncertainties = df['uncertainty'] if 'uncertainty' in df.columns else pd.Series(None, index=df.index)
+    score_columns = [df['z_score' if name == 'z' else name] for name in SCORE_COLUMNS]
+
+    rows, occurrences = {}, {}
+    for parameter_code, technique_code, value, uncertainty, performed, *scores in zip(
+            df['parameter_code'], techniques, df['result_value'], uncertainties, dates, *score_columns):
+        base = _row_key(parameter_code, technique_code)
+        n = occurrences[base] = occurrences.get(base, -1) + 1
+        rows[base + (n,)] = (
+            _rounded(value),
+            _rounded(uncertainty),
+            tuple(_rounded(score) for score in scores),
+            None if pd.isna(performed) else performed.to_pydatetime(),
+        )
+    return rows
+
+
+def diff_upload(previous, new, replace=False):
+    """
+    Confronta i risultati presenti con le righe del nuovo file
+    
+    Args:
+        previous: Righe da _previous_rows
+        new: Righe da _new_rows
+        replace: True se il file sostituisce tutti i risultati (le righe assenti sono da eliminare)
+        
+    Returns:
+        dict: Chiavi 'insert', 'update', 'delete', 'unchanged' (liste di chiavi)
+    """
+    diff = {'insert': [], 'update': [], 'delete': [], 'unchanged': []}
+    for key, (value, uncertainty, scores, performed) in new.items():
+        old = previous.get(key)
+        if old is None:
+            diff['insert'].append(key)
+        elif (old[1], old[2], old[3]) != (value, uncertainty, scores) or (performed is not None and performed != old[4]):
+            diff['update'].append(key)
+        else:
+            diff['unchanged'].append(key)
+    if replace:
+        diff['delete'] = [key for key in previous if key not in new]
+    return diff
+
+
+def save_upload_rows(df, lab_code, upload_file_id, cycle_code, replace=False):
+    """
+    Scrive i risultati di un upload applicando solo le differenze con quelli presenti
+
+    Args:
+        df: DataFrame elaborato da process_results_csv
+        lab_code: Codice laboratorio
+        upload_file_id: ID del nuovo UploadFile (già nel DB)
+        cycle_code: Ciclo dei risultati
+        replace: True per sostituire i risultati del lab nel ciclo (elimina le righe assenti dal file)
+
+    Returns:
+        dict: Numero di righe inserite, aggiornate, eliminate e invariate
+    """
+    previous = _previous_rows(lab_code, cycle_code)
+    new = _new_rows(df)
+    diff = diff_upload(previous, new, replace=replace)
+    now = datetime.utcnow()
+
+    # Righe invariate: passano al nuovo upload, che ne diventa il riferimento
+    unchanged_ids = [previous[key][0] for key in diff['unchanged']]
+    if unchanged_ids:
+        db.session.execute(
+            update(Result).where(Result.id.in_(unchanged_ids)).values(upload_file_id=upload_file_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    for key in diff['update']:
+        result_id = previous[key][0]
+        value, uncertainty, scores, performed = new[key]
+        values = {'measured_value': value, 'uncertainty': uncertainty, 'upload_file_id': upload_file_id,
+                  'updated_at': now}
+        if performed is not None:
+            values['submitted_at'] = performed
+        db.session.execute(update(Result).where(Result.id == result_id).values(**values)
+                           .execution_options(synchronize_session=False))
+        db.session.execute(update(ZScore).where(ZScore.result_id == result_id)
+                           .values(updated_at=now, **dict(zip(SCORE_COLUMNS, scores)))
+                           .execution_options(synchronize_session=False))
+
+    deleted_ids = [previous[key][0] for key in diff['delete']]
+    if deleted_ids:
+        db.session.execute(delete(ZScore).where(ZScore.result_id.in_(deleted_ids))
+                           .execution_options(synchronize_session=False))
+        db.session.execute(delete(Result).where(Result.id.in_(deleted_ids))
+                           .execution_options(synchronize_session=False))
+
+    for key in diff['insert']:
+        parameter_code, technique_code, _ = key
+        value, uncertainty, scores, performed = new[key]
+        result = Result(
+            lab_code=lab_code,
+            cycle_code=cycle_code,
+            parameter_code=parameter_code,
+            technique_code=technique_code,
+            measured_value=value,
+            uncertainty=uncertainty,
+            submitted_at=performed or now,
+            upload_file_id=upload_file_id,
+        )
+        result.zscore = ZScore(**dict(zip(SCORE_COLUMNS, scores)))
+        db.session.add(result)
+    db.session.flush()
+
+    touched = {key[0] for name in ('insert', 'update', 'delete') for key in diff[name]}
+    _refresh_pt_stats(lab_code, cycle_code, touched)
+
+    return {name: len(keys) for name, keys in diff.items()}
+
+
+def _refresh_pt_stats(lab_code, cycle_code, parameter_codes):
+    """
+    Ricalcola n_results, mean_z e rsz delle PtStats dei parametri modificati
+
+    Le statistiche si calcolano su tutti i risultati del laboratorio nel ciclo
+    per quei parametri (non solo sulle righe del file), come il ricalcolo del ciclo.
+    """
+    import pandas as pd
+    from .queries_stats import as_float
+    from .services_stats import MAD_K
+
+    if not parameter_codes:
+        return
+
+    frame = pd.DataFrame(db.session.execute(
+        select(Result.parameter_code, as_float(ZScore.z))
+        .outerjoin(ZScore, ZScore.result_id == Result.id)
+        .where(Result.lab_code == lab_code, Result.cycle_code == cycle_code,
+               Result.parameter_code.in_(parameter_codes))
+    ).all(), columns=['parameter_code', 'z'])
+    frame['abs_dev'] = (frame['z'] - frame.groupby('parameter_code')['z'].transform('median')).abs()
+    aggregates = frame.groupby('parameter_code').agg(
+        n_results=('parameter_code', 'size'), n_z=('z', 'count'), mean_z=('z', 'mean'), mad=('abs_dev', 'median')
+    )
+    existing = {
+        stats.parameter_code: stats for stats in PtStats.query.filter(
+            PtStats.lab_code == lab_code, PtStats.cycle_code == cycle_code,
+            PtStats.parameter_code.in_(parameter_codes)
+        )
+    }
+    counted = set()
+    for parameter_code, n_results, n_z, mean_z, mad in aggregates.itertuples():
+        counted.add(parameter_code)
+        mean_z = None if n_z == 0 else float(mean_z)
+        # Come _calculate_statistics e il ricalcolo del ciclo: rsz nullo con meno di due punteggi
+        rsz = None if n_z == 0 else (MAD_K * float(mad) if n_z >= 2 else 0.0)
+        stats = existing.get(parameter_code)
+        if stats is None:
+            db.session.add(PtStats(
+                cycle_code=cycle_code, parameter_code=parameter_code, lab_code=lab_code,
+                n_results=int(n_results), mean_z=mean_z, rsz=rsz,
+            ))
+        else:
+            stats.n_results = int(n_results)
+            stats.mean_z = mean_z
+            stats.rsz = rsz
+            stats.updated_at = datetime.utcnow()
+
+    # Parametri rimasti senza risultati
+    for parameter_code in set(existing) - counted:
+        db.session.delete(existing[parameter_code])
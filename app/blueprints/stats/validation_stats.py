@@ -0,0 +1,152 @@
+"""
+Validazione dei file di risultati contro l'anagrafica, prima di ogni scrittura
+
+Tutte le righe del file sono verificate insieme, per colonna:
+
+- result_value e uncertainty numerici (uncertainty non negativa); le righe con
+  result_value vuoto sono righe del template non compilate e vengono ignorate
+- parameter_code e technique_code presenti in anagrafica: una sola query IN
+  per tabella sui codici distinti del file, appartenenza con Series.isin
+- unit_code a catalogo e convertibile nell'unità del parametro
+- result_value entro Parameter.min_value/max_value e con al più
+  Parameter.precision_digits decimali: limiti in array per parametro,
+  indicizzati con il codice fattorizzato di ogni riga (i decimali si verificano
+  sul valore numerico, senza espressioni regolari sulle stringhe)
+
+Gli errori sono un elenco per riga (riga, colonna, valore, messaggio) che
+l'utente può scaricare come CSV. Un file con errori non viene importato.
+"""
+
+import csv
+import io
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Parameter, Technique
+from app.services.unit_conversion import conversion_factors
+
+# Errori conservati nel report (il conteggio totale resta esatto)
+MAX_REPORTED_ERRORS = 10000
+
+REPORT_COLUMNS = ['row', 'column', 'value', 'error']
+
+
+class UploadValidationError(ValueError):
+    """File di risultati con righe non valide (nessuna riga è stata salvata)"""
+
+    def __init__(self, errors, total=None):
+        self.errors = errors
+        self.total = total if total is not None else len(errors)
+        super().__init__(f"{self.total} righe non valide nel file")
+
+
+def validate_results(df):
+    """
+    Verifica in blocco le righe di un file di risultati
+
+    Args:
+        df: DataFrame letto come stringhe (dtype=str, keep_default_na=False),
+            con colonne normalizzate e numero di riga 'row'
+
+    Returns:
+        list: Errori come dict con REPORT_COLUMNS, ordinati per riga
+    """
+    import numpy as np
+    import pandas as pd
+
+    errors = []
+
+    def report(mask, column, message):
+        mask = np.asarray(mask, dtype=bool)
+        if mask.any():
+            errors.append(pd.DataFrame({
+                'row': df['row'].to_numpy()[mask],
+                'column': column,
+                'value': df[column].to_numpy()[mask],
+                'error': message if isinstance(message, str) else np.asarray(message, dtype=object)[mask],
+            }))
+
+    raw_values = df['result_value'].str.strip()
+    values = pd.to_numeric(raw_values, errors='coerce')
+    filled = raw_values.ne('')
+    report(filled & values.isna(), 'result_value', "result_value non numerico")
+
+    if 'uncertainty' in df.columns:
+        declared = df['uncertainty'].str.strip().ne('')
+        uncertainties = pd.to_numeric(df['uncertainty'].where(declared), errors='coerce')
+        report(declared & ~(uncertainties >= 0), 'uncertainty', "uncertainty non numerica o negativa")
+
+    # Parametri: codici distinti del file in una sola query, limiti allineati ai codici fattorizzati
+    codes = df['parameter_code'].str.strip()
+    report(codes.eq(''), 'parameter_code', "parameter_code mancante")
+    param_idx, unique_codes = pd.factorize(codes)
+    master, canonical = {}, {}
+    for code, min_value, max_value, digits, unit_code in db.session.execute(
+        select(Parameter.code, Parameter.min_value, Parameter.max_value, Parameter.precision_digits,
+               Parameter.unit_code)
+        .where(Parameter.code.in_([code for code in unique_codes if code]))
+    ):
+        master[code] = (min_value, max_value, digits)
+        canonical[code] = unit_code
+    report(codes.ne('') & ~codes.isin(list(master)), 'parameter_code', "Parametro sconosciuto")
+
+    # Unità dichiarate: a catalogo e convertibili nell'unità del parametro (matrice dei fattori in cache)
+    raw_numeric = numeric = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    if 'unit_code' in df.columns:
+        targets = np.array([canonical.get(code, '') for code in unique_codes], dtype=object)
+        factors, unknown = conversion_factors(df['unit_code'], targets[param_idx])
+        report(unknown, 'unit_code', "Unità sconosciuta")
+        not_convertible = np.array([f"Unità non convertibile in {unit}" for unit in targets], dtype=object)
+        report(~unknown & np.isnan(factors) & (targets[param_idx] != ''), 'unit_code', not_convertible[param_idx])
+        # I limiti del parametro sono nella sua unità: si confrontano i valori convertiti
+        numeric = numeric * np.nan_to_num(factors, nan=1.0)
+
+    bounds = np.array([
+        [np.nan if limit is None else float(limit) for limit in master.get(code, (None, None, None))]
+        for code in unique_codes
+    ], dtype=np.float64).reshape(-1, 3)
+    min_value, max_value, digits = (bounds[param_idx, i] for i in range(3))
+    checked = (filled & values.notna()).to_numpy()
+    # Messaggi costruiti per codice (pochi) e distribuiti sulle righe con l'indice del parametro
+    below = np.array([f"result_value sotto il minimo {low:g}" for low in bounds[:, 0]], dtype=object)
+    above = np.array([f"result_value sopra il massimo {high:g}" for high in bounds[:, 1]], dtype=object)
+    too_precise = np.array([f"result_value con più decimali di {n:.0f}" for n in bounds[:, 2]], dtype=object)
+    with np.errstate(invalid='ignore'):
+        report(checked & (numeric < min_value), 'result_value', below[param_idx])
+        report(checked & (numeric > max_value), 'result_value', above[param_idx])
+        # Al più d decimali (zeri finali esclusi) se x·10^d è intero, a meno dell'errore di rappresentazione;
+        # la precisione riguarda il valore come scritto nel file, prima della conversione
+        scaled = raw_numeric * 10.0 ** digits
+        excess = np.abs(scaled - np.round(scaled)) > 1e-9 * np.maximum(1.0, np.abs(scaled))
+        report(checked & np.isfinite(digits) & excess, 'result_value', too_precise[param_idx])
+
+    if 'technique_code' in df.columns:
+        techniques = df['technique_code'].str.strip()
+        used = techniques.ne('')
+        known = set(db.session.scalars(
+            select(Technique.code).where(Technique.code.in_(techniques[used].unique().tolist()))
+        ))
+        report(used & ~techniques.isin(list(known)), 'technique_code', "Tecnica sconosciuta")
+
+    if not errors:
+        return []
+    report_df = pd.concat(errors, ignore_index=True).sort_values('row', kind='stable')
+    return report_df.astype({'row': int}).to_dict('records')
+
+
+def error_report_csv(errors):
+    """
+    Report CSV degli errori di validazione
+
+    Args:
+        errors: Errori restituiti da validate_results
+
+    Returns:
+        str: Contenuto CSV con REPORT_COLUMNS
+    """
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(errors)
+    return output.getvalue()
@@ -0,0 +1,467 @@
+# app/cli.py
+"""
+Comandi CLI dell'applicazione (flask <comando>)
+"""
+import json
+import os
+import time
+
+import click
+from flask import current_app
+
+from app import db
+
+
+def register_commands(app):
+    """Registra i comandi CLI sull'app"""
+    app.cli.add_command(seed_command)
+    app.cli.add_command(bulk_import_command)
+    app.cli.add_command(recompute_cycle_command)
+    app.cli.add_command(api_token_group)
+    app.cli.add_command(cascade_delete_command)
+    app.cli.add_command(backup_group)
+    app.cli.add_command(archive_group)
+    app.cli.add_command(snapshot_group)
+    app.cli.add_command(history_group)
+
+
+@click.command("seed")
+@click.option("--scale", type=click.Choice(["tiny", "small", "medium", "production"]), default="small",
+              show_default=True, help="Dimensione predefinita del dataset")
+@click.option("--labs", type=int, help="Numero di laboratori (sovrascrive --scale)")
+@click.option("--cycles", type=int, help="Numero di cicli (sovrascrive --scale)")
+@click.option("--parameters", type=int, help="Numero di parametri (sovrascrive --scale)")
+@click.option("--results-per-combo", type=int, help="Risultati per lab/ciclo/parametro (sovrascrive --scale)")
+@click.option("--seed", "random_seed", type=int, default=42, show_default=True, help="Seme del generatore casuale")
+@click.option("--lab-batch", type=int, default=25, show_default=True, help="Laboratori generati per blocco")
+@click.option("--reset", is_flag=True, help="Elimina e ricrea tutte le tabelle prima del popolamento")
+@click.option("--yes", is_flag=True, help="Non chiedere conferma per --reset")
+def seed_command(scale, labs, cycles, parameters, results_per_combo, random_seed, lab_batch, reset, yes):
+    """Popola il database con un dataset PT sintetico (COPY su PostgreSQL, executemany su SQLite)"""
+    from app.models import Lab, Result
+    from app.services.seeding import SCALES, seed_synthetic
+
+    spec = dict(SCALES[scale])
+    overrides = {"labs": labs, "cycles": cycles, "parameters": parameters, "results_per_combo": results_per_combo}
+    spec.update({key: value for key, value in overrides.items() if value is not None})
+
+    if reset:
+        if not yes:
+            click.confirm(f"Eliminare TUTTI i dati di {current_app.config['SQLALCHEMY_DATABASE_URI']}?", abort=True)
+        db.drop_all()
+        db.create_all()
+    elif db.session.query(Lab.id).first() or db.session.query(Result.id).first():
+        raise click.ClickException("Il database contiene già dati: usa --reset per ripartire da zero.")
+
+    total = spec["labs"] * spec["cycles"] * spec["parameters"] * spec["results_per_combo"]
+    click.echo(f"Popolamento {spec} ({total} risultati)...")
+    start = time.perf_counter()
+
+    def progress(done, expected):
+        elapsed = time.perf_counter() - start
+        click.echo(f"  {done}/{expected} risultati ({done / elapsed:,.0f} righe/s)")
+
+    counts = seed_synthetic(spec, seed=random_seed, lab_batch=lab_batch, progress=progress)
+    click.echo(f"Completato in {time.perf_counter() - start:.1f}s: {counts}")
+
+
+@click.command("bulk-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--user-email", required=True, help="Utente a cui attribuire gli upload")
+@click.option("--workers", type=int, help="Processi paralleli (default BULK_IMPORT_WORKERS, altrimenti uno per CPU)")
+@click.option("--report", "report_path", type=click.Path(dir_okay=False),
+              help="File CSV in cui salvare gli errori per laboratorio")
+@click.option("--mode", type=click.Choice(["merge", "replace"]), default="merge", show_default=True,
+              help="merge: aggiunge o corregge; replace: elimina i risultati dei lab nei cicli del file assenti dal file")
+@click.option("--yes", is_flag=True, help="Non chiedere conferma per --mode replace")
+def bulk_import_command(path, user_email, workers, report_path, mode, yes):
+    """Importa un file CSV/Excel/Parquet di un provider con risultati di più laboratori e cicli"""
+    import csv
+    from app.models import User
+    from app.services.bulk_import import BulkImportError, read_bulk_file, run_bulk_import, error_report_rows
+
+    user = User.query.filter_by(email=user_email).first()
+    if user is None:
+        raise click.ClickException(f"Utente {user_email} non trovato")
+
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as stream:
+            df = read_bulk_file(stream, path)
+    except BulkImportError as e:
+        raise click.ClickException(str(e))
+
+    if workers is None and current_app.config.get('BULK_IMPORT_WORKERS') is None:
+        workers = 0  # da riga di comando: un processo per CPU
+    if mode == "replace" and not yes:
+        click.confirm("Eliminare i risultati dei laboratori nei cicli del file che non compaiono nel file?",
+                      abort=True)
+    result = run_bulk_import(df, user.id, os.path.basename(path), workers=workers, mode=mode)
+    summary = result["summary"]
+    click.echo(f"{summary['rows']} righe, {summary['partitions']} partizioni lab/ciclo "
+               f"({summary['workers']} processi, modalità {mode}) in {time.perf_counter() - start:.1f}s")
+    click.echo(f"  importate {summary['imported']}, invariate {summary['skipped']}, con errori {summary['failed']}")
+    click.echo(f"  risultati nuovi {summary['inserted']}, modificati {summary['updated']}, "
+               f"eliminati {summary['deleted']}")
+    for report in result["partitions"]:
+        if report.get("delete"):
+            click.echo(f"  {report['lab_code']}/{report['cycle_code']}: {report['delete']} risultati eliminati")
+        if report["errors"]:
+            click.echo(f"  {report['lab_code']}/{report['cycle_code']}: {len(report['errors'])} errori "
+                       f"(es. {report['errors'][0]['error']})")
+
+    if report_path:
+        with open(report_path, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=["lab_code", "cycle_code", "row", "error"])
+            writer.writeheader()
+            writer.writerows(error_report_rows(result))
+        click.echo(f"Report errori salvato in {report_path}")
+
+
+@click.command("recompute-cycle")
+@click.argument("cycle_codes", nargs=-1, required=True)
+@click.option("--workers", type=int, help="Processi paralleli (default: STATS_COMPUTE_WORKERS sopra STATS_PARALLEL_MIN_ROWS)")
+@click.option("--show-consensus", is_flag=True, help="Mostra mediana e scarto tipo robusto per parametro")
+def recompute_cycle_command(cycle_codes, workers, show_consensus):
+    """Ricalcola punteggi (z, sz², z', zeta, En), PtStats e consenso robusto dei cicli indicati"""
+    from app.models import Cycle
+    from app.blueprints.stats.cycle_stats import recompute_cycle_statistics
+
+    for cycle_code in cycle_codes:
+        cycle = Cycle.query.filter_by(code=cycle_code).first()
+        if cycle is None:
+            raise click.ClickException(f"Ciclo {cycle_code} non trovato")
+        if cycle.archived_at is not None:
+            raise click.ClickException(f"Ciclo {cycle_code} archiviato: ripristinarlo con flask archive restore")
+        if cycle.frozen_at is not None:
+            raise click.ClickException(f"Ciclo {cycle_code} congelato: scongelarlo con flask snapshot unfreeze")
+        summary = recompute_cycle_statistics(cycle_code, workers=workers)
+        click.echo(f"{cycle_code}: {summary['results']} risultati ({summary['workers']} processi) in "
+                   f"{summary['seconds']}s - punteggi aggiornati {summary['updated']}, creati {summary['inserted']}, "
+                   f"PtStats {summary['pt_stats']}, esclusi {summary['skipped']}")
+        if show_consensus:
+            for parameter_code, consensus in summary["consensus"].items():
+                click.echo(f"  {parameter_code}: n={consensus['n']} mediana={consensus['median']} "
+                           f"sd robusto={consensus['robust_sd']}")
+
+
+@click.group("api-token")
+def api_token_group():
+    """Token per l'API dei risultati (POST /l/<lab>/stats/api/results)"""
+
+
+@api_token_group.command("create")
+@click.argument("lab_code")
+@click.option("--user-email", required=True, help="Utente a cui attribuire gli upload (almeno analyst del laboratorio)")
+@click.option("--name", required=True, help="Nome del token (es. il LIMS che lo usa)")
+def api_token_create_command(lab_code, user_email, name):
+    """Crea un token API per un laboratorio (il token è mostrato una sola volta)"""
+    from app.models import ApiToken, Lab, User
+
+    if Lab.query.filter_by(code=lab_code).first() is None:
+        raise click.ClickException(f"Laboratorio {lab_code} non trovato")
+    user = User.query.filter_by(email=user_email).first()
+    if user is None:
+        raise click.ClickException(f"Utente {user_email} non trovato")
+    if not user.has_lab_min_role(lab_code, "analyst"):
+        raise click.ClickException(f"{user_email} non ha il ruolo analyst nel laboratorio {lab_code}")
+
+    api_token, token = ApiToken.create_token(lab_code, user.id, name)
+    db.session.add(api_token)
+    db.session.commit()
+    click.echo(f"Token {api_token.id} ({name}) per {lab_code}:")
+    click.echo(token)
+
+
+@api_token_group.command("list")
+@click.option("--lab", "lab_code", help="Solo i token di un laboratorio")
+def api_token_list_command(lab_code):
+    """Elenca i token API"""
+    from app.models import ApiToken
+
+    query = ApiToken.query.order_by(ApiToken.lab_code, ApiToken.id)
+    if lab_code:
+        query = query.filter_by(lab_code=lab_code)
+    for api_token in query:
+        state = f"revocato {api_token.revoked_at:%Y-%m-%d}" if api_token.revoked_at else "attivo"
+        last_used = f"{api_token.last_used_at:%Y-%m-%d %H:%M}" if api_token.last_used_at else "mai"
+        click.echo(f"{api_token.id:5d}  {api_token.lab_code:12s}  {api_token.name:30s}  {state:20s}  ultimo uso {last_used}")
+
+
+@api_token_group.command("revoke")
+@click.argument("token_id", type=int)
+def api_token_revoke_command(token_id):
+    """Revoca un token API"""
+    from datetime import datetime
+    from app.models import ApiToken
+
+    api_token = db.session.get(ApiToken, token_id)
+    if api_token is None:
+        raise click.ClickException(f"Token {token_id} non trovato")
+    api_token.revoked_at = api_token.revoked_at or datetime.utcnow()
+    db.session.commit()
+    click.echo(f"Token {token_id} ({api_token.name}) revocato")
+
+
+@click.command("cascade-delete")
+@click.argument("kind", type=click.Choice(["lab", "cycle"]))
+@click.argument("code")
+@click.option("--yes", is_flag=True, help="Non chiedere conferma")
+def cascade_delete_command(kind, code, yes):
+    """Elimina un laboratorio o un ciclo con tutti i dati collegati (riprende un'eliminazione interrotta)"""
+    from app.models import JobLog
+    from app.services.cascade_delete import CascadeDeleteError, run_deletion, running_deletion, start_deletion
+
+    def progress(deleted, total):
+        click.echo(f"  {deleted:,}/{total:,} risultati eliminati")
+
+    if not yes:
+        click.confirm(f"Eliminare {kind} {code} con risultati, upload e partecipazioni?", abort=True)
+
+    start = time.perf_counter()
+    job = running_deletion(kind, code)
+    if job is not None:
+        click.echo(f"Ripresa dell'eliminazione interrotta (job {job.id})")
+        run_deletion(job.id, progress=progress)
+    else:
+        try:
+            job = start_deletion(kind, code, background=False, progress=progress)
+        except CascadeDeleteError as e:
+            raise click.ClickException(str(e))
+
+    job = db.session.get(JobLog, job.id)
+    if job.status != "completed":
+        raise click.ClickException(f"Eliminazione non riuscita: {job.error_message}")
+    click.echo(f"{kind} {code} eliminato in {time.perf_counter() - start:.1f}s")
+
+
+@click.group("backup")
+def backup_group():
+    """Backup a caldo del database, prova di ripristino e ripristino in un nuovo file"""
+    pass
+
+
+def _format_bytes(size):
+    return f"{size / 1e6:,.1f} MB"
+
+
+@backup_group.command("create")
+@click.option("--incremental", is_flag=True, help="Solo le pagine cambiate dall'ultimo backup (SQLite)")
+@click.option("--verify", is_flag=True, help="Esegue subito la prova di ripristino")
+def backup_create_command(incremental, verify):
+    """Esegue un backup senza fermare l'applicazione"""
+    from app.models import JobLog
+    from app.services.backup import BackupError, start_job
+
+    def progress(copied, total):
+        if copied == total or copied % (50 * current_app.config['BACKUP_PAGES_PER_STEP']) == 0:
+            click.echo(f"  {copied:,}/{total:,} pagine copiate")
+
+    try:
+        job = start_job("backup", incremental=incremental, background=False, progress=progress)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    if job.status != "completed":
+        raise click.ClickException(f"Backup non riuscito: {job.error_message}")
+    details = json.loads(job.details)
+    click.echo(f"Backup {details['backup_id']} ({details['kind']}): {_format_bytes(details['size_bytes'])} "
+               f"in {details['seconds']:.1f}s")
+
+    if verify:
+        job = start_job("backup_verify", backup_id=details['backup_id'], background=False)
+        _echo_verify(db.session.get(JobLog, job.id))
+
+
+def _echo_verify(job):
+    details = json.loads(job.details)
+    if job.status != "completed":
+        raise click.ClickException(f"Prova di ripristino non riuscita: {job.error_message}")
+    click.echo(f"Prova di ripristino {details['backup_id']} ok: ripristino {details['restore_seconds']:.1f}s, "
+               f"controlli {details['check_seconds']:.1f}s")
+
+
+@backup_group.command("list")
+def backup_list_command():
+    """Elenca i backup disponibili"""
+    from app.services.backup import list_backups
+
+    for manifest in list_backups():
+        verify = manifest.get('verify')
+        status = "non provato" if not verify else (
+            f"provato ({verify['restore_seconds'] + verify['check_seconds']:.1f}s)" if verify['ok'] else "PROVA FALLITA")
+        click.echo(f"{manifest['id']:32s} {manifest['kind']:12s} {_format_bytes(manifest['size_bytes']):>12s}  {status}")
+
+
+@backup_group.command("verify")
+@click.argument("backup_id")
+def backup_verify_command(backup_id):
+    """Prova di ripristino cronometrata di un backup (in un file temporaneo)"""
+    from app.services.backup import BackupError, start_job
+
+    try:
+        job = start_job("backup_verify", backup_id=backup_id, background=False)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    _echo_verify(job)
+
+
+@backup_group.command("restore")
+@click.argument("backup_id")
+@click.argument("target", type=click.Path(dir_okay=False))
+def backup_restore_command(backup_id, target):
+    """Ricostruisce un backup in un nuovo file (database SQLite o archivio pg_dump)"""
+    from app.services.backup import BackupError, restore_backup
+
+    try:
+        restored = restore_backup(backup_id, target)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Backup {backup_id} ripristinato in {restored['target']} in {restored['seconds']:.1f}s")
+
+
+@click.group("archive")
+def archive_group():
+    """Archiviazione dei risultati dei cicli chiusi nelle tabelle di archivio"""
+    pass
+
+
+@archive_group.command("run")
+@click.option("--older-than-days", type=int, help="Età minima dalla fine del ciclo (default ARCHIVE_AFTER_DAYS)")
+@click.option("--dry-run", is_flag=True, help="Elenca i cicli archiviabili senza spostarli")
+def archive_run_command(older_than_days, dry_run):
+    """Archivia i cicli pubblicati terminati da più di ARCHIVE_AFTER_DAYS giorni"""
+    from app.services.archive import archivable_cycles, run_archival
+
+    if dry_run:
+        cycle_codes = archivable_cycles(older_than_days)
+        click.echo(f"Cicli archiviabili ({len(cycle_codes)}): {', '.join(cycle_codes) or '-'}")
+        return
+
+    start = time.perf_counter()
+    job = run_archival(older_than_days, progress=lambda code, moved: click.echo(f"  {code}: {moved:,} risultati"))
+    if job.status != "completed":
+        raise click.ClickException(f"Archiviazione non riuscita: {job.error_message}")
+    details = json.loads(job.details)
+    click.echo(f"Archiviati {len(details['cycles'])} cicli ({details['results']:,} risultati) "
+               f"in {time.perf_counter() - start:.1f}s")
+
+
+@archive_group.command("restore")
+@click.argument("cycle_code")
+def archive_restore_command(cycle_code):
+    """Riporta un ciclo archiviato nelle tabelle correnti"""
+    from app.services.archive import ArchiveError, restore_cycle
+
+    try:
+        moved = restore_cycle(cycle_code)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Ciclo {cycle_code} ripristinato ({moved:,} risultati)")
+
+
+@archive_group.command("status")
+def archive_status_command():
+    """Cicli archiviati e risultati nelle tabelle correnti e di archivio"""
+    from app.services.archive import archive_summary
+
+    summary = archive_summary()
+    click.echo(f"Cicli archiviati: {summary['archived_cycles']}")
+    click.echo(f"Risultati correnti: {summary['hot_results']:,}  archiviati: {summary['archived_results']:,}")
+
+
+@click.group("snapshot")
+def snapshot_group():
+    """Snapshot colonnari immutabili dei cicli chiusi (congelamento)"""
+    pass
+
+
+@snapshot_group.command("freeze")
+@click.argument("cycle_codes", nargs=-1)
+@click.option("--all-closed", is_flag=True, help="Congela tutti i cicli pubblicati e terminati non ancora congelati")
+def snapshot_freeze_command(cycle_codes, all_closed):
+    """Congela i cicli indicati (una nuova versione se già congelati)"""
+    from app.services.snapshots import SnapshotError, freezable_cycles, freeze_cycle
+
+    cycle_codes = list(cycle_codes) + (freezable_cycles() if all_closed else [])
+    if not cycle_codes:
+        raise click.UsageError("Indicare almeno un ciclo o --all-closed")
+    for cycle_code in cycle_codes:
+        start = time.perf_counter()
+        try:
+            manifest = freeze_cycle(cycle_code)
+        except SnapshotError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{cycle_code}: snapshot v{manifest['version']} con {manifest['rows']:,} risultati "
+                   f"in {time.perf_counter() - start:.1f}s")
+
+
+@snapshot_group.command("unfreeze")
+@click.argument("cycle_code")
+def snapshot_unfreeze_command(cycle_code):
+    """Scongela un ciclo ed elimina i suoi snapshot"""
+    from app.services.snapshots import SnapshotError, unfreeze_cycle
+
+    try:
+        unfreeze_cycle(cycle_code)
+    except SnapshotError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Ciclo {cycle_code} scongelato")
+
+
+@snapshot_group.command("list")
+def snapshot_list_command():
+    """Elenca i cicli congelati"""
+    from app.models import Cycle
+    from app.services.snapshots import current_snapshot
+
+    for cycle in Cycle.query.filter(Cycle.frozen_at.isnot(None)).order_by(Cycle.end_date):
+        snapshot = current_snapshot(cycle.code)
+        status = f"v{snapshot.version} {snapshot.manifest['rows']:,} risultati" if snapshot else "SNAPSHOT MANCANTE"
+        click.echo(f"{cycle.code:20s} {cycle.frozen_at:%Y-%m-%d}  {status}")
+
+
+@snapshot_group.command("verify")
+@click.argument("cycle_code")
+def snapshot_verify_command(cycle_code):
+    """Controlla gli SHA-256 dei file dello snapshot corrente"""
+    from app.services.snapshots import verify_snapshot
+
+    errors = verify_snapshot(cycle_code)
+    if errors:
+        raise click.ClickException("; ".join(errors))
+    click.echo(f"Snapshot di {cycle_code} integro")
+
+
+@click.group("history")
+def history_group():
+    """Storici dei punteggi per laboratorio in memory map (HISTORY_STORE_DIR)"""
+    pass
+
+
+@history_group.command("build")
+@click.argument("lab_codes", nargs=-1)
+def history_build_command(lab_codes):
+    """Riscrive gli storici dei laboratori indicati (default: tutti i laboratori attivi)"""
+    from app.models import Lab
+    from app.services.history_store import build_lab, enabled
+
+    if not enabled():
+        raise click.ClickException("HISTORY_STORE_DIR non configurata")
+    lab_codes = list(lab_codes) or [lab.code for lab in Lab.query.filter_by(is_active=True).order_by(Lab.code)]
+    for lab_code in lab_codes:
+        start = time.perf_counter()
+        meta = build_lab(lab_code)
+        click.echo(f"{lab_code}: {meta['count']:,} punteggi (generazione {meta['generation']}) "
+                   f"in {time.perf_counter() - start:.1f}s")
+
+
+@history_group.command("status")
+def history_status_command():
+    """Elenca gli storici e se sono allineati alla data_version del laboratorio"""
+    from app.services.history_store import enabled, store_status
+
+    if not enabled():
+        raise click.ClickException("HISTORY_STORE_DIR non configurata")
+    for row in store_status():
+        state = "aggiornato" if row['current'] else "OBSOLETO (letture da SQL)"
+        click.echo(f"{row['lab_code']:20s} {row['records']:>10,} punteggi  gen {row['generation']}  {state}")
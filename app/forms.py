@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, SelectField, BooleanField, FloatField, IntegerField, SubmitField, SelectMultipleField
 from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
-from app.models import Unit, Technique, Lab, User, Parameter, Provider, Result, Cycle
+from app.models import Unit, Technique, Lab, User, Parameter, Provider, Cycle
 
 
 class UnitForm(FlaskForm):
@@ -182,6 +182,14 @@ class ChartsForm(FlaskForm):
                           ('', 'Tutti i dati disponibili')
                       ], 
                       default='90')
+    metric = SelectField('Punteggio',
+                        choices=[
+                            ('z', 'z-score'),
+                            ('z_prime', "z'-score (con u(xpt))"),
+                            ('zeta', 'zeta-score (con u(x) e u(xpt))'),
+                            ('en', 'En (incertezze estese, k=2)')
+                        ],
+                        default='z')
     submit = SubmitField('Aggiorna Grafico')
     
     def __init__(self, lab_code=None, *args, **kwargs):
@@ -195,29 +203,33 @@ class ChartsForm(FlaskForm):
             return
             
         from app import db
+        from app.services.archive import distinct_options, result_sources
         
         try:
+            # Anche i risultati dei cicli archiviati, se il laboratorio ne ha
+            sources = result_sources(self.lab_code)
+            
+            def distinct_rows(build):
+                return distinct_options(build, sources)
+            
             # Parametri disponibili per questo lab
-            params = db.session.query(Result.parameter_code, Parameter.name)\
-                .join(Parameter, Result.parameter_code == Parameter.code)\
-                .filter(Result.lab_code == self.lab_code)\
-                .distinct().all()
+            params = distinct_rows(lambda Result, ZScore: db.select(Result.parameter_code, Parameter.name)
+                                   .join(Parameter, Result.parameter_code == Parameter.code)
+                                   .where(Result.lab_code == self.lab_code))
             
             self.parameters.choices = [(p[0], f"{p[0]} - {p[1] or p[0]}") for p in params]
             
             # Tecniche disponibili
-            techs = db.session.query(Result.technique_code, Technique.name)\
-                .join(Technique, Result.technique_code == Technique.code, isouter=True)\
-                .filter(Result.lab_code == self.lab_code, Result.technique_code.isnot(None))\
-                .distinct().all()
+            techs = distinct_rows(lambda Result, ZScore: db.select(Result.technique_code, Technique.name)
+                                  .join(Technique, Result.technique_code == Technique.code, isouter=True)
+                                  .where(Result.lab_code == self.lab_code, Result.technique_code.isnot(None)))
             
             self.techniques.choices = [(t[0], f"{t[0]} - {t[1] or t[0]}") for t in techs]
             
             # Cicli disponibili  
-            cycles = db.session.query(Result.cycle_code, Cycle.name)\
-                .join(Cycle, Result.cycle_code == Cycle.code)\
-                .filter(Result.lab_code == self.lab_code)\
-                .distinct().all()
+            cycles = distinct_rows(lambda Result, ZScore: db.select(Result.cycle_code, Cycle.name)
+                                   .join(Cycle, Result.cycle_code == Cycle.code)
+                                   .where(Result.lab_code == self.lab_code))
                 
             self.cycles.choices = [(c[0], f"{c[0]} - {c[1] or c[0]}") for c in cycles]
             
@@ -88,15 +88,19 @@ class Lab(db.Model):
     contact_email = db.Column(db.String(120), nullable=True)
     contact_phone = db.Column(db.String(30), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
+    # Versione dei dati (incrementata a ogni upload/ricalcolo) per il caching HTTP
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    data_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     #relazioni
-    user_roles = db.relationship('UserLabRole', back_populates='lab', cascade='all, delete-orphan')
-    participations = db.relationship('LabParticipation', back_populates='lab', cascade='all, delete-orphan')
-    results = db.relationship('Result', back_populates='lab', cascade='all, delete-orphan')
-    uploads = db.relationship('UploadFile', back_populates='lab', cascade='all, delete-orphan')
-    stats = db.relationship('PtStats', back_populates='lab', primaryjoin='Lab.code==PtStats.lab_code')
+    # passive_deletes: i figli sono eliminati dal database (ON DELETE CASCADE), senza caricarli nella sessione
+    user_roles = db.relationship('UserLabRole', back_populates='lab', cascade='all, delete-orphan', passive_deletes=True)
+    participations = db.relationship('LabParticipation', back_populates='lab', cascade='all, delete-orphan', passive_deletes=True)
+    results = db.relationship('Result', back_populates='lab', cascade='all, delete-orphan', passive_deletes=True)
+    uploads = db.relationship('UploadFile', back_populates='lab', cascade='all, delete-orphan', passive_deletes=True)
+    stats = db.relationship('PtStats', back_populates='lab', primaryjoin='Lab.code==PtStats.lab_code', cascade='all, delete-orphan', passive_deletes=True)
     invites = db.relationship('InviteToken', back_populates='lab', cascade='all, delete-orphan', primaryjoin='Lab.code==InviteToken.lab_code', foreign_keys='InviteToken.lab_code')
 
 class Role(db.Model):
@@ -119,7 +123,7 @@ class UserLabRole(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    lab_id = db.Column(db.Integer, db.ForeignKey('lab.id'), nullable=False)
+    lab_id = db.Column(db.Integer, db.ForeignKey('lab.id', ondelete='CASCADE'), nullable=False, index=True)
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -146,6 +150,18 @@ class Unit(db.Model):
     # relazioni
     parameters = db.relationship('Parameter', back_populates='unit', primaryjoin='Unit.code==Parameter.unit_code')
 
+class UnitConversion(db.Model):
+    __tablename__ = 'unit_conversion'
+    __table_args__ = (db.UniqueConstraint('from_unit_code', 'to_unit_code', name='uq_unit_conversion_pair'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # valore in to_unit = valore in from_unit × factor (la conversione inversa è implicita)
+    from_unit_code = db.Column(db.String(20), db.ForeignKey('unit.code'), nullable=False)
+    to_unit_code = db.Column(db.String(20), db.ForeignKey('unit.code'), nullable=False)
+    factor = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Matrix(db.Model):
     __tablename__ = 'matrix'
     
@@ -225,7 +241,7 @@ class CycleDoc(db.Model):
     __tablename__ = 'cycle_doc'
     
     id = db.Column(db.Integer, primary_key=True)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     doc_id = db.Column(db.Integer, db.ForeignKey('doc_file.id'), nullable=False)
     doc_type = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -248,6 +264,11 @@ class Cycle(db.Model):
     doc_id = db.Column(db.Integer, db.ForeignKey('doc_file.id'), nullable=True)
     start_date = db.Column(db.DateTime, nullable=True)
     end_date = db.Column(db.DateTime, nullable=True)
+    # Risultati spostati nelle tabelle di archivio (vedi app/services/archive.py)
+    archived_at = db.Column(db.DateTime, nullable=True)
+    # Ciclo congelato in uno snapshot colonnare immutabile (vedi app/services/snapshots.py)
+    frozen_at = db.Column(db.DateTime, nullable=True)
+    snapshot_version = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -255,21 +276,22 @@ class Cycle(db.Model):
     provider_id = db.Column(db.Integer, db.ForeignKey('provider.id'), nullable=True)
     provider = db.relationship('Provider', back_populates='cycles')
     doc_file = db.relationship('DocFile', back_populates='cycles', uselist=False)
-    docs = db.relationship('CycleDoc', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==CycleDoc.cycle_code')
-    parameters = db.relationship('CycleParameter', back_populates='cycle', primaryjoin='Cycle.code==CycleParameter.cycle_code', cascade='all, delete-orphan')
-    participants = db.relationship('LabParticipation', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==LabParticipation.cycle_code')
-    results = db.relationship('Result', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==Result.cycle_code')
-    stats = db.relationship('PtStats', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==PtStats.cycle_code')
-    uploads = db.relationship('UploadFile', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==UploadFile.cycle_code')
+    docs = db.relationship('CycleDoc', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==CycleDoc.cycle_code', passive_deletes=True)
+    parameters = db.relationship('CycleParameter', back_populates='cycle', primaryjoin='Cycle.code==CycleParameter.cycle_code', cascade='all, delete-orphan', passive_deletes=True)
+    participants = db.relationship('LabParticipation', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==LabParticipation.cycle_code', passive_deletes=True)
+    results = db.relationship('Result', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==Result.cycle_code', passive_deletes=True)
+    stats = db.relationship('PtStats', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==PtStats.cycle_code', passive_deletes=True)
+    uploads = db.relationship('UploadFile', back_populates='cycle', cascade='all, delete-orphan', primaryjoin='Cycle.code==UploadFile.cycle_code', passive_deletes=True)
 
 class CycleParameter(db.Model):
     __tablename__ = 'cycle_parameter'
     
     id = db.Column(db.Integer, primary_key=True)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
     xpt = db.Column(db.Numeric(18, 6), nullable=False)
     sigma_pt = db.Column(db.Numeric(18, 6), nullable=False)
+    u_xpt = db.Column(db.Numeric(18, 6), nullable=True)  # incertezza tipo del valore assegnato
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -285,8 +307,8 @@ class LabParticipation(db.Model):
     __tablename__ = 'lab_participation'
     
     id = db.Column(db.Integer, primary_key=True)
-    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code'), nullable=False)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False, index=True)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     status = db.Column(db.String(20), nullable=False, default='active')
     registered_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -295,17 +317,19 @@ class LabParticipation(db.Model):
     # relazioni
     lab= db.relationship('Lab', back_populates='participations', primaryjoin='Lab.code==LabParticipation.lab_code')
     cycle = db.relationship('Cycle', back_populates='participants', primaryjoin='Cycle.code==LabParticipation.cycle_code')
-    result = db.relationship('Result', back_populates='lab_participation', primaryjoin='LabParticipation.id==Result.lab_participation_id', cascade='all, delete-orphan')
+    result = db.relationship('Result', back_populates='lab_participation', primaryjoin='LabParticipation.id==Result.lab_participation_id', cascade='all, delete-orphan', passive_deletes=True)
 
 class Result(db.Model):
     __tablename__ = 'result'
     
     id = db.Column(db.Integer, primary_key=True)
-    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code'), nullable=False)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False, index=True)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
     technique_code = db.Column(db.String(20), db.ForeignKey('technique.code'), nullable=True)
-    lab_participation_id = db.Column(db.Integer, db.ForeignKey('lab_participation.id'), nullable=True)
+    lab_participation_id = db.Column(db.Integer, db.ForeignKey('lab_participation.id', ondelete='CASCADE'), nullable=True, index=True)
+    # Upload che ha scritto (o confermato) il risultato, per il diff dei ricaricamenti
+    upload_file_id = db.Column(db.Integer, db.ForeignKey('upload_file.id', ondelete='SET NULL'), nullable=True, index=True)
     measured_value = db.Column(db.Numeric(18, 6), nullable=False)
     uncertainty = db.Column(db.Numeric(18, 6), nullable=True)
     notes = db.Column(db.Text, nullable=True)
@@ -319,7 +343,7 @@ class Result(db.Model):
     parameter = db.relationship('Parameter', back_populates='results', primaryjoin='Parameter.code==Result.parameter_code')
     technique = db.relationship('Technique', back_populates='results', primaryjoin='Technique.code==Result.technique_code')
     lab_participation = db.relationship('LabParticipation', back_populates='result')
-    zscore= db.relationship('ZScore', back_populates='result', cascade='all, delete-orphan', uselist=False)
+    zscore= db.relationship('ZScore', back_populates='result', cascade='all, delete-orphan', uselist=False, passive_deletes=True)
 # ===========================
 # TABELLE DERIVATI QC
 # ===========================
@@ -328,22 +352,65 @@ class ZScore(db.Model):
     __tablename__ = 'z_score'
     
     id = db.Column(db.Integer, primary_key=True)
-    result_id = db.Column(db.Integer, db.ForeignKey('result.id'), nullable=False)
+    result_id = db.Column(db.Integer, db.ForeignKey('result.id', ondelete='CASCADE'), nullable=False, index=True)
     z = db.Column(db.Numeric(18, 6), nullable=False)
     sz2 = db.Column(db.Numeric(18, 6), nullable=False)
+    # Punteggi ISO 13528 con le incertezze (NULL se non calcolabili, vedi stats/scores_stats.py)
+    z_prime = db.Column(db.Numeric(18, 6), nullable=True)
+    zeta = db.Column(db.Numeric(18, 6), nullable=True)
+    en = db.Column(db.Numeric(18, 6), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # relazioni
     result = db.relationship('Result', back_populates='zscore')
 
+# ===========================
+# TABELLE ARCHIVIO
+# ===========================
+
+# Risultati e punteggi dei cicli archiviati: stesse colonne e stessi id di result e z_score
+# (vedi app/services/archive.py)
+class ResultArchive(db.Model):
+    __tablename__ = 'result_archive'
+    __table_args__ = (
+        db.Index('ix_result_archive_lab_submitted', 'lab_code', 'submitted_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
+    parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
+    technique_code = db.Column(db.String(20), db.ForeignKey('technique.code'), nullable=True)
+    lab_participation_id = db.Column(db.Integer, db.ForeignKey('lab_participation.id', ondelete='CASCADE'), nullable=True, index=True)
+    upload_file_id = db.Column(db.Integer, db.ForeignKey('upload_file.id', ondelete='SET NULL'), nullable=True, index=True)
+    measured_value = db.Column(db.Numeric(18, 6), nullable=False)
+    uncertainty = db.Column(db.Numeric(18, 6), nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    submitted_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+class ZScoreArchive(db.Model):
+    __tablename__ = 'z_score_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    result_id = db.Column(db.Integer, db.ForeignKey('result_archive.id', ondelete='CASCADE'), nullable=False, index=True)
+    z = db.Column(db.Numeric(18, 6), nullable=False)
+    sz2 = db.Column(db.Numeric(18, 6), nullable=False)
+    z_prime = db.Column(db.Numeric(18, 6), nullable=True)
+    zeta = db.Column(db.Numeric(18, 6), nullable=True)
+    en = db.Column(db.Numeric(18, 6), nullable=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
 class PtStats(db.Model):
     __tablename__ = 'pt_stats'
     
     id = db.Column(db.Integer, primary_key=True)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
-    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code'), nullable=False)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False, index=True)
     n_results = db.Column(db.Integer, nullable=False)
     mean_z = db.Column(db.Numeric(18, 6), nullable=True)
     rsz = db.Column(db.Numeric(18, 6), nullable=True)
@@ -356,6 +423,35 @@ class PtStats(db.Model):
     parameter = db.relationship('Parameter', back_populates='stats', primaryjoin='Parameter.code==PtStats.parameter_code')
     lab= db.relationship('Lab', back_populates='stats', primaryjoin='Lab.code==PtStats.lab_code')
 
+class SampleMeasurement(db.Model):
+    __tablename__ = 'sample_measurement'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
+    parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
+    study = db.Column(db.String(20), nullable=False, default='homogeneity')  # homogeneity | stability
+    sample_id = db.Column(db.String(50), nullable=False)
+    replicate = db.Column(db.Integer, nullable=False, default=1)
+    value = db.Column(db.Numeric(18, 6), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class HomogeneityResult(db.Model):
+    __tablename__ = 'homogeneity_result'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
+    parameter_code = db.Column(db.String(20), db.ForeignKey('parameter.code'), nullable=False)
+    study = db.Column(db.String(20), nullable=False)
+    n_samples = db.Column(db.Integer, nullable=False)
+    n_measurements = db.Column(db.Integer, nullable=False)
+    mean = db.Column(db.Numeric(18, 6), nullable=True)
+    sw = db.Column(db.Numeric(18, 6), nullable=True)  # dev. std. entro campione
+    ss = db.Column(db.Numeric(18, 6), nullable=True)  # dev. std. tra campioni
+    difference = db.Column(db.Numeric(18, 6), nullable=True)  # |media stabilità - media omogeneità|
+    criterion = db.Column(db.Numeric(18, 6), nullable=True)  # 0.3·σpt
+    passed = db.Column(db.Boolean, nullable=False, default=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ControlChartConfig(db.Model):
     __tablename__ = 'control_chart_config'
     
@@ -382,12 +478,14 @@ class UploadFile(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
     mime_type = db.Column(db.String(100), nullable=False)
-    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code'), nullable=False)
-    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code'), nullable=False)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False, index=True)
+    cycle_code = db.Column(db.String(20), db.ForeignKey('cycle.code', ondelete='CASCADE'), nullable=False, index=True)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(20), nullable=False, default='pending')
+    # SHA-256 del contenuto (fine riga normalizzati) per riconoscere i file già caricati
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
 
     # relazioni
     lab = db.relationship('Lab', back_populates='uploads', primaryjoin='Lab.code==UploadFile.lab_code')
@@ -500,4 +598,56 @@ class InviteToken(db.Model):
             token=token,
             expires_at=expires_at,
             created_by=created_by
-        )
\ No newline at end of file
+        )
+
+class ApiToken(db.Model):
+    __tablename__ = 'api_token'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False, index=True)
+    # Utente a cui sono attribuiti gli upload inviati con il token
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    # Solo l'hash SHA-256: il token in chiaro è mostrato una volta alla creazione
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    
+    user = db.relationship('User')
+    
+    @property
+    def is_valid(self):
+        """Verifica se il token non è stato revocato"""
+        return self.revoked_at is None
+    
+    @staticmethod
+    def hash_token(token):
+        """Hash SHA-256 del token in chiaro"""
+        import hashlib
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    @classmethod
+    def create_token(cls, lab_code, user_id, name):
+        """Crea un nuovo token: restituisce (record, token in chiaro)"""
+        import secrets
+        token = secrets.token_urlsafe(32)
+        return cls(lab_code=lab_code, user_id=user_id, name=name, token_hash=cls.hash_token(token)), token
+
+
+class ApiIdempotencyKey(db.Model):
+    __tablename__ = 'api_idempotency_key'
+    __table_args__ = (db.UniqueConstraint('lab_code', 'idempotency_key', name='uq_api_idempotency_lab_key'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    lab_code = db.Column(db.String(50), db.ForeignKey('lab.code', ondelete='CASCADE'), nullable=False)
+    idempotency_key = db.Column(db.String(255), nullable=False)
+    # SHA-256 del corpo: la stessa chiave con un corpo diverso è un errore del client
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing, completed
+    response_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Inizio dell'elaborazione in corso: oltre API_IDEMPOTENCY_LEASE_SECONDS un reinvio la riprende
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
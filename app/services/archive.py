@@ -0,0 +1,255 @@
+# app/services/archive.py
+"""
+Archiviazione dei risultati dei cicli chiusi
+
+I risultati (e i loro punteggi) dei cicli pubblicati terminati da più di
+ARCHIVE_AFTER_DAYS giorni sono spostati da result e z_score nelle tabelle
+result_archive e z_score_archive, con le stesse colonne e gli stessi id, e il
+ciclo è marcato con archived_at. Le tabelle calde contengono così solo i cicli
+recenti: indici più piccoli e query dei laboratori che non scorrono lo storico.
+
+Le letture delle statistiche ottengono da result_sources le coppie di tabelle
+da interrogare: le tabelle di archivio si aggiungono (UNION ALL, vedi
+union_results) solo se la finestra richiesta arriva ai dati archiviati del
+laboratorio, cioè se tra i cicli filtrati c'è un ciclo archiviato o se esiste
+un risultato archiviato successivo all'inizio della finestra (una ricerca
+sull'indice lab_code, submitted_at di result_archive).
+
+Lo spostamento di un ciclo è un INSERT ... SELECT seguito da DELETE in
+un'unica transazione. restore_cycle riporta il ciclo nelle tabelle calde:
+upload, import e ricalcoli rifiutano i cicli archiviati finché non sono ripristinati.
+"""
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, exists, func, insert, select, union_all, update
+
+from app import db
+from app.models import Cycle, JobLog, Result, ResultArchive, ZScore, ZScoreArchive
+
+# Coppie (risultati, punteggi): tabelle calde e tabelle di archivio
+HOT = (Result, ZScore)
+ARCHIVE = (ResultArchive, ZScoreArchive)
+
+
+class ArchiveError(Exception):
+    """Ciclo non archiviabile o non ripristinabile"""
+    pass
+
+
+# ===========================
+# LETTURA
+# ===========================
+
+def result_sources(lab_code, since=None, cycle_codes=None):
+    """
+    Tabelle da interrogare per i risultati di un laboratorio in una finestra
+
+    Args:
+        lab_code: Codice del laboratorio
+        since: Inizio della finestra su submitted_at (None = tutto lo storico)
+        cycle_codes: Cicli filtrati (opzionale)
+
+    Returns:
+        list: [(Result, ZScore)], più (ResultArchive, ZScoreArchive) se la finestra arriva ai dati archiviati
+    """
+    if cycle_codes:
+        # I cicli richiesti dicono subito se serve l'archivio, senza toccarlo
+        reaches_archive = db.session.scalar(select(exists().where(
+            Cycle.code.in_(list(cycle_codes)), Cycle.archived_at.isnot(None)
+        )))
+    else:
+        condition = ResultArchive.lab_code == lab_code
+        if since is not None:
+            condition = condition & (ResultArchive.submitted_at >= since)
+        reaches_archive = db.session.scalar(select(exists().where(condition)))
+    return [HOT, ARCHIVE] if reaches_archive else [HOT]
+
+
+def union_results(build, sources):
+    """
+    Stessa select sulle tabelle calde e, se richieste, su quelle di archivio
+
+    Args:
+        build: Funzione (modello risultati, modello punteggi) -> Select
+        sources: Coppie di tabelle da result_sources
+
+    Returns:
+        Subquery: La select (una sola fonte) o l'UNION ALL delle select, con le colonne della prima
+    """
+    selects = [build(results, scores) for results, scores in sources]
+    statement = selects[0] if len(selects) == 1 else union_all(*selects)
+    return statement.subquery('results')
+
+
+def distinct_options(build, sources):
+    """
+    Righe distinte (codice, nome) per le opzioni dei filtri, ordinate per codice
+
+    Args:
+        build: Funzione (modello risultati, modello punteggi) -> Select
+        sources: Coppie di tabelle da result_sources
+
+    Returns:
+        list: Righe distinte dell'unione
+    """
+    results = union_results(build, sources)
+    first_column = next(iter(results.c))
+    return db.session.execute(select(results).distinct().order_by(first_column)).all()
+
+
+def archived_cycle_codes(cycle_codes):
+    """Cicli archiviati tra quelli indicati"""
+    return set(db.session.scalars(
+        select(Cycle.code).where(Cycle.code.in_(list(cycle_codes)), Cycle.archived_at.isnot(None))
+    ))
+
+
+# ===========================
+# ARCHIVIAZIONE
+# ===========================
+
+def archivable_cycles(older_than_days=None):
+    """
+    Cicli pubblicati, non archiviati, terminati da più di older_than_days giorni
+
+    Args:
+        older_than_days: Età minima dalla fine del ciclo (default ARCHIVE_AFTER_DAYS)
+
+    Returns:
+        list: Codici dei cicli, dal più vecchio
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    return list(db.session.scalars(
+        select(Cycle.code).where(Cycle.status == 'published', Cycle.archived_at.is_(None),
+                                 Cycle.end_date.isnot(None), Cycle.end_date < cutoff)
+        .order_by(Cycle.end_date)
+    ))
+
+
+def _move(source, target, cycle_code):
+    """Sposta risultati e punteggi di un ciclo da una coppia di tabelle all'altra (stessa transazione)"""
+    (results, scores), (target_results, target_scores) = source, target
+    result_ids = select(results.id).where(results.cycle_code == cycle_code)
+    result_columns = [column.name for column in results.__table__.columns]
+    score_columns = [column.name for column in scores.__table__.columns]
+
+    moved = db.session.execute(insert(target_results).from_select(
+        result_columns, select(*(getattr(results, name) for name in result_columns))
+        .where(results.cycle_code == cycle_code)
+    )).rowcount
+    db.session.execute(insert(target_scores).from_select(
+        score_columns, select(*(getattr(scores, name) for name in score_columns))
+        .where(scores.result_id.in_(result_ids))
+    ))
+    db.session.execute(delete(scores).where(scores.result_id.in_(result_ids))
+                       .execution_options(synchronize_session=False))
+    db.session.execute(delete(results).where(results.cycle_code == cycle_code)
+                       .execution_options(synchronize_session=False))
+    return moved
+
+
+def archive_cycle(cycle_code):
+    """
+    Sposta nelle tabelle di archivio i risultati di un ciclo
+
+    Returns:
+        int: Risultati archiviati
+
+    Raises:
+        ArchiveError: Ciclo inesistente o già archiviato
+    """
+    cycle = Cycle.query.filter_by(code=cycle_code).first()
+    if cycle is None:
+        raise ArchiveError(f"Ciclo {cycle_code} non trovato")
+    if cycle.archived_at is not None:
+        raise ArchiveError(f"Ciclo {cycle_code} già archiviato")
+    try:
+        moved = _move(HOT, ARCHIVE, cycle_code)
+        db.session.execute(update(Cycle).where(Cycle.code == cycle_code).values(archived_at=datetime.utcnow()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return moved
+
+
+def restore_cycle(cycle_code):
+    """
+    Riporta nelle tabelle calde i risultati di un ciclo archiviato
+
+    Returns:
+        int: Risultati ripristinati
+
+    Raises:
+        ArchiveError: Ciclo inesistente, non archiviato o con id già riusati nelle tabelle calde
+    """
+    cycle = Cycle.query.filter_by(code=cycle_code).first()
+    if cycle is None:
+        raise ArchiveError(f"Ciclo {cycle_code} non trovato")
+    if cycle.archived_at is None:
+        raise ArchiveError(f"Ciclo {cycle_code} non archiviato")
+    clash = db.session.scalar(select(exists().where(
+        Result.id.in_(select(ResultArchive.id).where(ResultArchive.cycle_code == cycle_code))
+    )))
+    if clash:
+        raise ArchiveError(f"Id dei risultati di {cycle_code} già in uso nelle tabelle calde")
+    try:
+        moved = _move(ARCHIVE, HOT, cycle_code)
+        db.session.execute(update(Cycle).where(Cycle.code == cycle_code).values(archived_at=None))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return moved
+
+
+def run_archival(older_than_days=None, progress=None):
+    """
+    Archivia tutti i cicli archiviabili, uno per transazione, registrando il job nel JobLog
+
+    Args:
+        older_than_days: Età minima dalla fine del ciclo (default ARCHIVE_AFTER_DAYS)
+        progress: Callback opzionale (codice ciclo, risultati archiviati)
+
+    Returns:
+        JobLog: Job dell'archiviazione ('archive')
+    """
+    cycle_codes = archivable_cycles(older_than_days)
+    details = {'cycles': {}, 'results': 0}
+    job = JobLog(job_type='archive', status='running', started_at=datetime.utcnow(), details=json.dumps(details))
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    try:
+        for cycle_code in cycle_codes:
+            moved = archive_cycle(cycle_code)
+            details['cycles'][cycle_code] = moved
+            details['results'] += moved
+            if progress:
+                progress(cycle_code, moved)
+        status, error = 'completed', None
+    except Exception as e:
+        current_app.logger.error(f"Archiviazione interrotta: {e}")
+        status, error = 'failed', str(e)
+
+    job = db.session.get(JobLog, job_id)
+    job.status = status
+    job.error_message = error
+    job.completed_at = datetime.utcnow()
+    job.details = json.dumps(details)
+    db.session.commit()
+    return job
+
+
+def archive_summary():
+    """Cicli archiviati e righe nelle tabelle calde e di archivio"""
+    return {
+        'archived_cycles': db.session.scalar(select(func.count(Cycle.id)).where(Cycle.archived_at.isnot(None))),
+        'hot_results': db.session.scalar(select(func.count(Result.id))),
+        'archived_results': db.session.scalar(select(func.count(ResultArchive.id))),
+    }
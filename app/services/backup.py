@@ -0,0 +1,648 @@
+# app/services/backup.py
+"""
+Backup a caldo del database, incrementali e prova di ripristino
+
+SQLite: la copia usa l'API di backup online (sqlite3.Connection.backup) a passi
+di BACKUP_PAGES_PER_STEP pagine con una pausa di BACKUP_STEP_SLEEP secondi tra
+un passo e l'altro. In modalità WAL la connessione sorgente tiene aperta una
+transazione di lettura: la copia è l'istantanea del database all'inizio del
+backup e chi scrive continua a farlo (le scritture vanno nel WAL). Con il
+journal classico il lock di lettura è rilasciato tra un passo e l'altro, per
+non bloccare le scritture, e SQLite riparte se il database cambia nel frattempo.
+
+L'istantanea è compressa (zstd se è installato il pacchetto zstandard,
+altrimenti gzip) e accompagnata da un manifest JSON e dall'impronta di ogni
+pagina. Un backup incrementale confronta le impronte con quelle del backup
+precedente e salva solo le pagine cambiate: il ripristino applica al backup
+completo gli incrementali della catena, in ordine, e ricostruisce il database
+byte per byte (controllato con lo SHA-256 dell'istantanea).
+
+PostgreSQL: esportazione logica con pg_dump (formato custom, un'unica
+istantanea senza lock sulle scritture) compressa allo stesso modo; solo backup
+completi, da ripristinare con pg_restore.
+
+La prova di ripristino ricostruisce il backup in un file temporaneo, controlla
+integrità, SHA-256 e righe per tabella e registra il tempo nel manifest.
+Backup e prove sono registrati nel JobLog (job_type 'backup' e 'backup_verify').
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models import JobLog
+
+# Byte dell'impronta di una pagina (blake2b)
+PAGE_DIGEST_SIZE = 8
+
+# Pagine lette per blocco da istantanee e incrementali
+READ_PAGES = 256
+
+# Intestazione dei file incrementali: magic, dimensione pagina, numero di pagine
+DELTA_MAGIC = b'OCHEMPG1'
+_DELTA_HEADER = struct.Struct('>8sII')
+_PAGE_NUMBER = struct.Struct('>I')
+
+# Backup non eseguibili in parallelo nello stesso processo
+_running = threading.Lock()
+
+
+class BackupError(Exception):
+    """Backup, prova o ripristino non eseguibile"""
+    pass
+
+
+# ===========================
+# COMPRESSIONE
+# ===========================
+
+def compression_codec():
+    """
+    Compressione dei nuovi backup secondo BACKUP_COMPRESSION
+
+    Returns:
+        str: 'zst', 'gz' o '' (nessuna compressione)
+
+    Raises:
+        BackupError: zstd richiesto ma il pacchetto zstandard non è installato
+    """
+    setting = current_app.config['BACKUP_COMPRESSION']
+    if setting in ('auto', 'zstd'):
+        try:
+            import zstandard  # noqa: F401
+            return 'zst'
+        except ImportError:
+            if setting == 'zstd':
+                raise BackupError("La compressione zstd richiede il pacchetto zstandard")
+    if setting == 'none':
+        return ''
+    return 'gz'
+
+
+def _open_compressed(path, mode, codec=None):
+    """File compresso (codec o, se manca, l'estensione) aperto in lettura ('rb') o scrittura ('wb')"""
+    if codec is None:
+        codec = os.path.splitext(path)[1].lstrip('.')
+    if codec == 'gz':
+        return gzip.open(path, mode, compresslevel=6)
+    if codec == 'zst':
+        import zstandard
+        raw = open(path, mode)
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    return open(path, mode)
+
+
+# ===========================
+# MANIFEST
+# ===========================
+
+def backup_dir():
+    """Cartella dei backup (creata se manca)"""
+    path = current_app.config['BACKUP_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _manifest_path(backup_id):
+    return os.path.join(backup_dir(), f"{backup_id}.json")
+
+
+def _write_manifest(manifest):
+    path = _manifest_path(manifest['id'])
+    with open(path + '.part', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.part', path)
+
+
+def list_backups():
+    """
+    Backup disponibili, dal più recente
+
+    Returns:
+        list: Manifest dei backup completati
+    """
+    manifests = []
+    for name in os.listdir(backup_dir()):
+        if name.endswith('.json'):
+            with open(os.path.join(backup_dir(), name)) as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda m: m['created_at'], reverse=True)
+
+
+def get_backup(backup_id):
+    """
+    Manifest di un backup
+
+    Raises:
+        BackupError: Backup inesistente
+    """
+    if os.path.basename(backup_id) != backup_id or not os.path.exists(_manifest_path(backup_id)):
+        raise BackupError(f"Backup {backup_id} non trovato")
+    with open(_manifest_path(backup_id)) as f:
+        return json.load(f)
+
+
+def backup_file(manifest):
+    """Percorso del file dati di un backup"""
+    return os.path.join(backup_dir(), manifest['file'])
+
+
+def backup_chain(backup_id):
+    """
+    Backup da applicare per ricostruire backup_id: il completo di partenza e gli incrementali in ordine
+
+    Raises:
+        BackupError: Un backup della catena manca
+    """
+    chain = [get_backup(backup_id)]
+    while chain[0].get('parent_id'):
+        chain.insert(0, get_backup(chain[0]['parent_id']))
+    return chain
+
+
+# ===========================
+# SQLITE
+# ===========================
+
+def _engine_name():
+    return db.engine.dialect.name
+
+
+def _sqlite_path():
+    """Percorso del file SQLite dell'applicazione"""
+    database = db.engine.url.database
+    if not database or database == ':memory:':
+        raise BackupError("Il database SQLite in memoria non ha un file da copiare")
+    return os.path.abspath(database)
+
+
+def _table_counts(connection):
+    """Righe per tabella di un database SQLite"""
+    tables = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    return {table: connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def snapshot_sqlite(target_path, progress=None):
+    """
+    Copia a caldo del database SQLite in target_path con l'API di backup online
+
+    Args:
+        target_path: File di destinazione (sovrascritto)
+        progress: Callback opzionale (pagine copiate, pagine totali) dopo ogni passo
+
+    Returns:
+        dict: page_size, page_count, steps, wal e tables (righe per tabella dell'istantanea)
+    """
+    pages = current_app.config['BACKUP_PAGES_PER_STEP']
+    sleep = current_app.config['BACKUP_STEP_SLEEP']
+    steps = 0
+
+    def on_step(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if progress:
+            progress(total - remaining, total)
+
+    source = sqlite3.connect(_sqlite_path(), isolation_level=None, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            # La transazione di lettura fissa l'istantanea; le scritture proseguono nel WAL
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=pages, progress=on_step, sleep=sleep)
+        if wal:
+            source.execute('COMMIT')
+        # Copia autonoma, senza file -wal
+        target.execute('PRAGMA journal_mode=DELETE').fetchone()
+        info = {
+            'page_size': target.execute('PRAGMA page_size').fetchone()[0],
+            'page_count': target.execute('PRAGMA page_count').fetchone()[0],
+            'steps': steps,
+            'wal': wal,
+            'tables': _table_counts(target),
+        }
+    finally:
+        target.close()
+        source.close()
+    return info
+
+
+def _iter_pages(stream, page_size):
+    """Pagine di un file di database letto a blocchi"""
+    while True:
+        block = stream.read(page_size * READ_PAGES)
+        if not block:
+            return
+        for offset in range(0, len(block), page_size):
+            yield block[offset:offset + page_size]
+
+
+def _page_digest(page):
+    return hashlib.blake2b(page, digest_size=PAGE_DIGEST_SIZE).digest()
+
+
+def _read_page_digests(manifest):
+    """Impronte delle pagine di un backup (None se mancano)"""
+    path = os.path.join(backup_dir(), manifest.get('page_digests') or '')
+    if not manifest.get('page_digests') or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _latest_sqlite_backup():
+    """Backup SQLite più recente con le impronte delle pagine (base di un incrementale)"""
+    for manifest in list_backups():
+        if manifest['engine'] == 'sqlite' and _read_page_digests(manifest) is not None:
+            return manifest
+    return None
+
+
+def _write_full(snapshot_path, data_path, page_size, codec):
+    """Comprime l'istantanea; restituisce (sha256, impronte delle pagine)"""
+    sha256 = hashlib.sha256()
+    digests = bytearray()
+    with open(snapshot_path, 'rb') as source, _open_compressed(data_path, 'wb', codec) as out:
+        for page in _iter_pages(source, page_size):
+            sha256.update(page)
+            digests += _page_digest(page)
+            out.write(page)
+    return sha256.hexdigest(), bytes(digests)
+
+
+def _write_delta(snapshot_path, data_path, page_size, page_count, parent_digests, codec):
+    """Salva le pagine diverse dal backup precedente; restituisce (sha256, impronte, pagine cambiate)"""
+    sha256 = hashlib.sha256()
+    digests = bytearray()
+    changed = 0
+    with open(snapshot_path, 'rb') as source, _open_compressed(data_path, 'wb', codec) as out:
+        out.write(_DELTA_HEADER.pack(DELTA_MAGIC, page_size, page_count))
+        for number, page in enumerate(_iter_pages(source, page_size)):
+            sha256.update(page)
+            digest = _page_digest(page)
+            digests += digest
+            start = number * PAGE_DIGEST_SIZE
+            if parent_digests[start:start + PAGE_DIGEST_SIZE] != digest:
+                out.write(_PAGE_NUMBER.pack(number))
+                out.write(page)
+                changed += 1
+    return sha256.hexdigest(), bytes(digests), changed
+
+
+def _apply_delta(data_path, target):
+    """Scrive nel file target le pagine di un incrementale e lo porta alla lunghezza dell'istantanea"""
+    with _open_compressed(data_path, 'rb') as delta:
+        magic, page_size, page_count = _DELTA_HEADER.unpack(delta.read(_DELTA_HEADER.size))
+        if magic != DELTA_MAGIC:
+            raise BackupError(f"{os.path.basename(data_path)} non è un backup incrementale")
+        while True:
+            header = delta.read(_PAGE_NUMBER.size)
+            if not header:
+                break
+            number, = _PAGE_NUMBER.unpack(header)
+            target.seek(number * page_size)
+            target.write(delta.read(page_size))
+    target.truncate(page_count * page_size)
+
+
+# ===========================
+# BACKUP
+# ===========================
+
+def _new_backup_id(kind):
+    return f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')[:-3]}_{kind}"
+
+
+def create_backup(incremental=False, progress=None):
+    """
+    Esegue un backup del database dell'applicazione
+
+    Args:
+        incremental: Solo le pagine cambiate dall'ultimo backup (SQLite; completo se non c'è un backup di partenza)
+        progress: Callback opzionale (pagine copiate, pagine totali) durante la copia SQLite
+
+    Returns:
+        dict: Manifest del backup
+
+    Raises:
+        BackupError: Database non supportato, backup già in corso o pg_dump non disponibile
+    """
+    if not _running.acquire(blocking=False):
+        raise BackupError("Un backup è già in corso")
+    try:
+        engine = _engine_name()
+        if engine == 'sqlite':
+            return _backup_sqlite(incremental, progress)
+        if engine == 'postgresql':
+            if incremental:
+                raise BackupError("Il backup incrementale è disponibile solo per SQLite "
+                                  "(su PostgreSQL usare l'archiviazione continua del WAL)")
+            return _backup_postgres()
+        raise BackupError(f"Backup non supportato per il database {engine}")
+    finally:
+        _running.release()
+
+
+def _backup_sqlite(incremental, progress):
+    parent = _latest_sqlite_backup() if incremental else None
+    start = time.perf_counter()
+    codec = compression_codec()
+
+    fd, snapshot_path = tempfile.mkstemp(suffix='.sqlite3', dir=backup_dir())
+    os.close(fd)
+    try:
+        info = snapshot_sqlite(snapshot_path, progress=progress)
+        snapshot_seconds = time.perf_counter() - start
+        if parent is not None and parent['page_size'] != info['page_size']:
+            parent = None  # VACUUM con un'altra dimensione di pagina: serve un completo
+
+        kind = 'incremental' if parent is not None else 'full'
+        backup_id = _new_backup_id(kind)
+        data_file = f"{backup_id}.{'pages' if parent is not None else 'sqlite3'}" + (f".{codec}" if codec else '')
+        data_path = os.path.join(backup_dir(), data_file)
+        if parent is not None:
+            sha256, digests, changed = _write_delta(snapshot_path, data_path + '.part', info['page_size'],
+                                                    info['page_count'], _read_page_digests(parent), codec)
+        else:
+            sha256, digests = _write_full(snapshot_path, data_path + '.part', info['page_size'], codec)
+            changed = info['page_count']
+        os.replace(data_path + '.part', data_path)
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+    digests_file = f"{backup_id}.pagedigest"
+    with open(os.path.join(backup_dir(), digests_file), 'wb') as f:
+        f.write(digests)
+
+    manifest = {
+        'id': backup_id,
+        'kind': kind,
+        'engine': 'sqlite',
+        'created_at': datetime.utcnow().isoformat(),
+        'parent_id': parent['id'] if parent is not None else None,
+        'base_id': (parent.get('base_id') or parent['id']) if parent is not None else None,
+        'file': data_file,
+        'page_digests': digests_file,
+        'compression': codec or None,
+        'page_size': info['page_size'],
+        'page_count': info['page_count'],
+        'changed_pages': changed,
+        'database_bytes': info['page_size'] * info['page_count'],
+        'size_bytes': os.path.getsize(data_path),
+        'sha256': sha256,
+        'tables': info['tables'],
+        'steps': info['steps'],
+        'wal': info['wal'],
+        'snapshot_seconds': round(snapshot_seconds, 3),
+        'seconds': round(time.perf_counter() - start, 3),
+        'verify': None,
+    }
+    _write_manifest(manifest)
+    return manifest
+
+
+def _pg_command(program, *args):
+    """Comando pg_dump/pg_restore con i parametri di connessione dell'applicazione (password nell'ambiente)"""
+    url = db.engine.url
+    command = [program, *args]
+    for option, value in (('--host', url.host), ('--port', url.port), ('--username', url.username),
+                          ('--dbname', url.database)):
+        if value:
+            command += [option, str(value)]
+    env = dict(os.environ)
+    if url.password:
+        env['PGPASSWORD'] = str(url.password)
+    return command, env
+
+
+def _backup_postgres():
+    start = time.perf_counter()
+    codec = compression_codec()
+    backup_id = _new_backup_id('full')
+    data_file = f"{backup_id}.dump" + (f".{codec}" if codec else '')
+    data_path = os.path.join(backup_dir(), data_file)
+
+    # pg_dump lavora su un'istantanea REPEATABLE READ: le scritture non sono bloccate
+    command, env = _pg_command('pg_dump', '--format=custom', '--compress=0', '--no-owner')
+    sha256 = hashlib.sha256()
+    try:
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise BackupError("pg_dump non trovato: installare i client PostgreSQL")
+    with _open_compressed(data_path + '.part', 'wb', codec) as out:
+        for block in iter(lambda: process.stdout.read(1024 * 1024), b''):
+            sha256.update(block)
+            out.write(block)
+    stderr = process.stderr.read().decode(errors='replace')
+    if process.wait() != 0:
+        os.remove(data_path + '.part')
+        raise BackupError(f"pg_dump non riuscito: {stderr.strip()}")
+    os.replace(data_path + '.part', data_path)
+
+    manifest = {
+        'id': backup_id,
+        'kind': 'full',
+        'engine': 'postgresql',
+        'created_at': datetime.utcnow().isoformat(),
+        'parent_id': None,
+        'base_id': None,
+        'file': data_file,
+        'page_digests': None,
+        'compression': codec or None,
+        'size_bytes': os.path.getsize(data_path),
+        'sha256': sha256.hexdigest(),
+        'seconds': round(time.perf_counter() - start, 3),
+        'verify': None,
+    }
+    _write_manifest(manifest)
+    return manifest
+
+
+# ===========================
+# RIPRISTINO E PROVA
+# ===========================
+
+def restore_backup(backup_id, target_path):
+    """
+    Ricostruisce un backup in un nuovo file (mai sul database in uso)
+
+    SQLite: database completo al momento del backup (completo + incrementali della catena).
+    PostgreSQL: archivio pg_dump da caricare con pg_restore.
+
+    Args:
+        backup_id: Backup da ripristinare
+        target_path: File di destinazione (non deve esistere)
+
+    Returns:
+        dict: target, sha256 e seconds
+
+    Raises:
+        BackupError: Backup inesistente, destinazione esistente o catena danneggiata
+    """
+    chain = backup_chain(backup_id)
+    target_path = os.path.abspath(target_path)
+    if os.path.exists(target_path):
+        raise BackupError(f"{target_path} esiste già")
+    if _engine_name() == 'sqlite' and target_path == _sqlite_path():
+        raise BackupError("La destinazione è il database in uso")
+
+    start = time.perf_counter()
+    with open(target_path + '.part', 'wb') as target:
+        with _open_compressed(backup_file(chain[0]), 'rb') as source:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    if len(chain) > 1:
+        with open(target_path + '.part', 'r+b') as target:
+            for manifest in chain[1:]:
+                _apply_delta(backup_file(manifest), target)
+
+    sha256 = hashlib.sha256()
+    with open(target_path + '.part', 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    os.replace(target_path + '.part', target_path)
+    return {'target': target_path, 'sha256': sha256.hexdigest(), 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def verify_backup(backup_id):
+    """
+    Prova di ripristino cronometrata: ricostruisce il backup in un file temporaneo e lo controlla
+
+    SQLite: SHA-256 dell'istantanea, PRAGMA integrity_check e righe per tabella.
+    PostgreSQL: SHA-256 e indice dell'archivio leggibile da pg_restore --list.
+
+    Returns:
+        dict: Esito (ok, errors, restore_seconds, check_seconds, verified_at), salvato anche nel manifest
+    """
+    manifest = get_backup(backup_id)
+    workdir = tempfile.mkdtemp(dir=backup_dir())
+    target = os.path.join(workdir, 'restore')
+    errors = []
+    try:
+        restored = restore_backup(backup_id, target)
+        if restored['sha256'] != manifest['sha256']:
+            errors.append("SHA-256 del ripristino diverso da quello del backup")
+
+        start = time.perf_counter()
+        if manifest['engine'] == 'sqlite':
+            connection = sqlite3.connect(target)
+            try:
+                integrity = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+                if integrity != ['ok']:
+                    errors += integrity[:20]
+                counts = _table_counts(connection)
+            finally:
+                connection.close()
+            for table, rows in manifest['tables'].items():
+                if counts.get(table) != rows:
+                    errors.append(f"Tabella {table}: {counts.get(table)} righe invece di {rows}")
+        else:
+            try:
+                # Solo l'indice dell'archivio: nessuna connessione al database
+                listing = subprocess.run(['pg_restore', '--list', target], capture_output=True, text=True)
+            except FileNotFoundError:
+                raise BackupError("pg_restore non trovato: installare i client PostgreSQL")
+            if listing.returncode != 0:
+                errors.append(listing.stderr.strip())
+        check_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        'ok': not errors,
+        'errors': errors,
+        'restore_seconds': restored['seconds'],
+        'check_seconds': round(check_seconds, 3),
+        'verified_at': datetime.utcnow().isoformat(),
+    }
+    manifest['verify'] = result
+    _write_manifest(manifest)
+    return result
+
+
+# ===========================
+# JOB
+# ===========================
+
+def start_job(action, backup_id=None, incremental=False, background=True, progress=None):
+    """
+    Avvia un backup ('backup') o una prova di ripristino ('backup_verify') registrandola nel JobLog
+
+    Args:
+        action: 'backup' o 'backup_verify'
+        backup_id: Backup da provare (solo backup_verify)
+        incremental: Backup incrementale (solo backup)
+        background: Esegue in un thread (default True, per le richieste web)
+        progress: Callback (pagine copiate, pagine totali) per il backup nello stesso processo
+
+    Returns:
+        JobLog: Job avviato (completato se eseguito subito)
+    """
+    if action == 'backup_verify':
+        get_backup(backup_id)
+    details = {'backup_id': backup_id} if action == 'backup_verify' else {'incremental': incremental}
+    job = JobLog(job_type=action, status='running', started_at=datetime.utcnow(), details=json.dumps(details))
+    db.session.add(job)
+    db.session.commit()
+
+    if not background:
+        run_job(job.id, progress=progress)
+        return db.session.get(JobLog, job.id)
+
+    app = current_app._get_current_object()
+
+    def worker():
+        with app.app_context():
+            run_job(job.id)
+
+    threading.Thread(target=worker, name=f"{action}-{job.id}", daemon=True).start()
+    return job
+
+
+def run_job(job_id, progress=None):
+    """
+    Esegue il backup o la prova registrati in un JobLog
+
+    Returns:
+        dict: Dettagli finali del job
+    """
+    job = db.session.get(JobLog, job_id)
+    details = json.loads(job.details)
+    db.session.commit()  # nessuna transazione aperta durante la copia
+    try:
+        if job.job_type == 'backup':
+            manifest = create_backup(details['incremental'], progress=progress)
+            details.update(backup_id=manifest['id'], kind=manifest['kind'], size_bytes=manifest['size_bytes'],
+                           seconds=manifest['seconds'])
+        else:
+            details.update(verify_backup(details['backup_id']))
+        job = db.session.get(JobLog, job_id)
+        job.status = 'completed' if details.get('ok', True) else 'failed'
+        job.error_message = '; '.join(details.get('errors', []))[:1000] or None
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"{job.job_type} fallito: {e}")
+        job = db.session.get(JobLog, job_id)
+        job.status = 'failed'
+        job.error_message = str(e)
+    job.completed_at = datetime.utcnow()
+    job.details = json.dumps(details)
+    db.session.commit()
+    return details
@@ -0,0 +1,370 @@
+# app/services/bulk_import.py
+"""
+Import massivo dei risultati da parte dei provider PT
+
+Un unico file (CSV, Excel o Parquet) con le colonne lab_code, cycle_code,
+parameter_code, result_value (e opzionali technique_code, unit_code,
+date_performed, uncertainty) viene suddiviso per laboratorio e ciclo. Le righe
+sono validate con le stesse regole degli upload dei laboratori e dell'API
+(validate_results, una sola volta su tutto il file), più i controlli sul ciclo
+di ogni partizione. Ogni partizione è portata nelle unità dei parametri (vedi
+services/unit_conversion.py), valutata (z, sz², z', zeta, En, rsz con i valori
+di riferimento del proprio ciclo) e salvata in una sua transazione, come un upload del laboratorio: stesso
+hash del contenuto, stesso diff riga per riga (vedi stats/uploads_stats.py).
+Per default le righe si aggiungono ai risultati del laboratorio nel ciclo o li
+correggono; solo con mode='replace' la partizione sostituisce i risultati del
+ciclo e quelli assenti dal file (anche caricati dal laboratorio) sono eliminati.
+
+Le partizioni si elaborano in parallelo in un pool di processi; il risultato è
+un report per laboratorio con gli errori di ciascuna partizione. Una partizione
+con righe non valide non viene importata.
+"""
+import io
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models import Lab, Cycle, CycleParameter, UploadFile, JobLog
+from app.blueprints.stats.uploads_stats import UPLOAD_MODES, DEFAULT_UPLOAD_MODE
+from app.blueprints.stats.validation_stats import validate_results
+from app.services.archive import archived_cycle_codes
+from app.services.snapshots import frozen_cycle_codes
+from app.services.spreadsheet import SpreadsheetError, read_xlsx
+from app.services.unit_conversion import normalize_units
+
+REQUIRED_COLUMNS = ['lab_code', 'cycle_code', 'parameter_code', 'result_value']
+OPTIONAL_COLUMNS = ['technique_code', 'unit_code', 'date_performed', 'uncertainty']
+
+_worker_app = None
+
+
+class BulkImportError(Exception):
+    """Errore bloccante dell'import (file illeggibile, colonne mancanti)"""
+    pass
+
+
+def read_bulk_file(stream, filename):
+    """
+    Legge il file del provider in un DataFrame
+
+    Args:
+        stream: File o stream binario
+        filename: Nome del file (l'estensione sceglie il formato)
+
+    Returns:
+        DataFrame: Righe con colonne normalizzate e numero di riga 'row'
+
+    Raises:
+        BulkImportError: Formato non supportato o colonne mancanti
+    """
+    import pandas as pd
+
+    name = filename.lower()
+    try:
+        if name.endswith('.parquet'):
+            df = pd.read_parquet(stream)
+        elif name.endswith('.csv'):
+            df = pd.read_csv(stream, dtype=str, keep_default_na=False)
+        elif name.endswith('.xlsx'):
+            df = read_xlsx(stream)
+        else:
+            raise BulkImportError("Formato non supportato: usa un file .csv, .xlsx o .parquet")
+    except ImportError:
+        raise BulkImportError("La lettura dei file Parquet richiede il pacchetto pyarrow")
+    except SpreadsheetError as e:
+        raise BulkImportError(str(e))
+    except (ValueError, OSError) as e:
+        raise BulkImportError(f"File non leggibile: {e}")
+
+    df.columns = df.columns.str.strip().str.lower()
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise BulkImportError(f"Colonne obbligatorie mancanti: {missing}")
+
+    df = df[REQUIRED_COLUMNS + [col for col in OPTIONAL_COLUMNS if col in df.columns]].copy()
+    # Tutto come testo (anche i valori numerici del Parquet): la validazione vede i valori come scritti
+    for col in df.columns:
+        df[col] = df[col].astype('string').str.strip().fillna('').astype(object)
+    # Numero di riga dei dati (1 = prima riga dopo l'intestazione)
+    df['row'] = range(1, len(df) + 1)
+    return df
+
+
+def _reference_values(cycle_codes):
+    """Valori di riferimento per ciclo: {(cycle_code, parameter_code): (xpt, sigma_pt, u_xpt)}"""
+    rows = db.session.query(
+        CycleParameter.cycle_code, CycleParameter.parameter_code, CycleParameter.xpt, CycleParameter.sigma_pt,
+        CycleParameter.u_xpt
+    ).filter(CycleParameter.cycle_code.in_(cycle_codes)).all()
+    return {
+        (cycle, param): (float(xpt), float(sigma), float(u_xpt) if u_xpt is not None else None)
+        for cycle, param, xpt, sigma, u_xpt in rows
+    }
+
+
+def _partition_errors(part, lab_code, cycle_code, known_lab, known_cycle, refs, row_errors, archived_cycle=False,
+                      frozen_cycle=False):
+    """
+    Errori di una partizione lab/ciclo
+
+    Args:
+        part: Righe della partizione
+        lab_code, cycle_code: Laboratorio e ciclo della partizione
+        known_lab, known_cycle: Laboratorio e ciclo esistono in anagrafica
+        refs: Valori di riferimento del ciclo {(cycle_code, parameter_code): (xpt, sigma_pt, u_xpt)}
+        row_errors: Errori di validate_results per le righe della partizione
+        archived_cycle, frozen_cycle: Ciclo archiviato o congelato
+
+    Returns:
+        list: Errori come dict con row (None = intera partizione) ed error, ordinati per riga
+    """
+    if not known_lab:
+        return [{'row': None, 'error': f"Laboratorio sconosciuto: {lab_code}"}]
+    if not known_cycle:
+        return [{'row': None, 'error': f"Ciclo sconosciuto: {cycle_code}"}]
+    if archived_cycle:
+        return [{'row': None, 'error': f"Ciclo archiviato: {cycle_code}"}]
+    if frozen_cycle:
+        return [{'row': None, 'error': f"Ciclo congelato: {cycle_code}"}]
+
+    errors = [{'row': error['row'], 'error': error['error']} for error in row_errors]
+    # Controlli sul ciclo solo per le righe altrimenti valide e compilate (come fa l'upload)
+    invalid = {error['row'] for error in row_errors}
+    checked = part[~part['row'].isin(invalid) & part['result_value'].ne('')]
+    for row, code in zip(checked['row'], checked['parameter_code']):
+        if (cycle_code, code) not in refs:
+            errors.append({'row': int(row), 'error': f"Parametro {code} non previsto nel ciclo {cycle_code}"})
+        elif not refs[(cycle_code, code)][1] > 0:
+            errors.append({'row': int(row), 'error': f"sigma_pt non positivo per il ciclo {cycle_code}"})
+    if not errors and checked.empty:
+        errors.append({'row': None, 'error': "Nessun result_value nella partizione"})
+    return sorted(errors, key=lambda e: e['row'] or 0)
+
+
+def import_partition(task):
+    """
+    Valuta e salva una partizione lab/ciclo (in una propria transazione)
+
+    Args:
+        task: dict con lab_code, cycle_code, rows (CSV della partizione), errors (da _partition_errors),
+            refs, user_id, source, mode (UPLOAD_MODES)
+
+    Returns:
+        dict: Report della partizione (status, conteggi, errori)
+    """
+    import pandas as pd
+    from app.blueprints.stats.services_stats import _calculate_statistics
+    from app.blueprints.stats.uploads_stats import compute_content_hash, find_duplicate_upload, save_upload_rows
+    from app.services.data_version import bump_data_version
+    from app.services.history_store import sync_lab
+
+    lab_code, cycle_code = task['lab_code'], task['cycle_code']
+    report = {'lab_code': lab_code, 'cycle_code': cycle_code, 'rows': 0, 'status': 'error', 'errors': []}
+    try:
+        raw = task['rows'].encode()
+        part = pd.read_csv(io.BytesIO(raw), dtype=str, keep_default_na=False)
+        report['rows'] = len(part)
+
+        if task['errors']:
+            report['errors'] = task['errors']
+            return report
+        # Righe del template senza result_value: ignorate, come negli upload
+        part = part[part['result_value'].str.strip().ne('')].copy()
+
+        # Hash senza i numeri di riga: la stessa partizione in un'altra posizione del file è identica
+        content_hash = compute_content_hash(part.drop(columns=['row']).to_csv(index=False).encode())
+        replace = task['mode'] == 'replace'
+        # In sostituzione si confronta sempre: il file può non coprire righe caricate da altri upload
+        if not replace and find_duplicate_upload(lab_code, cycle_code, content_hash):
+            report['status'] = 'skipped'
+            return report
+
+        refs = task['refs']
+        part['result_value'] = pd.to_numeric(part['result_value'].str.strip())
+        if 'uncertainty' in part.columns:
+            part['uncertainty'] = pd.to_numeric(part['uncertainty'].str.strip(), errors='coerce')
+        normalize_units(part)
+        part['xpt'] = [refs[(cycle_code, code)][0] for code in part['parameter_code']]
+        part['spt'] = [refs[(cycle_code, code)][1] for code in part['parameter_code']]
+        part['u_xpt'] = [refs[(cycle_code, code)][2] for code in part['parameter_code']]
+        part = _calculate_statistics(part)
+
+        upload = UploadFile(
+            filename=f"bulk_{lab_code}_{cycle_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            original_filename=task['source'],
+            file_size=len(raw),
+            mime_type='text/csv',
+            lab_code=lab_code,
+            cycle_code=cycle_code,
+            uploaded_by=task['user_id'],
+            uploaded_at=datetime.utcnow(),
+            processed_at=datetime.utcnow(),
+            status='processed',
+            content_hash=content_hash,
+        )
+        db.session.add(upload)
+        db.session.flush()
+        changes = save_upload_rows(part, lab_code, upload.id, cycle_code, replace=replace)
+        changed = changes['insert'] or changes['update'] or changes['delete']
+        if changed:
+            bump_data_version(lab_code)
+        db.session.commit()
+        if changed:
+            sync_lab(lab_code, append_only=not (changes['update'] or changes['delete']))
+
+        report.update(status='imported', **changes)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk import {lab_code}/{cycle_code} fallito: {e}")
+        report['errors'] = [{'row': None, 'error': str(e)}]
+    return report
+
+
+def _worker_config():
+    """
+    Configurazione dell'app da ricreare nei processi del pool
+
+    Tutte le chiavi serializzabili, non solo il database: snapshot
+    (SNAPSHOT_DIR), storici (HISTORY_STORE_DIR) e le altre impostazioni
+    usate durante l'import devono valere anche nei processi.
+    """
+    config = {}
+    for key, value in current_app.config.items():
+        if not key.isupper():
+            continue
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        config[key] = value
+    return config
+
+
+def _init_worker(config):
+    """Inizializza un processo del pool con la propria app (e il proprio engine)"""
+    global _worker_app
+    from app import create_app
+    from config import Config
+
+    worker_config = type('BulkImportWorkerConfig', (Config,), dict(config))
+    _worker_app = create_app(worker_config)
+
+
+def _run_in_worker(task):
+    with _worker_app.app_context():
+        return import_partition(task)
+
+
+def run_bulk_import(df, user_id, source, workers=None, job_type='bulk_import', mode=DEFAULT_UPLOAD_MODE):
+    """
+    Importa un DataFrame letto da read_bulk_file
+
+    Args:
+        df: Righe del provider
+        user_id: Utente a cui attribuire gli upload
+        source: Nome del file di origine
+        workers: Processi del pool (default BULK_IMPORT_WORKERS, altrimenti 1; 0 = uno per CPU;
+            1 = nello stesso processo)
+        job_type: Tipo del JobLog dell'import (es. 'api_results' per i lotti dell'API)
+        mode: 'merge' (aggiunge o corregge) o 'replace' (elimina i risultati del lab nel ciclo assenti dal file)
+
+    Returns:
+        dict: Riepilogo (con righe inserite, modificate ed eliminate) e report per partizione
+
+    Raises:
+        BulkImportError: Modalità non valida
+    """
+    if mode not in UPLOAD_MODES:
+        raise BulkImportError(f"Modalità non valida: {mode} (ammesse: {', '.join(UPLOAD_MODES)})")
+
+    job = JobLog(job_type=job_type, status='running', started_at=datetime.utcnow(),
+                 details=json.dumps({'source': source, 'rows': len(df), 'mode': mode}))
+    db.session.add(job)
+    db.session.commit()
+
+    known_labs = {code for (code,) in db.session.query(Lab.code).filter(Lab.code.in_(df['lab_code'].unique().tolist()))}
+    cycle_codes = df['cycle_code'].unique().tolist()
+    known_cycles = {code for (code,) in db.session.query(Cycle.code).filter(Cycle.code.in_(cycle_codes))}
+    archived_cycles = archived_cycle_codes(cycle_codes)
+    frozen_cycles = frozen_cycle_codes(cycle_codes)
+    refs = _reference_values(cycle_codes)
+    # Validazione per riga su tutto il file (una query per tabella), poi distribuita sulle partizioni
+    row_errors = {}
+    for error in validate_results(df):
+        row_errors.setdefault(error['row'], []).append(error)
+
+    tasks = []
+    for (lab_code, cycle_code), part in df.groupby(['lab_code', 'cycle_code'], sort=True):
+        cycle_refs = {key: value for key, value in refs.items() if key[0] == cycle_code}
+        errors = _partition_errors(
+            part, lab_code, cycle_code, lab_code in known_labs, cycle_code in known_cycles, cycle_refs,
+            [error for row in part['row'].tolist() for error in row_errors.get(row, [])],
+            archived_cycle=cycle_code in archived_cycles, frozen_cycle=cycle_code in frozen_cycles,
+        )
+        tasks.append({
+            'lab_code': lab_code,
+            'cycle_code': cycle_code,
+            'rows': part.drop(columns=['lab_code', 'cycle_code']).to_csv(index=False),
+            'errors': errors,
+            'refs': cycle_refs,
+            'user_id': user_id,
+            'source': source,
+            'mode': mode,
+        })
+
+    if workers is None:
+        workers = current_app.config.get('BULK_IMPORT_WORKERS')
+    if workers is None:
+        # Una richiesta web non avvia un processo per core
+        workers = 1
+    workers = min(workers or os.cpu_count() or 1, len(tasks)) or 1
+    if workers == 1:
+        reports = [import_partition(task) for task in tasks]
+    else:
+        import multiprocessing
+        config = _worker_config()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(config,)) as pool:
+            futures = [pool.submit(_run_in_worker, task) for task in tasks]
+            reports = [future.result() for future in as_completed(futures)]
+        reports.sort(key=lambda r: (r['lab_code'], r['cycle_code']))
+
+    summary = {
+        'source': source,
+        'rows': len(df),
+        'partitions': len(reports),
+        'imported': sum(r['status'] == 'imported' for r in reports),
+        'skipped': sum(r['status'] == 'skipped' for r in reports),
+        'failed': sum(r['status'] == 'error' for r in reports),
+        'mode': mode,
+        'inserted': sum(r.get('insert', 0) for r in reports),
+        'updated': sum(r.get('update', 0) for r in reports),
+        'deleted': sum(r.get('delete', 0) for r in reports),
+        'workers': workers,
+    }
+    job = db.session.get(JobLog, job.id)
+    job.status = 'completed' if not summary['failed'] else 'partial'
+    job.completed_at = datetime.utcnow()
+    job.details = json.dumps(dict(summary, errors={
+        f"{r['lab_code']}/{r['cycle_code']}": r['errors'] for r in reports if r['errors']
+    }))
+    db.session.commit()
+
+    return {'summary': summary, 'partitions': reports, 'job_id': job.id}
+
+
+def error_report_rows(result):
+    """Righe del report errori per laboratorio (per CSV o tabella)"""
+    for report in result['partitions']:
+        for error in report['errors']:
+            yield {
+                'lab_code': report['lab_code'],
+                'cycle_code': report['cycle_code'],
+                'row': error['row'] if error['row'] is not None else '',
+                'error': error['error'],
+            }
@@ -0,0 +1,230 @@
+# app/services/cascade_delete.py
+"""
+Eliminazione di laboratori e cicli con tutti i dati collegati
+
+Le tabelle figlie (risultati, punteggi, upload, partecipazioni, statistiche...)
+hanno chiavi esterne ON DELETE CASCADE e le relazioni ORM passive_deletes:
+eliminare il laboratorio o il ciclo con una DELETE lascia al database la
+rimozione dei figli, senza caricarli nella sessione.
+
+Per i sottoalberi grandi i risultati (con i loro punteggi, anche quelli
+archiviati) sono eliminati prima, a blocchi di CASCADE_DELETE_CHUNK_ROWS id in
+transazioni separate, così nessuna transazione tiene in lock o nel log
+centinaia di migliaia di righe.
+Sopra CASCADE_DELETE_BACKGROUND_ROWS risultati l'eliminazione prosegue in un
+thread in background; l'avanzamento è nel JobLog (job_type 'cascade_delete').
+Un'eliminazione interrotta si può ripetere: riparte dai risultati rimasti.
+
+Su SQLite senza PRAGMA foreign_keys i figli sono eliminati esplicitamente.
+Gli snapshot di un ciclo eliminato sono rimossi; i cicli congelati con risultati
+di un laboratorio eliminato sono ricongelati in una nuova versione senza di essi.
+Allo stesso modo sono riscritti o rimossi gli storici dei punteggi per laboratorio.
+"""
+import json
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, func, select, text, union, update
+
+from app import db
+from app.models import (
+    ApiIdempotencyKey, ApiToken, Cycle, CycleDoc, CycleParameter, HomogeneityResult, InviteToken, JobLog, Lab,
+    LabParticipation, PtStats, Result, ResultArchive, SampleMeasurement, UploadFile, UserLabRole, ZScore,
+    ZScoreArchive,
+)
+
+# Figli eliminati esplicitamente quando il database non applica ON DELETE CASCADE (ordine: prima i dipendenti)
+_LAB_CHILDREN = [
+    (PtStats, PtStats.lab_code), (UploadFile, UploadFile.lab_code), (LabParticipation, LabParticipation.lab_code),
+    (ApiToken, ApiToken.lab_code), (ApiIdempotencyKey, ApiIdempotencyKey.lab_code),
+]
+_CYCLE_CHILDREN = [
+    (PtStats, PtStats.cycle_code), (UploadFile, UploadFile.cycle_code),
+    (LabParticipation, LabParticipation.cycle_code), (CycleDoc, CycleDoc.cycle_code),
+    (CycleParameter, CycleParameter.cycle_code), (SampleMeasurement, SampleMeasurement.cycle_code),
+    (HomogeneityResult, HomogeneityResult.cycle_code),
+]
+
+# Oggetto eliminato, colonna dei suoi risultati, figli
+TARGETS = {
+    'lab': (Lab, 'lab_code', _LAB_CHILDREN),
+    'cycle': (Cycle, 'cycle_code', _CYCLE_CHILDREN),
+}
+
+# Risultati e punteggi: tabelle correnti e di archivio (vedi app/services/archive.py)
+_RESULT_TABLES = [(Result, ZScore), (ResultArchive, ZScoreArchive)]
+
+
+class CascadeDeleteError(Exception):
+    """Eliminazione non avviata (oggetto inesistente, ciclo pubblicato o già in eliminazione)"""
+    pass
+
+
+def _cascade_enforced():
+    """True se il database applica le chiavi esterne (sempre, tranne SQLite senza PRAGMA foreign_keys)"""
+    if db.engine.dialect.name != 'sqlite':
+        return True
+    return bool(db.session.execute(text('PRAGMA foreign_keys')).scalar())
+
+
+def running_deletion(kind, code):
+    """JobLog dell'eliminazione in corso dello stesso oggetto, se esiste"""
+    for job in JobLog.query.filter_by(job_type='cascade_delete', status='running'):
+        details = json.loads(job.details or '{}')
+        if details.get('kind') == kind and details.get('code') == code:
+            return job
+    return None
+
+
+def start_deletion(kind, code, background=None, progress=None):
+    """
+    Avvia l'eliminazione di un laboratorio o di un ciclo
+
+    Args:
+        kind: 'lab' o 'cycle'
+        code: Codice del laboratorio o del ciclo
+        background: Forza (True) o esclude (False) il thread; default secondo CASCADE_DELETE_BACKGROUND_ROWS
+        progress: Callback (eliminati, totale) per l'eliminazione nello stesso processo
+
+    Returns:
+        JobLog: Job dell'eliminazione (completato se eseguita subito)
+
+    Raises:
+        CascadeDeleteError: Oggetto inesistente, ciclo pubblicato o già in eliminazione
+    """
+    model, result_column, _ = TARGETS[kind]
+    if db.session.scalar(select(model.id).where(model.code == code)) is None:
+        raise CascadeDeleteError(f"{code} non trovato")
+    if kind == 'cycle' and db.session.scalar(select(Cycle.status).where(Cycle.code == code)) == 'published':
+        raise CascadeDeleteError(f"Impossibile eliminare il ciclo pubblicato {code}: riportalo prima in bozza.")
+    if running_deletion(kind, code) is not None:
+        raise CascadeDeleteError(f"Eliminazione di {code} già in corso")
+
+    total = sum(db.session.scalar(select(func.count(results.id)).where(getattr(results, result_column) == code))
+                for results, _ in _RESULT_TABLES)
+    if background is None:
+        background = total > current_app.config['CASCADE_DELETE_BACKGROUND_ROWS']
+
+    job = JobLog(job_type='cascade_delete', status='running', started_at=datetime.utcnow(),
+                 details=json.dumps({'kind': kind, 'code': code, 'results': total, 'deleted': 0,
+                                     'background': background}))
+    db.session.add(job)
+    if kind == 'lab':
+        # Il laboratorio sparisce subito dalle viste degli utenti
+        db.session.execute(update(Lab).where(Lab.code == code).values(is_active=False))
+    db.session.commit()
+
+    if not background:
+        run_deletion(job.id, progress=progress)
+        return db.session.get(JobLog, job.id)
+
+    app = current_app._get_current_object()
+
+    def worker():
+        with app.app_context():
+            run_deletion(job.id)
+
+    threading.Thread(target=worker, name=f"cascade-delete-{kind}-{code}", daemon=True).start()
+    return job
+
+
+def run_deletion(job_id, chunk_rows=None, progress=None):
+    """
+    Esegue (o riprende) l'eliminazione registrata in un JobLog
+
+    Args:
+        job_id: JobLog creato da start_deletion
+        chunk_rows: Risultati per transazione (default CASCADE_DELETE_CHUNK_ROWS)
+        progress: Callback opzionale (eliminati, totale) dopo ogni blocco
+
+    Returns:
+        dict: Dettagli finali del job
+    """
+    from app.services.data_version import bump_data_version
+    from app.services.history_store import drop_lab, refresh_labs
+    from app.services.snapshots import drop_snapshots, freeze_cycle
+
+    job = db.session.get(JobLog, job_id)
+    details = json.loads(job.details)
+    kind, code = details['kind'], details['code']
+    model, result_column, children = TARGETS[kind]
+    chunk_rows = chunk_rows or current_app.config['CASCADE_DELETE_CHUNK_ROWS']
+
+    try:
+        enforced = _cascade_enforced()
+        # Laboratori i cui dati cambiano con l'eliminazione di un ciclo (per il caching HTTP)
+        affected_labs = [] if kind == 'lab' else list(db.session.scalars(union(
+            select(LabParticipation.lab_code).where(LabParticipation.cycle_code == code),
+            select(Result.lab_code).where(Result.cycle_code == code),
+            select(ResultArchive.lab_code).where(ResultArchive.cycle_code == code),
+        )))
+        # Cicli congelati che contengono risultati del laboratorio (da ricongelare)
+        frozen_cycles = [] if kind == 'cycle' else list(db.session.scalars(
+            select(Cycle.code).where(Cycle.frozen_at.isnot(None), Cycle.code.in_(union(
+                select(Result.cycle_code).where(Result.lab_code == code),
+                select(ResultArchive.cycle_code).where(ResultArchive.lab_code == code),
+            )))
+        ))
+
+        for results, scores in _RESULT_TABLES:
+            while True:
+                ids = list(db.session.scalars(
+                    select(results.id).where(getattr(results, result_column) == code).limit(chunk_rows)
+                ))
+                if not ids:
+                    break
+                if not enforced:
+                    db.session.execute(delete(scores).where(scores.result_id.in_(ids))
+                                       .execution_options(synchronize_session=False))
+                db.session.execute(delete(results).where(results.id.in_(ids))
+                                   .execution_options(synchronize_session=False))
+                details['deleted'] += len(ids)
+                job.details = json.dumps(details)
+                db.session.commit()
+                if progress:
+                    progress(details['deleted'], details['results'])
+
+        if not enforced:
+            for child, column in children:
+                db.session.execute(delete(child).where(column == code).execution_options(synchronize_session=False))
+            if kind == 'lab':
+                lab_id = db.session.scalar(select(Lab.id).where(Lab.code == code))
+                db.session.execute(delete(UserLabRole).where(UserLabRole.lab_id == lab_id)
+                                   .execution_options(synchronize_session=False))
+        if kind == 'lab':
+            # Inviti legati al laboratorio solo per codice (nessuna chiave esterna)
+            db.session.execute(delete(InviteToken).where(InviteToken.lab_code == code)
+                               .execution_options(synchronize_session=False))
+        # I figli rimasti (upload, partecipazioni, statistiche...) sono eliminati dal database
+        db.session.execute(delete(model).where(model.code == code).execution_options(synchronize_session=False))
+        if affected_labs:
+            bump_data_version(affected_labs)
+
+        job.status = 'completed'
+        job.completed_at = datetime.utcnow()
+        job.details = json.dumps(details)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Eliminazione {kind} {code} fallita: {e}")
+        job = db.session.get(JobLog, job_id)
+        job.status = 'failed'
+        job.completed_at = datetime.utcnow()
+        job.error_message = str(e)
+        db.session.commit()
+        return details
+
+    # Snapshot e storici: l'eliminazione è già conclusa, un errore qui non la annulla
+    try:
+        if kind == 'cycle':
+            drop_snapshots(code)
+            refresh_labs(affected_labs)
+        else:
+            drop_lab(code)
+        for cycle_code in frozen_cycles:
+            freeze_cycle(cycle_code)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Aggiornamento di snapshot e storici dopo l'eliminazione di {kind} {code} fallito: {e}")
+    return details
@@ -0,0 +1,76 @@
+# app/services/compression.py
+"""
+Compressione in-process delle risposte JSON (brotli o gzip)
+
+La codifica si negozia con Accept-Encoding: brotli se il pacchetto è
+installato e il client lo accetta, altrimenti gzip. L'ETag della risposta
+compressa riceve un suffisso per codifica (es. "...-gzip"), così resta un ETag
+forte distinto per ogni rappresentazione.
+"""
+import gzip
+
+from flask import current_app, request
+
+ENCODINGS = ('br', 'gzip')
+
+
+def etag_variants(etag):
+    """Restituisce l'ETag base e le sue varianti per codifica"""
+    return [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if accepted['br'] and _brotli() is not None:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """
+    Comprime una risposta JSON se il client lo accetta e supera la soglia
+
+    Args:
+        response: Risposta Flask
+
+    Returns:
+        Response: La stessa risposta, eventualmente compressa
+    """
+    config = current_app.config
+    if (not config.get('RESPONSE_COMPRESSION_ENABLED', True)
+            or response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < config.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024):
+        return response
+
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        body = _brotli().compress(data, quality=config.get('RESPONSE_COMPRESSION_BROTLI_QUALITY', 4))
+    else:
+        body = gzip.compress(data, compresslevel=config.get('RESPONSE_COMPRESSION_GZIP_LEVEL', 3), mtime=0)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
@@ -0,0 +1,140 @@
+# app/services/data_version.py
+"""
+Versione dei dati per laboratorio e caching HTTP delle API statistiche
+
+Ogni laboratorio ha un contatore data_version incrementato a ogni upload o
+ricalcolo. Le API JSON derivano da esso un ETag forte e Last-Modified e
+rispondono 304 alle richieste condizionali senza leggere le tabelle dei risultati.
+
+Le risposte contengono anche i nomi di parametri, tecniche, cicli e provider:
+l'ETag include quindi una versione globale del catalogo, ricavata da numero di
+righe e ultimo updated_at di quelle tabelle, così una rinomina o un cambio di
+stato del ciclo invalida le risposte di tutti i laboratori.
+"""
+import hashlib
+from datetime import datetime, time, timezone
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import select, update, func
+
+from app import db
+from app.models import Lab, Parameter, Technique, Cycle, Provider
+from app.services.compression import etag_variants
+
+# Anagrafiche i cui nomi compaiono nelle risposte delle API statistiche
+CATALOGUE_MODELS = (Parameter, Technique, Cycle, Provider)
+
+
+def bump_data_version(lab_codes):
+    """
+    Incrementa la versione dei dati dei laboratori (nella transazione corrente)
+
+    Args:
+        lab_codes: Codice o lista di codici laboratorio
+    """
+    if isinstance(lab_codes, str):
+        lab_codes = [lab_codes]
+    if not lab_codes:
+        return
+    db.session.execute(
+        update(Lab)
+        .where(Lab.code.in_(list(lab_codes)))
+        .values(data_version=Lab.data_version + 1, data_updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_data_version(lab_code):
+    """
+    Returns:
+        tuple: (data_version, data_updated_at) oppure None se il laboratorio non esiste
+    """
+    row = db.session.execute(
+        select(Lab.data_version, Lab.data_updated_at).where(Lab.code == lab_code)
+    ).first()
+    return tuple(row) if row else None
+
+
+def get_catalogue_version():
+    """
+    Versione globale del catalogo (CATALOGUE_MODELS) in una sola query
+
+    Modifiche ORM e UPDATE aggiornano updated_at (onupdate), inserimenti e
+    cancellazioni cambiano il numero di righe.
+
+    Returns:
+        tuple: (numero di righe, ultimo updated_at o None)
+    """
+    row = db.session.execute(select(
+        *(select(func.count()).select_from(model).scalar_subquery() for model in CATALOGUE_MODELS),
+        *(select(func.max(model.updated_at)).scalar_subquery() for model in CATALOGUE_MODELS),
+    )).one()
+    counts, updated = row[:len(CATALOGUE_MODELS)], [value for value in row[len(CATALOGUE_MODELS):] if value]
+    return sum(counts), max(updated, default=None)
+
+
+def _compute_etag(lab_code, version, updated_at, catalogue, day=None):
+    # La rappresentazione dipende dalla versione dei dati, dal catalogo e dai filtri della query string
+    args = sorted(request.args.items(multi=True))
+    rows, catalogue_at = catalogue
+    key = (f"{request.endpoint}|{lab_code}|{version}|{updated_at.isoformat() if updated_at else ''}|"
+           f"{rows}|{catalogue_at.isoformat() if catalogue_at else ''}|{day or ''}|{args}")
+    return f"{lab_code}-v{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+
+def _set_cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('STATS_CACHE_MAX_AGE', 0)
+    response.cache_control.must_revalidate = True
+    # Anche i 304: l'ETag confermato può essere quello di una variante compressa
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def conditional_stats(time_window=False):
+    """
+    Decoratore per le API statistiche di laboratorio: ETag, Last-Modified e 304
+
+    Args:
+        time_window: True se la risposta dipende dall'ora corrente (filtro
+            'ultimi N giorni'); la validità è allora limitata al giorno UTC
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            lab_code = kwargs.get('lab_code')
+            version = get_data_version(lab_code) if lab_code else None
+            if version is None:
+                return view(*args, **kwargs)
+
+            data_version, updated_at = version
+            catalogue = get_catalogue_version()
+            day = None
+            last_modified = max(filter(None, (updated_at, catalogue[1])), default=None)
+            if time_window or request.args.get('days'):
+                day = datetime.utcnow().date()
+                midnight = datetime.combine(day, time.min)
+                last_modified = max(last_modified, midnight) if last_modified else midnight
+            etag = _compute_etag(lab_code, data_version, updated_at, catalogue, day)
+
+            if request.if_none_match:
+                # L'ETag del client può essere quello di una rappresentazione compressa
+                matched = next((tag for tag in etag_variants(etag) if request.if_none_match.contains(tag)), None)
+            elif (request.if_modified_since and last_modified
+                  and request.if_modified_since >= last_modified.replace(microsecond=0, tzinfo=timezone.utc)):
+                matched = etag
+            else:
+                matched = None
+            if matched:
+                return _set_cache_headers(current_app.response_class(status=304), matched, last_modified)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_cache_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+# app/services/db_engine.py
+"""
+Profili di configurazione dell'engine database
+
+Il profilo si sceglie con la variabile d'ambiente DB_ENGINE_PROFILE:
+- basic: nessuna ottimizzazione (comportamento predefinito di SQLAlchemy)
+- development: SQLite in WAL con busy_timeout e chiavi esterne attive, pool ridotto per PostgreSQL
+- production: pool dimensionato per i worker gunicorn, pre-ping e recycle;
+  su SQLite WAL, synchronous=NORMAL, mmap e cache più ampi
+
+Ogni valore si può sovrascrivere con le variabili d'ambiente indicate sotto.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+ENGINE_PROFILES = {
+    'basic': {
+        'pool': {},
+        'sqlite_pragmas': {},
+    },
+    'development': {
+        'pool': {'pool_size': 5, 'max_overflow': 5, 'pool_pre_ping': True, 'pool_recycle': 1800},
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'foreign_keys': 'ON',        # vincoli e ON DELETE CASCADE (disattivati di default in SQLite)
+        },
+    },
+    'production': {
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_pre_ping': True,
+                 'pool_recycle': 1800, 'pool_timeout': 30},
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 15000,
+            'foreign_keys': 'ON',
+            'cache_size': -64000,        # KiB (valore negativo = dimensione in KiB)
+            'mmap_size': 268435456,      # 256 MiB
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
+DEFAULT_PROFILE = 'development'
+
+# Variabili d'ambiente -> (sezione, chiave, tipo)
+ENV_OVERRIDES = {
+    'DB_POOL_SIZE': ('pool', 'pool_size', int),
+    'DB_MAX_OVERFLOW': ('pool', 'max_overflow', int),
+    'DB_POOL_RECYCLE': ('pool', 'pool_recycle', int),
+    'DB_POOL_TIMEOUT': ('pool', 'pool_timeout', int),
+    'SQLITE_BUSY_TIMEOUT_MS': ('sqlite_pragmas', 'busy_timeout', int),
+    'SQLITE_CACHE_SIZE_KB': ('sqlite_pragmas', 'cache_size', lambda v: -abs(int(v))),
+    'SQLITE_MMAP_SIZE': ('sqlite_pragmas', 'mmap_size', int),
+    'SQLITE_SYNCHRONOUS': ('sqlite_pragmas', 'synchronous', str),
+    'SQLITE_JOURNAL_MODE': ('sqlite_pragmas', 'journal_mode', str),
+}
+
+
+def get_profile(name=None, environ=None):
+    """
+    Restituisce il profilo richiesto con le sovrascritture da ambiente
+
+    Args:
+        name: Nome del profilo (default: DB_ENGINE_PROFILE o 'development')
+        environ: Mappa delle variabili d'ambiente (default os.environ)
+
+    Returns:
+        dict: {'name', 'pool', 'sqlite_pragmas'}
+    """
+    environ = os.environ if environ is None else environ
+    name = name or environ.get('DB_ENGINE_PROFILE') or DEFAULT_PROFILE
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Profilo engine sconosciuto: {name} (validi: {', '.join(ENGINE_PROFILES)})")
+
+    profile = {
+        'name': name,
+        'pool': dict(ENGINE_PROFILES[name]['pool']),
+        'sqlite_pragmas': dict(ENGINE_PROFILES[name]['sqlite_pragmas']),
+    }
+    for var, (section, key, cast) in ENV_OVERRIDES.items():
+        if environ.get(var):
+            profile[section][key] = cast(environ[var])
+    return profile
+
+
+def engine_options(database_uri, profile):
+    """
+    Calcola SQLALCHEMY_ENGINE_OPTIONS per l'URI e il profilo
+
+    Le opzioni di pool si applicano solo ai database server (PostgreSQL, MySQL):
+    su SQLite la concorrenza si gestisce con le pragma.
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return dict(profile['pool'])
+
+
+def _apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(app, engine, profile):
+    """
+    Registra le pragma SQLite da applicare a ogni nuova connessione
+
+    Args:
+        app: Applicazione Flask (per il log)
+        engine: Engine SQLAlchemy
+        profile: Profilo restituito da get_profile()
+    """
+    pragmas = profile['sqlite_pragmas']
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    app.logger.info(f"Profilo engine '{profile['name']}': pragma SQLite {pragmas}")
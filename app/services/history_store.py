@@ -0,0 +1,367 @@
+# app/services/history_store.py
+"""
+Storico dei punteggi per laboratorio in file colonnari (opzionale)
+
+Con HISTORY_STORE_DIR impostato ogni laboratorio ha un file di record a
+lunghezza fissa (RECORD: data di invio, z, z', zeta, En, id di risultato,
+parametro, tecnica e ciclo) ordinati per data, più un file .json con il
+numero di record, la generazione del file e la data_version del laboratorio
+che il file rappresenta. get_control_chart_data apre il file in memory map,
+trova l'inizio della finestra con una ricerca binaria sulle date e filtra con
+maschere booleane: le sole query sono sulle tabelle piccole (nomi di
+parametri, tecniche e cicli) e sulla data_version.
+
+Il file si aggiorna dopo ogni upload: se l'upload ha solo inserito risultati
+non anteriori all'ultimo record, i nuovi record sono accodati; altrimenti
+(righe modificate o rimosse, date retrodatate, ricalcoli) il file è riscritto
+in una nuova generazione e il .json è sostituito con una rinomina atomica. I
+record già scritti non cambiano mai: chi legge vede sempre uno stato coerente.
+
+Se il file manca o la sua data_version non è quella del laboratorio, i
+grafici tornano alla query SQL. `flask history build` crea i file iniziali.
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models import Cycle, Parameter, Provider, Technique
+
+FORMAT = 'ochem-z-history'
+FORMAT_VERSION = 1
+
+# Record per risultato (date in microsecondi epoch UTC; -1 = tecnica assente)
+RECORD_FIELDS = [
+    ('submitted_at', '<i8'), ('z', '<f8'), ('z_prime', '<f8'), ('zeta', '<f8'), ('en', '<f8'),
+    ('result_id', '<i8'), ('parameter_id', '<i4'), ('technique_id', '<i4'), ('cycle_id', '<i4'), ('_pad', '<i4'),
+]
+
+SCORE_FIELDS = ('z', 'z_prime', 'zeta', 'en')
+
+
+def _record_dtype():
+    import numpy as np
+    return np.dtype(RECORD_FIELDS)
+
+
+def enabled():
+    """True se lo storico per laboratorio è configurato (HISTORY_STORE_DIR)"""
+    return bool(current_app.config.get('HISTORY_STORE_DIR'))
+
+
+def _stem(lab_code):
+    """Percorso base dei file di un laboratorio (codici non sicuri come nome file in esadecimale)"""
+    name = lab_code if re.fullmatch(r'[A-Za-z0-9_.-]+', lab_code) and not lab_code.startswith('.') \
+        else 'x-' + lab_code.encode().hex()
+    return os.path.join(current_app.config['HISTORY_STORE_DIR'], name)
+
+
+def _data_file(lab_code, generation):
+    return f"{_stem(lab_code)}.{generation}.bin"
+
+
+def read_meta(lab_code):
+    """Metadati dello storico di un laboratorio (None se manca)"""
+    try:
+        with open(_stem(lab_code) + '.json') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get('format') != FORMAT or meta.get('format_version') != FORMAT_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(lab_code, meta):
+    path = _stem(lab_code) + '.json'
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def _locked(lab_code):
+    """Lock esclusivo sui file del laboratorio (upload paralleli dello stesso lab, anche in altri processi)"""
+    os.makedirs(current_app.config['HISTORY_STORE_DIR'], exist_ok=True)
+    with open(_stem(lab_code) + '.lock', 'a') as lock:
+        try:
+            import fcntl
+        except ImportError:  # Windows: nessun lock tra processi
+            fcntl = None
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# ===========================
+# SCRITTURA
+# ===========================
+
+def _current_data_version(lab_code):
+    from app.services.data_version import get_data_version
+
+    version = get_data_version(lab_code)
+    return version[0] if version else None
+
+
+def _read_records(lab_code, after_result_id=None):
+    """
+    Record del laboratorio dal database, ordinati per data e id
+
+    Args:
+        lab_code: Codice del laboratorio
+        after_result_id: Solo i risultati con id maggiore (nuovi upload, tabelle calde)
+
+    Returns:
+        np.ndarray: Array strutturato con dtype RECORD_FIELDS
+    """
+    import numpy as np
+    import pandas as pd
+    from app.blueprints.stats.queries_stats import as_float
+    from app.services.archive import ARCHIVE, HOT
+
+    frames = []
+    for results, scores in ([HOT] if after_result_id is not None else [HOT, ARCHIVE]):
+        query = select(
+            results.submitted_at, *(as_float(getattr(scores, name)) for name in SCORE_FIELDS), results.id,
+            Parameter.id, Technique.id, Cycle.id,
+        ).join(scores, scores.result_id == results.id).join(
+            Parameter, results.parameter_code == Parameter.code
+        ).outerjoin(
+            Technique, results.technique_code == Technique.code
+        ).join(
+            Cycle, results.cycle_code == Cycle.code
+        ).where(results.lab_code == lab_code)
+        if after_result_id is not None:
+            query = query.where(results.id > after_result_id)
+        frames.append(pd.DataFrame(db.session.execute(query).all(),
+                                   columns=['submitted_at', *SCORE_FIELDS, 'result_id', 'parameter_id',
+                                            'technique_id', 'cycle_id']))
+    frame = pd.concat(frames, ignore_index=True)
+
+    records = np.zeros(len(frame), dtype=_record_dtype())
+    submitted = pd.to_datetime(frame['submitted_at']).to_numpy('datetime64[us]')
+    records['submitted_at'] = submitted.view('int64')
+    for name in SCORE_FIELDS:
+        records[name] = pd.to_numeric(frame[name], errors='coerce').to_numpy('float64')
+    records['result_id'] = frame['result_id'].to_numpy('int64')
+    records['parameter_id'] = frame['parameter_id'].to_numpy('int32')
+    records['technique_id'] = frame['technique_id'].fillna(-1).to_numpy('int32')
+    records['cycle_id'] = frame['cycle_id'].to_numpy('int32')
+    return records[np.lexsort((records['result_id'], records['submitted_at']))]
+
+
+def _meta_for(lab_code, generation, records, data_version, previous=None):
+    count = len(records) + (previous['count'] if previous else 0)
+    return {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'lab_code': lab_code,
+        'generation': generation,
+        'count': count,
+        'data_version': data_version,
+        'max_result_id': max(int(records['result_id'].max()) if len(records) else 0,
+                             previous['max_result_id'] if previous else 0),
+        'last_submitted_at': int(records['submitted_at'][-1]) if len(records) else
+                             (previous['last_submitted_at'] if previous else None),
+    }
+
+
+def build_lab(lab_code):
+    """
+    Riscrive lo storico di un laboratorio in una nuova generazione
+
+    Returns:
+        dict: Metadati dello storico scritto
+    """
+    with _locked(lab_code):
+        return _rebuild(lab_code)
+
+
+def _rebuild(lab_code):
+    # Versione letta prima dei dati: un upload concorrente la rende subito obsoleta (letture da SQL)
+    data_version = _current_data_version(lab_code)
+    records = _read_records(lab_code)
+    previous = read_meta(lab_code)
+    generation = (previous['generation'] + 1) if previous else 1
+
+    path = _data_file(lab_code, generation)
+    with open(path, 'wb') as f:
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    meta = _meta_for(lab_code, generation, records, data_version)
+    _write_meta(lab_code, meta)
+    if previous:
+        # Chi ha ancora in memory map la generazione precedente continua a leggerla
+        try:
+            os.remove(_data_file(lab_code, previous['generation']))
+        except FileNotFoundError:
+            pass
+    return meta
+
+
+def sync_lab(lab_code, append_only=False):
+    """
+    Aggiorna lo storico dopo un upload già registrato (commit eseguito)
+
+    Accoda i nuovi risultati se l'upload ha solo inserito righe non anteriori
+    all'ultimo record e lo storico era alla versione precedente; altrimenti lo
+    riscrive. Non fa nulla se lo storico non è configurato. Un errore non
+    interrompe l'upload: lo storico resta obsoleto e i grafici usano SQL.
+
+    Args:
+        lab_code: Codice del laboratorio
+        append_only: True se l'upload non ha modificato né rimosso risultati
+    """
+    if not enabled():
+        return
+    try:
+        with _locked(lab_code):
+            meta = read_meta(lab_code)
+            data_version = _current_data_version(lab_code)
+            if meta is None or not append_only or meta['data_version'] != data_version - 1:
+                _rebuild(lab_code)
+                return
+            records = _read_records(lab_code, after_result_id=meta['max_result_id'])
+            last = meta['last_submitted_at']
+            if len(records) and last is not None and records['submitted_at'][0] < last:
+                # Risultati retrodatati: l'ordine per data richiede di riscrivere il file
+                _rebuild(lab_code)
+                return
+            with open(_data_file(lab_code, meta['generation']), 'r+b') as f:
+                # Eventuali byte di un'accodatura interrotta oltre count sono sovrascritti
+                f.seek(meta['count'] * _record_dtype().itemsize)
+                f.truncate()
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            _write_meta(lab_code, _meta_for(lab_code, meta['generation'], records, data_version, previous=meta))
+    except Exception as e:
+        current_app.logger.error(f"Aggiornamento dello storico di {lab_code} fallito: {e}")
+
+
+def refresh_labs(lab_codes):
+    """Riscrive gli storici esistenti dei laboratori indicati (dopo ricalcoli o eliminazioni di cicli)"""
+    if not enabled():
+        return
+    for lab_code in lab_codes:
+        if read_meta(lab_code) is not None:
+            sync_lab(lab_code)
+
+
+def drop_lab(lab_code):
+    """Elimina lo storico di un laboratorio (laboratorio eliminato)"""
+    if not enabled():
+        return
+    meta = read_meta(lab_code)
+    paths = [_stem(lab_code) + suffix for suffix in ('.json', '.lock')]
+    if meta:
+        paths.append(_data_file(lab_code, meta['generation']))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ===========================
+# LETTURA
+# ===========================
+
+def _ids(model, codes):
+    return list(db.session.scalars(select(model.id).where(model.code.in_(list(codes)))))
+
+
+def history_columns(lab_code, score, parameter_codes=None, technique_codes=None, cycle_codes=None, since=None):
+    """
+    Punteggi di un laboratorio dallo storico in memory map, filtrati e ordinati per data
+
+    Args:
+        lab_code: Codice del laboratorio
+        score: Colonna del punteggio (z, z_prime, zeta, en); i record senza punteggio sono esclusi
+        parameter_codes: Parametri filtrati (opzionale)
+        technique_codes: Tecniche filtrate (opzionale)
+        cycle_codes: Cicli filtrati (opzionale)
+        since: Inizio della finestra su submitted_at (opzionale)
+
+    Returns:
+        dict | None: submitted_at, <score>, parameter_code, parameter_name, technique_name,
+            cycle_name, provider_name (array); None se lo storico manca o non è aggiornato
+    """
+    import numpy as np
+
+    if not enabled():
+        return None
+    meta = read_meta(lab_code)
+    if meta is None or meta['data_version'] != _current_data_version(lab_code):
+        return None
+
+    dtype = _record_dtype()
+    if meta['count']:
+        records = np.memmap(_data_file(lab_code, meta['generation']), dtype=dtype, mode='r', shape=(meta['count'],))
+    else:
+        records = np.zeros(0, dtype=dtype)
+    if since is not None:
+        # Record ordinati per data: l'inizio della finestra con una ricerca binaria
+        start = np.searchsorted(records['submitted_at'], np.datetime64(since, 'us').astype('int64'), side='left')
+        records = records[start:]
+
+    mask = ~np.isnan(records[score]) if score != 'z' else np.ones(len(records), dtype=bool)
+    for field, model, codes in (('parameter_id', Parameter, parameter_codes),
+                                ('technique_id', Technique, technique_codes),
+                                ('cycle_id', Cycle, cycle_codes)):
+        if codes:
+            mask &= np.isin(records[field], _ids(model, codes))
+    records = records[mask]
+
+    parameters = {row.id: row for row in db.session.execute(
+        select(Parameter.id, Parameter.code, Parameter.name)
+        .where(Parameter.id.in_(np.unique(records['parameter_id']).tolist()))
+    )}
+    techniques = dict(db.session.execute(
+        select(Technique.id, Technique.name).where(Technique.id.in_(np.unique(records['technique_id']).tolist()))
+    ).all())
+    cycles = {row.id: row for row in db.session.execute(
+        select(Cycle.id, Cycle.name, Provider.name.label('provider_name'))
+        .outerjoin(Provider, Cycle.provider_id == Provider.id)
+        .where(Cycle.id.in_(np.unique(records['cycle_id']).tolist()))
+    )}
+
+    def labels(ids, lookup):
+        # Nomi cercati una volta per id distinto, poi distribuiti sui record
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        return np.array([lookup(row_id) for row_id in unique_ids.tolist()], dtype=object)[inverse]
+
+    return {
+        'submitted_at': records['submitted_at'].view('datetime64[us]'),
+        score: np.asarray(records[score]),
+        'parameter_code': labels(records['parameter_id'], lambda i: parameters[i].code),
+        'parameter_name': labels(records['parameter_id'], lambda i: parameters[i].name),
+        'technique_name': labels(records['technique_id'], techniques.get),
+        'cycle_name': labels(records['cycle_id'], lambda i: cycles[i].name),
+        'provider_name': labels(records['cycle_id'], lambda i: cycles[i].provider_name),
+    }
+
+
+def store_status():
+    """Laboratori con storico: numero di record e stato rispetto alla data_version"""
+    from app.models import Lab
+
+    status = []
+    for lab_code, data_version in db.session.execute(select(Lab.code, Lab.data_version).order_by(Lab.code)):
+        meta = read_meta(lab_code)
+        if meta is not None:
+            status.append({'lab_code': lab_code, 'records': meta['count'], 'generation': meta['generation'],
+                           'current': meta['data_version'] == data_version})
+    return status
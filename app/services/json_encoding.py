@@ -0,0 +1,80 @@
+# app/services/json_encoding.py
+"""
+Provider JSON dell'applicazione
+
+- NumpyJSONProvider: encoder standard di Flask che serializza anche array e
+  scalari numpy (usati dal formato compatto dei grafici)
+- OrjsonJSONProvider: encoder orjson con supporto numpy nativo, attivato da
+  FAST_JSON_ENCODER=1 se il pacchetto orjson è installato
+
+numpy non viene importato qui: gli oggetti si riconoscono da tolist()/item().
+"""
+import decimal
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+
+def _numpy_default(o):
+    if hasattr(o, 'tolist') and hasattr(o, 'dtype'):
+        return o.tolist()
+    raise TypeError
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Encoder standard di Flask con supporto per array e scalari numpy"""
+
+    @staticmethod
+    def default(o):
+        try:
+            return _numpy_default(o)
+        except TypeError:
+            return DefaultJSONProvider.default(o)
+
+
+def _orjson_default(o):
+    # Stessa rappresentazione dell'encoder standard di Flask
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, 'timetuple'):
+        return http_date(o)
+    return NumpyJSONProvider.default(o)
+
+
+class OrjsonJSONProvider(NumpyJSONProvider):
+    """Encoder orjson: serializzazione più veloce, array numpy senza conversione a liste"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self._orjson = orjson
+        self._options = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                         | orjson.OPT_PASSTHROUGH_DATETIME)
+        if self.sort_keys:
+            self._options |= orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj, **kwargs):
+        options = self._options
+        if kwargs.get('indent'):
+            options |= self._orjson.OPT_INDENT_2
+        return self._orjson.dumps(obj, default=_orjson_default, option=options).decode()
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+
+def configure_json_provider(app):
+    """
+    Imposta il provider JSON secondo FAST_JSON_ENCODER
+
+    Args:
+        app: Applicazione Flask
+    """
+    provider_class = NumpyJSONProvider
+    if app.config.get('FAST_JSON_ENCODER'):
+        try:
+            import orjson  # noqa: F401
+            provider_class = OrjsonJSONProvider
+        except ImportError:
+            app.logger.warning("FAST_JSON_ENCODER attivo ma orjson non è installato: uso l'encoder standard")
+    app.json = provider_class(app)
@@ -0,0 +1,85 @@
+# app/services/query_diagnostics.py
+"""
+Diagnostica delle query (disattivata di default)
+
+Quando QUERY_DIAGNOSTICS_ENABLED è attivo, una frazione delle chiamate
+(QUERY_DIAGNOSTICS_SAMPLE_RATE) viene campionata: la SQL compilata e i dettagli
+vengono registrati nel log e in un buffer in memoria consultabile da /admin.
+Le chiamate non campionate non pagano né la compilazione della SQL né le
+query diagnostiche aggiuntive.
+"""
+import random
+import threading
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+
+_lock = threading.Lock()
+_entries = deque(maxlen=200)
+
+
+def is_enabled():
+    """Verifica se la diagnostica delle query è attiva"""
+    return bool(current_app.config.get('QUERY_DIAGNOSTICS_ENABLED', False))
+
+
+def should_sample():
+    """
+    Decide se campionare la chiamata corrente
+
+    Returns:
+        bool: True solo se la diagnostica è attiva e la chiamata rientra nel campione
+    """
+    if not is_enabled():
+        return False
+    rate = float(current_app.config.get('QUERY_DIAGNOSTICS_SAMPLE_RATE', 0.1))
+    return rate >= 1.0 or random.random() < rate
+
+
+def compile_sql(statement):
+    """Compila lo statement con i parametri inline (solo per diagnostica)"""
+    try:
+        return str(statement.compile(compile_kwargs={'literal_binds': True}))
+    except Exception:
+        return str(statement)
+
+
+def record(name, statement=None, **details):
+    """
+    Registra una voce diagnostica strutturata
+
+    Args:
+        name: Nome logico della query (es. 'chart_data')
+        statement: Statement SQLAlchemy da compilare (opzionale)
+        **details: Dettagli aggiuntivi (filtri, conteggi, durate)
+
+    Returns:
+        dict: La voce registrata
+    """
+    entry = {
+        'name': name,
+        'recorded_at': datetime.utcnow().isoformat(),
+        'sql': compile_sql(statement) if statement is not None else None,
+        'details': details,
+    }
+    with _lock:
+        max_entries = int(current_app.config.get('QUERY_DIAGNOSTICS_MAX_ENTRIES', 200))
+        global _entries
+        if _entries.maxlen != max_entries:
+            _entries = deque(_entries, maxlen=max_entries)
+        _entries.append(entry)
+    current_app.logger.info(f"[query-diagnostics] {name}: {details}")
+    return entry
+
+
+def recent_entries():
+    """Restituisce le voci diagnostiche più recenti (dalla più nuova)"""
+    with _lock:
+        return list(reversed(_entries))
+
+
+def clear():
+    """Svuota il buffer delle voci diagnostiche"""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,96 @@
+# app/services/read_replica.py
+"""
+Instradamento delle letture statistiche verso una replica in sola lettura
+
+Se DATABASE_REPLICA_URL è configurato, la replica viene registrata come bind
+'replica' di Flask-SQLAlchemy. Le view decorate con @replica_reads eseguono le
+SELECT sulla replica; scritture, flush e query testuali restano sul primario.
+
+Read-your-writes: ogni scrittura sui risultati (upload, API, import massivo,
+ricalcolo, cancellazione) incrementa Lab.data_version nella stessa transazione.
+Prima di usare la replica si confronta la versione del laboratorio sul primario
+e sulla replica: finché la replica è indietro le letture restano sul primario,
+per tutti gli utenti del laboratorio e per qualsiasi worker.
+"""
+from functools import wraps
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import select, func
+
+REPLICA_BIND = 'replica'
+USE_REPLICA_KEY = 'use_read_replica'
+
+
+class RoutingSession(Session):
+    """Sessione che invia le SELECT alla replica quando richiesto dalla view"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(USE_REPLICA_KEY) and not self._flushing:
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None and getattr(clause, 'is_select', False):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_binds(replica_uri, options=None):
+    """
+    Restituisce la voce SQLALCHEMY_BINDS per la replica
+
+    Args:
+        replica_uri: URL della replica (None se non configurata)
+        options: Opzioni engine aggiuntive (pool)
+
+    Returns:
+        dict: {'replica': {...}} oppure {} se la replica non è configurata
+    """
+    if not replica_uri:
+        return {}
+    return {REPLICA_BIND: dict(options or {}, url=replica_uri)}
+
+
+def replica_enabled():
+    from app import db
+    return REPLICA_BIND in db.engines
+
+
+def _lab_versions(engine, lab_code=None):
+    """Versione dei dati del laboratorio (None se assente) o (numero di laboratori, somma delle versioni)"""
+    from app import db
+    from app.models import Lab
+
+    if lab_code is not None:
+        query = select(Lab.data_version).where(Lab.code == lab_code)
+    else:
+        query = select(func.count(Lab.code), func.coalesce(func.sum(Lab.data_version), 0))
+    row = db.session.execute(query, bind_arguments={'bind': engine}).first()
+    return tuple(row) if row else None
+
+
+def replica_lags(lab_code=None):
+    """
+    Verifica se la replica non ha ancora ricevuto le ultime scritture
+
+    Args:
+        lab_code: Laboratorio della richiesta (None = tutti i laboratori)
+
+    Returns:
+        bool: True se la data_version sulla replica differisce da quella del primario
+    """
+    from app import db
+    return _lab_versions(db.engines[REPLICA_BIND], lab_code) != _lab_versions(db.engine, lab_code)
+
+
+def replica_reads(view):
+    """Decoratore: esegue le letture della view sulla replica, se configurata e allineata"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db
+        if not replica_enabled() or replica_lags(kwargs.get('lab_code')):
+            return view(*args, **kwargs)
+
+        db.session.info[USE_REPLICA_KEY] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop(USE_REPLICA_KEY, None)
+    return wrapper
@@ -0,0 +1,322 @@
+# app/services/results_api.py
+"""
+Invio dei risultati via API da parte dei LIMS dei laboratori
+
+Un lotto è un array JSON di oggetti o un file NDJSON (un oggetto per riga) con
+i campi cycle_code, parameter_code, result_value e, opzionali, uncertainty,
+technique_code, unit_code, date_performed. Il corpo è letto a blocchi e ogni
+elemento finisce subito in liste per colonna: in memoria non resta l'albero
+JSON dell'intero lotto. Il corpo è anche sottoposto a hash durante la lettura,
+per riconoscere i reinvii con la stessa chiave di idempotenza.
+
+Le colonne diventano un DataFrame di stringhe come quello di un CSV: la
+validazione (validate_results: anagrafica, unità, limiti, decimali, una sola
+volta per lotto), i punteggi e il salvataggio sono quelli dell'import massivo
+(run_bulk_import, una partizione per ciclo nello stesso processo). Il lotto di
+un ciclo è salvato solo se tutti i suoi elementi sono validi. Come per gli
+upload, per default i risultati si aggiungono a quelli del laboratorio nel
+ciclo o li correggono (lotti incrementali); solo con mode='replace' il lotto
+sostituisce i risultati del ciclo e quelli assenti sono eliminati.
+
+L'esito è restituito per elemento (indice nel lotto, stato, errori), con il
+numero di risultati inseriti, modificati ed eliminati nel riepilogo.
+
+Una Idempotency-Key resta 'processing' durante l'elaborazione; se il processo
+termina senza completarla, dopo API_IDEMPOTENCY_LEASE_SECONDS un reinvio dello
+stesso lotto la riprende.
+"""
+import codecs
+import hashlib
+import json
+import re
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from app import db
+from app.models import ApiIdempotencyKey
+from app.blueprints.stats.uploads_stats import DEFAULT_UPLOAD_MODE
+from app.services.bulk_import import run_bulk_import
+
+ITEM_COLUMNS = ['cycle_code', 'parameter_code', 'result_value', 'uncertainty', 'technique_code', 'unit_code',
+                'date_performed']
+
+# Byte letti dal corpo della richiesta per blocco
+READ_CHUNK_BYTES = 64 * 1024
+
+NDJSON_MIME_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class ApiBatchError(ValueError):
+    """Lotto illeggibile o troppo grande (nessun elemento è stato elaborato)"""
+
+    def __init__(self, message, status_code=400):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+class HashingReader:
+    """Stream che calcola lo SHA-256 dei byte letti"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.stream.readline(size)
+        self.sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def iter_ndjson_items(stream):
+    """
+    Elementi di un corpo NDJSON, una riga alla volta (le righe vuote sono ignorate)
+
+    Raises:
+        ApiBatchError: Riga non JSON
+    """
+    for line_number, line in enumerate(iter(stream.readline, b''), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise ApiBatchError(f"Riga {line_number}: JSON non valido")
+
+
+def iter_json_items(stream, chunk_size=READ_CHUNK_BYTES):
+    """
+    Elementi di un array JSON, decodificati uno alla volta mentre il corpo arriva a blocchi
+
+    Raises:
+        ApiBatchError: Corpo che non è un array JSON valido
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        # Aggiunge un blocco al buffer scartando la parte già decodificata
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+    def next_token():
+        # Primo carattere non di spaziatura (None a fine corpo)
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return None
+            fill()
+
+    try:
+        fill()
+        if next_token() != '[':
+            raise ApiBatchError("Il corpo deve essere un array JSON di risultati")
+        pos += 1
+        if next_token() == ']':
+            return
+        while True:
+            next_token()
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # Un valore che arriva alla fine del buffer potrebbe continuare nel blocco successivo
+                complete = end < len(buffer) or eof
+            except ValueError:
+                if eof:
+                    raise ApiBatchError("JSON non valido nel corpo della richiesta")
+                complete = False
+            if not complete:
+                fill()
+                continue
+            pos = end
+            yield item
+            token = next_token()
+            if token == ']':
+                return
+            if token != ',':
+                raise ApiBatchError("JSON non valido nel corpo della richiesta")
+            pos += 1
+    except UnicodeDecodeError:
+        raise ApiBatchError("Il corpo della richiesta non è in UTF-8")
+
+
+def collect_items(items, max_items):
+    """
+    Raccoglie gli elementi del lotto in colonne di stringhe
+
+    Args:
+        items: Iteratore di elementi decodificati
+        max_items: Numero massimo di elementi per lotto
+
+    Returns:
+        tuple: (DataFrame con ITEM_COLUMNS e indice 'row', {indice: [errori]} degli elementi non oggetti)
+
+    Raises:
+        ApiBatchError: Lotto oltre max_items (413)
+    """
+    import pandas as pd
+
+    columns = {column: [] for column in ITEM_COLUMNS}
+    errors = {}
+    for index, item in enumerate(items):
+        if index >= max_items:
+            raise ApiBatchError(f"Lotto troppo grande: al massimo {max_items} risultati per richiesta", 413)
+        if not isinstance(item, dict):
+            errors[index] = ["L'elemento non è un oggetto JSON"]
+            item = {}
+        for column, values in columns.items():
+            value = item.get(column)
+            values.append('' if value is None else str(value).strip())
+
+    df = pd.DataFrame(columns, dtype=str)
+    df['row'] = range(len(df))
+    return df, errors
+
+
+def process_batch(df, item_errors, lab_code, user_id, source, mode=DEFAULT_UPLOAD_MODE):
+    """
+    Valida, valuta e salva un lotto
+
+    Args:
+        df: Colonne del lotto da collect_items
+        item_errors: Errori già rilevati per elemento ({indice: [errori]})
+        lab_code: Laboratorio del token
+        user_id: Utente a cui attribuire gli upload
+        source: Descrizione dell'origine (nome del token)
+        mode: 'merge' (aggiunge o corregge) o 'replace' (elimina i risultati del ciclo assenti dal lotto)
+
+    Returns:
+        dict: summary (conteggi per stato e risultati inseriti/modificati/eliminati), items (esito
+            per elemento), job_id dell'import
+    """
+    errors = {index: list(messages) for index, messages in item_errors.items()}
+
+    def add(rows, message):
+        for row in rows:
+            errors.setdefault(int(row), []).append(message)
+
+    add(df.loc[df['cycle_code'].eq(''), 'row'], "cycle_code mancante")
+    add(df.loc[df['result_value'].eq(''), 'row'], "result_value mancante")
+
+    # Un ciclo con elementi non validi non viene salvato (come un upload con righe non valide);
+    # la validazione per riga è quella di run_bulk_import, i suoi errori tornano nei report delle partizioni
+    rows = df['row'].to_numpy()
+    cycles = df['cycle_code'].to_numpy()
+    rejected_cycles = set(cycles[df['row'].isin(list(errors)).to_numpy()])
+    statuses = {}
+    job_id = None
+    changes = dict.fromkeys(('inserted', 'updated', 'deleted'), 0)
+
+    importable = df[~df['cycle_code'].isin(rejected_cycles)]
+    if len(importable):
+        result = run_bulk_import(importable.assign(lab_code=lab_code), user_id, source, workers=1,
+                                 job_type='api_results', mode=mode)
+        job_id = result['job_id']
+        changes = {name: result['summary'][name] for name in changes}
+        partition_rows = importable.groupby('cycle_code')['row']
+        for report in result['partitions']:
+            part_rows = partition_rows.get_group(report['cycle_code']).tolist()
+            if report['status'] != 'error':
+                statuses.update(dict.fromkeys(part_rows, 'accepted' if report['status'] == 'imported' else 'unchanged'))
+                continue
+            rejected_cycles.add(report['cycle_code'])
+            for error in report['errors']:
+                add(part_rows if error['row'] is None else [error['row']], error['error'])
+
+    items = []
+    for row, cycle in zip(rows.tolist(), cycles.tolist()):
+        if row in errors:
+            items.append({'index': row, 'status': 'rejected', 'errors': errors[row]})
+        elif cycle in rejected_cycles:
+            items.append({'index': row, 'status': 'not_imported'})
+        else:
+            items.append({'index': row, 'status': statuses[row]})
+
+    summary = {'items': len(items)}
+    for status in ('accepted', 'unchanged', 'rejected', 'not_imported'):
+        summary[status] = sum(item['status'] == status for item in items)
+    summary.update(mode=mode, **changes)
+    return {'summary': summary, 'items': items, 'job_id': job_id}
+
+
+def reserve_idempotency_key(lab_code, key, request_hash):
+    """
+    Registra la chiave di idempotenza prima dell'elaborazione del lotto
+
+    Args:
+        lab_code: Laboratorio del token
+        key: Valore dell'header Idempotency-Key
+        request_hash: SHA-256 del corpo
+
+    Returns:
+        tuple: (record della chiave, record esistente da riproporre o None)
+
+    Raises:
+        ApiBatchError: Chiave già usata con un altro corpo (422) o lotto ancora in elaborazione (409)
+            entro API_IDEMPOTENCY_LEASE_SECONDS
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    existing = ApiIdempotencyKey.query.filter_by(lab_code=lab_code, idempotency_key=key).first()
+    if existing is None:
+        record = ApiIdempotencyKey(lab_code=lab_code, idempotency_key=key, request_hash=request_hash)
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record, None
+        except IntegrityError:
+            # Stessa chiave registrata da una richiesta concorrente
+            db.session.rollback()
+            existing = ApiIdempotencyKey.query.filter_by(lab_code=lab_code, idempotency_key=key).first()
+
+    if existing.request_hash != request_hash:
+        raise ApiBatchError("Idempotency-Key già usata con un lotto diverso", 422)
+    if existing.status != 'completed':
+        # Elaborazione scaduta (processo terminato): la riprende un solo reinvio, con un UPDATE condizionale
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=current_app.config['API_IDEMPOTENCY_LEASE_SECONDS'])
+        taken = db.session.execute(
+            update(ApiIdempotencyKey)
+            .where(ApiIdempotencyKey.id == existing.id, ApiIdempotencyKey.status == 'processing',
+                   ApiIdempotencyKey.started_at < expired)
+            .values(started_at=now)
+        ).rowcount
+        db.session.commit()
+        if not taken:
+            raise ApiBatchError("Lotto con questa Idempotency-Key ancora in elaborazione", 409)
+        db.session.refresh(existing)
+        return existing, None
+    return existing, existing
+
+
+def complete_idempotency_key(record, body, status_code):
+    """Salva la risposta del lotto per i reinvii con la stessa chiave"""
+    record.status = 'completed'
+    record.response_code = status_code
+    record.response_body = json.dumps(body)
+    record.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def release_idempotency_key(record):
+    """Libera la chiave di un lotto interrotto da un errore, perché il client possa ripeterlo"""
+    db.session.rollback()
+    db.session.delete(db.session.merge(record))
+    db.session.commit()
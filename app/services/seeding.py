@@ -0,0 +1,314 @@
+# app/services/seeding.py
+"""
+Popolamento massivo del database con dati PT sintetici
+
+Le tabelle vengono costruite come DataFrame pandas (z-score e PtStats calcolati
+in modo vettoriale) e caricate a blocchi:
+- PostgreSQL: COPY FROM STDIN
+- SQLite e altri: executemany sul cursore DBAPI
+"""
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app import db
+from app.models import (Unit, UnitConversion, Technique, Provider, Parameter, Cycle, CycleParameter,
+                        Lab, Result, ZScore, PtStats)
+
+# Costante per calcolo RSZ (Robust Z-Score), come in services_stats
+MAD_K = 1.4826
+
+# Scale predefinite: la "production" riproduce il carico reale (500 × 40 × 200)
+SCALES = {
+    'tiny': {'labs': 5, 'cycles': 3, 'parameters': 10, 'results_per_combo': 2},
+    'small': {'labs': 20, 'cycles': 5, 'parameters': 20, 'results_per_combo': 2},
+    'medium': {'labs': 100, 'cycles': 20, 'parameters': 50, 'results_per_combo': 1},
+    'production': {'labs': 500, 'cycles': 40, 'parameters': 200, 'results_per_combo': 1},
+}
+
+N_TECHNIQUES = 8
+N_PROVIDERS = 3
+# Anagrafica dei parametri sintetici: unità, limiti e decimali ammessi dalla validazione
+PARAMETER_UNIT = 'mg/L'
+PARAMETER_LIMITS = (0.0, 1e6)
+PARAMETER_PRECISION = 3
+
+
+def lab_code(i):
+    return f"LAB{i:04d}"
+
+
+def cycle_code(i):
+    return f"CYC{i:03d}"
+
+
+def parameter_code(i):
+    return f"P{i:03d}"
+
+
+def technique_code(i):
+    return f"T{i:02d}"
+
+
+# ===========================
+# CARICAMENTO A BLOCCHI
+# ===========================
+
+def _dbapi_cursor():
+    """Cursore DBAPI sulla stessa connessione (e transazione) della sessione"""
+    return db.session.connection().connection.dbapi_connection.cursor()
+
+
+def _copy_postgres(table, frame):
+    """Carica un DataFrame con COPY FROM STDIN (psycopg2 o psycopg 3)"""
+    columns = ', '.join(frame.columns)
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    sql = f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    cursor = _dbapi_cursor()
+    if hasattr(cursor, 'copy_expert'):
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    else:
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def _executemany(table, frame, chunk_size):
+    """Carica un DataFrame con executemany sul cursore DBAPI (SQLite)"""
+    frame = frame.copy()
+    # Stesso formato testuale usato da SQLAlchemy per DateTime su SQLite
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    frame = frame.astype(object).where(frame.notna(), None)
+
+    placeholders = ', '.join('?' for _ in frame.columns)
+    sql = f"INSERT INTO {table.name} ({', '.join(frame.columns)}) VALUES ({placeholders})"
+    rows = list(frame.itertuples(index=False, name=None))
+    cursor = _dbapi_cursor()
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(sql, rows[start:start + chunk_size])
+
+
+def bulk_load(model, frame, chunk_size=50000):
+    """
+    Carica un DataFrame nella tabella del modello con il metodo più veloce per il dialetto
+
+    Args:
+        model: Modello SQLAlchemy di destinazione
+        frame: DataFrame con colonne uguali a quelle della tabella
+        chunk_size: Righe per blocco (executemany)
+    """
+    if frame.empty:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        _copy_postgres(table, frame)
+    elif dialect == 'sqlite':
+        _executemany(table, frame, chunk_size)
+    else:
+        records = frame.to_dict('records')
+        for start in range(0, len(records), chunk_size):
+            db.session.execute(table.insert(), records[start:start + chunk_size])
+
+
+def _sync_sequences(models):
+    """Riallinea le sequenze degli id dopo inserimenti con id espliciti (PostgreSQL)"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+
+
+# ===========================
+# COSTRUZIONE DATASET
+# ===========================
+
+def compute_scores(measured, xpt, sigma_pt, uncertainty=None, u_xpt=None):
+    """
+    Calcola i punteggi ISO 13528 (z, sz², z', zeta, En) in modo vettoriale
+
+    Returns:
+        dict: Array numpy per colonna di ZScore, arrotondati a 6 decimali
+    """
+    from app.blueprints.stats.scores_stats import compute_iso_scores
+
+    scores = compute_iso_scores(measured, xpt, sigma_pt, u_x=uncertainty, u_xpt=u_xpt)
+    return {name: values.round(6) for name, values in scores.items()}
+
+
+def compute_pt_stats(frame):
+    """
+    Calcola PtStats (n_results, mean_z, rsz) per ciclo/parametro/lab
+
+    Args:
+        frame: DataFrame con cycle_code, parameter_code, lab_code, z
+
+    Returns:
+        DataFrame: Una riga per gruppo
+    """
+    keys = ['cycle_code', 'parameter_code', 'lab_code']
+    grouped = frame.groupby(keys, sort=False)['z']
+    abs_dev = (frame['z'] - grouped.transform('median')).abs()
+    stats = frame[keys].assign(abs_dev=abs_dev, z=frame['z']).groupby(keys, as_index=False, sort=False).agg(
+        n_results=('z', 'size'), mean_z=('z', 'mean'), mad=('abs_dev', 'median')
+    )
+    stats['rsz'] = np.where(stats['n_results'] >= 2, MAD_K * stats['mad'], 0.0).round(6)
+    stats['mean_z'] = stats['mean_z'].round(6)
+    return stats.drop(columns='mad')
+
+
+def seed_synthetic(spec, seed=42, lab_batch=25, chunk_size=50000, progress=None):
+    """
+    Popola il database con un dataset sintetico
+
+    Args:
+        spec: Dizionario con labs, cycles, parameters, results_per_combo
+        seed: Seme del generatore casuale
+        lab_batch: Laboratori generati per blocco (limita la memoria)
+        chunk_size: Righe per singolo executemany
+        progress: Callback opzionale progress(righe_inserite, righe_totali)
+
+    Returns:
+        dict: Conteggi delle righe inserite
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    n_labs, n_cycles = spec['labs'], spec['cycles']
+    n_params, per_combo = spec['parameters'], spec['results_per_combo']
+    total = n_labs * n_cycles * n_params * per_combo
+
+    # Anagrafiche
+    bulk_load(Unit, pd.DataFrame({
+        'code': ['mg/L', 'µg/L', 'g/L'],
+        'description': ['Milligrammi per litro', 'Microgrammi per litro', 'Grammi per litro'],
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+    bulk_load(UnitConversion, pd.DataFrame({
+        'from_unit_code': ['µg/L', 'mg/L'], 'to_unit_code': ['mg/L', 'g/L'], 'factor': [0.001, 0.001],
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+    bulk_load(Technique, pd.DataFrame({
+        'code': [technique_code(i) for i in range(N_TECHNIQUES)],
+        'name': [f"Tecnica {i}" for i in range(N_TECHNIQUES)],
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+    bulk_load(Provider, pd.DataFrame({
+        'id': np.arange(1, N_PROVIDERS + 1),
+        'code': [f"PRV{i}" for i in range(N_PROVIDERS)],
+        'name': [f"Provider {i}" for i in range(N_PROVIDERS)],
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+    bulk_load(Parameter, pd.DataFrame({
+        'code': [parameter_code(i) for i in range(n_params)],
+        'name': [f"Parametro {i}" for i in range(n_params)],
+        'unit_code': PARAMETER_UNIT,
+        'min_value': PARAMETER_LIMITS[0], 'max_value': PARAMETER_LIMITS[1], 'precision_digits': PARAMETER_PRECISION,
+        'active': True,
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+
+    # Cicli distribuiti sull'ultimo periodo, uno ogni 30 giorni
+    cycle_starts = pd.DatetimeIndex([now - timedelta(days=30 * (n_cycles - i)) for i in range(n_cycles)])
+    bulk_load(Cycle, pd.DataFrame({
+        'code': [cycle_code(i) for i in range(n_cycles)],
+        'name': [f"Ciclo {i}" for i in range(n_cycles)],
+        'status': 'published',
+        'provider_id': (np.arange(n_cycles) % N_PROVIDERS) + 1,
+        'start_date': cycle_starts,
+        'end_date': cycle_starts + pd.Timedelta(days=30),
+        'created_at': cycle_starts, 'updated_at': cycle_starts,
+    }), chunk_size)
+
+    xpt = rng.uniform(1.0, 100.0, size=(n_cycles, n_params)).round(6)
+    sigma_pt = (xpt * rng.uniform(0.05, 0.15, size=xpt.shape)).round(6)
+    u_xpt = (sigma_pt * rng.uniform(0.05, 0.3, size=xpt.shape)).round(6)
+    cp_cycle, cp_param = np.meshgrid(np.arange(n_cycles), np.arange(n_params), indexing='ij')
+    bulk_load(CycleParameter, pd.DataFrame({
+        'cycle_code': [cycle_code(i) for i in cp_cycle.ravel()],
+        'parameter_code': [parameter_code(i) for i in cp_param.ravel()],
+        'xpt': xpt.ravel(), 'sigma_pt': sigma_pt.ravel(), 'u_xpt': u_xpt.ravel(),
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+
+    bulk_load(Lab, pd.DataFrame({
+        'code': [lab_code(i) for i in range(n_labs)],
+        'name': [f"Laboratorio {i}" for i in range(n_labs)],
+        'is_active': True, 'data_version': 0, 'data_updated_at': now,
+        'created_at': now, 'updated_at': now,
+    }), chunk_size)
+    db.session.commit()
+
+    # Risultati, z-score e PtStats per blocchi di laboratori
+    cycle_codes = np.array([cycle_code(i) for i in range(n_cycles)], dtype=object)
+    param_codes = np.array([parameter_code(i) for i in range(n_params)], dtype=object)
+    tech_codes = np.array([technique_code(i) for i in range(N_TECHNIQUES)], dtype=object)
+    start_values = cycle_starts.values
+    next_id = (db.session.scalar(db.select(db.func.max(Result.id))) or 0) + 1
+    next_z_id = (db.session.scalar(db.select(db.func.max(ZScore.id))) or 0) + 1
+    n_results = 0
+    n_stats = 0
+
+    for first_lab in range(0, n_labs, lab_batch):
+        labs = np.arange(first_lab, min(first_lab + lab_batch, n_labs))
+        lab_idx, cyc_idx, par_idx, _ = np.meshgrid(
+            labs, np.arange(n_cycles), np.arange(n_params), np.arange(per_combo), indexing='ij'
+        )
+        lab_idx, cyc_idx, par_idx = lab_idx.ravel(), cyc_idx.ravel(), par_idx.ravel()
+        size = lab_idx.size
+
+        ref_xpt = xpt[cyc_idx, par_idx]
+        ref_sigma = sigma_pt[cyc_idx, par_idx]
+        measured = (ref_xpt + rng.normal(0.0, 1.2, size=size) * ref_sigma).round(6)
+        uncertainty = (ref_sigma * 0.5).round(6)
+        scores = compute_scores(measured, ref_xpt, ref_sigma, uncertainty, u_xpt[cyc_idx, par_idx])
+        offsets = rng.integers(0, 30 * 24 * 3600, size=size).astype('timedelta64[s]')
+        ids = np.arange(next_id, next_id + size)
+        next_id += size
+
+        lab_codes = np.array([lab_code(i) for i in labs], dtype=object)[lab_idx - first_lab]
+        results = pd.DataFrame({
+            'id': ids,
+            'lab_code': lab_codes,
+            'cycle_code': cycle_codes[cyc_idx],
+            'parameter_code': param_codes[par_idx],
+            'technique_code': tech_codes[par_idx % N_TECHNIQUES],
+            'measured_value': measured,
+            'uncertainty': uncertainty,
+            'submitted_at': pd.to_datetime(start_values[cyc_idx] + offsets),
+            'created_at': now, 'updated_at': now,
+        })
+        bulk_load(Result, results, chunk_size)
+        bulk_load(ZScore, pd.DataFrame({
+            'id': np.arange(next_z_id, next_z_id + size),
+            'result_id': ids, **scores,
+            'created_at': now, 'updated_at': now,
+        }), chunk_size)
+        next_z_id += size
+
+        stats = compute_pt_stats(results[['cycle_code', 'parameter_code', 'lab_code']].assign(z=scores['z']))
+        stats['created_at'] = now
+        stats['updated_at'] = now
+        bulk_load(PtStats, stats, chunk_size)
+        db.session.commit()
+
+        n_results += size
+        n_stats += len(stats)
+        if progress:
+            progress(n_results, total)
+
+    _sync_sequences([Provider, Result, ZScore])
+    db.session.commit()
+
+    return {'results': n_results, 'zscores': n_results, 'pt_stats': n_stats,
+            'labs': n_labs, 'cycles': n_cycles, 'parameters': n_params}
+
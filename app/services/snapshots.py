@@ -0,0 +1,521 @@
+# app/services/snapshots.py
+"""
+Snapshot congelati delle statistiche dei cicli chiusi
+
+Un ciclo pubblicato e terminato non cambia più: "congelarlo" scrive in
+SNAPSHOT_DIR/<ciclo>/v<versione>/ i suoi dati in formato colonnare, un file
+.npy per colonna, più un manifest.json con dizionari dei codici e SHA-256:
+
+- rows.*: un record per risultato con punteggi (id, laboratorio, parametro,
+  tecnica, data, valore, incertezza, z, sz², z', zeta, En), ordinati per
+  laboratorio e data; lab_offsets.npy delimita le righe di ogni laboratorio
+- pt_stats.*: PtStats del ciclo (n_results, mean_z, rsz per lab/parametro)
+- parameters.*: per parametro consenso robusto dei valori (mediana, MAD_K × MAD)
+  e distribuzione degli z (quartili, estremi, conteggi per classe)
+
+I file sono in sola lettura e una versione non viene mai modificata: ricongelare
+(per esempio dopo l'eliminazione di un laboratorio) scrive la versione successiva
+e sposta il puntatore CURRENT con una rinomina atomica. In lettura le colonne
+sono aperte con np.load(mmap_mode='r'): le richieste dei laboratori filtrate
+su cicli congelati leggono solo le pagine del proprio intervallo di righe,
+senza query sul database (lo stato di congelamento è il file CURRENT).
+
+Un ciclo congelato non accetta upload, import né ricalcoli finché non viene
+scongelato (unfreeze_cycle).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.models import Cycle, Parameter, PtStats, Technique
+
+FORMAT = 'ochem-cycle-snapshot'
+FORMAT_VERSION = 1
+
+# Colonne dei risultati: nome -> dtype numpy (indici dei dizionari, -1 = tecnica assente)
+ROW_COLUMNS = {
+    'result_id': 'int64', 'lab': 'int32', 'parameter': 'int32', 'technique': 'int32',
+    'submitted_at': 'datetime64[us]', 'measured_value': 'float64', 'uncertainty': 'float64',
+    'z': 'float64', 'sz2': 'float64', 'z_prime': 'float64', 'zeta': 'float64', 'en': 'float64',
+}
+
+# Riepilogo per parametro (oltre all'indice del parametro): consenso dei valori e distribuzione degli z
+PARAMETER_SUMMARY = ['n', 'median', 'robust_sd', 'z_min', 'z_q1', 'z_median', 'z_q3', 'z_max',
+                     'z_mean', 'excellent', 'acceptable', 'poor']
+
+# Snapshot aperti nel processo: cartella del ciclo -> CycleSnapshot della versione corrente
+_open_snapshots = {}
+_open_lock = threading.Lock()
+
+
+class SnapshotError(Exception):
+    """Ciclo non congelabile o snapshot non valido"""
+    pass
+
+
+def snapshot_dir(cycle_code=None):
+    """Cartella degli snapshot (o di quelli di un ciclo)"""
+    root = current_app.config['SNAPSHOT_DIR']
+    return os.path.join(root, cycle_code) if cycle_code else root
+
+
+def current_version(cycle_code):
+    """Versione corrente dello snapshot di un ciclo dal file CURRENT (None = non congelato)"""
+    try:
+        with open(os.path.join(snapshot_dir(cycle_code), 'CURRENT')) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _version_dir(cycle_code, version):
+    return os.path.join(snapshot_dir(cycle_code), f"v{version:04d}")
+
+
+# ===========================
+# LETTURA
+# ===========================
+
+class CycleSnapshot:
+    """
+    Snapshot di un ciclo aperto in memory map
+
+    Le colonne sono array numpy in sola lettura; i codici di laboratori,
+    parametri e tecniche sono indici nei dizionari del manifest.
+    """
+
+    def __init__(self, path, manifest, arrays):
+        import numpy as np
+
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+        self.cycle_code = manifest['cycle']['code']
+        self.version = manifest['version']
+        self.lab_index = {code: i for i, code in enumerate(manifest['labs'])}
+        self.parameter_index = {code: i for i, (code, _) in enumerate(manifest['parameters'])}
+        self.technique_index = {code: i for i, (code, _) in enumerate(manifest['techniques'])}
+        self.parameter_codes = np.array([code for code, _ in manifest['parameters']], dtype=object)
+        self.parameter_names = np.array([name for _, name in manifest['parameters']], dtype=object)
+        # Ultima posizione: tecnica assente (indice -1)
+        self.technique_names = np.array([name for _, name in manifest['techniques']] + [None], dtype=object)
+
+    @classmethod
+    def open(cls, path):
+        import numpy as np
+
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT or manifest.get('format_version') != FORMAT_VERSION:
+            raise SnapshotError(f"Formato dello snapshot non supportato: {path}")
+        arrays = {name: np.load(os.path.join(path, entry['file']), mmap_mode='r')
+                  for name, entry in manifest['files'].items()}
+        return cls(path, manifest, arrays)
+
+    def lab_rows(self, lab_code):
+        """
+        Righe di un laboratorio (viste sulle colonne rows.*, senza copia)
+
+        Returns:
+            dict: Nome colonna -> array (vuoti se il laboratorio non ha risultati nel ciclo)
+        """
+        lab = self.lab_index.get(lab_code)
+        offsets = self.arrays['lab_offsets']
+        start, stop = (int(offsets[lab]), int(offsets[lab + 1])) if lab is not None else (0, 0)
+        return {name: self.arrays[f"rows.{name}"][start:stop] for name in ROW_COLUMNS}
+
+    def summary(self):
+        """Aggregati del ciclo: PtStats per lab/parametro e consenso e distribuzione per parametro"""
+        labs = self.manifest['labs']
+        codes = self.parameter_codes
+        arrays = self.arrays
+        pt_stats = [
+            {'lab_code': labs[lab], 'parameter_code': codes[parameter], 'n_results': _plain(n_results),
+             'mean_z': _plain(mean_z), 'rsz': _plain(rsz)}
+            for lab, parameter, n_results, mean_z, rsz in zip(
+                arrays['pt_stats.lab'], arrays['pt_stats.parameter'], arrays['pt_stats.n_results'],
+                arrays['pt_stats.mean_z'], arrays['pt_stats.rsz'])
+        ]
+        parameters = [
+            dict(parameter_code=codes[parameter],
+                 **{name: _plain(arrays[f"parameters.{name}"][i]) for name in PARAMETER_SUMMARY})
+            for i, parameter in enumerate(arrays['parameters.parameter'])
+        ]
+        return {
+            'cycle': self.manifest['cycle'],
+            'version': self.version,
+            'created_at': self.manifest['created_at'],
+            'rows': self.manifest['rows'],
+            'pt_stats': pt_stats,
+            'parameters': parameters,
+        }
+
+
+def _plain(value):
+    """Valore numpy -> tipo Python per il JSON (NaN -> None)"""
+    value = value.item()
+    return None if isinstance(value, float) and value != value else value
+
+
+def current_snapshot(cycle_code):
+    """
+    Snapshot corrente di un ciclo, aperto una volta per processo e per versione
+
+    Returns:
+        CycleSnapshot | None: None se il ciclo non è congelato
+    """
+    version = current_version(cycle_code)
+    if version is None:
+        return None
+    key = snapshot_dir(cycle_code)
+    snapshot = _open_snapshots.get(key)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _open_lock:
+        snapshot = _open_snapshots.get(key)
+        if snapshot is None or snapshot.version != version:
+            snapshot = CycleSnapshot.open(_version_dir(cycle_code, version))
+            _open_snapshots[key] = snapshot
+    return snapshot
+
+
+def frozen_snapshots(cycle_codes):
+    """
+    Snapshot dei cicli richiesti, solo se sono tutti congelati
+
+    Args:
+        cycle_codes: Cicli filtrati dalla richiesta
+
+    Returns:
+        list[CycleSnapshot] | None: None se nessun ciclo è indicato o uno non è congelato
+    """
+    if not cycle_codes:
+        return None
+    snapshots = []
+    for cycle_code in dict.fromkeys(cycle_codes):
+        snapshot = current_snapshot(cycle_code)
+        if snapshot is None:
+            return None
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def lab_columns(snapshots, lab_code, parameter_codes=None, technique_codes=None, since=None, not_null=None):
+    """
+    Risultati di un laboratorio nei cicli congelati, filtrati e ordinati per data
+
+    Args:
+        snapshots: Snapshot da frozen_snapshots
+        lab_code: Codice del laboratorio
+        parameter_codes: Parametri filtrati (opzionale)
+        technique_codes: Tecniche filtrate (opzionale)
+        since: Inizio della finestra su submitted_at (opzionale)
+        not_null: Colonna di punteggio che deve essere presente (opzionale)
+
+    Returns:
+        dict: Colonne di ROW_COLUMNS più parameter_code, parameter_name,
+            technique_name, cycle_name, provider_name (array object)
+    """
+    import numpy as np
+
+    parts = []
+    for snapshot in snapshots:
+        rows = snapshot.lab_rows(lab_code)
+        mask = np.ones(len(rows['lab']), dtype=bool)
+        if parameter_codes:
+            wanted = [snapshot.parameter_index[code] for code in parameter_codes if code in snapshot.parameter_index]
+            mask &= np.isin(rows['parameter'], wanted)
+        if technique_codes:
+            wanted = [snapshot.technique_index[code] for code in technique_codes if code in snapshot.technique_index]
+            mask &= np.isin(rows['technique'], wanted)
+        if since is not None:
+            mask &= rows['submitted_at'] >= np.datetime64(since, 'us')
+        if not_null:
+            mask &= ~np.isnan(rows[not_null])
+        part = {name: column[mask] for name, column in rows.items()}
+        part['parameter_code'] = snapshot.parameter_codes[part['parameter']]
+        part['parameter_name'] = snapshot.parameter_names[part['parameter']]
+        part['technique_name'] = snapshot.technique_names[part['technique']]
+        part['cycle_name'] = np.full(mask.sum(), snapshot.manifest['cycle']['name'], dtype=object)
+        part['provider_name'] = np.full(mask.sum(), snapshot.manifest['cycle']['provider_name'], dtype=object)
+        parts.append(part)
+
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    if len(parts) > 1:
+        order = np.argsort(columns['submitted_at'], kind='stable')
+        columns = {name: column[order] for name, column in columns.items()}
+    return columns
+
+
+# ===========================
+# CONGELAMENTO
+# ===========================
+
+def _read_rows(cycle):
+    """Risultati con punteggi del ciclo (dalle tabelle calde o di archivio) come DataFrame"""
+    import pandas as pd
+    from app.blueprints.stats.queries_stats import as_float
+    from app.services.archive import ARCHIVE, HOT
+
+    results, scores = ARCHIVE if cycle.archived_at else HOT
+    query = select(
+        results.id.label('result_id'), results.lab_code, results.parameter_code, results.technique_code,
+        results.submitted_at, as_float(results.measured_value), as_float(results.uncertainty),
+        *(as_float(getattr(scores, name)) for name in ('z', 'sz2', 'z_prime', 'zeta', 'en')),
+    ).join(scores, scores.result_id == results.id).where(results.cycle_code == cycle.code)
+    rows = db.session.execute(query).all()
+    return pd.DataFrame(rows, columns=list(query.selected_columns.keys()))
+
+
+def _build_columns(cycle, frame):
+    """Colonne dello snapshot e dizionari dei codici"""
+    import numpy as np
+    import pandas as pd
+    from app.blueprints.stats.services_stats import MAD_K
+
+    labs = sorted(frame['lab_code'].unique().tolist())
+    parameter_codes = sorted(frame['parameter_code'].unique().tolist())
+    technique_codes = sorted(frame['technique_code'].dropna().unique().tolist())
+    lab_idx = pd.Index(labs).get_indexer(frame['lab_code']).astype('int32')
+    parameter_idx = pd.Index(parameter_codes).get_indexer(frame['parameter_code']).astype('int32')
+    technique_idx = pd.Index(technique_codes).get_indexer(frame['technique_code']).astype('int32')
+
+    submitted = pd.to_datetime(frame['submitted_at']).to_numpy('datetime64[us]')
+    order = np.lexsort((frame['result_id'].to_numpy(), submitted, lab_idx))
+    rows = {
+        'result_id': frame['result_id'].to_numpy('int64'), 'lab': lab_idx, 'parameter': parameter_idx,
+        'technique': technique_idx, 'submitted_at': submitted,
+    }
+    for name in ('measured_value', 'uncertainty', 'z', 'sz2', 'z_prime', 'zeta', 'en'):
+        rows[name] = pd.to_numeric(frame[name], errors='coerce').to_numpy('float64')
+    arrays = {f"rows.{name}": np.ascontiguousarray(column[order], dtype=ROW_COLUMNS[name])
+              for name, column in rows.items()}
+    arrays['lab_offsets'] = np.searchsorted(lab_idx[order], np.arange(len(labs) + 1)).astype('int64')
+
+    # PtStats del ciclo (calcolate da upload e ricalcoli)
+    stats = db.session.execute(
+        select(PtStats.lab_code, PtStats.parameter_code, PtStats.n_results, PtStats.mean_z, PtStats.rsz)
+        .where(PtStats.cycle_code == cycle.code, PtStats.lab_code.in_(labs),
+               PtStats.parameter_code.in_(parameter_codes))
+        .order_by(PtStats.lab_code, PtStats.parameter_code)
+    ).all()
+    stats = pd.DataFrame(stats, columns=['lab_code', 'parameter_code', 'n_results', 'mean_z', 'rsz'])
+    arrays['pt_stats.lab'] = pd.Index(labs).get_indexer(stats['lab_code']).astype('int32')
+    arrays['pt_stats.parameter'] = pd.Index(parameter_codes).get_indexer(stats['parameter_code']).astype('int32')
+    arrays['pt_stats.n_results'] = stats['n_results'].to_numpy('int64')
+    for name in ('mean_z', 'rsz'):
+        arrays[f"pt_stats.{name}"] = pd.to_numeric(stats[name], errors='coerce').to_numpy('float64')
+
+    # Consenso robusto dei valori e distribuzione degli z per parametro
+    values = pd.DataFrame({'parameter': parameter_idx, 'value': rows['measured_value'], 'z': rows['z']})
+    abs_z = values['z'].abs()
+    values = values.assign(
+        dev=(values['value'] - values.groupby('parameter')['value'].transform('median')).abs(),
+        excellent=abs_z < 2, acceptable=(abs_z >= 2) & (abs_z < 3), poor=abs_z >= 3,
+    )
+    grouped = values.groupby('parameter', sort=True)
+    summary = pd.DataFrame({
+        'n': grouped.size(),
+        'median': grouped['value'].median(),
+        'robust_sd': MAD_K * grouped['dev'].median(),
+        'z_min': grouped['z'].min(),
+        'z_q1': grouped['z'].quantile(0.25),
+        'z_median': grouped['z'].median(),
+        'z_q3': grouped['z'].quantile(0.75),
+        'z_max': grouped['z'].max(),
+        'z_mean': grouped['z'].mean(),
+        'excellent': grouped['excellent'].sum(),
+        'acceptable': grouped['acceptable'].sum(),
+        'poor': grouped['poor'].sum(),
+    })
+    arrays['parameters.parameter'] = summary.index.to_numpy('int32')
+    for name in PARAMETER_SUMMARY:
+        dtype = 'int64' if name in ('n', 'excellent', 'acceptable', 'poor') else 'float64'
+        arrays[f"parameters.{name}"] = summary[name].to_numpy(dtype)
+
+    names = dict(db.session.execute(select(Parameter.code, Parameter.name).where(Parameter.code.in_(parameter_codes))).all())
+    techniques = dict(db.session.execute(select(Technique.code, Technique.name).where(Technique.code.in_(technique_codes))).all())
+    dictionaries = {
+        'labs': labs,
+        'parameters': [[code, names.get(code)] for code in parameter_codes],
+        'techniques': [[code, techniques.get(code)] for code in technique_codes],
+    }
+    return arrays, dictionaries
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_version(cycle, version, arrays, dictionaries):
+    """Scrive una versione in una cartella temporanea e la rinomina (nessuna versione a metà)"""
+    import numpy as np
+
+    final = _version_dir(cycle.code, version)
+    partial = final + '.part'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    files = {}
+    for name, array in arrays.items():
+        file_name = f"{name}.npy"
+        path = os.path.join(partial, file_name)
+        np.save(path, array, allow_pickle=False)
+        files[name] = {'file': file_name, 'dtype': str(array.dtype), 'length': int(len(array)),
+                       'sha256': _sha256(path)}
+    manifest = {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'cycle': {'code': cycle.code, 'name': cycle.name,
+                  'provider_name': cycle.provider.name if cycle.provider else None,
+                  'end_date': cycle.end_date.isoformat() if cycle.end_date else None},
+        'rows': int(len(arrays['rows.result_id'])),
+        'files': files,
+        **dictionaries,
+    }
+    with open(os.path.join(partial, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    for file_name in os.listdir(partial):
+        os.chmod(os.path.join(partial, file_name), 0o444)
+    os.rename(partial, final)
+    return manifest
+
+
+def _set_current(cycle_code, version):
+    """Sposta il puntatore CURRENT (rinomina atomica); None lo rimuove"""
+    pointer = os.path.join(snapshot_dir(cycle_code), 'CURRENT')
+    if version is None:
+        if os.path.exists(pointer):
+            os.remove(pointer)
+        return
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(str(version))
+    os.replace(pointer + '.tmp', pointer)
+
+
+def _prune_versions(cycle_code, keep):
+    """Elimina le versioni diverse da quella corrente (i processi che le hanno in memory map le leggono ancora)"""
+    directory = snapshot_dir(cycle_code)
+    for name in os.listdir(directory):
+        if name.startswith('v') and name != f"v{keep:04d}":
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def freezable_cycles():
+    """Cicli chiusi (pubblicati e terminati) non ancora congelati, dal più vecchio"""
+    return list(db.session.scalars(
+        select(Cycle.code).where(Cycle.status == 'published', Cycle.frozen_at.is_(None),
+                                 Cycle.end_date.isnot(None), Cycle.end_date < datetime.utcnow())
+        .order_by(Cycle.end_date)
+    ))
+
+
+def freeze_cycle(cycle_code):
+    """
+    Congela un ciclo chiuso (o ne scrive una nuova versione se è già congelato)
+
+    Args:
+        cycle_code: Codice del ciclo
+
+    Returns:
+        dict: Manifest della versione scritta
+
+    Raises:
+        SnapshotError: Ciclo inesistente, non pubblicato o non ancora terminato
+    """
+    cycle = Cycle.query.filter_by(code=cycle_code).first()
+    if cycle is None:
+        raise SnapshotError(f"Ciclo {cycle_code} non trovato")
+    if cycle.status != 'published' or cycle.end_date is None or cycle.end_date > datetime.utcnow():
+        raise SnapshotError(f"Ciclo {cycle_code} non chiuso: si congelano solo i cicli pubblicati e terminati")
+
+    # Prima il blocco delle scritture, poi la lettura dei dati
+    db.session.execute(update(Cycle).where(Cycle.code == cycle_code)
+                       .values(frozen_at=cycle.frozen_at or datetime.utcnow()))
+    db.session.commit()
+
+    os.makedirs(snapshot_dir(cycle_code), exist_ok=True)
+    previous = current_version(cycle_code)
+    existing = [int(name[1:]) for name in os.listdir(snapshot_dir(cycle_code))
+                if name.startswith('v') and name[1:].isdigit()]
+    version = max(existing + [previous or 0]) + 1
+    try:
+        arrays, dictionaries = _build_columns(cycle, _read_rows(cycle))
+        manifest = _write_version(cycle, version, arrays, dictionaries)
+    except Exception:
+        if previous is None:
+            db.session.execute(update(Cycle).where(Cycle.code == cycle_code).values(frozen_at=None))
+            db.session.commit()
+        raise
+    _set_current(cycle_code, version)
+    _prune_versions(cycle_code, keep=version)
+    db.session.execute(update(Cycle).where(Cycle.code == cycle_code).values(snapshot_version=version))
+    db.session.commit()
+    return manifest
+
+
+def unfreeze_cycle(cycle_code):
+    """
+    Scongela un ciclo: le letture tornano al database e il ciclo accetta di nuovo modifiche
+
+    Raises:
+        SnapshotError: Ciclo inesistente o non congelato
+    """
+    cycle = Cycle.query.filter_by(code=cycle_code).first()
+    if cycle is None:
+        raise SnapshotError(f"Ciclo {cycle_code} non trovato")
+    if cycle.frozen_at is None:
+        raise SnapshotError(f"Ciclo {cycle_code} non congelato")
+    # Prima il puntatore: nessuna lettura dallo snapshot dopo lo sblocco delle scritture
+    _set_current(cycle_code, None)
+    drop_snapshots(cycle_code)
+    db.session.execute(update(Cycle).where(Cycle.code == cycle_code).values(frozen_at=None, snapshot_version=None))
+    db.session.commit()
+
+
+def drop_snapshots(cycle_code):
+    """Elimina tutti gli snapshot di un ciclo (ciclo scongelato o eliminato)"""
+    shutil.rmtree(snapshot_dir(cycle_code), ignore_errors=True)
+    with _open_lock:
+        _open_snapshots.pop(snapshot_dir(cycle_code), None)
+
+
+def frozen_cycle_codes(cycle_codes):
+    """Cicli congelati tra quelli indicati"""
+    return set(db.session.scalars(
+        select(Cycle.code).where(Cycle.code.in_(list(cycle_codes)), Cycle.frozen_at.isnot(None))
+    ))
+
+
+def verify_snapshot(cycle_code):
+    """
+    Controlla SHA-256 e lunghezze dei file della versione corrente
+
+    Returns:
+        list: Errori trovati (vuota se lo snapshot è integro)
+    """
+    version = current_version(cycle_code)
+    if version is None:
+        return [f"Ciclo {cycle_code} non congelato"]
+    path = _version_dir(cycle_code, version)
+    snapshot = CycleSnapshot.open(path)
+    errors = []
+    for name, entry in snapshot.manifest['files'].items():
+        if _sha256(os.path.join(path, entry['file'])) != entry['sha256']:
+            errors.append(f"{entry['file']}: SHA-256 diverso dal manifest")
+        if len(snapshot.arrays[name]) != entry['length']:
+            errors.append(f"{entry['file']}: lunghezza {len(snapshot.arrays[name])} invece di {entry['length']}")
+    return errors
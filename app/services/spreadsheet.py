@@ -0,0 +1,115 @@
+# app/services/spreadsheet.py
+"""
+Lettura in streaming dei file Excel (.xlsx) di risultati
+
+Il foglio viene letto con openpyxl in modalità read-only, che scorre l'XML del
+foglio senza costruire il modello del workbook in memoria. Le righe arrivano a
+blocchi di XLSX_BATCH_ROWS e ogni blocco diventa subito un DataFrame di
+stringhe, come quello di pd.read_csv(dtype=str, keep_default_na=False): la
+validazione e il calcolo dei punteggi sono gli stessi del CSV e in memoria resta
+solo il DataFrame, non le celle del workbook.
+
+Senza nome del foglio si legge il primo del workbook (non quello attivo al
+salvataggio, che dipende da dove l'utente ha lasciato il cursore).
+"""
+from itertools import islice
+
+# Righe convertite per blocco
+XLSX_BATCH_ROWS = 5000
+
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class SpreadsheetError(ValueError):
+    """File Excel illeggibile o senza intestazione"""
+    pass
+
+
+def iter_xlsx_batches(stream, batch_rows=XLSX_BATCH_ROWS, sheet=None):
+    """
+    Legge il foglio a blocchi di righe
+
+    La prima riga non vuota è l'intestazione; le righe completamente vuote sono ignorate.
+
+    Args:
+        stream: File o stream binario (con seek)
+        batch_rows: Righe per blocco
+        sheet: Nome del foglio (default: il primo foglio)
+
+    Yields:
+        DataFrame: Blocco di righe con valori stringa ('' per le celle vuote)
+
+    Raises:
+        SpreadsheetError: File non valido, foglio inesistente o vuoto
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise SpreadsheetError(f"File Excel non leggibile: {e}")
+
+    try:
+        if sheet and sheet not in workbook.sheetnames:
+            raise SpreadsheetError(f"Foglio {sheet} non trovato nel file Excel")
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next((row for row in rows if any(cell is not None for cell in row)), None)
+        if header is None:
+            raise SpreadsheetError("Il foglio Excel è vuoto")
+        # Colonne senza intestazione (celle formattate oltre i dati) scartate
+        width = max(i + 1 for i, cell in enumerate(header) if cell is not None)
+        columns = [str(cell).strip() if cell is not None else f"column_{i}" for i, cell in enumerate(header[:width])]
+
+        data_rows = (
+            row[:width] + (None,) * (width - len(row))
+            for row in rows if any(cell is not None for cell in row)
+        )
+        empty = True
+        while True:
+            batch = list(islice(data_rows, batch_rows))
+            if not batch:
+                break
+            empty = False
+            yield _as_text(pd.DataFrame.from_records(batch, columns=columns))
+        if empty:
+            # Solo intestazione: le colonne servono comunque alla validazione
+            yield pd.DataFrame(columns=columns, dtype=str)
+    finally:
+        workbook.close()
+
+
+def read_xlsx(stream, batch_rows=XLSX_BATCH_ROWS, sheet=None):
+    """
+    Legge un foglio Excel in un unico DataFrame di stringhe
+
+    Args:
+        stream: File o stream binario
+        batch_rows: Righe per blocco di lettura
+        sheet: Nome del foglio (default: il primo foglio)
+
+    Returns:
+        DataFrame: Valori stringa, come pd.read_csv(dtype=str, keep_default_na=False)
+    """
+    import pandas as pd
+
+    return pd.concat(iter_xlsx_batches(stream, batch_rows, sheet), ignore_index=True)
+
+
+def _as_text(frame):
+    """Celle come testo: vuote -> '', numeri interi senza '.0', date in formato ISO"""
+    import pandas as pd
+
+    text = {}
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_float_dtype(values) and values.dropna().mod(1).eq(0).all():
+            values = values.astype('Int64')
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d %H:%M:%S').str.replace(' 00:00:00', '', regex=False)
+        elif values.dtype == object:
+            # Colonne miste (es. codici numerici e alfanumerici): interi Excel salvati come float
+            values = values.map(lambda v: int(v) if isinstance(v, float) and v.is_integer() else v)
+        text[column] = values.astype(object).where(values.notna(), '').astype(str)
+    return pd.DataFrame(text, index=frame.index)
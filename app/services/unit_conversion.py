@@ -0,0 +1,185 @@
+# app/services/unit_conversion.py
+"""
+Conversione vettoriale delle unità di misura in fase di import
+
+Le conversioni note sono archi di un grafo sulle unità del catalogo (tabella
+unit_conversion: valore in to_unit = valore in from_unit × factor, l'inverso è
+implicito). Dal grafo si ricava la matrice completa dei fattori tra tutte le
+coppie di unità collegate da un cammino (prodotto dei fattori lungo il cammino;
+NaN se non convertibili).
+
+La matrice è calcolata una volta per processo e database e riusata finché il
+catalogo non cambia (firma: numero di righe e ultimo updated_at di unit e
+unit_conversion, letti con una sola query). Convertire un upload con unità miste
+è così un'indicizzazione della matrice con i codici fattorizzati di ogni riga e
+una moltiplicazione vettoriale, senza Python per riga.
+"""
+import threading
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Unit, UnitConversion, Parameter
+
+# Colonne convertite insieme al valore (stessa unità del risultato)
+SCALED_COLUMNS = ('result_value', 'uncertainty')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _catalogue_signature():
+    """Firma del catalogo unità/conversioni: cambia a ogni inserimento, modifica o eliminazione"""
+    return tuple(db.session.execute(select(
+        select(func.count(Unit.id)).scalar_subquery(),
+        select(func.max(Unit.updated_at)).scalar_subquery(),
+        select(func.count(UnitConversion.id)).scalar_subquery(),
+        select(func.max(UnitConversion.updated_at)).scalar_subquery(),
+    )).one())
+
+
+def build_factor_matrix(unit_codes, conversions):
+    """
+    Matrice dei fattori di conversione tra tutte le unità
+
+    Args:
+        unit_codes: Codici delle unità (ordine di righe e colonne)
+        conversions: Tuple (from_unit_code, to_unit_code, factor)
+
+    Returns:
+        ndarray: matrix[i, j] = fattore da unit_codes[i] a unit_codes[j] (NaN se non collegate)
+    """
+    import numpy as np
+
+    index = {code: i for i, code in enumerate(unit_codes)}
+    edges = {i: [] for i in range(len(unit_codes))}
+    for from_code, to_code, factor in conversions:
+        if from_code in index and to_code in index and factor:
+            edges[index[from_code]].append((index[to_code], float(factor)))
+            edges[index[to_code]].append((index[from_code], 1.0 / float(factor)))
+
+    # Visita in ampiezza da ogni unità: il catalogo ha poche decine di unità
+    matrix = np.full((len(unit_codes), len(unit_codes)), np.nan)
+    for source in range(len(unit_codes)):
+        matrix[source, source] = 1.0
+        frontier = [source]
+        while frontier:
+            reached = []
+            for node in frontier:
+                for target, factor in edges[node]:
+                    if np.isnan(matrix[source, target]):
+                        matrix[source, target] = matrix[source, node] * factor
+                        reached.append(target)
+            frontier = reached
+    return matrix
+
+
+def conversion_matrix():
+    """
+    Matrice dei fattori del catalogo corrente (in cache finché il catalogo non cambia)
+
+    Returns:
+        tuple: (pandas.Index dei codici unità, matrice dei fattori)
+    """
+    import pandas as pd
+
+    key = db.engine.url.render_as_string(hide_password=True)
+    signature = _catalogue_signature()
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1], cached[2]
+
+    with _cache_lock:
+        unit_codes = list(db.session.scalars(select(Unit.code).order_by(Unit.code)))
+        conversions = db.session.execute(
+            select(UnitConversion.from_unit_code, UnitConversion.to_unit_code, UnitConversion.factor)
+        ).all()
+        units = pd.Index(unit_codes)
+        matrix = build_factor_matrix(unit_codes, conversions)
+        _cache[key] = (signature, units, matrix)
+    return units, matrix
+
+
+def conversion_factors(from_units, to_units):
+    """
+    Fattori di conversione riga per riga
+
+    I codici sono fattorizzati: le operazioni su stringhe riguardano solo le
+    unità distinte, le righe sono solo indicizzazioni di array.
+
+    Args:
+        from_units: Unità dichiarate (vuota o mancante = già nell'unità di destinazione)
+        to_units: Unità di destinazione
+
+    Returns:
+        tuple: (fattori, maschera unità dichiarate sconosciute); fattore NaN se le unità non sono convertibili
+    """
+    import numpy as np
+
+    units, matrix = conversion_matrix()
+    from_codes, from_uniques = _factorize_units(from_units)
+    to_codes, to_uniques = _factorize_units(to_units)
+    from_idx = units.get_indexer(from_uniques)[from_codes]
+    to_idx = units.get_indexer(to_uniques)[to_codes]
+
+    declared = (from_uniques != '')[from_codes]
+    unknown = declared & (from_idx < 0)
+    factors = np.ones(len(from_codes))
+    lookup = declared & (from_idx >= 0) & (to_idx >= 0)
+    factors[lookup] = matrix[from_idx[lookup], to_idx[lookup]]
+    factors[declared & ~lookup] = np.nan
+    # Stessa unità anche se non a catalogo (es. unità del parametro rinominata)
+    same = from_uniques[:, None] == to_uniques[None, :]
+    factors[declared & same[from_codes, to_codes]] = 1.0
+    return factors, unknown
+
+
+def _factorize_units(codes):
+    """Codici unità fattorizzati: (indice per riga, codici distinti ripuliti, '' per i mancanti in coda)"""
+    import numpy as np
+    import pandas as pd
+
+    row_codes, uniques = pd.factorize(np.asarray(codes, dtype=object), use_na_sentinel=True)
+    uniques = np.array([str(code).strip() for code in uniques] + [''], dtype=object)
+    row_codes[row_codes < 0] = len(uniques) - 1
+    return row_codes, uniques
+
+
+def parameter_units(parameter_codes):
+    """Unità canoniche dei parametri: {parameter_code: unit_code} con una query IN"""
+    codes = [code for code in set(parameter_codes) if code]
+    return dict(db.session.execute(
+        select(Parameter.code, Parameter.unit_code).where(Parameter.code.in_(codes))
+    ).all())
+
+
+def normalize_units(df, canonical=None):
+    """
+    Porta valori e incertezze nell'unità canonica di ogni parametro
+
+    Args:
+        df: DataFrame con parameter_code, valori numerici e colonna opzionale unit_code
+        canonical: {parameter_code: unit_code} (default: letto con parameter_units)
+
+    Returns:
+        int: Righe convertite (unit_code diventa l'unità del parametro)
+
+    Raises:
+        ValueError: Unità sconosciute o non convertibili (la validazione dovrebbe averle già escluse)
+    """
+    if 'unit_code' not in df.columns or not len(df):
+        return 0
+    if canonical is None:
+        canonical = parameter_units(df['parameter_code'].unique().tolist())
+
+    targets = df['parameter_code'].map(canonical).fillna('')
+    factors, unknown = conversion_factors(df['unit_code'], targets)
+    if unknown.any() or (factors != factors).any():
+        raise ValueError("Unità di misura sconosciute o non convertibili nel file")
+
+    converted = factors != 1.0
+    for column in SCALED_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column] * factors
+    df['unit_code'] = targets.to_numpy()
+    return int(converted.sum())
@@ -0,0 +1,10 @@
+"""
+Benchmark OCHEM - dataset PT sintetici e misura dei percorsi critici
+
+Uso:
+    python -m benchmarks.run --scale small
+    python -m benchmarks.run --scale production --database-url postgresql://localhost/ochem_bench
+    python -m benchmarks.run --compare benchmarks/results/<precedente>.json
+
+ATTENZIONE: il database indicato con --database-url viene svuotato e ricreato.
+"""
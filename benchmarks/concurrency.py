@@ -0,0 +1,182 @@
+"""
+Benchmark di concorrenza: traffico misto di upload e letture
+
+Ogni profilo engine (DB_ENGINE_PROFILE) viene provato su un database appena
+popolato: più processi (come i worker gunicorn) eseguono per una durata fissa
+upload CSV e letture delle API statistiche. Si misurano throughput, latenze ed
+errori (es. "database is locked").
+
+Uso:
+    python -m benchmarks.concurrency --profiles basic,development,production --workers 8
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks import datasets  # noqa: E402
+from benchmarks.run import RESULTS_DIR, _git_commit, _make_config  # noqa: E402
+
+
+def _create_app(database_url, profile):
+    from app import create_app
+    config = _make_config(database_url)
+    config.DB_ENGINE_PROFILE = profile
+    return create_app(config)
+
+
+def _worker(database_url, profile, spec, duration, write_ratio, seed, queue):
+    """Processo worker: esegue richieste miste fino allo scadere della durata"""
+    app = _create_app(database_url, profile)
+    client = app.test_client()
+    client.post('/auth/login', data={
+        'email': datasets.BENCH_USER_EMAIL, 'password': datasets.BENCH_USER_PASSWORD
+    })
+
+    rng = random.Random(seed)
+    params = [datasets.parameter_code(i) for i in range(min(5, spec['parameters']))]
+    param_query = '&'.join(f'parameters[]={p}' for p in params)
+    reads = [
+        'stats/api/chart-data?{params}&days=0',
+        'stats/api/table-data?page=1&per_page=50',
+        'stats/api/statistics',
+    ]
+    samples = {'write': [], 'read': []}
+    errors = []
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        lab = datasets.lab_code(rng.randrange(spec['labs']))
+        kind = 'write' if rng.random() < write_ratio else 'read'
+        start = time.perf_counter()
+        try:
+            if kind == 'write':
+                # Valori nuovi a ogni upload: i file identici verrebbero saltati
+                csv_content = datasets.upload_csv(spec, seed=rng.randrange(10**9)).encode()
+                response = client.post(f'/l/{lab}/stats/upload', data={
+                    'file': (io.BytesIO(csv_content), 'results.csv')
+                }, content_type='multipart/form-data')
+                # L'upload reindirizza ai risultati solo in caso di successo
+                ok = response.status_code == 302 and response.headers.get('Location', '').endswith('/stats/results')
+            else:
+                path = rng.choice(reads).format(params=param_query)
+                response = client.get(f'/l/{lab}/{path}')
+                ok = response.status_code == 200
+            if not ok:
+                errors.append(f"{kind} HTTP {response.status_code}")
+        except Exception as e:
+            errors.append(f"{kind} {type(e).__name__}: {e}")
+            ok = False
+        if ok:
+            samples[kind].append((time.perf_counter() - start) * 1000)
+
+    queue.put({'samples': samples, 'errors': errors})
+
+
+def _latency_stats(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'median_ms': round(statistics.median(values), 3),
+        'p95_ms': round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+
+def run_profile(database_url, profile, spec, workers, duration, write_ratio):
+    """
+    Popola il database e lancia i worker con il profilo indicato
+
+    Returns:
+        dict: Throughput, latenze ed errori del profilo
+    """
+    from app import db
+    app = _create_app(database_url, profile)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        datasets.seed_dataset(spec)
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(database_url, profile, spec, duration, write_ratio, seed, queue))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outputs = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    writes = [v for out in outputs for v in out['samples']['write']]
+    reads = [v for out in outputs for v in out['samples']['read']]
+    errors = [e for out in outputs for e in out['errors']]
+    return {
+        'workers': workers,
+        'duration_s': duration,
+        'write_ratio': write_ratio,
+        'throughput_rps': round((len(writes) + len(reads)) / duration, 2),
+        'writes': _latency_stats(writes),
+        'reads': _latency_stats(reads),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:10],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di concorrenza upload/letture per profilo engine")
+    parser.add_argument('--profiles', default='basic,development,production')
+    parser.add_argument('--scale', choices=sorted(datasets.SCALES), default='small')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help="Secondi per profilo")
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--database-url', help="Database da usare (VIENE SVUOTATO). Default: SQLite temporaneo per profilo")
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    spec = dict(datasets.SCALES[args.scale])
+    commit = _git_commit()
+    report = {
+        'meta': {'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'dataset': spec},
+        'profiles': {},
+    }
+
+    for profile in args.profiles.split(','):
+        # Un file SQLite nuovo per profilo: journal_mode=WAL resta persistente nel file
+        database_url = args.database_url or (
+            f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ochem_conc_'), 'bench.sqlite3')}"
+        )
+        print(f"\n=== profilo {profile} ({args.workers} worker, {args.duration}s) ===")
+        result = run_profile(database_url, profile, spec, args.workers, args.duration, args.write_ratio)
+        report['profiles'][profile] = result
+        print(f"  throughput {result['throughput_rps']} req/s   errori {result['errors']}")
+        print(f"  letture {result['reads']}")
+        print(f"  scritture {result['writes']}")
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"concurrency_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
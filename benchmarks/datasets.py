@@ -0,0 +1,76 @@
+"""
+Dataset PT sintetici per i benchmark (labs × cicli × parametri × risultati)
+La generazione è in app.services.seeding, condivisa con il comando `flask seed`
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app import db
+from app.models import Lab, User, Role, UserLabRole
+from app.services.seeding import (SCALES, N_TECHNIQUES, PARAMETER_LIMITS, PARAMETER_PRECISION,  # noqa: F401
+                                  PARAMETER_UNIT, seed_synthetic, lab_code, cycle_code, parameter_code,
+                                  technique_code)
+
+BENCH_USER_EMAIL = 'bench@ochem.local'
+BENCH_USER_PASSWORD = 'bench'
+# Numero di laboratori assegnati all'utente di benchmark (per /stats/general)
+BENCH_USER_LABS = 10
+
+
+def seed_dataset(spec, seed=42):
+    """
+    Popola il database con il dataset sintetico e l'utente di benchmark
+
+    Args:
+        spec: Dizionario con labs, cycles, parameters, results_per_combo
+        seed: Seme del generatore casuale
+
+    Returns:
+        dict: Conteggi delle righe inserite
+    """
+    counts = seed_synthetic(spec, seed=seed)
+    _seed_bench_user(spec['labs'], datetime.utcnow())
+    return counts
+
+
+def _seed_bench_user(n_labs, now):
+    """Crea l'utente di benchmark (admin) con ruolo owner su alcuni laboratori"""
+    user = User(email=BENCH_USER_EMAIL, first_name='Bench', last_name='User',
+                is_admin=True, accepted_disclaimer_at=now)
+    user.set_password(BENCH_USER_PASSWORD)
+    role = Role(name='owner_lab', description='Ruolo owner_lab')
+    db.session.add_all([user, role])
+    db.session.flush()
+    labs = Lab.query.order_by(Lab.id).limit(min(BENCH_USER_LABS, n_labs)).all()
+    db.session.add_all([UserLabRole(user_id=user.id, lab_id=lab.id, role_id=role.id) for lab in labs])
+    db.session.commit()
+
+
+def upload_csv(spec, rows_per_parameter=1, seed=7):
+    """
+    Genera un CSV di risultati come quello caricato da un laboratorio
+
+    I valori rispettano l'anagrafica dei parametri sintetici (unità, limiti e
+    decimali), così la validazione li accetta e si misura l'import vero e proprio.
+
+    Args:
+        spec: Dizionario con il numero di parametri
+        rows_per_parameter: Righe per parametro
+        seed: Seme del generatore casuale
+
+    Returns:
+        str: Contenuto CSV
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.repeat([parameter_code(i) for i in range(spec['parameters'])], rows_per_parameter)
+    frame = pd.DataFrame({
+        'parameter_code': codes,
+        'result_value': rng.uniform(1.0, 100.0, size=codes.size).clip(*PARAMETER_LIMITS).round(PARAMETER_PRECISION),
+        'technique_code': [technique_code(i % N_TECHNIQUES) for i in range(codes.size)],
+        'unit_code': PARAMETER_UNIT,
+        'date_performed': '',
+    })
+    return frame.to_csv(index=False)
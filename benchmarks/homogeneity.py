@@ -0,0 +1,114 @@
+"""
+Benchmark dell'ANOVA di omogeneità su cicli con molti parametri
+
+Genera misure in replicato sintetiche (parametri × campioni × repliche) e
+confronta anova_by_parameter, vettoriale su tutti i parametri, con il calcolo
+per parametro (un groupby pandas per ciascuno, come farebbe un ciclo sui
+parametri del ciclo). Si verifica che ss e sw coincidano.
+
+Uso:
+    python -m benchmarks.homogeneity --parameters 100,500,2000 --samples 10 --replicates 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.run import RESULTS_DIR, _git_commit  # noqa: E402
+
+
+def make_measurements(parameters, samples, replicates, seed=42):
+    """Array delle misure: valori, indice del parametro e del campione (univoco tra parametri)"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    param_idx = np.repeat(np.arange(parameters), samples * replicates)
+    sample_idx = np.repeat(np.arange(parameters * samples), replicates)
+    level = rng.uniform(1.0, 100.0, parameters)
+    between = rng.normal(0.0, 0.02, parameters * samples) * level.repeat(samples)
+    values = level[param_idx] + between[sample_idx] + rng.normal(0.0, 0.01, len(param_idx)) * level[param_idx]
+    return values, param_idx, sample_idx
+
+
+def anova_loop(values, param_idx, sample_idx):
+    """Riferimento: ANOVA parametro per parametro"""
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame({'value': values, 'param': param_idx, 'sample': sample_idx})
+    ss, sw = [], []
+    for _, part in df.groupby('param', sort=True):
+        groups = part.groupby('sample')['value']
+        n_i = groups.size().to_numpy(dtype=float)
+        means = groups.mean().to_numpy()
+        n, g = n_i.sum(), len(n_i)
+        msw = ((part['value'] - groups.transform('mean')) ** 2).sum() / (n - g)
+        msb = (n_i * (means - part['value'].mean()) ** 2).sum() / (g - 1)
+        n0 = (n - (n_i ** 2).sum() / n) / (g - 1)
+        sw.append(np.sqrt(msw))
+        ss.append(np.sqrt(max(0.0, (msb - msw) / n0)))
+    return np.array(ss), np.array(sw)
+
+
+def main(argv=None):
+    import numpy as np
+    from app.blueprints.stats.homogeneity_stats import anova_by_parameter
+
+    parser = argparse.ArgumentParser(description="ANOVA di omogeneità vettoriale contro ciclo per parametro")
+    parser.add_argument('--parameters', default="100,500,2000")
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--replicates', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    commit = _git_commit()
+    report = {
+        'meta': {'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'cpu_count': os.cpu_count(),
+                 'samples': args.samples, 'replicates': args.replicates},
+        'parameters': {},
+    }
+
+    for parameters in sorted({int(p) for p in args.parameters.split(',')}):
+        arrays = make_measurements(parameters, args.samples, args.replicates)
+        timings = {}
+        for name, func in (('vectorized', lambda: anova_by_parameter(*arrays, parameters)),
+                           ('loop', lambda: anova_loop(*arrays))):
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                output = func()
+                times.append(time.perf_counter() - start)
+            timings[name] = (min(times), output)
+
+        vectorized, (loop_ss, loop_sw) = timings['vectorized'][1], timings['loop'][1]
+        matches = bool(np.allclose(vectorized['ss'], loop_ss) and np.allclose(vectorized['sw'], loop_sw))
+        speedup = timings['loop'][0] / timings['vectorized'][0]
+        report['parameters'][parameters] = {
+            'measurements': len(arrays[0]),
+            'vectorized_s': round(timings['vectorized'][0], 4),
+            'loop_s': round(timings['loop'][0], 4),
+            'speedup': round(speedup, 1),
+            'matches_loop': matches,
+        }
+        print(f"  {parameters:5d} parametri   vettoriale {timings['vectorized'][0]:8.4f} s   "
+              f"per parametro {timings['loop'][0]:8.4f} s   {speedup:6.1f}x   {'ok' if matches else 'DIVERSO'}")
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"homogeneity_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark della lettura dei punteggi: Decimal contro float nativi
+
+Le colonne Numeric(18, 6) restituiscono un decimal.Decimal per riga, che le
+analisi convertono con float(). Sullo stesso dataset si confronta la select
+delle colonne Numeric con conversione in Python e la stessa select con
+as_float (CAST in SQL, float direttamente dal driver): tutti i risultati con
+punteggio (come gli storici e gli snapshot) e i risultati di un laboratorio
+(come grafici e statistiche). Si verifica che i valori coincidano.
+
+Uso:
+    python -m benchmarks.numeric_reads --scale medium --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from sqlalchemy.engine import make_url  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from benchmarks import datasets  # noqa: E402
+from benchmarks.run import RESULTS_DIR, _git_commit, _make_config, _timeit  # noqa: E402
+
+# Colonne lette dalle analisi
+COLUMNS = ('measured_value', 'z', 'sz2')
+
+
+def _select(lab_code, native):
+    """Select delle colonne numeriche dei risultati con punteggio (Decimal o float nativi)"""
+    from app.blueprints.stats.queries_stats import as_float
+    from app.models import Result, ZScore
+
+    columns = [Result.measured_value, ZScore.z, ZScore.sz2]
+    query = db.select(*(as_float(column) if native else column for column in columns)).join(
+        ZScore, ZScore.result_id == Result.id
+    )
+    if lab_code is not None:
+        query = query.where(Result.lab_code == lab_code)
+    return query
+
+
+def read_decimal(lab_code=None):
+    """Percorso precedente: Decimal dal driver, float() per ogni valore"""
+    rows = db.session.execute(_select(lab_code, native=False)).all()
+    return [[float(value) for value in column] for column in zip(*rows)]
+
+
+def read_native(lab_code=None):
+    """Percorso as_float: i valori arrivano già float"""
+    rows = db.session.execute(_select(lab_code, native=True)).all()
+    return [list(column) for column in zip(*rows)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lettura dei punteggi Numeric: Decimal contro float nativi")
+    parser.add_argument('--scale', choices=sorted(datasets.SCALES), default='medium')
+    parser.add_argument('--database-url', help="Database da ricreare (default SQLite temporaneo)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ochem_bench_'), 'bench.sqlite3')}"
+    spec = dict(datasets.SCALES[args.scale])
+    app = create_app(_make_config(database_url))
+
+    commit = _git_commit()
+    report = {
+        'meta': {'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'scale': args.scale,
+                 'dataset': spec, 'backend': make_url(database_url).get_backend_name()},
+        'cases': {},
+    }
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        datasets.seed_dataset(spec)
+        print(f"Dataset {spec} generato in {time.perf_counter() - start:.1f}s")
+
+        for case, lab_code in (('all_results', None), ('one_lab', datasets.lab_code(0))):
+            decimal_values, native_values = read_decimal(lab_code), read_native(lab_code)
+            rows = len(native_values[0]) if native_values else 0
+            timings = {
+                'decimal': _timeit(lambda: read_decimal(lab_code), args.repeat),
+                'native': _timeit(lambda: read_native(lab_code), args.repeat),
+            }
+            saved_ms = timings['decimal']['min_ms'] - timings['native']['min_ms']
+            report['cases'][case] = {
+                'rows': rows,
+                'values': rows * len(COLUMNS),
+                'timings': timings,
+                'speedup': round(timings['decimal']['min_ms'] / timings['native']['min_ms'], 2),
+                'saved_us_per_row': round(saved_ms * 1000 / rows, 3) if rows else 0,
+                'matches_decimal': decimal_values == native_values,
+            }
+            result = report['cases'][case]
+            print(f"  {case:12s} {rows:>9,} righe   Decimal {timings['decimal']['min_ms']:9.1f} ms   "
+                  f"float {timings['native']['min_ms']:9.1f} ms   {result['speedup']:5.2f}x   "
+                  f"{result['saved_us_per_row']:.3f} µs/riga   {'ok' if result['matches_decimal'] else 'DIVERSO'}")
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"numeric_reads_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark del calcolo statistiche di ciclo in serie e in parallelo
+
+Genera array sintetici (risultati ordinati per parametro, come li carica
+recompute_cycle_statistics) e misura compute_cycle_scores con un numero
+crescente di processi. Il tempo include l'avvio del pool e la copia in memoria
+condivisa; si verifica che i risultati coincidano con il calcolo seriale.
+
+Uso:
+    python -m benchmarks.parallel_stats --rows 5000000 --workers 1,2,4,8,16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.run import RESULTS_DIR, _git_commit  # noqa: E402
+
+
+def make_arrays(rows, labs, parameters, seed=42):
+    """Array riga per riga di un ciclo sintetico, ordinati per parametro"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    param_idx = np.sort(rng.integers(0, parameters, rows)).astype(np.int32)
+    lab_idx = rng.integers(0, labs, rows).astype(np.int32)
+    xpt = rng.uniform(1.0, 100.0, parameters)[param_idx]
+    sigma = xpt * 0.1
+    values = xpt + rng.normal(0.0, 1.2, rows) * sigma
+    u_x = sigma * 0.5
+    return values, xpt, sigma, lab_idx, param_idx, u_x, sigma * 0.1
+
+
+def main(argv=None):
+    import numpy as np
+    from app.blueprints.stats.cycle_stats import compute_cycle_scores
+
+    parser = argparse.ArgumentParser(description="Scalabilità del calcolo statistiche di ciclo per processi")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--labs', type=int, default=500)
+    parser.add_argument('--parameters', type=int, default=200)
+    parser.add_argument('--workers', default=f"1,2,4,{os.cpu_count() or 1}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    arrays = make_arrays(args.rows, args.labs, args.parameters)
+    commit = _git_commit()
+    report = {
+        'meta': {'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'cpu_count': os.cpu_count(),
+                 'rows': args.rows, 'labs': args.labs, 'parameters': args.parameters},
+        'workers': {},
+    }
+
+    baseline = None
+    for workers in sorted({int(w) for w in args.workers.split(',')}):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            scores, lab_stats, consensus = compute_cycle_scores(*arrays, workers=workers)
+            times.append(time.perf_counter() - start)
+        if baseline is None:
+            baseline = (min(times), scores, lab_stats)
+        matches = bool(all(np.array_equal(scores[key], baseline[1][key], equal_nan=True) for key in scores)
+                       and all(np.allclose(lab_stats[key], baseline[2][key]) for key in lab_stats))
+        report['workers'][workers] = {
+            'best_s': round(min(times), 3),
+            'speedup': round(baseline[0] / min(times), 2),
+            'matches_serial': matches,
+        }
+        print(f"  {workers:3d} processi   best {min(times):8.3f} s   speedup {baseline[0] / min(times):5.2f}x"
+              f"   {'ok' if matches else 'DIVERSO DAL SERIALE'}")
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"parallel_stats_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Esegue i benchmark dei percorsi critici su uno o più database
+
+Per ogni database: crea lo schema, genera il dataset sintetico e misura
+upload CSV, calcolo z-score, dati grafico, dati tabella, opzioni filtri e
+statistiche generali. I tempi vengono salvati in JSON per confrontare i commit.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from benchmarks import datasets  # noqa: E402
+
+RESULTS_DIR = ROOT_DIR / 'benchmarks' / 'results'
+
+
+def _make_config(database_url):
+    """Configurazione dell'app puntata sul database di benchmark"""
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+    return BenchmarkConfig
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _timeit(fn, repeat, warmup=1):
+    """
+    Misura una funzione più volte
+
+    Returns:
+        dict: Statistiche dei tempi in millisecondi
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def _expect(response, *codes):
+    if response.status_code not in codes:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def benchmark_target(database_url, spec, repeat):
+    """
+    Genera il dataset su un database e misura tutti i percorsi critici
+
+    Args:
+        database_url: URL SQLAlchemy del database (viene ricreato)
+        spec: Dimensioni del dataset
+        repeat: Ripetizioni per ogni misura
+
+    Returns:
+        dict: Tempi di seeding e dei benchmark
+    """
+    from app.blueprints.stats.services_stats import process_results_csv
+
+    app = create_app(_make_config(database_url))
+    report = {'dataset': dict(spec), 'benchmarks': {}}
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        report['rows'] = datasets.seed_dataset(spec)
+        report['seed_seconds'] = round(time.perf_counter() - start, 3)
+
+    client = app.test_client()
+    _expect(client.post('/auth/login', data={
+        'email': datasets.BENCH_USER_EMAIL, 'password': datasets.BENCH_USER_PASSWORD
+    }), 302)
+
+    lab = datasets.lab_code(0)
+    params = [datasets.parameter_code(i) for i in range(min(5, spec['parameters']))]
+    param_query = '&'.join(f'parameters[]={p}' for p in params)
+    csv_content = datasets.upload_csv(spec)
+
+    def zscore_compute():
+        with app.test_request_context():
+            process_results_csv(io.StringIO(csv_content), lab)
+
+    upload_seeds = iter(range(1000, 10**6))
+
+    def csv_upload(content=None):
+        # Ogni upload è una correzione del precedente (valori diversi): misura il percorso di scrittura
+        content = content or datasets.upload_csv(spec, seed=next(upload_seeds))
+        response = _expect(client.post(f'/l/{lab}/stats/upload', data={
+            'file': (io.BytesIO(content.encode()), 'results.csv')
+        }, content_type='multipart/form-data'), 302)
+        # Un file rifiutato (validazione) torna alla pagina di upload: non misurerebbe l'import
+        if not response.headers.get('Location', '').endswith('/stats/results'):
+            raise RuntimeError(f"Upload non importato (redirect a {response.headers.get('Location')})")
+
+    cases = {
+        'zscore_compute': zscore_compute,
+        'chart_data': lambda: _expect(client.get(f'/l/{lab}/stats/api/chart-data?{param_query}&days=0'), 200),
+        'chart_data_all_parameters': lambda: _expect(client.get(f'/l/{lab}/stats/api/chart-data?days=0'), 200),
+        'chart_data_compact_gzip': lambda: _expect(client.get(f'/l/{lab}/stats/api/chart-data?days=0&format=compact',
+                                                              headers={'Accept-Encoding': 'gzip'}), 200),
+        'table_data': lambda: _expect(client.get(f'/l/{lab}/stats/api/table-data?page=1&per_page=50'), 200),
+        'filter_options': lambda: _expect(client.get(f'/l/{lab}/stats/api/filter-options?{param_query}'), 200),
+        'statistics': lambda: _expect(client.get(f'/l/{lab}/stats/api/statistics'), 200),
+        'results_view': lambda: _expect(client.get(f'/l/{lab}/stats/results'), 200),
+        'general_stats_lab': lambda: _expect(client.get(f'/l/{lab}/stats/general'), 200),
+        'general_stats': lambda: _expect(client.get('/stats/general'), 200),
+        # Per ultimi: l'upload aggiunge righe al database
+        'csv_upload': csv_upload,
+        'csv_upload_duplicate': lambda: csv_upload(csv_content),
+    }
+
+    for name, fn in cases.items():
+        try:
+            report['benchmarks'][name] = _timeit(fn, repeat)
+        except Exception as e:
+            report['benchmarks'][name] = {'error': str(e)}
+        print(f"  {name:28s} {_format_case(report['benchmarks'][name])}")
+
+    return report
+
+
+def _format_case(case):
+    if 'error' in case:
+        return f"ERRORE: {case['error']}"
+    return f"median {case['median_ms']:10.2f} ms   p95 {case['p95_ms']:10.2f} ms"
+
+
+def compare_reports(previous, current):
+    """Stampa il rapporto tra le mediane di due report (>1 = più lento)"""
+    for target, data in current['targets'].items():
+        old = previous.get('targets', {}).get(target)
+        if not old:
+            continue
+        print(f"\nConfronto {previous['meta']['commit']} -> {current['meta']['commit']} ({target})")
+        for name, case in data['benchmarks'].items():
+            old_case = old['benchmarks'].get(name, {})
+            if 'median_ms' in case and 'median_ms' in old_case and old_case['median_ms'] > 0:
+                ratio = case['median_ms'] / old_case['median_ms']
+                print(f"  {name:28s} {old_case['median_ms']:10.2f} -> {case['median_ms']:10.2f} ms  x{ratio:.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OCHEM su dataset PT sintetici")
+    parser.add_argument('--scale', choices=sorted(datasets.SCALES), default='small')
+    parser.add_argument('--labs', type=int)
+    parser.add_argument('--cycles', type=int)
+    parser.add_argument('--parameters', type=int)
+    parser.add_argument('--results-per-combo', type=int)
+    parser.add_argument('--database-url', action='append', dest='database_urls',
+                        help="Database da usare (ripetibile). Default: SQLite temporaneo. VIENE SVUOTATO.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="File JSON di output (default benchmarks/results/bench_<commit>_<ts>.json)")
+    parser.add_argument('--compare', help="Report JSON precedente da confrontare")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec = dict(datasets.SCALES[args.scale])
+    for key in ('labs', 'cycles', 'parameters', 'results_per_combo'):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+
+    tmp_dir = None
+    database_urls = args.database_urls
+    if not database_urls:
+        tmp_dir = tempfile.mkdtemp(prefix='ochem_bench_')
+        database_urls = [f"sqlite:///{os.path.join(tmp_dir, 'bench.sqlite3')}"]
+
+    commit = _git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'dataset': spec,
+        },
+        'targets': {},
+    }
+
+    for url in database_urls:
+        target = make_url(url).render_as_string(hide_password=True)
+        print(f"\n=== {target} ({spec}) ===")
+        report['targets'][make_url(url).get_backend_name()] = dict(
+            benchmark_target(url, spec, args.repeat), url=target
+        )
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"bench_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+
+    if args.compare:
+        compare_reports(json.loads(Path(args.compare).read_text()), report)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark della lettura dei file di risultati: CSV contro Excel in streaming
+
+Genera lo stesso file di risultati in CSV e in .xlsx (righe con le colonne del
+template) e misura il tempo di lettura fino al DataFrame di stringhe che entra
+nella validazione: pd.read_csv per il CSV, read_xlsx (openpyxl read-only a
+blocchi) per l'Excel e, come riferimento, pd.read_excel. Il picco di memoria
+Python di ogni lettura è misurato con tracemalloc in un passaggio separato.
+
+Uso:
+    python -m benchmarks.xlsx_ingest --rows 10000,100000
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from benchmarks.run import RESULTS_DIR, _git_commit  # noqa: E402
+
+COLUMNS = ['parameter_code', 'result_value', 'uncertainty', 'technique_code', 'unit_code', 'date_performed']
+
+
+def make_files(rows, seed=42):
+    """Stesso contenuto in CSV e in .xlsx (bytes)"""
+    import numpy as np
+    import pandas as pd
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'parameter_code': [f"P{i:03d}" for i in rng.integers(0, 200, rows)],
+        'result_value': np.round(rng.uniform(0.1, 500.0, rows), 3),
+        'uncertainty': np.round(rng.uniform(0.01, 5.0, rows), 3),
+        'technique_code': [f"T{i:02d}" for i in rng.integers(0, 20, rows)],
+        'unit_code': rng.choice(['mg/L', 'µg/L'], rows),
+        'date_performed': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+    })
+    csv_bytes = df.to_csv(index=False, date_format='%Y-%m-%d').encode()
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Risultati')
+    sheet.append(COLUMNS)
+    for row in df.itertuples(index=False):
+        sheet.append([row.parameter_code, row.result_value, row.uncertainty, row.technique_code,
+                      row.unit_code, row.date_performed.to_pydatetime()])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return csv_bytes, buffer.getvalue()
+
+
+def _measure(read, payload, repeat):
+    """Tempo migliore e picco di memoria tracemalloc di una lettura"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = read(io.BytesIO(payload))
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    read(io.BytesIO(payload))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, frame
+
+
+def main(argv=None):
+    import pandas as pd
+    from app.services.spreadsheet import read_xlsx
+
+    parser = argparse.ArgumentParser(description="Lettura file risultati: CSV contro Excel in streaming")
+    parser.add_argument('--rows', default="10000,100000")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    readers = {
+        'csv': lambda stream: pd.read_csv(stream, dtype=str, keep_default_na=False),
+        'xlsx_streaming': read_xlsx,
+        'xlsx_pandas': lambda stream: pd.read_excel(stream, dtype=str, keep_default_na=False),
+    }
+
+    commit = _git_commit()
+    report = {
+        'meta': {'commit': commit, 'created_at': datetime.utcnow().isoformat(), 'cpu_count': os.cpu_count()},
+        'rows': {},
+    }
+    for rows in sorted({int(r) for r in args.rows.split(',')}):
+        csv_bytes, xlsx_bytes = make_files(rows)
+        entry = {'csv_bytes': len(csv_bytes), 'xlsx_bytes': len(xlsx_bytes)}
+        frames = {}
+        print(f"\n{rows} righe (CSV {len(csv_bytes) / 1e6:.1f} MB, xlsx {len(xlsx_bytes) / 1e6:.1f} MB)")
+        for name, read in readers.items():
+            best, peak, frames[name] = _measure(read, xlsx_bytes if name.startswith('xlsx') else csv_bytes,
+                                                args.repeat)
+            entry[name] = {'best_s': round(best, 3), 'rows_per_s': int(rows / best), 'peak_mb': round(peak / 1e6, 1)}
+            print(f"  {name:15s} {best:8.3f} s   {rows / best:10.0f} righe/s   picco {peak / 1e6:7.1f} MB")
+
+        # Stesso contenuto numerico e di codici dal CSV e dall'Excel in streaming
+        csv_frame, xlsx_frame = frames['csv'], frames['xlsx_streaming']
+        entry['matches_csv'] = bool(
+            list(xlsx_frame.columns) == COLUMNS
+            and (csv_frame['parameter_code'] == xlsx_frame['parameter_code']).all()
+            and (pd.to_numeric(csv_frame['result_value']) == pd.to_numeric(xlsx_frame['result_value'])).all()
+            and (pd.to_datetime(csv_frame['date_performed']) == pd.to_datetime(xlsx_frame['date_performed'])).all()
+        )
+        print(f"  contenuto uguale al CSV: {'ok' if entry['matches_csv'] else 'DIVERSO'}")
+        report['rows'][rows] = entry
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"xlsx_ingest_{commit}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nReport salvato in {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,10 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ochem.sqlite3')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Profilo engine: basic | development | production (vedi app/services/db_engine.py)
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE') or 'development'
+    # Replica in sola lettura per le statistiche (opzionale)
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
     
     # Flask-WTF
     WTF_CSRF_ENABLED = True
@@ -14,4 +18,62 @@ class Config:
     
     # Upload files
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    
+    # Cache HTTP delle API statistiche (secondi prima della rivalidazione con ETag)
+    STATS_CACHE_MAX_AGE = int(os.environ.get('STATS_CACHE_MAX_AGE', '0'))
+    
+    # Import massivo dei provider: processi paralleli (0 = uno per CPU). Non impostato: un solo processo
+    # per le richieste web e l'API, uno per CPU da flask bulk-import
+    BULK_IMPORT_WORKERS = int(os.environ['BULK_IMPORT_WORKERS']) if os.environ.get('BULK_IMPORT_WORKERS') else None
+    
+    # Eliminazione di laboratori e cicli: risultati per transazione e soglia oltre la quale
+    # l'eliminazione prosegue in background (avanzamento nel JobLog)
+    CASCADE_DELETE_CHUNK_ROWS = int(os.environ.get('CASCADE_DELETE_CHUNK_ROWS', '5000'))
+    CASCADE_DELETE_BACKGROUND_ROWS = int(os.environ.get('CASCADE_DELETE_BACKGROUND_ROWS', '20000'))
+    
+    # Backup a caldo (vedi app/services/backup.py): cartella, pagine SQLite per passo e pausa tra i passi
+    # (secondi), compressione auto | zstd | gzip | none (auto = zstd se installato, altrimenti gzip)
+    BACKUP_DIR = os.environ.get('BACKUP_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'backups')
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '1024'))
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.005'))
+    BACKUP_COMPRESSION = os.environ.get('BACKUP_COMPRESSION', 'auto').lower()
+    
+    # Archiviazione dei cicli pubblicati terminati da più di N giorni (flask archive run)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '730'))
+    
+    # Snapshot colonnari dei cicli congelati (flask snapshot freeze): cartella condivisa da tutti i processi
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'snapshots')
+    
+    # Storico dei punteggi per laboratorio in memory map per i grafici (vedi app/services/history_store.py);
+    # non impostato = disattivato, i grafici leggono da SQL. File iniziali con flask history build
+    HISTORY_STORE_DIR = os.environ.get('HISTORY_STORE_DIR') or None
+    
+    # API dei risultati per i LIMS: elementi massimi per lotto (JSON o NDJSON)
+    API_BATCH_MAX_ITEMS = int(os.environ.get('API_BATCH_MAX_ITEMS', '50000'))
+    # Durata massima di un lotto in elaborazione: oltre, la sua Idempotency-Key passa al reinvio
+    # (un worker terminato a metà non blocca la chiave per sempre)
+    API_IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('API_IDEMPOTENCY_LEASE_SECONDS', '900'))
+    
+    # Ricalcolo statistiche di ciclo: in parallelo per parametro sopra la soglia di righe (0 = un processo per CPU);
+    # sotto la soglia l'avvio dei processi costa più del calcolo
+    STATS_COMPUTE_WORKERS = int(os.environ.get('STATS_COMPUTE_WORKERS', '0'))
+    STATS_PARALLEL_MIN_ROWS = int(os.environ.get('STATS_PARALLEL_MIN_ROWS', '1000000'))
+    
+    # Pubblicazione dei cicli: richiede lo studio di omogeneità per ogni parametro
+    # (gli studi non conformi bloccano comunque la pubblicazione)
+    HOMOGENEITY_REQUIRED = os.environ.get('HOMOGENEITY_REQUIRED', '0').lower() in ('1', 'true', 'yes')
+    
+    # Compressione delle risposte JSON (brotli se installato, altrimenti gzip)
+    RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    RESPONSE_COMPRESSION_MIN_SIZE = 1024  # byte
+    RESPONSE_COMPRESSION_GZIP_LEVEL = 3  # livelli alti costano molta CPU per pochi byte in meno
+    RESPONSE_COMPRESSION_BROTLI_QUALITY = 4
+    
+    # Encoder JSON veloce (orjson con supporto numpy)
+    FAST_JSON_ENCODER = os.environ.get('FAST_JSON_ENCODER', '').lower() in ('1', 'true', 'yes')
+    
+    # Diagnostica query (disattivata di default, campionata quando attiva)
+    QUERY_DIAGNOSTICS_ENABLED = os.environ.get('QUERY_DIAGNOSTICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    QUERY_DIAGNOSTICS_SAMPLE_RATE = float(os.environ.get('QUERY_DIAGNOSTICS_SAMPLE_RATE', '0.1'))
+    QUERY_DIAGNOSTICS_MAX_ENTRIES = 200
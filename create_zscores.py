@@ -9,6 +9,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app, db
 from app.models import Result, ZScore
+from app.services.data_version import bump_data_version
 import random
 
 def create_missing_zscores():
@@ -50,6 +51,8 @@ def create_missing_zscores():
                     print(f"  {result.parameter_code} ({result.cycle_code}): z={z_score:.3f}")
             
             try:
+                # Invalida le risposte in cache delle API statistiche
+                bump_data_version('LAB_ALPHA')
                 db.session.commit()
                 print("Z-score creati con successo!")
                 
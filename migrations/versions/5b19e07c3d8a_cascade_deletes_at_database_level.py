@@ -0,0 +1,85 @@
+"""Cascade deletes at database level, with indexes on the child columns
+
+Revision ID: 5b19e07c3d8a
+Revises: ad1d3c918ff0
+Create Date: 2026-10-19 06:02:14.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b19e07c3d8a'
+down_revision = 'ad1d3c918ff0'
+branch_labels = None
+depends_on = None
+
+# Le chiavi esterne create senza nome (SQLite) si eliminano con questo nome in batch mode
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+# (tabella, colonna, tabella riferita, colonna riferita, ondelete)
+FOREIGN_KEYS = [
+    ('api_idempotency_key', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('api_token', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('cycle_doc', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('cycle_parameter', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('homogeneity_result', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('lab_participation', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('lab_participation', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('pt_stats', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('pt_stats', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('result', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('result', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('result', 'lab_participation_id', 'lab_participation', 'id', 'CASCADE'),
+    ('result', 'upload_file_id', 'upload_file', 'id', 'SET NULL'),
+    ('sample_measurement', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('upload_file', 'lab_code', 'lab', 'code', 'CASCADE'),
+    ('upload_file', 'cycle_code', 'cycle', 'code', 'CASCADE'),
+    ('user_lab_role', 'lab_id', 'lab', 'id', 'CASCADE'),
+    ('z_score', 'result_id', 'result', 'id', 'CASCADE'),
+]
+
+# Colonne figlie senza indice: ogni DELETE del padre le scorrerebbe per intero
+INDEXES = [
+    ('cycle_doc', 'cycle_code'),
+    ('cycle_parameter', 'cycle_code'),
+    ('lab_participation', 'cycle_code'),
+    ('lab_participation', 'lab_code'),
+    ('pt_stats', 'cycle_code'),
+    ('pt_stats', 'lab_code'),
+    ('result', 'cycle_code'),
+    ('result', 'lab_code'),
+    ('result', 'lab_participation_id'),
+    ('upload_file', 'cycle_code'),
+    ('upload_file', 'lab_code'),
+    ('user_lab_role', 'lab_id'),
+    ('z_score', 'result_id'),
+]
+
+
+def _replace_foreign_keys(downgrade=False):
+    inspector = sa.inspect(op.get_bind())
+    tables = sorted({table for table, *_ in FOREIGN_KEYS})
+    for table in tables:
+        existing = {tuple(fk['constrained_columns']): fk['name'] for fk in inspector.get_foreign_keys(table)}
+        with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+            for fk_table, column, referred_table, referred_column, ondelete in FOREIGN_KEYS:
+                if fk_table != table:
+                    continue
+                name = existing.get((column,)) or f"fk_{table}_{column}_{referred_table}"
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred_table, [column], [referred_column],
+                                            ondelete=None if downgrade else ondelete)
+
+
+def upgrade():
+    for table, column in INDEXES:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+    _replace_foreign_keys()
+
+
+def downgrade():
+    _replace_foreign_keys(downgrade=True)
+    for table, column in INDEXES:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
@@ -0,0 +1,83 @@
+"""
+Backup completo e incrementali: il ripristino riproduce il database
+
+Dopo un backup completo il database cambia (aggiornamenti, archiviazione, poi
+eliminazione di un laboratorio e VACUUM che accorcia il file) e a ogni passo si
+esegue un incrementale. Ogni backup della catena, ripristinato, ha lo stesso
+contenuto (schema e righe) del database vivo al momento del backup.
+"""
+import sqlite3
+
+import pytest
+from sqlalchemy import update
+
+from config import Config
+from app import create_app, db
+from app.models import Result
+from app.services.archive import archive_cycle
+from app.services.backup import create_backup, restore_backup
+from app.services.cascade_delete import start_deletion
+from app.services.seeding import seed_synthetic, cycle_code, lab_code
+
+SPEC = {'labs': 3, 'cycles': 2, 'parameters': 5, 'results_per_combo': 20}
+
+
+@pytest.fixture(params=['basic', 'development'])
+def app(request, tmp_path):
+    class BackupConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'backup.sqlite3'}"
+        DB_ENGINE_PROFILE = request.param
+        BACKUP_DIR = str(tmp_path / 'backups')
+        BACKUP_PAGES_PER_STEP = 7
+        BACKUP_STEP_SLEEP = 0
+        TESTING = True
+
+    app = create_app(BackupConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _dump(path):
+    connection = sqlite3.connect(path)
+    try:
+        return list(connection.iterdump())
+    finally:
+        connection.close()
+
+
+def _live_dump():
+    db.session.commit()
+    return _dump(db.engine.url.database)
+
+
+def _vacuum():
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM')
+
+
+def test_full_and_incremental_restore_reproduce_live_db(app, tmp_path):
+    backups = [(create_backup(), _live_dump())]
+
+    db.session.execute(update(Result).where(Result.lab_code == lab_code(0)).values(measured_value=Result.measured_value * 2))
+    archive_cycle(cycle_code(0))
+    backups.append((create_backup(incremental=True), _live_dump()))
+
+    assert start_deletion('lab', lab_code(1), background=False).status == 'completed'
+    _vacuum()
+    backups.append((create_backup(incremental=True), _live_dump()))
+
+    full, first, second = (manifest for manifest, _ in backups)
+    assert full['kind'] == 'full'
+    assert first['kind'] == second['kind'] == 'incremental'
+    assert first['parent_id'] == full['id'] and second['parent_id'] == first['id']
+    assert 0 < first['changed_pages'] < first['page_count']
+    assert second['page_count'] < first['page_count']
+
+    for i, (manifest, live) in enumerate(backups):
+        restored = restore_backup(manifest['id'], tmp_path / f'restored_{i}.sqlite3')
+        assert restored['sha256'] == manifest['sha256']
+        assert _dump(restored['target']) == live
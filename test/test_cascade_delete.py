@@ -0,0 +1,115 @@
+"""
+Eliminazione a cascata di laboratori e cicli: nessuna riga orfana
+
+Lo stesso scenario gira con SQLite senza chiavi esterne (profilo basic, figli
+eliminati esplicitamente) e con PRAGMA foreign_keys attivo (ON DELETE CASCADE).
+Dopo l'eliminazione ogni chiave esterna punta a una riga esistente e i dati
+degli altri laboratori o cicli sono intatti.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text, update
+
+from config import Config
+from app import create_app, db
+from app.models import ApiToken, Cycle, InviteToken, Lab, LabParticipation, Role, User, UserLabRole
+from app.services.archive import archive_cycle
+from app.services.cascade_delete import _cascade_enforced, start_deletion
+from app.services.seeding import seed_synthetic, cycle_code, lab_code, parameter_code
+
+SPEC = {'labs': 2, 'cycles': 2, 'parameters': 3, 'results_per_combo': 2}
+
+
+@pytest.fixture(params=['basic', 'development'])
+def app(request, tmp_path):
+    class CascadeConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'cascade.sqlite3'}"
+        DB_ENGINE_PROFILE = request.param
+        TESTING = True
+
+    app = create_app(CascadeConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        assert _cascade_enforced() == (request.param == 'development')
+
+        user = User(email='cascade@ochem.local', first_name='Cascade', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('cascade')
+        role = Role(name='lab_admin')
+        db.session.add_all([user, role])
+        db.session.flush()
+        for i in range(SPEC['labs']):
+            code = lab_code(i)
+            lab = Lab.query.filter_by(code=code).one()
+            record, token = ApiToken.create_token(code, user.id, 'lims')
+            db.session.add_all([
+                record,
+                UserLabRole(user_id=user.id, lab_id=lab.id, role_id=role.id),
+                InviteToken(lab_code=code, email=f'invite{i}@ochem.local', role='lab_viewer', token=f'invite-{i}',
+                            expires_at=datetime.utcnow() + timedelta(days=1), created_by=user.email),
+                *(LabParticipation(lab_code=code, cycle_code=cycle_code(c)) for c in range(SPEC['cycles'])),
+            ])
+            db.session.commit()
+            # Upload via API (UploadFile, risultati collegati e chiave di idempotenza)
+            items = [{'cycle_code': cycle_code(1), 'parameter_code': parameter_code(0), 'result_value': 12.5,
+                      'unit_code': 'mg/L'}]
+            response = app.test_client().post(f'/l/{code}/stats/api/results', data=json.dumps(items),
+                                              content_type='application/json',
+                                              headers={'Authorization': f'Bearer {token}', 'Idempotency-Key': 'k1'})
+            assert response.status_code == 200
+        # Un ciclo nelle tabelle di archivio, l'altro in quelle correnti
+        archive_cycle(cycle_code(0))
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _orphans():
+    """Righe con una chiave esterna verso una riga inesistente: {tabella.colonna: conteggio}"""
+    orphans = {}
+    for table in db.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            column, target = fk.parent, fk.column
+            count = db.session.scalar(select(func.count()).select_from(table).where(
+                column.isnot(None), column.notin_(select(target))))
+            if count:
+                orphans[f"{table.name}.{column.name}"] = count
+    count = db.session.scalar(select(func.count(InviteToken.id)).where(InviteToken.lab_code.notin_(select(Lab.code))))
+    if count:
+        orphans['invite_token.lab_code'] = count
+    return orphans
+
+
+def _rows(column_name, code):
+    """Righe per tabella con column_name == code"""
+    return {table.name: db.session.scalar(select(func.count()).select_from(table).where(table.c[column_name] == code))
+            for table in db.metadata.sorted_tables if column_name in table.c}
+
+
+def _check(kind, code, kept, column_name):
+    before = _rows(column_name, kept)
+    assert sum(_rows(column_name, code).values()) > 0
+
+    job = start_deletion(kind, code, background=False)
+    assert job.status == 'completed', job.error_message
+    db.session.expire_all()
+
+    assert _orphans() == {}
+    assert sum(_rows(column_name, code).values()) == 0
+    assert _rows(column_name, kept) == before
+    # Le chiavi esterne dichiarate restano coerenti anche per SQLite
+    assert db.session.execute(text('PRAGMA foreign_key_check')).all() == []
+
+
+def test_lab_delete_leaves_no_orphans(app):
+    _check('lab', lab_code(0), lab_code(1), 'lab_code')
+    assert db.session.scalar(select(func.count(UserLabRole.id))) == 1
+
+
+def test_cycle_delete_leaves_no_orphans(app):
+    db.session.execute(update(Cycle).where(Cycle.code == cycle_code(0)).values(status='draft'))
+    db.session.commit()
+    _check('cycle', cycle_code(0), cycle_code(1), 'cycle_code')
@@ -0,0 +1,101 @@
+"""
+Dati dei grafici indipendenti da dove stanno i risultati
+
+Le risposte di /api/chart-data restano identiche quando i risultati passano
+nelle tabelle di archivio (archive_cycle), tornano in quelle correnti
+(restore_cycle) o sono letti da uno snapshot congelato (freeze_cycle).
+"""
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import User
+from app.services.archive import archive_cycle, restore_cycle
+from app.services.seeding import seed_synthetic, cycle_code, lab_code, parameter_code
+from app.services.snapshots import freeze_cycle, unfreeze_cycle
+
+SPEC = {'labs': 2, 'cycles': 3, 'parameters': 3, 'results_per_combo': 4}
+URL = f'/l/{lab_code(0)}/stats/api/chart-data'
+
+QUERIES = {
+    'all': {'days': 365},
+    'window': {'days': 45},
+    'parameter': {'days': 365, 'parameters[]': [parameter_code(1)]},
+    'old cycle': {'days': 365, 'cycles[]': [cycle_code(0)]},
+    'closed cycles': {'days': 365, 'cycles[]': [cycle_code(0), cycle_code(1)]},
+    'compact zeta': {'days': 365, 'format': 'compact', 'metric': 'zeta'},
+    'compact cycle en': {'days': 365, 'format': 'compact', 'metric': 'en', 'cycles[]': [cycle_code(1)]},
+}
+
+
+@pytest.fixture
+def client(tmp_path):
+    class ChartConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'chart.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        SNAPSHOT_DIR = str(tmp_path / 'snapshots')
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+
+    app = create_app(ChartConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        user = User(email='chart@ochem.local', first_name='Chart', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('chart')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'chart@ochem.local', 'password': 'chart'})
+    yield client
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _responses(client):
+    responses = {}
+    for name, query in QUERIES.items():
+        response = client.get(URL, query_string=query)
+        assert response.status_code == 200, name
+        responses[name] = response.get_json()
+    return responses
+
+
+def _apply(client, change, *args):
+    with client.application.app_context():
+        change(*args)
+
+
+def _check_steps(client, steps):
+    expected = _responses(client)
+    assert expected['all']['data']['y'] and expected['old cycle']['data']['y']
+    assert len(expected['window']['data']['y']) < len(expected['all']['data']['y'])
+
+    for change, code in steps:
+        _apply(client, change, code)
+        responses = _responses(client)
+        for name in QUERIES:
+            assert responses[name] == expected[name], f"{change.__name__}({code}): {name}"
+
+
+def test_chart_data_survives_archive_and_restore(client):
+    _check_steps(client, [
+        (archive_cycle, cycle_code(0)),
+        (restore_cycle, cycle_code(0)),
+        (archive_cycle, cycle_code(1)),
+    ])
+
+
+def test_chart_data_survives_freeze(client):
+    # Cicli congelati dalle tabelle correnti e da quelle di archivio
+    _check_steps(client, [
+        (freeze_cycle, cycle_code(1)),
+        (archive_cycle, cycle_code(0)),
+        (freeze_cycle, cycle_code(0)),
+        (freeze_cycle, cycle_code(1)),
+        (unfreeze_cycle, cycle_code(0)),
+    ])
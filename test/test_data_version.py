@@ -0,0 +1,83 @@
+"""
+ETag delle API statistiche: dati del laboratorio e catalogo
+
+Una richiesta condizionale con l'ETag ricevuto risponde 304 finché né i
+risultati del laboratorio né le anagrafiche (nomi in risposta) cambiano.
+"""
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import Parameter, User
+from app.services.data_version import bump_data_version
+from app.services.seeding import seed_synthetic, lab_code, parameter_code
+
+SPEC = {'labs': 2, 'cycles': 1, 'parameters': 2, 'results_per_combo': 1}
+LAB = lab_code(0)
+URL = f'/l/{LAB}/stats/api/filter-options'
+
+
+@pytest.fixture
+def client(tmp_path):
+    class ETagConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'etag.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        RESPONSE_COMPRESSION_MIN_SIZE = 0
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+
+    app = create_app(ETagConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        user = User(email='etag@ochem.local', first_name='ETag', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('etag')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'etag@ochem.local', 'password': 'etag'})
+    yield client
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _revalidate(client, etag):
+    response = client.get(URL, headers={'If-None-Match': etag})
+    assert 'Accept-Encoding' in response.vary
+    return response.status_code
+
+
+def _update(client, change):
+    with client.application.app_context():
+        change()
+        db.session.commit()
+
+
+def test_etag_follows_lab_data_and_catalogue(client):
+    response = client.get(URL)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert _revalidate(client, etag) == 304
+
+    # Variante compressa: stesso 304 con la stessa chiave di cache
+    response = client.get(URL, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert _revalidate(client, response.headers['ETag']) == 304
+
+    # Nuovi dati di un altro laboratorio: risposta invariata
+    _update(client, lambda: bump_data_version(lab_code(1)))
+    assert _revalidate(client, etag) == 304
+
+    # Rinomina di un parametro: cambia per tutti i laboratori
+    _update(client, lambda: setattr(Parameter.query.filter_by(code=parameter_code(0)).one(), 'name', 'Rinominato'))
+    assert _revalidate(client, etag) == 200
+    response = client.get(URL)
+    assert 'Rinominato' in response.get_data(as_text=True)
+    etag = response.headers['ETag']
+
+    _update(client, lambda: bump_data_version(LAB))
+    assert _revalidate(client, etag) == 200
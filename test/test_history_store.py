@@ -0,0 +1,115 @@
+"""
+Storico per laboratorio: stessi dati dei grafici della query SQL
+
+get_control_chart_data con lo storico in memory map deve restituire ciò che
+restituisce la query SQL (storico non configurato), dopo la costruzione,
+dopo un upload accodato e dopo un upload che riscrive il file.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import ApiToken, User
+from app.blueprints.stats.services_stats import get_control_chart_data
+from app.services.history_store import build_lab, history_columns, read_meta
+from app.services.seeding import seed_synthetic, cycle_code, lab_code, parameter_code, technique_code
+
+SPEC = {'labs': 2, 'cycles': 2, 'parameters': 3, 'results_per_combo': 3}
+LAB = lab_code(0)
+
+CHARTS = [
+    {'limit_days': 365},
+    {'limit_days': 20},
+    {'limit_days': 365, 'parameter_codes': [parameter_code(2)]},
+    {'limit_days': 365, 'technique_codes': [technique_code(0)]},
+    {'limit_days': 365, 'cycle_codes': [cycle_code(1)], 'metric': 'zeta'},
+    {'limit_days': 365, 'metric': 'en', 'compact': True},
+    {'limit_days': 365, 'compact': True, 'parameter_codes': [parameter_code(0), parameter_code(1)]},
+]
+
+
+@pytest.fixture
+def app(tmp_path):
+    class HistoryConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'history.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        HISTORY_STORE_DIR = str(tmp_path / 'history')
+        TESTING = True
+
+    (tmp_path / 'history').mkdir()
+    app = create_app(HistoryConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        user = User(email='history@ochem.local', first_name='History', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('history')
+        db.session.add(user)
+        db.session.flush()
+        record, app.token = ApiToken.create_token(LAB, user.id, 'lims')
+        db.session.add(record)
+        db.session.commit()
+        build_lab(LAB)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _post(app, items):
+    response = app.test_client().post(f'/l/{LAB}/stats/api/results', data=json.dumps(items),
+                                      content_type='application/json',
+                                      headers={'Authorization': f'Bearer {app.token}'})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['summary']
+
+
+def _item(parameter, value, performed):
+    return {'cycle_code': cycle_code(1), 'parameter_code': parameter_code(parameter), 'result_value': value,
+            'unit_code': 'mg/L', 'date_performed': performed.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def _assert_matches_sql(app):
+    db.session.expire_all()
+    assert history_columns(LAB, 'z') is not None
+    # Confronto sul JSON della risposta (il formato compatto contiene array numpy)
+    from_history = [app.json.dumps(get_control_chart_data(LAB, **chart)) for chart in CHARTS]
+
+    directory = app.config['HISTORY_STORE_DIR']
+    app.config['HISTORY_STORE_DIR'] = None
+    try:
+        from_sql = [app.json.dumps(get_control_chart_data(LAB, **chart)) for chart in CHARTS]
+    finally:
+        app.config['HISTORY_STORE_DIR'] = directory
+    for chart, history, sql in zip(CHARTS, from_history, from_sql):
+        assert history == sql, chart
+
+
+def test_history_matches_sql_after_append_and_rebuild(app):
+    _assert_matches_sql(app)
+    built = read_meta(LAB)
+
+    # Risultati nuovi, successivi all'ultimo record: accodati nella stessa generazione
+    now = datetime.utcnow().replace(microsecond=0)
+    summary = _post(app, [_item(i, 10.0 + i, now + timedelta(minutes=i)) for i in range(3)])
+    assert summary['inserted'] == 3
+    appended = read_meta(LAB)
+    assert appended['generation'] == built['generation']
+    assert appended['count'] == built['count'] + 3
+    _assert_matches_sql(app)
+
+    # Valore corretto: il file è riscritto in una nuova generazione
+    summary = _post(app, [_item(0, 15.0, now)])
+    assert summary['updated'] == 1
+    rebuilt = read_meta(LAB)
+    assert rebuilt['generation'] == appended['generation'] + 1
+    assert rebuilt['count'] == appended['count']
+    _assert_matches_sql(app)
+
+    # Risultato retrodatato: non accodabile in ordine di data, riscrittura
+    summary = _post(app, [_item(1, 11.0, now - timedelta(days=10)) | {'technique_code': technique_code(5)}])
+    assert summary['inserted'] == 1
+    assert read_meta(LAB)['generation'] == rebuilt['generation'] + 1
+    _assert_matches_sql(app)
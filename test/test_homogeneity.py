@@ -0,0 +1,90 @@
+"""
+Studi di omogeneità (ISO 13528, B.3): ANOVA e blocco della pubblicazione
+
+Il parametro 0 ha 3 campioni in doppio: medie 11, 14, 12 (media generale 37/3),
+SSW = 4 con N - g = 3, SSB = 2·(16 + 25 + 1)/9 = 28/3 con g - 1 = 2, n0 = 2:
+sw² = 4/3 e ss² = (14/3 - 4/3) / 2 = 5/3.
+"""
+import io
+import math
+
+import numpy as np
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import CycleParameter
+from app.blueprints.stats.homogeneity_stats import (
+    anova_by_parameter, read_sample_measurements, store_sample_measurements, publication_blockers,
+)
+from app.services.seeding import seed_synthetic, cycle_code, parameter_code
+
+SW = math.sqrt(4 / 3)
+SS = math.sqrt(5 / 3)
+
+# Parametro 0: esempio sopra; 1: un solo campione; 2: due campioni senza repliche
+VALUES = [10, 12, 14, 14, 11, 13, 5, 6, 7, 8]
+PARAM_IDX = [0, 0, 0, 0, 0, 0, 1, 1, 2, 2]
+SAMPLE_IDX = [0, 0, 1, 1, 2, 2, 3, 3, 4, 5]
+
+
+def test_anova_matches_hand_computation():
+    anova = anova_by_parameter(VALUES, PARAM_IDX, SAMPLE_IDX)
+
+    assert anova['n_samples'].tolist() == [3, 1, 2]
+    assert anova['n_measurements'].tolist() == [6, 2, 2]
+    assert anova['mean'] == pytest.approx([37 / 3, 5.5, 7.5])
+    assert anova['sw'][0] == pytest.approx(SW)
+    assert anova['ss'][0] == pytest.approx(SS)
+    # Meno di 2 campioni o nessuna replica: non calcolabili
+    assert np.isnan(anova['ss'][1:]).all() and np.isnan(anova['sw'][1:]).all()
+
+
+@pytest.fixture
+def app(tmp_path):
+    class HomogeneityConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'homogeneity.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        HOMOGENEITY_REQUIRED = False
+        TESTING = True
+
+    app = create_app(HomogeneityConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic({'labs': 1, 'cycles': 1, 'parameters': 4, 'results_per_combo': 1})
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_publication_gate(app):
+    cycle = cycle_code(0)
+    # Criterio 0.3·σpt: 1.5 (parametro 0 conforme) e 0.3 (parametro 3 non conforme)
+    for code, sigma in zip((parameter_code(i) for i in range(4)), (5.0, 5.0, 5.0, 1.0)):
+        CycleParameter.query.filter_by(cycle_code=cycle, parameter_code=code).update({'sigma_pt': sigma})
+    db.session.commit()
+
+    rows = [(parameter_code(p), f"S{s}", value) for value, p, s in zip(VALUES, PARAM_IDX, SAMPLE_IDX)]
+    rows += [(parameter_code(3), f"S{s}", value) for s, value in ((6, 10), (6, 12), (7, 14), (7, 14))]
+    # Parametro 3: ss = 2 oltre il criterio; stabilità del parametro 0 entro il criterio
+    csv = "parameter_code,sample_id,value,study\n" + "".join(
+        f"{code},{sample},{value},homogeneity\n" for code, sample, value in rows
+    ) + f"{parameter_code(0)},T1,12.5,stability\n{parameter_code(0)},T1,12.1,stability\n"
+    df, errors = read_sample_measurements(io.StringIO(csv))
+    assert not errors
+    results, errors = store_sample_measurements(cycle, df)
+    assert not errors
+
+    by_key = {(r['parameter_code'], r['study']): r for r in results}
+    first = by_key[(parameter_code(0), 'homogeneity')]
+    assert first['sw'] == pytest.approx(SW, abs=1e-6)
+    assert first['ss'] == pytest.approx(SS, abs=1e-6)
+    assert first['passed']
+    assert by_key[(parameter_code(0), 'stability')]['passed']
+    assert by_key[(parameter_code(1), 'homogeneity')]['ss'] is None
+
+    assert publication_blockers(cycle) == [
+        f"{parameter_code(1)}: omogeneità con dati insufficienti (servono almeno 2 campioni con misure replicate)",
+        f"{parameter_code(2)}: omogeneità con dati insufficienti (servono almeno 2 campioni con misure replicate)",
+        f"{parameter_code(3)}: omogeneità non conforme",
+    ]
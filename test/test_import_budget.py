@@ -0,0 +1,62 @@
+"""
+Profilo di avvio basato su `python -X importtime`
+
+Verifica che create_app() non importi librerie scientifiche/grafiche pesanti
+(caricate solo al primo uso) e che il tempo di avvio (import di `app` e
+create_app(), con i moduli importati durante la creazione) resti entro il budget.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Moduli che non devono essere importati all'avvio dell'app
+LAZY_MODULES = ("pandas", "numpy", "plotly", "faker")
+
+# Budget del tempo di avvio: import di `app` più create_app() (microsecondi, sovrascrivibile da env)
+IMPORT_BUDGET_US = int(os.environ.get("OCHEM_IMPORT_BUDGET_MS", "2000")) * 1000
+
+# Cronometra import e create_app() insieme e stampa i microsecondi come ultima riga
+STARTUP_SCRIPT = (
+    "import time; start = time.perf_counter(); "
+    "from app import create_app; create_app(); "
+    "print(int((time.perf_counter() - start) * 1e6))"
+)
+
+
+def _importtime_profile():
+    """
+    Esegue create_app() in un processo pulito
+
+    Returns:
+        tuple: ({modulo: cumulativo_us}, durata di import + create_app() in us)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        env=dict(os.environ, DATABASE_URL="sqlite://"),
+    )
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            profile[name.strip()] = int(cumulative)
+    return profile, int(proc.stdout.strip().splitlines()[-1])
+
+
+def test_create_app_does_not_import_heavy_libraries():
+    profile, _ = _importtime_profile()
+    loaded = sorted(name for name in profile if name.split(".")[0] in LAZY_MODULES)
+    assert not loaded, f"Import pesanti all'avvio: {loaded[:10]}"
+
+
+def test_create_app_import_budget():
+    profile, startup_us = _importtime_profile()
+    assert startup_us <= IMPORT_BUDGET_US, (
+        f"Avvio (import di app {profile.get('app', 0) / 1000:.0f} ms + create_app()): "
+        f"{startup_us / 1000:.0f} ms (budget {IMPORT_BUDGET_US / 1000:.0f} ms)"
+    )
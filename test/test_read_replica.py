@@ -0,0 +1,112 @@
+"""
+Instradamento delle letture statistiche su replica con due file SQLite
+
+Il primario viene copiato nella replica e poi la replica viene modificata:
+le risposte delle API indicano quale database ha servito la lettura. Una
+data_version del laboratorio più recente sul primario simula la replica in ritardo.
+"""
+import io
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import User
+from app.services.data_version import bump_data_version
+from app.services.read_replica import REPLICA_BIND, replica_lags
+from app.services.seeding import seed_synthetic, lab_code, parameter_code
+
+SPEC = {'labs': 2, 'cycles': 1, 'parameters': 3, 'results_per_combo': 2}
+LAB = lab_code(0)
+
+
+@pytest.fixture
+def client(tmp_path):
+    primary = tmp_path / 'primary.sqlite3'
+    replica = tmp_path / 'replica.sqlite3'
+
+    class ReplicaConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{primary}"
+        SQLALCHEMY_REPLICA_URI = f"sqlite:///{replica}"
+        DB_ENGINE_PROFILE = 'basic'
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        for email in ('replica@ochem.local', 'member@ochem.local'):
+            user = User(email=email, first_name='Replica', last_name='Test',
+                        is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+            user.set_password('replica')
+            db.session.add(user)
+        db.session.commit()
+        db.engine.dispose()
+
+    # Replica = copia del primario con un risultato in meno per il laboratorio
+    with sqlite3.connect(primary) as src, sqlite3.connect(replica) as dst:
+        src.backup(dst)
+        dst.execute("DELETE FROM z_score WHERE result_id = (SELECT MIN(id) FROM result WHERE lab_code = ?)", (LAB,))
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'replica@ochem.local', 'password': 'replica'})
+    yield client
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # Il bind registra un MetaData sull'estensione globale: le app successive senza replica non lo hanno
+    db.metadatas.pop(REPLICA_BIND, None)
+
+
+def _total_results(client):
+    response = client.get(f'/l/{LAB}/stats/api/statistics')
+    assert response.status_code == 200
+    return response.get_json()['statistics']['total_results']
+
+
+def test_stats_reads_use_replica(client):
+    primary_total = SPEC['cycles'] * SPEC['parameters'] * SPEC['results_per_combo']
+    assert _total_results(client) == primary_total - 1
+
+
+def _upload(client):
+    csv_content = "parameter_code,result_value,technique_code,unit_code,date_performed\n" + "".join(
+        f"{parameter_code(i)},10.0,,mg/L,\n" for i in range(SPEC['parameters'])
+    )
+    response = client.post(f'/l/{LAB}/stats/upload', data={
+        'file': (io.BytesIO(csv_content.encode()), 'results.csv')
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/stats/results')
+
+
+def test_upload_pins_lab_to_primary(client):
+    _upload(client)
+    primary_total = SPEC['cycles'] * SPEC['parameters'] * SPEC['results_per_combo'] + SPEC['parameters']
+    assert _total_results(client) == primary_total
+
+
+def test_other_users_read_primary_after_upload(client):
+    _upload(client)
+
+    member = client.application.test_client()
+    member.post('/auth/login', data={'email': 'member@ochem.local', 'password': 'replica'})
+    primary_total = SPEC['cycles'] * SPEC['parameters'] * SPEC['results_per_combo'] + SPEC['parameters']
+    assert _total_results(member) == primary_total
+
+
+def test_writes_outside_requests_pin_lab(client):
+    # Import massivo e API token incrementano la versione senza sessione utente
+    with client.application.app_context():
+        bump_data_version(LAB)
+        db.session.commit()
+
+    primary_total = SPEC['cycles'] * SPEC['parameters'] * SPEC['results_per_combo']
+    assert _total_results(client) == primary_total
+    # Gli altri laboratori, allineati, restano sulla replica
+    with client.application.app_context():
+        assert not replica_lags(lab_code(1))
+        assert replica_lags()
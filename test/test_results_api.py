@@ -0,0 +1,177 @@
+"""
+API dei risultati per i LIMS: lettura del corpo, token, idempotenza e modalità
+
+I parser sono provati con blocchi piccolissimi (confini a metà di numeri e di
+caratteri UTF-8); le richieste usano il client di test con un token API.
+"""
+import hashlib
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import ApiIdempotencyKey, ApiToken, Result, User
+from app.services.results_api import ApiBatchError, collect_items, iter_json_items, iter_ndjson_items
+from app.services.seeding import seed_synthetic, cycle_code, lab_code, parameter_code
+
+SPEC = {'labs': 2, 'cycles': 1, 'parameters': 4, 'results_per_combo': 1}
+LAB = lab_code(0)
+URL = f'/l/{LAB}/stats/api/results'
+ITEMS = [{'a': 1}, {'b': 'è€', 'c': [1.25, None, True]}, {'d': {'e': -12.5e3}}]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64 * 1024])
+def test_json_items_across_chunk_boundaries(chunk_size):
+    body = json.dumps(ITEMS, ensure_ascii=False).encode()
+    assert list(iter_json_items(io.BytesIO(body), chunk_size=chunk_size)) == ITEMS
+    spaced = b' \n[ ' + b' ,\n '.join(json.dumps(item).encode() for item in ITEMS) + b' ] \n'
+    assert list(iter_json_items(io.BytesIO(spaced), chunk_size=chunk_size)) == ITEMS
+    assert list(iter_json_items(io.BytesIO(b'[ ]'), chunk_size=chunk_size)) == []
+
+
+@pytest.mark.parametrize('body', [b'{"a": 1}', b'[{"a": 1}', b'[{"a": 1} {"b": 2}]', b'[{"a": }]', b'[1,]',
+                                  b'', b'["\xff"]'])
+def test_json_items_invalid_body(body):
+    with pytest.raises(ApiBatchError) as error:
+        list(iter_json_items(io.BytesIO(body), chunk_size=2))
+    assert error.value.status_code == 400
+
+
+def test_ndjson_items():
+    body = b'{"a": 1}\n\n  \n{"b": "\xc3\xa8"}\r\n'
+    assert list(iter_ndjson_items(io.BytesIO(body))) == [{'a': 1}, {'b': 'è'}]
+    with pytest.raises(ApiBatchError, match='Riga 3'):
+        list(iter_ndjson_items(io.BytesIO(b'{"a": 1}\n\n{"b": \n')))
+
+
+def test_collect_items_cap_and_non_objects():
+    df, errors = collect_items(iter([{'parameter_code': ' P1 ', 'result_value': 1.5}, [1]]), max_items=2)
+    assert df['parameter_code'].tolist() == ['P1', '']
+    assert df['result_value'].tolist() == ['1.5', '']
+    assert list(errors) == [1]
+    with pytest.raises(ApiBatchError) as error:
+        collect_items(iter([{}] * 3), max_items=2)
+    assert error.value.status_code == 413
+
+
+@pytest.fixture
+def api(tmp_path):
+    class ApiConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'api.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        API_BATCH_MAX_ITEMS = 10
+        TESTING = True
+
+    app = create_app(ApiConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        user = User(email='lims@ochem.local', first_name='Lims', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('lims')
+        db.session.add(user)
+        db.session.flush()
+        tokens = {}
+        for name, code in (('lims', LAB), ('other', lab_code(1)), ('revoked', LAB)):
+            record, tokens[name] = ApiToken.create_token(code, user.id, name)
+            if name == 'revoked':
+                record.revoked_at = datetime.utcnow()
+            db.session.add(record)
+        db.session.commit()
+
+    app.tokens = tokens
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _items(*parameters, value=10.0):
+    return [{'cycle_code': cycle_code(0), 'parameter_code': parameter_code(i), 'result_value': value + i,
+             'unit_code': 'mg/L'} for i in parameters]
+
+
+def _post(app, items, token='lims', ndjson=False, query='', key=None):
+    if ndjson:
+        body, content_type = '\n'.join(json.dumps(item) for item in items), 'application/x-ndjson'
+    else:
+        body, content_type = json.dumps(items), 'application/json'
+    headers = {'Authorization': f"Bearer {app.tokens[token]}"}
+    if key:
+        headers['Idempotency-Key'] = key
+    return app.test_client().post(URL + query, data=body, content_type=content_type, headers=headers)
+
+
+def _api_parameters(app):
+    with app.app_context():
+        return sorted(code for (code,) in db.session.query(Result.parameter_code).filter(
+            Result.lab_code == LAB, Result.upload_file_id.isnot(None)))
+
+
+def test_token_required_for_own_lab(api):
+    assert api.test_client().post(URL, json=_items(0)).status_code == 401
+    assert _post(api, _items(0), token='revoked').status_code == 401
+    assert _post(api, _items(0), token='other').status_code == 403
+    assert _post(api, _items(0)).status_code == 200
+
+
+def test_batch_cap_returns_413(api):
+    response = _post(api, _items(0) * 11)
+    assert response.status_code == 413
+    assert _api_parameters(api) == []
+
+
+def test_incremental_batches_merge_and_replace_is_explicit(api):
+    first = _post(api, _items(0, 1)).get_json()
+    assert first['summary']['inserted'] == 2 and first['summary']['deleted'] == 0
+
+    second = _post(api, _items(2, 3), ndjson=True).get_json()
+    assert second['summary'] == {'items': 2, 'accepted': 2, 'unchanged': 0, 'rejected': 0, 'not_imported': 0,
+                                 'mode': 'merge', 'inserted': 2, 'updated': 0, 'deleted': 0}
+    assert _api_parameters(api) == [parameter_code(i) for i in range(4)]
+
+    assert _post(api, _items(3), query='?mode=wipe').status_code == 400
+    replaced = _post(api, _items(3), query='?mode=replace').get_json()
+    # Restano solo le righe del lotto: eliminati i tre risultati API e quelli del seed per il ciclo
+    assert replaced['summary']['mode'] == 'replace'
+    assert replaced['summary']['deleted'] == 3 + SPEC['parameters'] * SPEC['results_per_combo']
+    assert _api_parameters(api) == [parameter_code(3)]
+
+
+def test_idempotent_replay_and_conflicts(api):
+    first = _post(api, _items(0), key='batch-1')
+    assert first.status_code == 200
+    replay = _post(api, _items(0), key='batch-1')
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == first.get_json()
+    assert _api_parameters(api) == [parameter_code(0)]
+
+    assert _post(api, _items(1), key='batch-1').status_code == 422
+    # Stesso corpo in sostituzione: lotto diverso
+    assert _post(api, _items(0), key='batch-1', query='?mode=replace').status_code == 422
+
+
+def test_processing_key_lease(api):
+    items = _items(1)
+    body_hash = hashlib.sha256(json.dumps(items).encode()).hexdigest()
+    lease = api.config['API_IDEMPOTENCY_LEASE_SECONDS']
+    with api.app_context():
+        db.session.add(ApiIdempotencyKey(lab_code=LAB, idempotency_key='crashed', request_hash=body_hash,
+                                          started_at=datetime.utcnow()))
+        db.session.commit()
+
+    # Elaborazione in corso entro il lease: 409
+    assert _post(api, items, key='crashed').status_code == 409
+
+    with api.app_context():
+        ApiIdempotencyKey.query.filter_by(idempotency_key='crashed').update(
+            {'started_at': datetime.utcnow() - timedelta(seconds=lease + 1)})
+        db.session.commit()
+
+    # Lease scaduto: il reinvio riprende il lotto, poi la risposta è riproposta
+    taken = _post(api, items, key='crashed')
+    assert taken.status_code == 200 and 'Idempotent-Replayed' not in taken.headers
+    assert _post(api, items, key='crashed').headers['Idempotent-Replayed'] == 'true'
+    assert _api_parameters(api) == [parameter_code(1)]
@@ -0,0 +1,80 @@
+"""
+Punteggi ISO 13528 (z, z', ζ, En) e classi di prestazione
+
+I valori attesi sono calcolati a mano dalle formule della norma
+(ISO 13528:2015, 9.4-9.7) con numeri scelti per dare radici esatte.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from app.blueprints.stats.scores_stats import EN_COVERAGE_FACTOR, compute_iso_scores, score_classes
+
+# x, xpt, σpt, u(x), u(xpt)
+VALUES = [10.5, 9.2]
+XPT = [10.0, 10.0]
+SIGMA_PT = [0.25, 0.4]
+U_X = [0.3, 0.15]
+U_XPT = [0.4, 0.2]
+
+
+def test_iso_scores_reference_values():
+    scores = compute_iso_scores(VALUES, XPT, SIGMA_PT, u_x=U_X, u_xpt=U_XPT)
+
+    # z = (x - xpt) / σpt
+    assert scores['z'] == pytest.approx([2.0, -2.0])
+    assert scores['sz2'] == pytest.approx([4.0, 4.0])
+    # z' = (x - xpt) / √(σpt² + u(xpt)²): 0.5 / √0.2225, -0.8 / √0.2
+    assert scores['z_prime'] == pytest.approx([1.0599979, -1.7888544])
+    # ζ = (x - xpt) / √(u(x)² + u(xpt)²): 0.5 / 0.5, -0.8 / 0.25
+    assert scores['zeta'] == pytest.approx([1.0, -3.2])
+    # En = (x - xpt) / √(U(x)² + U(xpt)²) con U = 2u: 0.5 / 1.0, -0.8 / 0.5
+    assert EN_COVERAGE_FACTOR == 2.0
+    assert scores['en'] == pytest.approx([0.5, -1.6])
+
+
+def test_missing_result_uncertainty_leaves_zeta_and_en_undefined():
+    scores = compute_iso_scores(VALUES, XPT, SIGMA_PT, u_x=[math.nan, 0.15], u_xpt=U_XPT)
+
+    assert scores['z'] == pytest.approx([2.0, -2.0])
+    assert scores['z_prime'] == pytest.approx([1.0599979, -1.7888544])
+    assert np.isnan(scores['zeta'][0]) and np.isnan(scores['en'][0])
+    assert scores['zeta'][1] == pytest.approx(-3.2)
+
+    # Senza nessuna incertezza: ζ ed En mai calcolabili
+    scores = compute_iso_scores(VALUES, XPT, SIGMA_PT)
+    assert np.isnan(scores['zeta']).all() and np.isnan(scores['en']).all()
+
+
+def test_missing_assigned_value_uncertainty_is_negligible():
+    for u_xpt in (None, [math.nan, math.nan]):
+        scores = compute_iso_scores(VALUES, XPT, SIGMA_PT, u_x=U_X, u_xpt=u_xpt)
+        # z' coincide con z, ζ usa la sola u(x)
+        assert scores['z_prime'] == pytest.approx(scores['z'])
+        assert scores['zeta'] == pytest.approx([0.5 / 0.3, -0.8 / 0.15])
+        assert scores['en'] == pytest.approx([0.5 / 0.6, -0.8 / 0.3])
+
+
+@pytest.mark.filterwarnings('error')
+def test_zero_sigma_pt_gives_undefined_z():
+    scores = compute_iso_scores([10.5, 10.5], [10.0, 10.0], [0.0, 0.0], u_x=[0.3, 0.3], u_xpt=[0.4, math.nan])
+
+    assert np.isnan(scores['z']).all() and np.isnan(scores['sz2']).all()
+    # z' resta definito solo se u(xpt) è positiva: 0.5 / 0.4
+    assert scores['z_prime'][0] == pytest.approx(1.25)
+    assert np.isnan(scores['z_prime'][1])
+    # ζ ed En non dipendono da σpt
+    assert scores['zeta'] == pytest.approx([1.0, 0.5 / 0.3])
+
+
+def test_score_classes_limits():
+    # |z| < 2 soddisfacente, 2 <= |z| < 3 avvertimento, |z| >= 3 azione
+    z = [0.0, 1.99, -2.0, 2.99, 3.0, -4.5]
+    assert score_classes(z, 'z').tolist() == [0, 0, 1, 1, 2, 2]
+    assert score_classes(z, 'zeta').tolist() == [0, 0, 1, 1, 2, 2]
+    assert score_classes(z).dtype == np.int8
+
+    # En: |En| < 1 soddisfacente, altrimenti azione (nessuna fascia di avvertimento)
+    en = [0.0, 0.99, -0.99, 1.0, -1.0, 1.6]
+    assert score_classes(en, 'en').tolist() == [0, 0, 0, 2, 2, 2]
@@ -0,0 +1,47 @@
+"""
+Lettura dei file Excel: primo foglio, celle come testo
+
+Il form di upload promette il primo foglio: un workbook salvato con un altro
+foglio attivo non cambia i dati letti.
+"""
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from app.services.spreadsheet import SpreadsheetError, iter_xlsx_batches, read_xlsx
+
+
+def _workbook(active=1):
+    workbook = Workbook()
+    first = workbook.active
+    first.title = 'Risultati'
+    first.append(['parameter_code', 'result_value', 'technique_code'])
+    first.append([])
+    first.append(['P001', 12.5, None])
+    first.append([1002, 3.0, 'T01'])
+    notes = workbook.create_sheet('Note')
+    notes.append(['nota'])
+    notes.append(['foglio attivo al salvataggio'])
+    workbook.active = active
+    stream = io.BytesIO()
+    workbook.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def test_reads_first_sheet_not_active_one():
+    df = read_xlsx(_workbook(active=1))
+    assert list(df.columns) == ['parameter_code', 'result_value', 'technique_code']
+    assert df.values.tolist() == [['P001', '12.5', ''], ['1002', '3.0', 'T01']]
+
+    assert read_xlsx(_workbook(), sheet='Note').values.tolist() == [['foglio attivo al salvataggio']]
+    with pytest.raises(SpreadsheetError):
+        read_xlsx(_workbook(), sheet='Mancante')
+
+
+def test_batches():
+    batches = list(iter_xlsx_batches(_workbook(), batch_rows=1))
+    assert [len(batch) for batch in batches] == [1, 1]
+    with pytest.raises(SpreadsheetError):
+        list(iter_xlsx_batches(io.BytesIO(b'non un file excel')))
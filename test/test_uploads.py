@@ -0,0 +1,117 @@
+"""
+Upload dei risultati: deduplicazione e confronto riga per riga
+
+Un file identico all'ultimo non viene rielaborato, un file corretto aggiorna
+solo le righe cambiate, un lotto parziale si aggiunge ai risultati presenti e
+solo la sostituzione esplicita elimina le righe assenti dal file.
+"""
+import io
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from config import Config
+from app import create_app, db
+from app.models import Cycle, PtStats, Result, UploadFile, User
+from app.services.seeding import seed_synthetic, lab_code, parameter_code
+
+SPEC = {'labs': 1, 'cycles': 1, 'parameters': 4, 'results_per_combo': 1}
+LAB = lab_code(0)
+
+
+@pytest.fixture
+def client(tmp_path):
+    class UploadConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'uploads.sqlite3'}"
+        DB_ENGINE_PROFILE = 'basic'
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+
+    app = create_app(UploadConfig)
+    with app.app_context():
+        db.create_all()
+        seed_synthetic(SPEC)
+        user = User(email='upload@ochem.local', first_name='Upload', last_name='Test',
+                    is_admin=True, accepted_disclaimer_at=datetime.utcnow())
+        user.set_password('upload')
+        db.session.add(user)
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'upload@ochem.local', 'password': 'upload'})
+    yield client
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _upload(client, values, replace=False):
+    csv_content = "parameter_code,result_value,technique_code,unit_code,date_performed\n" + "".join(
+        f"{parameter_code(i)},{value},,mg/L,\n" for i, value in values
+    )
+    data = {'file': (io.BytesIO(csv_content.encode()), 'results.csv')}
+    if replace:
+        data['replace'] = '1'
+    response = client.post(f'/l/{LAB}/stats/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/stats/results')
+
+
+def _state(client):
+    """Risultati del lab nel ciclo corrente: {(parametro, tecnica): [(id, valore)]}, PtStats.n_results, upload"""
+    with client.application.app_context():
+        cycle = Cycle.query.filter_by(status='published').order_by(Cycle.created_at.desc()).first()
+        results = {}
+        for result_id, code, technique, value in db.session.execute(
+            select(Result.id, Result.parameter_code, Result.technique_code, Result.measured_value)
+            .where(Result.lab_code == LAB, Result.cycle_code == cycle.code).order_by(Result.id)
+        ):
+            results.setdefault((code, technique), []).append((result_id, float(value)))
+        n_results = dict(db.session.execute(
+            select(PtStats.parameter_code, PtStats.n_results)
+            .where(PtStats.lab_code == LAB, PtStats.cycle_code == cycle.code)
+        ).all())
+        uploads = db.session.scalar(select(func.count(UploadFile.id)).where(UploadFile.lab_code == LAB))
+    return results, n_results, uploads
+
+
+def test_identical_reupload_is_skipped(client):
+    _upload(client, [(0, 10.0), (1, 11.0)])
+    before = _state(client)
+
+    _upload(client, [(0, 10.0), (1, 11.0)])
+    assert _state(client) == before
+
+
+def test_corrected_value_updates_single_row(client):
+    _upload(client, [(0, 10.0), (1, 11.0)])
+    results, n_results, _ = _state(client)
+
+    _upload(client, [(0, 10.0), (1, 12.5)])
+    corrected, corrected_n, _ = _state(client)
+    changed = {key for key in results if results[key] != corrected[key]}
+    assert changed == {(parameter_code(1), None)}
+    # Stesso risultato aggiornato, non eliminato e reinserito
+    assert corrected[(parameter_code(1), None)] == [(results[(parameter_code(1), None)][0][0], 12.5)]
+    assert corrected_n == n_results
+
+
+def test_partial_batches_keep_previous_rows(client):
+    seeded, _, _ = _state(client)
+    _upload(client, [(0, 10.0), (1, 11.0)])
+    _upload(client, [(2, 12.0), (3, 13.0)])
+
+    results, n_results, _ = _state(client)
+    for i in range(4):
+        assert results[(parameter_code(i), None)][0][1] == 10.0 + i
+    assert sum(map(len, results.values())) == sum(map(len, seeded.values())) + 4
+    assert n_results[parameter_code(0)] == n_results[parameter_code(3)]
+
+
+def test_replace_deletes_rows_missing_from_file(client):
+    _upload(client, [(0, 10.0), (1, 11.0)])
+    _upload(client, [(2, 12.0), (3, 13.0)], replace=True)
+
+    results, n_results, _ = _state(client)
+    assert sorted(results) == [(parameter_code(2), None), (parameter_code(3), None)]
+    assert n_results == {parameter_code(2): 1, parameter_code(3): 1}